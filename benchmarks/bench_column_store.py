@@ -0,0 +1,72 @@
+"""
+Benchmark loading one function for many trajectories from the h5py cache.
+
+We cache the values of one function for N_TRAJS trajectories in the
+(per-trajectory) h5py cache and measure the time to load them all, once by
+reading them trajectory by trajectory (through the TrajectoryFunctionValueCacheH5PY
+mapping) and once from the TrajectoryFunctionValueColumnStore (a single read
+of one dataset). We also report the time it takes to export the cache to the
+column store.
+
+Requires h5py.
+
+Usage: python bench_column_store.py [N_TRAJS ...]
+"""
+import os
+import sys
+import time
+import tempfile
+
+import h5py
+import numpy as np
+
+from asyncmd.trajectory.trajectory import TrajectoryFunctionValueCacheH5PY
+from asyncmd.trajectory.column_store import TrajectoryFunctionValueColumnStore
+
+
+FUNC_ID = "bench_column_store"
+TRAJ_LEN = 50
+
+
+def bench(directory, n_trajs):
+    fname = os.path.join(directory, f"cache_{n_trajs}.h5")
+    with h5py.File(fname, mode="w") as h5file:
+        for hash_traj in range(n_trajs):
+            cache = TrajectoryFunctionValueCacheH5PY(h5file,
+                                                     hash_traj=hash_traj)
+            cache.append(func_id=FUNC_ID, vals=np.random.random((TRAJ_LEN, 2)))
+        t0 = time.perf_counter()
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        store.export_h5py_cache(h5file)
+        t_export = time.perf_counter() - t0
+    timings = {"export": t_export}
+    with h5py.File(fname, mode="r") as h5file:
+        t0 = time.perf_counter()
+        per_traj = [TrajectoryFunctionValueCacheH5PY(h5file,
+                                                     hash_traj=hash_traj)[FUNC_ID]
+                    for hash_traj in range(n_trajs)]
+        timings["per-trajectory"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        values, hash_trajs, offsets = store.load(FUNC_ID)
+        timings["column store"] = time.perf_counter() - t0
+    # the export adds the trajectories in the order of the h5py group keys
+    for i, hash_traj in enumerate(hash_trajs):
+        assert np.array_equal(per_traj[hash_traj],
+                              values[offsets[i]:offsets[i + 1]])
+    return timings
+
+
+def main(n_trajs_list):
+    keys = ["per-trajectory", "column store", "export"]
+    print(f"{'n_trajs':>8}" + "".join(f"{f'{k} [ms]':>22}" for k in keys))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_trajs in n_trajs_list:
+            timings = bench(directory=tmpdir, n_trajs=n_trajs)
+            print(f"{n_trajs:>8}"
+                  + "".join(f"{timings[k] * 1e3:>22.1f}" for k in keys))
+
+
+if __name__ == "__main__":
+    n_trajs_list = [int(n) for n in sys.argv[1:]] or [100, 1000, 10000]
+    main(n_trajs_list)
@@ -0,0 +1,98 @@
+"""
+Benchmark the latency of h5py cache hits against the number of cached functions.
+
+For every number of cached functions we write the values for one trajectory
+in the previous (by index) h5py layout and measure the time per lookup with
+the previous lookup (reading all stored func_ids until the key is found), the
+time to migrate the trajectory to the current layout and the time per lookup
+of the current TrajectoryFunctionValueCacheH5PY (in a writeable and in a
+read-only file, the latter as a fresh file in the previous layout, i.e. using
+the in-memory index).
+
+Requires h5py.
+
+Usage: python bench_h5py_cache.py [N_FUNCS ...]
+"""
+import os
+import sys
+import time
+import tempfile
+
+import h5py
+import numpy as np
+
+from asyncmd.trajectory.trajectory import TrajectoryFunctionValueCacheH5PY
+
+
+HASH_TRAJ = 1234567890
+TRAJ_LEN = 1000
+N_LOOKUPS = 200
+
+
+def write_legacy_layout(fname, func_ids):
+    with h5py.File(fname, mode="w") as h5file:
+        root = h5file.require_group("asyncmd/TrajectoryFunctionValueCache/"
+                                    + f"{HASH_TRAJ}")
+        ids_grp = root.require_group("FunctionIDs")
+        vals_grp = root.require_group("FunctionValues")
+        for idx, func_id in enumerate(func_ids):
+            ids_grp.create_dataset(str(idx), data=func_id)
+            vals_grp.create_dataset(str(idx),
+                                    data=np.random.random((TRAJ_LEN, 1)))
+
+
+def legacy_getitem(h5file, key):
+    # the lookup of the previous layout
+    root = h5file[f"asyncmd/TrajectoryFunctionValueCache/{HASH_TRAJ}"]
+    ids_grp, vals_grp = root["FunctionIDs"], root["FunctionValues"]
+    for idx in range(len(ids_grp.keys())):
+        if ids_grp[str(idx)].asstr()[()] == key:
+            return vals_grp[str(idx)][:]
+    raise KeyError("Key not found.")
+
+
+def time_lookups(getitem, func_ids):
+    rng = np.random.default_rng(42)
+    keys = rng.choice(func_ids, size=N_LOOKUPS)
+    t0 = time.perf_counter()
+    for key in keys:
+        getitem(str(key))
+    return (time.perf_counter() - t0) / N_LOOKUPS
+
+
+def bench(directory, n_funcs):
+    func_ids = [str(10**19 + i) for i in range(n_funcs)]
+    fname = os.path.join(directory, f"cache_{n_funcs}.h5")
+    write_legacy_layout(fname=fname, func_ids=func_ids)
+    timings = {}
+    with h5py.File(fname, mode="r") as h5file:
+        timings["legacy"] = time_lookups(
+                            lambda key: legacy_getitem(h5file, key), func_ids)
+        t0 = time.perf_counter()
+        cache = TrajectoryFunctionValueCacheH5PY(h5file, hash_traj=HASH_TRAJ)
+        timings["index"] = time.perf_counter() - t0
+        timings["read-only"] = time_lookups(cache.__getitem__, func_ids)
+    with h5py.File(fname, mode="r+") as h5file:
+        t0 = time.perf_counter()
+        cache = TrajectoryFunctionValueCacheH5PY(h5file, hash_traj=HASH_TRAJ)
+        timings["migrate"] = time.perf_counter() - t0
+        timings["current"] = time_lookups(cache.__getitem__, func_ids)
+    return timings
+
+
+def main(n_funcs_list):
+    keys = ["legacy", "read-only", "current", "index", "migrate"]
+    units = ["us/hit", "us/hit", "us/hit", "ms", "ms"]
+    print(f"{'n_funcs':>8}" + "".join(f"{f'{k} [{u}]':>20}"
+                                      for k, u in zip(keys, units)))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_funcs in n_funcs_list:
+            timings = bench(directory=tmpdir, n_funcs=n_funcs)
+            print(f"{n_funcs:>8}"
+                  + "".join(f"{timings[k] * (1e6 if u == 'us/hit' else 1e3):>20.1f}"
+                            for k, u in zip(keys, units)))
+
+
+if __name__ == "__main__":
+    n_funcs_list = [int(n) for n in sys.argv[1:]] or [1, 10, 50, 200, 1000]
+    main(n_funcs_list)
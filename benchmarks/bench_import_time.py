@@ -0,0 +1,86 @@
+"""
+Benchmark the time it takes to import asyncmd (and some of its submodules).
+
+Every import is timed in a fresh python process (median over repeats). We
+also report which of the heavy dependencies have actually been imported
+(executed) afterwards and whether the SlurmClusterMediator has been created
+(which calls sinfo), both should not happen for a plain ``import asyncmd``.
+
+Usage: python bench_import_time.py [--repeats N] [--max-ms MS]
+
+With ``--max-ms`` the exit code is 1 if ``import asyncmd`` takes longer than
+the given time (in milliseconds), such that it can be used as a check.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ["numpy", "MDAnalysis", "scipy", "scipy.constants", "h5py",
+                 "asyncmd.gromacs.mdengine", "asyncmd.trajectory.propagate",
+                 ]
+
+STATEMENTS = ["import asyncmd",
+              "import asyncmd.slurm",
+              "from asyncmd.gromacs import MDP",
+              "from asyncmd import Trajectory",
+              "from asyncmd.gromacs import SlurmGmxEngine",
+              ]
+
+# run in the subprocess, prints the import time and what has been loaded
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - t0
+# modules imported lazily are in sys.modules, but only executed on first use
+loaded = [name for name in {heavy_modules!r}
+          if name in sys.modules
+          and type(sys.modules[name]).__name__ != "_LazyModule"]
+slurm = sys.modules.get("asyncmd.slurm", None)
+mediator = (slurm is not None
+            and slurm.SlurmProcess._slurm_cluster_mediator is not None)
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded,
+                  "mediator": mediator}}))
+"""
+
+
+def time_statement(statement, repeats):
+    results = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c",
+                              PROBE.format(statement=statement,
+                                           heavy_modules=HEAVY_MODULES)],
+                             capture_output=True, text=True, check=True,
+                             env=os.environ.copy(),
+                             )
+        results.append(json.loads(out.stdout.splitlines()[-1]))
+    return (statistics.median(r["elapsed"] for r in results) * 1000,
+            results[-1]["loaded"], results[-1]["mediator"])
+
+
+def main(repeats, max_ms):
+    print(f"{'statement':<45}{'time [ms]':>12}  {'mediator':<10}loaded")
+    import_asyncmd_ms = None
+    for statement in STATEMENTS:
+        ms, loaded, mediator = time_statement(statement, repeats=repeats)
+        if statement == "import asyncmd":
+            import_asyncmd_ms = ms
+        print(f"{statement:<45}{ms:>12.1f}  {str(mediator):<10}"
+              + (", ".join(loaded) or "-"))
+    if max_ms is not None and import_asyncmd_ms > max_ms:
+        print(f"`import asyncmd` took {import_asyncmd_ms:.1f} ms, "
+              + f"more than {max_ms} ms.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+    sys.exit(main(repeats=args.repeats, max_ms=args.max_ms))
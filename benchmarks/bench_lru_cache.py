@@ -0,0 +1,99 @@
+"""
+Benchmark repeated cache hits with and without the in-memory LRU tier.
+
+We cache the values of N_FUNCS functions for a trajectory in the npz cache
+(and optionally in a h5py cache) and then query them repeatedly through
+``Trajectory._apply_wrapped_func`` (as e.g. the ConditionalTrajectoryPropagator
+does), once with the LRU tier disabled (every hit reads from the npz/h5py
+file) and once with it enabled (see asyncmd.config.set_trajectory_cache_lru_size).
+
+Requires numpy and MDAnalysis (and h5py for the h5py cache) and the test
+trajectory from tests/test_data, i.e. run it from the repository root.
+
+Usage: python benchmarks/bench_lru_cache.py [N_FUNCS] [N_LOOKUPS]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+import numpy as np
+
+import asyncmd
+from asyncmd import Trajectory
+from asyncmd.trajectory.trajectory import TrajectoryFunctionValueCacheNPZ
+
+
+TRAJ_FILE = "tests/test_data/trajectory/ala_traj.trr"
+STRUCT_FILE = "tests/test_data/trajectory/ala.tpr"
+
+
+class FakeWrappedFunc:
+    # returns random values (only called once per func_id)
+    async def get_values_for_trajectory(self, traj):
+        return np.random.random((len(traj), 2))
+
+
+async def time_lookups(traj, func_ids, n_lookups):
+    t0 = time.perf_counter()
+    for i in range(n_lookups):
+        await traj._apply_wrapped_func(func_id=func_ids[i % len(func_ids)],
+                                       wrapped_func=None)
+    return (time.perf_counter() - t0) / n_lookups
+
+
+async def bench(cache_type, n_funcs, n_lookups, tmpdir):
+    if cache_type == "h5py":
+        import h5py
+        h5file = h5py.File(os.path.join(tmpdir, "cache.h5"), mode="w")
+        asyncmd.config.register_h5py_cache(h5py_group=h5file)
+    asyncmd.trajectory._forget_all_trajectories()
+    traj = Trajectory(trajectory_files=TRAJ_FILE, structure_file=STRUCT_FILE,
+                      cache_type=cache_type)
+    func_ids = [f"bench_lru_{cache_type}_{i}" for i in range(n_funcs)]
+    for func_id in func_ids:
+        await traj._apply_wrapped_func(func_id=func_id,
+                                       wrapped_func=FakeWrappedFunc())
+    timings = {}
+    max_bytes = asyncmd.config.get_trajectory_cache_lru_stats()["max_bytes"]
+    try:
+        asyncmd.config.set_trajectory_cache_lru_size(max_bytes=0)
+        timings["no LRU"] = await time_lookups(traj, func_ids, n_lookups)
+    finally:
+        asyncmd.config.set_trajectory_cache_lru_size(max_bytes=max_bytes)
+    # first pass fills the LRU tier
+    _ = await time_lookups(traj, func_ids, len(func_ids))
+    timings["LRU"] = await time_lookups(traj, func_ids, n_lookups)
+    if cache_type == "npz":
+        os.unlink(TrajectoryFunctionValueCacheNPZ._get_cache_filename(
+                                        fname_trajs=traj.trajectory_files,
+                                        trajectory_hash=traj.trajectory_hash,
+                                                                          ))
+    else:
+        h5file.close()
+    return timings
+
+
+async def main(n_funcs, n_lookups):
+    cache_types = ["npz"]
+    try:
+        import h5py  # noqa: F401
+    except ImportError:
+        print("h5py not installed, only benchmarking the npz cache.")
+    else:
+        cache_types.append("h5py")
+    print(f"{'cache':<8}{'no LRU [us/hit]':>18}{'LRU [us/hit]':>18}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for cache_type in cache_types:
+            timings = await bench(cache_type=cache_type, n_funcs=n_funcs,
+                                  n_lookups=n_lookups, tmpdir=tmpdir)
+            print(f"{cache_type:<8}{timings['no LRU'] * 1e6:>18.1f}"
+                  + f"{timings['LRU'] * 1e6:>18.1f}")
+    print(asyncmd.config.get_trajectory_cache_lru_stats())
+
+
+if __name__ == "__main__":
+    n_funcs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    asyncio.run(main(n_funcs=n_funcs, n_lookups=n_lookups))
@@ -0,0 +1,88 @@
+"""
+Benchmark the per-job cost of the SlurmClusterMediator job bookkeeping.
+
+Measures the time per job needed to register jobs, parse squeue and sacct
+output for all of them and to remove them again for an increasing number of
+monitored jobs. The per-job cost should stay (roughly) flat, i.e. the total
+cost should scale linearly with the number of jobs.
+
+No SLURM installation is needed, we use fake sinfo/sacct/squeue/scancel
+executables.
+
+Usage: python bench_slurm_registry.py [N_JOBS ...]
+"""
+import os
+import sys
+import stat
+import time
+import tempfile
+
+from asyncmd import slurm
+
+
+def make_fake_executables(directory):
+    # the mediator checks that the executables exist and calls sinfo once
+    executables = {}
+    for name, output in [("sinfo", "node001\nnode002\n"),
+                         ("sacct", ""),
+                         ("squeue", ""),
+                         ("scancel", ""),
+                         ]:
+        fname = os.path.join(directory, name)
+        with open(fname, "w") as f:
+            f.write("#!/bin/sh\n")
+            f.write(f"printf '{output}'\n")
+        os.chmod(fname, os.stat(fname).st_mode | stat.S_IEXEC)
+        executables[f"{name}_executable"] = fname
+    return executables
+
+
+def bench(mediator, n_jobs):
+    jobids = [str(1000000 + i) for i in range(n_jobs)]
+    squeue_out = "".join(f"{jid}||||RUNNING||||node001||||\n"
+                         for jid in jobids)
+    acct = ("2023-03-17T12:00:00||||2023-03-17T12:01:00||||"
+            + "2023-03-17T12:11:00||||600||||8||||01:10:00||||")
+    sacct_out = "".join(f"{jid}||||COMPLETED||||0:0||||node001||||"
+                        + acct + "||||\n"
+                        + f"{jid}.batch||||COMPLETED||||0:0||||node001||||"
+                        + acct + "1024K||||\n"
+                        for jid in jobids)
+    timings = {}
+    t0 = time.perf_counter()
+    for jid in jobids:
+        mediator.monitor_register_job(jobid=jid)
+    timings["register"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    chunks = mediator._chunk_jobids(jobids=list(mediator._jobids_sacct))
+    for chunk in chunks:
+        mediator._parse_squeue_output(squeue_return=squeue_out, jobids=chunk)
+    timings["squeue"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    mediator._parse_sacct_output(sacct_return=sacct_out)
+    timings["sacct"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for jid in jobids:
+        mediator.monitor_remove_job(jobid=jid)
+    timings["remove"] = time.perf_counter() - t0
+    return timings
+
+
+def main(n_jobs_list):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        executables = make_fake_executables(tmpdir)
+        # squeue_out contains all jobs, so only parse it once
+        mediator = slurm.SlurmClusterMediator(max_jobids_per_call=10**9,
+                                              **executables)
+        print(f"{'n_jobs':>8}" + "".join(f"{k + ' [us/job]':>18}"
+                                         for k in ["register", "squeue",
+                                                   "sacct", "remove"]))
+        for n_jobs in n_jobs_list:
+            timings = bench(mediator=mediator, n_jobs=n_jobs)
+            print(f"{n_jobs:>8}" + "".join(f"{t / n_jobs * 1e6:>18.2f}"
+                                           for t in timings.values()))
+
+
+if __name__ == "__main__":
+    n_jobs_list = [int(n) for n in sys.argv[1:]] or [100, 1000, 10000, 50000]
+    main(n_jobs_list)
@@ -0,0 +1,103 @@
+"""
+Scaling benchmark for asyncmd.slurm against the local SLURM emulator.
+
+For an increasing number of concurrent SlurmProcess instances we measure:
+
+ - the submission rate (jobs per second, including the sbatch calls)
+ - the state-detection latency, i.e. the time between the (fake) scheduler
+   ending a job and the corresponding ``SlurmProcess.wait()`` returning
+ - the CPU time and the peak memory (maxrss) used by the submitting/waiting
+   python process, i.e. mostly by the SlurmClusterMediator
+
+The jobs are not executed but only pretend to run (``--simulate-runtime``),
+such that tens of thousands of concurrent jobs fit on a single machine.
+See tests/helpers/fakeslurm.py for the emulator.
+
+Usage: python bench_slurm_scaling.py [N_JOBS ...]
+"""
+import os
+import sys
+import time
+import asyncio
+import resource
+import statistics
+import tempfile
+
+import asyncmd
+from asyncmd import slurm
+
+# the local SLURM emulator lives with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "tests"))
+from helpers.fakeslurm import FakeSlurm  # noqa: E402
+
+
+SIMULATED_RUNTIME = 5.
+
+
+async def bench(fake, workdir, n_jobs):
+    script = os.path.join(workdir, "job.slurm")
+    with open(script, "w") as f:
+        f.write("#!/bin/bash\ntrue\n")
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    t_start = time.time()
+    procs = await asyncio.gather(*(slurm.create_slurmprocess_submit(
+                                                    jobname=f"bench{i}",
+                                                    sbatch_script=script,
+                                                    workdir=workdir,
+                                                    stdfiles_removal="yes",
+                                                                    )
+                                   for i in range(n_jobs))
+                                 )
+    t_submitted = time.time()
+
+    async def wait(proc):
+        await proc.wait()
+        return time.time()
+
+    detected = await asyncio.gather(*(wait(p) for p in procs))
+    t_end = time.time()
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    states = fake.job_states()
+    latencies = [t_det - states[p.slurm_jobid]["end"]
+                 for p, t_det in zip(procs, detected)]
+    return {"submit [jobs/s]": n_jobs / (t_submitted - t_start),
+            "latency median [s]": statistics.median(latencies),
+            "latency max [s]": max(latencies),
+            "cpu [ms/job]": ((usage_end.ru_utime + usage_end.ru_stime
+                              - usage_start.ru_utime - usage_start.ru_stime)
+                             / n_jobs * 1e3),
+            "maxrss [MB]": usage_end.ru_maxrss / 1024,
+            "total [s]": t_end - t_start,
+            }
+
+
+async def main(n_jobs_list):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with FakeSlurm(os.path.join(tmpdir, "fakeslurm"),
+                       nodes=16, slots_per_node=10**6, queue_delay=1.,
+                       simulate_runtime=SIMULATED_RUNTIME) as fake:
+            asyncmd.config.set_all_slurm_settings(
+                                        min_time_between_sacct_calls=1,
+                                        max_time_between_sacct_calls=10,
+                                        # measure the raw submission rate
+                                        max_submissions_per_second=0.,
+                                        **fake.executables
+                                                  )
+            header = None
+            for n_jobs in n_jobs_list:
+                workdir = os.path.join(tmpdir, f"run_{n_jobs}")
+                os.mkdir(workdir)
+                results = await bench(fake=fake, workdir=workdir,
+                                      n_jobs=n_jobs)
+                if header is None:
+                    header = f"{'n_jobs':>8}" + "".join(f"{k:>20}"
+                                                        for k in results)
+                    print(header)
+                print(f"{n_jobs:>8}" + "".join(f"{v:>20.3f}"
+                                               for v in results.values()))
+
+
+if __name__ == "__main__":
+    n_jobs_list = [int(n) for n in sys.argv[1:]] or [100, 1000, 5000, 20000]
+    asyncio.run(main(n_jobs_list))
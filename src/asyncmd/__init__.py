@@ -12,10 +12,34 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import importlib as _importlib
+
 from . import config
 
 from .__about__ import (__author__, __author_email__, __copyright__,
                         __description__, __license__, __url__, __version__,
                         )
 
-from .trajectory.trajectory import Trajectory
+
+# NOTE: the submodules (and with them MDAnalysis etc.) are only imported when
+#       they are first accessed, such that `import asyncmd` stays fast, see
+#       benchmarks/bench_import_time.py
+_LAZY_SUBMODULES = ["gromacs", "mdconfig", "mdengine", "pilot", "slurm",
+                    "tools", "trajectory", "utils",
+                    ]
+_LAZY_ATTRIBUTES = {"Trajectory": ".trajectory.trajectory"}
+# __all__ is needed for `import *` to also find the not yet imported names
+__all__ = ["config"] + _LAZY_SUBMODULES + list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return _importlib.import_module(f".{name}", __name__)
+    if name in _LAZY_ATTRIBUTES:
+        module = _importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + _LAZY_SUBMODULES + list(_LAZY_ATTRIBUTES))
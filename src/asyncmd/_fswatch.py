@@ -0,0 +1,342 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+Watch directories for files to appear or to be closed after writing.
+
+Used by :class:`asyncmd.slurm.SlurmProcess` to notice that a job finished
+(e.g. because its result file appeared) before the next sacct call. We use
+inotify (via ctypes, i.e. linux only) if possible and poll (list the
+directories) otherwise. Polling is also used on network filesystems, because
+inotify only sees the changes made on the local host there.
+"""
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import struct
+import typing
+import asyncio
+import logging
+import weakref
+import collections
+
+
+logger = logging.getLogger(__name__)
+
+
+# filesystems on which inotify does not see changes made on other hosts
+_NETWORK_FILESYSTEMS = {"nfs", "nfs4", "lustre", "gpfs", "beegfs", "cifs",
+                        "smb3", "ceph", "panfs", "fuse.sshfs",
+                        "fuse.glusterfs", "fuse.beegfs", "afs",
+                        }
+
+# see `man 7 inotify`
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (of name)
+
+
+def filesystem_type(path: str) -> typing.Union[str, None]:
+    """
+    Return the type of the filesystem the given path is on (linux only).
+
+    Parameters
+    ----------
+    path : str
+        The path to check.
+
+    Returns
+    -------
+    str or None
+        The filesystem type as in ``/proc/self/mounts``, e.g. "ext4" or "nfs4".
+        None if it can not be determined.
+    """
+    path = os.path.realpath(path)
+    best_mount, fstype = "", None
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # spaces in mount points are escaped as octal
+                mount = fields[1].replace("\\040", " ")
+                if ((path == mount
+                     or path.startswith(mount.rstrip("/") + "/"))
+                        and len(mount) >= len(best_mount)):
+                    best_mount, fstype = mount, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """
+    Wait for files to appear in directories, one instance per event loop.
+
+    All waits share one inotify instance (one watch per directory) and one
+    polling task (one listing per directory and poll), such that we can wait
+    for the files of many jobs at once. Use :func:`get_file_watcher` to get the
+    watcher for the running event loop.
+    """
+
+    def __init__(self) -> None:
+        self._libc = _load_libc()
+        self._fd = None
+        self._wds = {}  # directory -> inotify watch descriptor
+        self._dirs = {}  # watch descriptor -> directory
+        # directory -> list of (names, close_names, future)
+        self._watches = collections.defaultdict(list)
+        # directory -> list of [names, future, poll_interval, next_poll]
+        self._poll_watches = collections.defaultdict(list)
+        self._poll_task = None
+        self._fs_types = {}
+
+    def _use_inotify(self, directory: str, method: str) -> bool:
+        if method == "poll":
+            return False
+        if self._libc is None:
+            if method == "inotify":
+                logger.warning("Inotify is not available, polling instead.")
+            return False
+        if method == "auto":
+            try:
+                fstype = self._fs_types[directory]
+            except KeyError:
+                fstype = filesystem_type(directory)
+                self._fs_types[directory] = fstype
+            return fstype not in _NETWORK_FILESYSTEMS
+        return True
+
+    async def wait(self, directory: str, names: "list[str]",
+                   close_names: typing.Optional["list[str]"] = None,
+                   method: str = "auto", poll_interval: float = 1.,
+                   ) -> typing.Union[str, None]:
+        """
+        Wait until one of the given files appears in the directory.
+
+        Parameters
+        ----------
+        directory : str
+            The directory to watch.
+        names : list[str]
+            Filenames (in directory) to wait for, a file counts as appeared if
+            it was closed after writing or moved to directory (inotify) or if
+            it exists (polling).
+        close_names : list[str], optional
+            Filenames (in directory) for which we wait for them to be closed
+            after writing, e.g. the stdfiles of a job. Only possible with
+            inotify, ignored when polling. By default None (no files).
+        method : str, optional
+            "auto" (inotify if possible and not on a network filesystem),
+            "inotify" or "poll", by default "auto".
+        poll_interval : float, optional
+            Time between two checks (in seconds) when polling, by default 1.
+
+        Returns
+        -------
+        str or None
+            The name of the file that appeared (or was closed). None if we can
+            not tell which file changed (after an inotify queue overflow).
+        """
+        directory = os.path.abspath(directory)
+        if close_names is None:
+            close_names = []
+        fut = asyncio.get_running_loop().create_future()
+        if self._use_inotify(directory, method):
+            try:
+                self._add_inotify_watch(directory)
+            except OSError as e:
+                logger.warning("Could not watch %s with inotify (%s), "
+                               "polling instead.", directory, e)
+                if len(self._watches) == 0:
+                    self._close_inotify()
+            else:
+                entry = (set(names), set(close_names), fut)
+                self._watches[directory].append(entry)
+                try:
+                    # the file might have been written before we watched
+                    existing = self._existing(directory, names)
+                    if existing is not None:
+                        return existing
+                    return await fut
+                finally:
+                    self._watches[directory].remove(entry)
+                    if len(self._watches[directory]) == 0:
+                        self._remove_inotify_watch(directory)
+        if len(names) == 0:
+            # nothing we can see by polling, wait until we are canceled
+            return await fut
+        entry = [set(names), fut, poll_interval, 0.]
+        self._poll_watches[directory].append(entry)
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll_loop())
+        try:
+            return await fut
+        finally:
+            self._poll_watches[directory].remove(entry)
+            if len(self._poll_watches[directory]) == 0:
+                del self._poll_watches[directory]
+
+    @staticmethod
+    def _existing(directory: str, names: "list[str]") -> typing.Union[str,
+                                                                      None]:
+        for name in names:
+            if os.path.exists(os.path.join(directory, name)):
+                return name
+        return None
+
+    def _add_inotify_watch(self, directory: str) -> None:
+        if directory in self._wds:
+            return
+        if self._fd is None:
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            self._fd = fd
+            asyncio.get_running_loop().add_reader(fd, self._read_events)
+        wd = self._libc.inotify_add_watch(self._fd,
+                                          os.fsencode(directory),
+                                          (_IN_CLOSE_WRITE | _IN_MOVED_TO
+                                           | _IN_ONLYDIR),
+                                          )
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), directory)
+        self._wds[directory] = wd
+        self._dirs[wd] = directory
+
+    def _remove_inotify_watch(self, directory: str) -> None:
+        del self._watches[directory]
+        wd = self._wds.pop(directory, None)
+        if wd is not None:
+            self._dirs.pop(wd, None)
+            # fails (harmlessly) if the directory has been removed already
+            self._libc.inotify_rm_watch(self._fd, wd)
+        if len(self._watches) == 0:
+            # last watch gone, do not keep the fd (and reader) around
+            self._close_inotify()
+
+    def _close_inotify(self) -> None:
+        if self._fd is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._wds.clear()
+        self._dirs.clear()
+
+    def _read_events(self) -> None:
+        # called by the event loop when the inotify fd is readable
+        while True:
+            try:
+                data = os.read(self._fd, 2**16)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data,
+                                                                   offset)
+                offset += _INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + name_len]
+                                   .rstrip(b"\0"))
+                offset += name_len
+                if mask & _IN_Q_OVERFLOW:
+                    # we might have missed events, wake everyone
+                    for entries in self._watches.values():
+                        for _, _, fut in entries:
+                            if not fut.done():
+                                fut.set_result(None)
+                    continue
+                if mask & _IN_IGNORED:
+                    # watch removed (by us or because the dir was removed)
+                    directory = self._dirs.pop(wd, None)
+                    if directory is not None:
+                        self._wds.pop(directory, None)
+                    continue
+                directory = self._dirs.get(wd, None)
+                if directory is None:
+                    continue
+                for names, close_names, fut in self._watches.get(directory,
+                                                                 []):
+                    if fut.done():
+                        continue
+                    if (name in names
+                            or (mask & _IN_CLOSE_WRITE and name in close_names)):
+                        fut.set_result(name)
+
+    async def _poll_loop(self) -> None:
+        # the one and only polling loop, runs as long as we have waiters
+        loop = asyncio.get_running_loop()
+        while len(self._poll_watches) > 0:
+            now = time.time()
+            next_poll = min(entry[3]
+                            for entries in self._poll_watches.values()
+                            for entry in entries)
+            if next_poll > now:
+                await asyncio.sleep(next_poll - now)
+                continue
+            for directory, entries in list(self._poll_watches.items()):
+                due = [entry for entry in entries if entry[3] <= now]
+                if len(due) == 0:
+                    continue
+                try:
+                    # the listing can block on network filesystems
+                    content = set(await loop.run_in_executor(None, os.listdir,
+                                                             directory))
+                except OSError:
+                    content = set()
+                for entry in due:
+                    names, fut, poll_interval, _ = entry
+                    entry[3] = time.time() + poll_interval
+                    appeared = names & content
+                    if len(appeared) > 0 and not fut.done():
+                        fut.set_result(appeared.pop())
+
+
+_WATCHERS = weakref.WeakKeyDictionary()
+
+
+def get_file_watcher() -> FileWatcher:
+    """Return the :class:`FileWatcher` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    try:
+        return _WATCHERS[loop]
+    except KeyError:
+        watcher = _WATCHERS[loop] = FileWatcher()
+        return watcher
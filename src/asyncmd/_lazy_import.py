@@ -0,0 +1,64 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+Import (heavy) modules lazily, i.e. only when they are first used.
+
+Importing e.g. MDAnalysis takes seconds, which short-lived scripts (and the
+pilot workers) that never touch a trajectory should not pay, see
+``benchmarks/bench_import_time.py``.
+"""
+import sys
+import types
+import importlib
+import importlib.util
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return the module with the given name, but execute it only on first use.
+
+    The module is found (and put into ``sys.modules``) directly, i.e. a
+    missing module still raises an ``ImportError`` here, but its code runs
+    only when an attribute of the returned module is accessed for the first
+    time. Modules that have already been imported are returned as they are.
+
+    Parameters
+    ----------
+    name : str
+        The (absolute) name of the module, e.g. "MDAnalysis".
+
+    Returns
+    -------
+    types.ModuleType
+        The (lazy) module.
+
+    Raises
+    ------
+    ModuleNotFoundError
+        If the module can not be found.
+    """
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,177 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+A least-recently-used cache bounded by the (approximate) size of its values.
+
+Used as ``_GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"]``, the in-memory tier in
+front of the persistent (h5py, sqlite and npz) trajectory function value
+caches, see :func:`asyncmd.config.set_trajectory_cache_lru_size`.
+"""
+import sys
+import typing
+import collections
+
+
+class ByteBoundedLRUCache:
+    """
+    Least-recently-used cache holding at most ``max_bytes`` worth of values.
+
+    The size of a value is its ``nbytes`` attribute (i.e. the size of the data
+    of a numpy array) or ``sys.getsizeof`` for objects without it. Values
+    larger than ``max_bytes`` are not cached at all. The cache counts hits,
+    misses and evictions, see :meth:`stats`.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Initialize a `ByteBoundedLRUCache`.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the cached values in bytes, zero disables
+            the cache.
+
+        Raises
+        ------
+        ValueError
+            If max_bytes is negative.
+        """
+        self._data = collections.OrderedDict()  # key -> (value, nbytes)
+        self._n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._max_bytes = 0
+        self.max_bytes = max_bytes
+
+    def __repr__(self) -> str:
+        return (f"<{type(self).__name__} max_bytes={self._max_bytes} "
+                + f"n_bytes={self._n_bytes} n_entries={len(self._data)}>")
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        # does not count as hit or miss and does not change the order
+        return key in self._data
+
+    @property
+    def max_bytes(self) -> int:
+        """Maximum total size of the cached values in bytes. Can be (re)set."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        if value < 0:
+            raise ValueError(f"max_bytes must be >= 0, but was {value}.")
+        self._max_bytes = int(value)
+        self._evict()
+
+    @property
+    def n_bytes(self) -> int:
+        """Total size of the currently cached values in bytes."""
+        return self._n_bytes
+
+    @staticmethod
+    def _size_of(value) -> int:
+        try:
+            return int(value.nbytes)
+        except AttributeError:
+            return sys.getsizeof(value)
+
+    def get(self, key: typing.Hashable, default=None):
+        """
+        Return the value for key (and mark it as most recently used).
+
+        Parameters
+        ----------
+        key : typing.Hashable
+            The key.
+        default : optional
+            Returned if key is not cached, by default None.
+        """
+        try:
+            value, _ = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: typing.Hashable, value) -> None:
+        """
+        Cache value for key, evicting least recently used values if needed.
+
+        Parameters
+        ----------
+        key : typing.Hashable
+            The key.
+        value : typing.Any
+            The value, should not be modified while it is in the cache.
+        """
+        self.discard(key)
+        n_bytes = self._size_of(value)
+        if n_bytes > self._max_bytes:
+            # would evict everything else and then not fit anyway
+            return
+        self._data[key] = (value, n_bytes)
+        self._n_bytes += n_bytes
+        self._evict()
+
+    def discard(self, key: typing.Hashable) -> None:
+        """
+        Remove key from the cache (if it is cached).
+
+        Parameters
+        ----------
+        key : typing.Hashable
+            The key.
+        """
+        try:
+            _, n_bytes = self._data.pop(key)
+        except KeyError:
+            return
+        self._n_bytes -= n_bytes
+
+    def clear(self) -> None:
+        """Remove all cached values (the counters are kept)."""
+        self._data.clear()
+        self._n_bytes = 0
+
+    def _evict(self) -> None:
+        while self._n_bytes > self._max_bytes:
+            _, (_, n_bytes) = self._data.popitem(last=False)
+            self._n_bytes -= n_bytes
+            self.evictions += 1
+
+    def stats(self) -> "dict[str, int]":
+        """
+        Return the counters and current size of the cache.
+
+        Returns
+        -------
+        dict[str, int]
+            With keys "hits", "misses", "evictions", "n_entries", "n_bytes"
+            and "max_bytes".
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "n_entries": len(self._data),
+                "n_bytes": self._n_bytes,
+                "max_bytes": self._max_bytes,
+                }
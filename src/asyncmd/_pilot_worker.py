@@ -0,0 +1,215 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+Worker agent for pilot jobs, see :mod:`asyncmd.pilot`.
+
+This file is executed as a script (by path) inside the pilot allocations, it
+therefore only uses the python standard library and does not import asyncmd.
+It claims tasks from a file-based queue (a directory on a shared filesystem),
+runs them and writes out their results.
+
+The queue directory layout is:
+
+ - ``tasks/$TASKID.json`` : pending tasks, claimed by renaming them to
+ - ``running/$TASKID@$WORKERID.json`` : tasks currently running
+ - ``done/$TASKID.json`` : results (returncode and state) of finished tasks
+ - ``cancel/$TASKID`` : request to cancel the (running) task
+ - ``workers/$WORKERID`` : heartbeat file of every worker (mtime is updated)
+ - ``shutdown`` : if it exists all workers exit as soon as they are idle
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import time
+
+
+def _write_json_atomic(fname, data):
+    # write to a tmp file and rename, such that readers never see partial data
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_fname, fname)
+
+
+def _touch(fname):
+    with open(fname, "a"):
+        pass
+    os.utime(fname)
+
+
+class PilotWorker:
+    """Claim and run tasks from the queue directory until told to stop."""
+
+    def __init__(self, queue_dir, worker_id, walltime=None,
+                 idle_timeout=600., poll_interval=1.,
+                 heartbeat_interval=10.):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.worker_id = worker_id
+        self.start = time.time()
+        # walltime is the allocation time limit in seconds
+        self.deadline = (None if walltime is None
+                         else self.start + walltime)
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._last_heartbeat = 0
+        self.heartbeat_file = os.path.join(self.queue_dir, "workers",
+                                           worker_id)
+
+    def _path(self, *parts):
+        return os.path.join(self.queue_dir, *parts)
+
+    def heartbeat(self, force=False):
+        now = time.time()
+        if force or now - self._last_heartbeat >= self.heartbeat_interval:
+            _touch(self.heartbeat_file)
+            self._last_heartbeat = now
+
+    def claim_task(self):
+        """Claim the oldest pending task that fits in our remaining time."""
+        try:
+            fnames = sorted(f for f in os.listdir(self._path("tasks"))
+                            if f.endswith(".json"))
+        except FileNotFoundError:
+            return None, None
+        for fname in fnames:
+            task_id = fname[:-len(".json")]
+            try:
+                with open(self._path("tasks", fname), "r") as f:
+                    task = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue  # claimed by someone else (or removed)
+            if (self.deadline is not None and task.get("time") is not None
+                    and time.time() + task["time"] * 3600 > self.deadline):
+                # would not finish before our allocation ends
+                continue
+            running_fname = self._path("running",
+                                       f"{task_id}@{self.worker_id}.json")
+            try:
+                # rename is atomic, i.e. only one worker can succeed
+                os.rename(self._path("tasks", fname), running_fname)
+            except FileNotFoundError:
+                continue
+            return task_id, task
+        return None, None
+
+    def run_task(self, task_id, task):
+        """Run the task and return (returncode, state)."""
+        stdin = (open(os.path.join(task["workdir"], task["stdin"]), "rb")
+                 if task.get("stdin") is not None else subprocess.DEVNULL)
+        timeout = (None if task.get("time") is None
+                   else task["time"] * 3600)
+        env = os.environ.copy()
+        env["ASYNCMD_PILOT_TASK_ID"] = task_id
+        env["ASYNCMD_PILOT_WORKER_ID"] = self.worker_id
+        cancel_fname = self._path("cancel", task_id)
+        with open(task["stdout"], "wb") as out, \
+                open(task["stderr"], "wb") as err:
+            proc = subprocess.Popen(["bash", task["script"]],
+                                    cwd=task["workdir"], stdin=stdin,
+                                    stdout=out, stderr=err, env=env,
+                                    # own process group, such that we can
+                                    # kill everything the task started
+                                    start_new_session=True,
+                                    )
+            state = None
+            while proc.poll() is None:
+                self.heartbeat()
+                if os.path.exists(cancel_fname):
+                    state = "CANCELLED"
+                elif (timeout is not None
+                        and time.time() - self._task_start > timeout):
+                    state = "TIMEOUT"
+                if state is not None:
+                    os.killpg(proc.pid, signal.SIGTERM)
+                    try:
+                        proc.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                        proc.wait()
+                    break
+                time.sleep(self.poll_interval)
+        if stdin is not subprocess.DEVNULL:
+            stdin.close()
+        returncode = proc.returncode
+        if state is None:
+            state = "COMPLETED" if returncode == 0 else "FAILED"
+        else:
+            # SLURM also reports non-zero exit for canceled/timed out jobs
+            returncode = 1
+        return returncode, state
+
+    def run(self):
+        self.heartbeat(force=True)
+        last_active = time.time()
+        while True:
+            self.heartbeat()
+            if self.deadline is not None and time.time() >= self.deadline:
+                break
+            task_id, task = self.claim_task()
+            if task_id is None:
+                if (os.path.exists(self._path("shutdown"))
+                        or time.time() - last_active > self.idle_timeout):
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            self._task_start = time.time()
+            try:
+                returncode, state = self.run_task(task_id, task)
+            except Exception as e:  # e.g. a missing workdir
+                returncode, state = 1, f"FAILED ({e!r})"
+            _write_json_atomic(self._path("done", task_id + ".json"),
+                               {"returncode": returncode,
+                                "state": state,
+                                "worker": self.worker_id,
+                                "start": self._task_start,
+                                "end": time.time(),
+                                })
+            try:
+                os.remove(self._path("running",
+                                     f"{task_id}@{self.worker_id}.json"))
+            except FileNotFoundError:
+                pass
+            last_active = time.time()
+        try:
+            os.remove(self.heartbeat_file)
+        except FileNotFoundError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="asyncmd pilot worker")
+    parser.add_argument("queue_dir")
+    parser.add_argument("worker_id")
+    parser.add_argument("--walltime", type=float, default=None,
+                        help="Allocation time limit in seconds.")
+    parser.add_argument("--idle-timeout", type=float, default=600.)
+    parser.add_argument("--poll-interval", type=float, default=1.)
+    parser.add_argument("--heartbeat-interval", type=float, default=10.)
+    args = parser.parse_args(argv)
+    worker = PilotWorker(queue_dir=args.queue_dir,
+                         worker_id=args.worker_id,
+                         walltime=args.walltime,
+                         idle_timeout=args.idle_timeout,
+                         poll_interval=args.poll_interval,
+                         heartbeat_interval=args.heartbeat_interval,
+                         )
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+A bounded semaphore with priority classes, per-class caps and reservations.
+
+Used as ``_SEMAPHORES["SLURM_MAX_JOB"]``, such that e.g. the (cheap) CV
+evaluations of :class:`asyncmd.trajectory.functionwrapper.SlurmTrajectoryFunctionWrapper`
+do not starve behind the mdrun jobs of :class:`asyncmd.gromacs.SlurmGmxEngine`,
+see :func:`asyncmd.config.set_slurm_max_jobs`.
+"""
+import asyncio
+import collections
+import itertools
+import typing
+
+
+class PrioritySemaphore:
+    """
+    Bounded semaphore handing out its slots by priority class.
+
+    Waiters of a class with higher priority are served first, waiters with the
+    same priority in the order they started waiting (FIFO). Every class can
+    additionally be capped (it never holds more than its cap) and have slots
+    reserved (which only it can use), such that e.g. CV jobs can always run
+    even if mdrun jobs would fill all slots. Calling :meth:`acquire` and
+    :meth:`release` without a class uses ``default_class``, i.e. it can be
+    used as a drop-in replacement for ``asyncio.BoundedSemaphore``.
+    """
+
+    def __init__(self, value: int,
+                 priorities: typing.Optional["dict[str, int]"] = None,
+                 max_per_class: typing.Optional["dict[str, int]"] = None,
+                 reserved_per_class: typing.Optional["dict[str, int]"] = None,
+                 default_class: str = "default",
+                 ) -> None:
+        """
+        Initialize a `PrioritySemaphore`.
+
+        Parameters
+        ----------
+        value : int
+            Total number of slots.
+        priorities : dict[str, int], optional
+            Priority for every class (higher is served first), classes not in
+            it have priority 0, by default None (all classes have priority 0).
+        max_per_class : dict[str, int], optional
+            Maximum number of slots held by every class, classes not in it are
+            only limited by value, by default None.
+        reserved_per_class : dict[str, int], optional
+            Number of slots reserved for every class, i.e. slots other classes
+            can not use, by default None.
+        default_class : str, optional
+            The class used if none is given, by default "default".
+
+        Raises
+        ------
+        ValueError
+            If value is smaller than one or the reservations exceed value.
+        """
+        if value < 1:
+            raise ValueError(f"value must be >= 1, but was {value}.")
+        self._value = value
+        self.priorities = dict(priorities or {})
+        self.max_per_class = dict(max_per_class or {})
+        self.reserved_per_class = dict(reserved_per_class or {})
+        if sum(self.reserved_per_class.values()) > value:
+            raise ValueError("The reserved slots "
+                             + f"({sum(self.reserved_per_class.values())}) "
+                             + f"exceed the total number of slots ({value}).")
+        self.default_class = default_class
+        self._in_use = collections.Counter()
+        # waiters are lists [-priority, count, job_class, future], such that
+        # sorting them gives the order in which we serve them
+        self._waiters = []
+        self._counter = itertools.count()
+
+    def __repr__(self) -> str:
+        return (f"<{type(self).__name__} value={self._value} "
+                + f"in_use={dict(self._in_use)} waiters={len(self._waiters)}>")
+
+    @property
+    def in_use(self) -> "dict[str, int]":
+        """Number of slots held by every class."""
+        return {job_class: n for job_class, n in self._in_use.items() if n > 0}
+
+    def waiting(self) -> "dict[str, int]":
+        """
+        Return the number of waiters for every class.
+
+        Returns
+        -------
+        dict[str, int]
+            Keys are the classes, values the number of waiting acquirers.
+        """
+        return dict(collections.Counter(w[2] for w in self._waiters
+                                        if not w[3].done()))
+
+    def _can_acquire(self, job_class: str) -> bool:
+        total = sum(self._in_use.values())
+        if total >= self._value:
+            return False
+        cap = self.max_per_class.get(job_class, None)
+        if cap is not None and self._in_use[job_class] >= cap:
+            return False
+        # slots still reserved for (and not used by) the other classes
+        reserved_for_others = sum(max(n - self._in_use[other], 0)
+                                  for other, n in self.reserved_per_class.items()
+                                  if other != job_class)
+        return self._value - total - reserved_for_others > 0
+
+    def locked(self, job_class: typing.Optional[str] = None) -> bool:
+        """
+        Return True if `acquire` would not return immediately for job_class.
+
+        Parameters
+        ----------
+        job_class : str, optional
+            The class, by default None, which results in ``default_class``.
+        """
+        if job_class is None:
+            job_class = self.default_class
+        return not self._can_acquire(job_class)
+
+    async def acquire(self, job_class: typing.Optional[str] = None) -> bool:
+        """
+        Acquire a slot for job_class, wait until one is free if necessary.
+
+        Parameters
+        ----------
+        job_class : str, optional
+            The class, by default None, which results in ``default_class``.
+
+        Returns
+        -------
+        bool
+            True (as ``asyncio.Semaphore.acquire``).
+        """
+        if job_class is None:
+            job_class = self.default_class
+        fut = asyncio.get_running_loop().create_future()
+        waiter = [-self.priorities.get(job_class, 0), next(self._counter),
+                  job_class, fut]
+        self._waiters.append(waiter)
+        self._wake_up()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # we got a slot but got canceled before we could use it
+                self._in_use[job_class] -= 1
+                self._wake_up()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass  # removed by _wake_up
+        return True
+
+    def release(self, job_class: typing.Optional[str] = None) -> None:
+        """
+        Release a slot held by job_class.
+
+        Parameters
+        ----------
+        job_class : str, optional
+            The class, by default None, which results in ``default_class``.
+
+        Raises
+        ------
+        ValueError
+            If job_class does not hold any slot.
+        """
+        if job_class is None:
+            job_class = self.default_class
+        if self._in_use[job_class] <= 0:
+            raise ValueError(f"PrioritySemaphore released too many times for "
+                             + f"class {job_class}.")
+        self._in_use[job_class] -= 1
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        # hand out free slots to the waiters in priority (then FIFO) order,
+        # waiters that can not acquire (because of their caps or the
+        # reservations) do not block the ones behind them
+        self._waiters.sort(key=lambda w: (w[0], w[1]))
+        for waiter in list(self._waiters):
+            job_class, fut = waiter[2], waiter[3]
+            if fut.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._can_acquire(job_class):
+                self._in_use[job_class] += 1
+                fut.set_result(True)
+                self._waiters.remove(waiter)
@@ -20,6 +20,8 @@ import typing
 
 
 from ._config import _GLOBALS, _SEMAPHORES
+from ._priority_semaphore import PrioritySemaphore
+from ._lru_cache import ByteBoundedLRUCache
 from .slurm import set_slurm_settings, set_all_slurm_settings
 # TODO: Do we want to set the _GLOBALS defaults here? E.g. CACHE_TYPE="npz"?
 
@@ -128,21 +130,54 @@ set_max_files_open()
 # otherwise we can use an unlimited number of syncronous slurm-jobs
 # (if the simulation requires that much)
 # TODO: document that somewhere, bc usually clusters have a job number limit?!
-def set_slurm_max_jobs(num: typing.Union[int, None]):
+def set_slurm_max_jobs(num: typing.Union[int, None],
+                       priorities: typing.Optional["dict[str, int]"] = None,
+                       max_jobs_per_class: typing.Optional["dict[str, int]"] = None,
+                       reserved_jobs_per_class: typing.Optional["dict[str, int]"] = None,
+                       ):
     """
     Set the maximum number of simultaneously submitted SLURM jobs.
 
+    The jobs are submitted by job class, by default the mdrun jobs of
+    :class:`asyncmd.gromacs.SlurmGmxEngine` are in class "mdrun" and the jobs
+    of :class:`asyncmd.trajectory.functionwrapper.SlurmTrajectoryFunctionWrapper`
+    in class "trajectory_function" (see their ``slurm_job_class`` attribute).
+    If all slots are taken, the next free slot goes to the waiting job of the
+    class with the highest priority (and within a class to the one that waits
+    the longest).
+
     Parameters
     ----------
     num : int or None
         The maximum number of simultaneous SLURM jobs for this invocation of
         python/asyncmd. `None` means do not limit the maximum number of jobs.
+    priorities : dict[str, int], optional
+        Priority for every job class, higher is served first, classes not in
+        it have priority 0. By default None, which results in
+        ``{"trajectory_function": 1}``, i.e. (the usually short) CV
+        evaluations, which decide if MD runs should continue, are not starved
+        by waiting mdrun jobs.
+    max_jobs_per_class : dict[str, int], optional
+        Maximum number of simultaneous SLURM jobs of every job class, by
+        default None (only limited by num).
+    reserved_jobs_per_class : dict[str, int], optional
+        Number of slots (out of num) reserved for every job class, i.e. slots
+        only jobs of that class can use, e.g. ``{"trajectory_function": 2}``
+        makes sure two CV jobs can always run even if mdrun jobs would take
+        all slots. By default None (no reservations).
     """
     global _SEMAPHORES
     if num is None:
         _SEMAPHORES["SLURM_MAX_JOB"] = None
     else:
-        _SEMAPHORES["SLURM_MAX_JOB"] = asyncio.BoundedSemaphore(num)
+        if priorities is None:
+            priorities = {"trajectory_function": 1}
+        _SEMAPHORES["SLURM_MAX_JOB"] = PrioritySemaphore(
+                                value=num,
+                                priorities=priorities,
+                                max_per_class=max_jobs_per_class,
+                                reserved_per_class=reserved_jobs_per_class,
+                                                         )
 
 
 set_slurm_max_jobs(num=None)
@@ -159,7 +194,7 @@ def set_default_trajectory_cache_type(cache_type: str):
     Parameters
     ----------
     cache_type : str
-        One of "h5py", "npz", "memory".
+        One of "h5py", "sqlite", "npz", "memory".
 
     Raises
     ------
@@ -167,7 +202,7 @@ def set_default_trajectory_cache_type(cache_type: str):
         Raised if ``cache_type`` is not one of the allowed values.
     """
     global _GLOBALS
-    allowed_values = ["h5py", "npz", "memory"]
+    allowed_values = ["h5py", "sqlite", "npz", "memory"]
     cache_type = cache_type.lower()
     if cache_type not in allowed_values:
         raise ValueError(f"Given cache type must be one of {allowed_values}."
@@ -175,6 +210,62 @@ def set_default_trajectory_cache_type(cache_type: str):
     _GLOBALS["TRAJECTORY_FUNCTION_CACHE_TYPE"] = cache_type
 
 
+def set_trajectory_cache_lru_size(max_bytes: int):
+    """
+    Set the size of the in-memory tier in front of the persistent caches.
+
+    Values read from (or written to) the persistent caches (cache types
+    "h5py", "sqlite" and "npz") are also kept in a process-wide
+    least-recently-used cache, such that repeatedly querying the same
+    function values (e.g. the conditions in
+    :meth:`asyncmd.trajectory.ConditionalTrajectoryPropagator.cut_and_concatenate`)
+    does not reopen the npz file or read from the h5py file or the sqlite
+    database every time. Once the cached values exceed max_bytes the least
+    recently used are evicted. Trajectories with cache type "memory" do not
+    use it (they already hold all values in memory). By default the budget
+    is 256 MiB.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size of the values kept in memory in bytes, zero
+        disables the in-memory tier (and drops all values held by it).
+
+    Raises
+    ------
+    ValueError
+        If max_bytes is negative.
+    """
+    global _GLOBALS
+    try:
+        lru_cache = _GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"]
+    except KeyError:
+        _GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"] = ByteBoundedLRUCache(
+                                                        max_bytes=max_bytes,
+                                                                        )
+    else:
+        # keep the cached values (as far as they fit) and the counters
+        lru_cache.max_bytes = max_bytes
+
+
+set_trajectory_cache_lru_size(max_bytes=256 * 1024**2)
+
+
+def get_trajectory_cache_lru_stats() -> "dict[str, int]":
+    """
+    Return the counters and size of the in-memory tier of the caches.
+
+    See :func:`set_trajectory_cache_lru_size`.
+
+    Returns
+    -------
+    dict[str, int]
+        With keys "hits", "misses", "evictions", "n_entries", "n_bytes" and
+        "max_bytes".
+    """
+    return _GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"].stats()
+
+
 def register_h5py_cache(h5py_group, make_default: bool = False):
     """
     Register a h5py file or group for CV value caching.
@@ -201,3 +292,56 @@ def register_h5py_cache(h5py_group, make_default: bool = False):
     if make_default:
         set_default_trajectory_cache_type(cache_type="h5py")
     _GLOBALS["H5PY_CACHE"] = h5py_group
+
+
+def register_sqlite_cache(fname: str, make_default: bool = False):
+    """
+    Register a sqlite database file for CV value caching.
+
+    The values for all trajectories are stored in this one file (keyed by
+    trajectory hash and function id), instead of in one npz file next to
+    every trajectory, which is much easier on the metadata servers of
+    network/parallel filesystems. The database is created if it does not
+    exist and uses write-ahead logging, such that multiple asyncmd processes
+    on the same node can use it concurrently (register it in every process).
+    Note that write-ahead logging needs shared memory, i.e. processes on
+    different nodes should not use the same database file.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the database file.
+    make_default: bool,
+        Whether we should also make "sqlite" the default trajectory function
+        cache type. By default False.
+    """
+    global _GLOBALS
+    if make_default:
+        set_default_trajectory_cache_type(cache_type="sqlite")
+    _GLOBALS["SQLITE_CACHE"] = os.path.abspath(fname)
+
+
+def migrate_h5py_cache(h5py_group) -> int:
+    """
+    Migrate all cached values in a h5py file or group to the current layout.
+
+    Caches written by older versions of asyncmd store the function values by
+    index, such that every lookup has to read all stored function ids. They
+    are migrated automatically (per trajectory) when the values of a
+    trajectory are first accessed, use this function to migrate all
+    trajectories at once (e.g. before opening the file read-only).
+
+    Parameters
+    ----------
+    h5py_group : h5py.Group or h5py.File
+        The file or group used for caching, see :func:`register_h5py_cache`.
+        Must be writeable.
+
+    Returns
+    -------
+    int
+        The number of migrated trajectories.
+    """
+    # import here to not import the trajectory module (and numpy) on import
+    from .trajectory.trajectory import TrajectoryFunctionValueCacheH5PY
+    return TrajectoryFunctionValueCacheH5PY.migrate(h5py_cache=h5py_group)
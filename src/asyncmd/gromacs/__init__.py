@@ -12,5 +12,25 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
-from .mdconfig import MDP
-from .mdengine import GmxEngine, SlurmGmxEngine
+import importlib as _importlib
+
+
+# NOTE: imported on first access, such that e.g. the MDP class can be used
+#       without importing the engines (and MDAnalysis)
+_LAZY_ATTRIBUTES = {"MDP": ".mdconfig",
+                    "GmxEngine": ".mdengine",
+                    "SlurmGmxEngine": ".mdengine",
+                    }
+# __all__ is needed for `import *` to also find the not yet imported names
+__all__ = [name for name in _LAZY_ATTRIBUTES if not name.startswith("_")]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = _importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
 import os
+import re
 import copy
 import shlex
 import random
@@ -28,9 +29,15 @@ import aiofiles.ospath
 from .._config import _SEMAPHORES
 from ..mdengine import MDEngine, EngineError, EngineCrashedError
 from ..trajectory.trajectory import Trajectory
+from ..trajectory.convert import TrajectoryConcatenator
 from .. import slurm
+from .. import pilot
 from .mdconfig import MDP
-from .utils import nstout_from_mdp, get_all_traj_parts
+from .utils import (nstout_from_mdp, get_all_traj_parts,
+                    mdrun_performance_from_log,
+                    last_checkpoint_step_from_log,
+                    checkpoint_steps_from_log,
+                    )
 from ..tools import ensure_executable_available
 
 
@@ -212,6 +219,12 @@ class GmxEngine(MDEngine):
         self._deffnm = None
         # tpr for trajectory (part), will become the structure/topology file
         self._tpr = None
+        # performance of the last part as reported by mdrun
+        self._performance = None
+        # trajectory files of previous segments of the current part, e.g. if
+        # the SlurmGmxEngine had to resubmit a preempted mdrun, which then
+        # continued from the checkpoint in a new gromacs part
+        self._part_segments = []
 
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -249,13 +262,16 @@ class GmxEngine(MDEngine):
             # self._tpr and self._deffnm are set in prepare, i.e. having them
             # set makes sure that we have at least prepared running the traj
             # but it might not be done yet
+            traj_file = os.path.join(
+                                self.workdir,
+                                (f"{self._deffnm}"
+                                 + f"{self._num_suffix(self._simulation_part)}"
+                                 + f".{self.output_traj_type}")
+                                     )
             traj = Trajectory(
-                    trajectory_files=os.path.join(
-                                        self.workdir,
-                                        (f"{self._deffnm}"
-                                         + f"{self._num_suffix(self._simulation_part)}"
-                                         + f".{self.output_traj_type}")
-                                                 ),
+                    trajectory_files=(self._part_segments + [traj_file]
+                                      if len(self._part_segments) > 0
+                                      else traj_file),
                     # NOTE: self._tpr already contains the path to workdir
                     structure_file=self._tpr,
                     nstout=self.nstout,
@@ -390,6 +406,43 @@ class GmxEngine(MDEngine):
         """
         return self._frames_done
 
+    @property
+    def performance(self):
+        """
+        Performance of the last trajectory part as reported by mdrun.
+
+        Dictionary with keys "ns_per_day", "hours_per_ns" and
+        "steps_per_hour", None if not known (yet).
+        """
+        if self._performance is None:
+            return None
+        return self._performance.copy()
+
+    @property
+    def steps_per_hour(self):
+        """Integration steps per hour for the last trajectory part (or None)."""
+        if self._performance is None:
+            return None
+        return self._performance["steps_per_hour"]
+
+    async def _update_performance(self):
+        # parse the performance from the log of the current simulation part
+        log_file = os.path.join(self.workdir,
+                                (f"{self._deffnm}"
+                                 + f"{self._num_suffix(self._simulation_part)}"
+                                 + ".log")
+                                )
+        try:
+            dt = self.dt
+        except KeyError:
+            dt = 0.001  # not set in the mdp, so it is the gromacs default
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            performance = await mdrun_performance_from_log(log_file=log_file,
+                                                           dt=dt)
+        if performance is not None:
+            # keep the last known value if mdrun did not report it
+            self._performance = performance
+
     async def apply_constraints(self, conf_in, conf_out_name, wdir="."):
         """
         Apply constraints to given configuration.
@@ -511,7 +564,7 @@ class GmxEngine(MDEngine):
             stdout, stderr = await self._proc.communicate()
             returncode = self._proc.returncode
         except asyncio.CancelledError:
-            self._proc.kill()
+            await self._kill_gmx_mdrun()
             raise  # reraise the error for encompassing coroutines
         else:
             if returncode != 0:
@@ -621,6 +674,7 @@ class GmxEngine(MDEngine):
                                f"{self._tpr} does not seem to be a file.")
         # make sure we can not mistake a previous Popen for current mdrun
         self._proc = None
+        self._part_segments = []
         self._frames_done = 0  # (re-)set how many frames we did
         self._steps_done = 0
         self._time_done = 0.
@@ -715,11 +769,15 @@ class GmxEngine(MDEngine):
         self._steps_done = previous_trajs[-1].last_step
         self._time_done = previous_trajs[-1].last_time
         self._proc = None
+        self._part_segments = []
+        # get the performance of the last part (if we did not know it yet)
+        await self._update_performance()
         self._prepared = True
 
     # NOTE: this enables us to reuse run and prepare methods in SlurmGmxEngine,
     # i.e. we only need to overwite the next 3 functions to write out the slurm
     # submission script, submit the job and allocate/release different resources
+    # (and _wait_gmx_mdrun to e.g. resubmit preempted jobs)
     async def _start_gmx_mdrun(self, cmd_str, workdir, **kwargs):
         proc = await asyncio.create_subprocess_exec(
                                             *shlex.split(cmd_str),
@@ -729,6 +787,11 @@ class GmxEngine(MDEngine):
                                                     )
         self._proc = proc
 
+    async def _wait_gmx_mdrun(self, **kwargs):
+        # wait for the mdrun started by _start_gmx_mdrun (in run), returns
+        # stdout and stderr
+        return await self._proc.communicate()
+
     async def _acquire_resources_gmx_mdrun(self, **kwargs):
         # *always* called before any gmx_mdrun, used to reserve resources
         # for local gmx we need 3 file descriptors: stdin, stdout, stderr
@@ -740,6 +803,11 @@ class GmxEngine(MDEngine):
         # release the semaphore for the 3 file descriptors
         _SEMAPHORES["MAX_FILES_OPEN"].release()
 
+    async def _kill_gmx_mdrun(self, **kwargs):
+        # called when we get canceled while gmx_mdrun runs (before cleanup)
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+
     async def run(self, nsteps=None, walltime=None, steps_per_part=False):
         """
         Run simulation for specified number of steps or/and a given walltime.
@@ -787,6 +855,7 @@ class GmxEngine(MDEngine):
                                  + "time...")
 
         self._simulation_part += 1
+        self._part_segments = []
         cmd_str = self._mdrun_cmd(tpr=self._tpr, workdir=self.workdir,
                                   deffnm=self._deffnm,
                                   # TODO: use more/any other kwargs?
@@ -800,10 +869,14 @@ class GmxEngine(MDEngine):
             await self._start_gmx_mdrun(cmd_str=cmd_str, workdir=self.workdir,
                                         walltime=walltime,)
             # self._proc is set by _start_gmx_mdrun!
-            stdout, stderr = await self._proc.communicate()
+            stdout, stderr = await self._wait_gmx_mdrun(cmd_str=cmd_str,
+                                                        workdir=self.workdir,
+                                                        walltime=walltime,
+                                                        nsteps=nsteps,
+                                                        )
             returncode = self._proc.returncode
         except asyncio.CancelledError:
-            self._proc.kill()
+            await self._kill_gmx_mdrun()
             raise  # reraise the error for encompassing coroutines
         else:
             #logger.debug(f"gmx mdrun stdout: {stdout.decode()}")
@@ -814,6 +887,7 @@ class GmxEngine(MDEngine):
                 # we will only find out with the next trajectory part anyways
                 self._steps_done = self.current_trajectory.last_step
                 self._time_done = self.current_trajectory.last_time
+                await self._update_performance()
                 return self.current_trajectory
             else:
                 raise EngineCrashedError(
@@ -935,8 +1009,9 @@ class SlurmGmxEngine(GmxEngine):
     # we reuse the `GmxEngine._proc` to keep a reference to a `SlurmProcess`
     # which emulates the API of `asyncio.subprocess.Process` and can (for our
     # purposes) be used as a drop-in replacement, therefore we only need to
-    # reimplement `_start_gmx_mdrun()`, `_acquire_resources_gmx_mdrun()` and
-    # `_cleanup_gmx_mdrun()` to have a working SlurmGmxEngine
+    # reimplement `_start_gmx_mdrun()`, `_acquire_resources_gmx_mdrun()`,
+    # `_cleanup_gmx_mdrun()` and `_kill_gmx_mdrun()` to have a working
+    # SlurmGmxEngine
     # take submit script as str/file, use pythons .format to insert stuff!
     # TODO: use SLURM also for grompp?! (would make stuff faster?)
     #       I (hejung) think probably not by much because we already use
@@ -960,8 +1035,40 @@ class SlurmGmxEngine(GmxEngine):
     #       due to reaching the maximum time limit in slurm. This in turn means
     #       that we would believe the job failed because it got cancelled
     #       although the mdrun was successfull.
+    presubmit_next_part = False
+    presubmit_steps_margin = 1.2
+    # NOTE: If True, we submit the next part (with the same mdrun command and
+    #       walltime) directly after submitting a part, with a SLURM dependency
+    #       on the successful completion of the current part. The next part
+    #       then starts from the checkpoint without waiting for us to notice
+    #       that the current part finished and without queueing again.
+    #       We only do so if the next part will be needed, i.e. when running
+    #       for a total number of steps (counted since `prepare`) and the steps
+    #       remaining after the current part starts are more than
+    #       presubmit_steps_margin times the steps the current part can do in
+    #       its walltime (according to the performance of the last part).
+    max_resubmits_per_part = 3
+    resubmit_slurm_states = ["PREEMPTED", "TIMEOUT", "NODE_FAIL", "BOOT_FAIL"]
+    # NOTE: mdrun jobs ending in one of the resubmit_slurm_states are
+    #       transparently resubmitted (at most max_resubmits_per_part times per
+    #       part) and continue from the last checkpoint. We then also submit
+    #       with --no-requeue, such that SLURM never restarts a preempted (or
+    #       node-failed) job behind our back (and we are the only ones
+    #       resubmitting), i.e. all states in which SLURM would requeue a job
+    #       must be in resubmit_slurm_states.
+    slurm_job_class = "mdrun"
+    # NOTE: the class our mdrun jobs have for the SLURM_MAX_JOB budget, see
+    #       `asyncmd.config.set_slurm_max_jobs`
+    slurm_partitions = []
+    slurm_qos = []
+    # NOTE: candidate SLURM partitions/QOS for the mdrun jobs, if more than one
+    #       combination is given, every part is submitted to the one with the
+    #       shortest expected queue wait, see
+    #       `asyncmd.slurm.SlurmProcess.choose_partition_qos`. Empty lists
+    #       mean we use what the sbatch script (or the cluster default) says.
 
     def __init__(self, mdconfig, gro_file, top_file, sbatch_script, ndx_file=None,
+                 pilot_executor: typing.Optional[pilot.PilotJobExecutor] = None,
                  **kwargs):
         """
         Initialize a :class:`SlurmGmxEngine`.
@@ -984,11 +1091,52 @@ class SlurmGmxEngine(GmxEngine):
 
         ndx_file: str or None
             Optional, absolute or relative path to a gromacs index file.
+        pilot_executor: asyncmd.pilot.PilotJobExecutor or None
+            Optional, if given the mdrun script is run by the workers of the
+            pilot executor (inside their allocations) instead of being
+            submitted as a separate SLURM job. Note that the script is then run
+            with bash, i.e. all ``#SBATCH`` options are ignored.
 
         Note that all attributes can be set at intialization by passing keyword
         arguments with their name, e.g. mdrun_extra_args="-ntomp 2" to instruct
         gromacs to use 2 openMP threads.
+        Setting presubmit_next_part=True makes the engine submit the next
+        trajectory part with ``--dependency=afterok:<jobid of current part>``
+        as soon as the current part is submitted, if the next part is needed
+        for sure, i.e. if `run` is called with a total number of steps (and a
+        walltime) and the current part can not do all remaining steps in its
+        walltime (see presubmit_steps_margin). The presubmitted part is used
+        by the next call to `run` (if it uses the same walltime) and canceled
+        if the current part fails or if no further part is requested, see
+        :meth:`cancel_presubmitted_part`.
+        A part whose SLURM job ends in one of the resubmit_slurm_states (by
+        default "PREEMPTED", "TIMEOUT", "NODE_FAIL" and "BOOT_FAIL") is
+        resubmitted from the last checkpoint (at most max_resubmits_per_part
+        times) and `run` returns the complete (logical) part, i.e. a
+        trajectory made up of all gromacs parts (with the frames after the
+        last checkpoint of interrupted parts removed).
+        Passing lists of candidate partitions and/or QOS values as
+        slurm_partitions and slurm_qos, e.g. slurm_partitions=["gpu",
+        "gpu-long"], makes the engine submit every part to the candidate with
+        the shortest expected queue wait.
+        The mdrun jobs count towards the SLURM_MAX_JOB budget as job class
+        slurm_job_class (by default "mdrun"), see
+        :func:`asyncmd.config.set_slurm_max_jobs`.
         """
+        self.pilot_executor = pilot_executor
+        # SlurmProcess of an in-flight mdrun found in the journal by
+        # prepare_from_files, reused by the next call to run
+        self._reattach_proc = None
+        # the presubmitted next part (if any), together with the mdrun command
+        # and walltime it was submitted with and the SLURM_MAX_JOB semaphore
+        # we hold for it (if any)
+        self._presubmitted_proc = None
+        self._presubmitted_cmd = None
+        self._presubmitted_walltime = None
+        self._presubmitted_sem = None
+        # total number of steps (since prepare) requested in the current call
+        # to run, None if not known (then we never presubmit)
+        self._nsteps_total = None
         super().__init__(mdconfig=mdconfig, gro_file=gro_file,
                          top_file=top_file, ndx_file=ndx_file, **kwargs)
         # we expect sbatch_script to be a str,
@@ -1001,6 +1149,122 @@ class SlurmGmxEngine(GmxEngine):
                 sbatch_script = f.read()
         self.sbatch_script = sbatch_script
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        # the executor (with its futures and tasks) is tied to this session
+        state["pilot_executor"] = None
+        state["_reattach_proc"] = None
+        # NOTE: we can not cancel the presubmitted part here, it will just
+        #       fail to start after the current part or be reattached to
+        #       through the journal
+        state["_presubmitted_proc"] = None
+        state["_presubmitted_cmd"] = None
+        state["_presubmitted_walltime"] = None
+        state["_presubmitted_sem"] = None
+        if isinstance(self._proc, pilot.PilotProcess):
+            state["_proc"] = None
+        return state
+
+    async def prepare_from_files(self, workdir: str, deffnm: str):
+        """
+        Prepare continuation run starting from the last part found in workdir.
+
+        Expects the checkpoint file and last trajectory part to exist, will
+        (probably) fail otherwise.
+        If the SLURM journal (see :func:`asyncmd.config.set_slurm_settings`)
+        contains a (running or successfully finished) mdrun job for the next
+        part (or the last part), e.g. because the previous python process died
+        while the job was running, the next call to `run` will reattach to
+        this job instead of submitting a new one.
+
+        Parameters
+        ----------
+        workdir : str
+            Absolute or relative path to an exisiting directory to use as
+            working directory.
+        deffnm : str
+            The name (prefix) to use for all files.
+        """
+        await super().prepare_from_files(workdir=workdir, deffnm=deffnm)
+        self._reattach_proc = None
+        await self.cancel_presubmitted_part()
+        mediator = slurm.SlurmProcess._slurm_cluster_mediator
+        if (mediator is None or mediator.journal_file is None
+                or self.pilot_executor is not None):
+            return
+        # the in-flight part might have already written (parts of) its
+        # trajectory, then it is the last part we found
+        for part in [self._simulation_part + 1, self._simulation_part]:
+            name = deffnm + self._num_suffix(sim_part=part)
+            jobids = mediator.find_journaled_jobs(jobname=name,
+                                                  workdir=self.workdir)
+            if len(jobids) == 0:
+                continue
+            proc = await slurm.reattach_slurmprocess(jobid=jobids[-1])
+            if proc.returncode not in [None, 0]:
+                # failed, we will just run it again
+                continue
+            if part == self._simulation_part:
+                # do not count the (partial) trajectory as done
+                previous_trajs = (await get_all_traj_parts(
+                                            self.workdir, deffnm=deffnm,
+                                            traj_type=self.output_traj_type,
+                                                           ))[:-1]
+                self._frames_done = sum(len(t) for t in previous_trajs)
+                if len(previous_trajs) > 0:
+                    self._steps_done = previous_trajs[-1].last_step
+                    self._time_done = previous_trajs[-1].last_time
+                else:
+                    self._steps_done = 0
+                    self._time_done = 0.
+            self._simulation_part = part - 1
+            self._reattach_proc = proc
+            logger.info("Found SLURM job %s for part %s in journal, reattaching"
+                        " to it in the next call to run.",
+                        proc.slurm_jobid, part)
+            break
+
+    async def backfill_walltime(self, walltimes: "list[float]",
+                                max_start_delay: float = 60.,
+                                ) -> typing.Union[float, None]:
+        """
+        Find the longest of the given walltimes that would start right away.
+
+        Probes the current SLURM backfill window with our sbatch script, see
+        :func:`asyncmd.slurm.find_backfill_walltime`. Nothing is submitted.
+
+        Parameters
+        ----------
+        walltimes : list[float]
+            The candidate walltimes in hours.
+        max_start_delay : float, optional
+            Maximum delay (in seconds) between now and the expected start for a
+            job to count as starting right away, by default 60.
+
+        Returns
+        -------
+        float or None
+            The longest fitting walltime or None if none fits (or if we run via
+            a pilot executor, which does not need SLURM to schedule the parts).
+        """
+        if self.pilot_executor is not None or len(walltimes) == 0:
+            return None
+        name = self._deffnm + ".backfill_probe"
+        fname = os.path.join(self.workdir, name + ".slurm")
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            async with aiofiles.open(fname, 'w') as f:
+                await f.write(self.sbatch_script.format(mdrun_cmd="true"))
+        try:
+            return await slurm.find_backfill_walltime(
+                                            sbatch_script=fname,
+                                            workdir=self.workdir,
+                                            walltimes=walltimes,
+                                            jobname=name,
+                                            max_start_delay=max_start_delay,
+                                                      )
+        finally:
+            await aiofiles.os.remove(fname)
+
     def _name_from_name_or_none(self, run_name: typing.Optional[str]) -> str:
         if run_name is not None:
             name = run_name
@@ -1009,9 +1273,124 @@ class SlurmGmxEngine(GmxEngine):
             name = self._deffnm + self._num_suffix(sim_part=self._simulation_part)
         return name
 
-    async def _start_gmx_mdrun(self, cmd_str, workdir, walltime=None,
-                               run_name=None, **kwargs):
-        name = self._name_from_name_or_none(run_name=run_name)
+    async def run(self, nsteps=None, walltime=None, steps_per_part=False):
+        self._nsteps_total = (int(nsteps)
+                              if nsteps is not None and not steps_per_part
+                              else None)
+        traj = await super().run(nsteps=nsteps, walltime=walltime,
+                                 steps_per_part=steps_per_part)
+        if (nsteps is not None and not steps_per_part
+                and self.steps_done >= nsteps):
+            # we are done, i.e. the next part will never be requested
+            await self.cancel_presubmitted_part()
+        return traj
+
+    run.__doc__ = GmxEngine.run.__doc__
+
+    async def cancel_presubmitted_part(self) -> None:
+        """
+        Cancel the presubmitted next trajectory part (if any).
+
+        This is done automatically if the current part fails and when a run
+        with nsteps counted since the last `prepare` reached its nsteps. It
+        should be called when no further part will be requested, e.g. when
+        stopping a propagation on a condition (the propagators in
+        :mod:`asyncmd.trajectory.propagate` do that).
+
+        If the presubmitted part already started, we wait until it ended,
+        remove its output files and restore the checkpoint of the current
+        part (mdrun replaces it with its own when it writes a checkpoint).
+
+        Raises
+        ------
+        EngineError
+            If the presubmitted part wrote more than one checkpoint, i.e. if
+            the checkpoint of the current part can not be restored. The
+            outputs of the canceled part are kept in that case, such that the
+            trajectory can be continued from them (using `prepare_from_files`).
+        """
+        proc = self._presubmitted_proc
+        if proc is None:
+            return
+        cmd_str = self._presubmitted_cmd
+        self._presubmitted_proc = None
+        self._presubmitted_cmd = None
+        self._presubmitted_walltime = None
+        mediator = proc.slurm_cluster_mediator
+        started = False
+        if proc.returncode is None:
+            try:
+                # nobody waits for the presubmitted part, i.e. the state
+                # cached by proc is not necessarily up to date
+                info = await mediator.get_info_for_job(jobid=proc.slurm_jobid)
+            except KeyError:
+                # not monitored anymore
+                info = {"state": None}
+            started = info["state"] not in [None, "PENDING"]
+            try:
+                await proc.terminate_async()
+            except slurm.SlurmError as e:
+                logger.warning("Could not cancel presubmitted part %s (%s).",
+                               proc.slurm_jobid, e)
+        if self._presubmitted_sem is not None:
+            self._presubmitted_sem.release(self.slurm_job_class)
+            self._presubmitted_sem = None
+        log_file = os.path.join(proc.workdir, proc.jobname + ".log")
+        try:
+            if started or await aiofiles.ospath.exists(log_file):
+                await self._clean_up_canceled_part(proc=proc, cmd_str=cmd_str,
+                                                   mediator=mediator)
+        finally:
+            try:
+                await aiofiles.os.remove(os.path.join(proc.workdir,
+                                                      proc.jobname + ".slurm"))
+            except FileNotFoundError:
+                pass
+
+    async def _clean_up_canceled_part(self, proc, cmd_str, mediator) -> None:
+        # wait until the canceled (but started) part is gone, mdrun writes a
+        # checkpoint when it gets the SIGTERM from scancel
+        jobid = proc.slurm_jobid
+        mediator.monitor_register_job(jobid=jobid)
+        try:
+            info = await mediator.get_info_for_job(jobid=jobid)
+            while info["parsed_exitcode"] is None:
+                info = await mediator.wait_for_state_change(
+                                                jobid=jobid,
+                                                last_state=info["state"])
+        finally:
+            mediator.monitor_remove_job(jobid=jobid)
+        workdir, name = proc.workdir, proc.jobname
+        # every checkpoint the part wrote moved the previous one to _prev.cpt
+        n_cpts = len(await checkpoint_steps_from_log(
+                                        os.path.join(workdir, name + ".log")))
+        if n_cpts == 1:
+            await aiofiles.os.replace(
+                        os.path.join(workdir, f"{self._deffnm}_prev.cpt"),
+                        os.path.join(workdir, f"{self._deffnm}.cpt"),
+                                      )
+        elif n_cpts > 1:
+            # the checkpoint of the previous part is gone, but the outputs of
+            # the canceled part are consistent with the current checkpoint,
+            # i.e. we keep them such that the run can be continued from there
+            raise EngineError(f"The canceled presubmitted part {name} wrote "
+                              f"{n_cpts} checkpoints, can not restore the "
+                              "checkpoint of the previous part "
+                              f"({self._deffnm}.cpt is ahead of the "
+                              "trajectory). The outputs of the canceled part "
+                              "are kept, use `prepare_from_files` to continue "
+                              "from them."
+                              )
+        fnames = [f"{name}.{ending}" for ending in ["trr", "xtc", "edr", "log"]]
+        fnames += self._confout_fnames(name=name, cmd_str=cmd_str) or []
+        for fname in fnames:
+            try:
+                await aiofiles.os.remove(os.path.join(workdir, fname))
+            except FileNotFoundError:
+                pass
+
+    async def _submit_part(self, name, cmd_str, workdir, walltime=None,
+                           dependency=None):
         # substitute placeholders in submit script
         script = self.sbatch_script.format(mdrun_cmd=cmd_str)
         # write it out
@@ -1025,26 +1404,290 @@ class SlurmGmxEngine(GmxEngine):
         async with _SEMAPHORES["MAX_FILES_OPEN"]:
             async with aiofiles.open(fname, 'w') as f:
                 await f.write(script)
-        self._proc = await slurm.create_slurmprocess_submit(
+        if self.pilot_executor is not None:
+            return await pilot.create_pilotprocess_submit(
+                                                executor=self.pilot_executor,
                                                 jobname=name,
                                                 sbatch_script=fname,
                                                 workdir=workdir,
                                                 time=walltime,
                                                 stdfiles_removal="success",
                                                 stdin=None,
-                                                            )
+                                                          )
+        return await slurm.create_slurmprocess_submit(
+                                                jobname=name,
+                                                sbatch_script=fname,
+                                                workdir=workdir,
+                                                time=walltime,
+                                                stdfiles_removal="success",
+                                                stdin=None,
+                                                dependency=dependency,
+                                                partition=(
+                                                    self.slurm_partitions
+                                                    or None),
+                                                qos=self.slurm_qos or None,
+                                                # mdrun writes the final
+                                                # configuration when done
+                                                completion_files=(
+                                                    self._confout_fnames(
+                                                        name=name,
+                                                        cmd_str=cmd_str)),
+                                                requeue=(
+                                                  False
+                                                  if self.max_resubmits_per_part
+                                                  else None),
+                                                      )
+
+    def _confout_fnames(self, name, cmd_str):
+        # the final configuration written by the mdrun in cmd_str (run as job
+        # with given name), with -noappend gromacs adds the part suffix to all
+        # output files, e.g. deffnm.confout.part0002.gro
+        match = re.search(r" -c (\S+)", cmd_str)
+        if match is None:
+            return None
+        part_match = re.search(r"\.part\d{4}$", name)
+        # the 0step MD (with its own name) always runs the first part
+        suffix = (part_match.group(0) if part_match is not None
+                  else self._num_suffix(sim_part=1))
+        head, ext = os.path.splitext(match.group(1))
+        return [head + suffix + ext]
+
+    @staticmethod
+    def _strip_nsteps(cmd_str):
+        return re.sub(r" -nsteps -?\d+", "", cmd_str)
+
+    async def _start_gmx_mdrun(self, cmd_str, workdir, walltime=None,
+                               run_name=None, **kwargs):
+        name = self._name_from_name_or_none(run_name=run_name)
+        if (self._reattach_proc is not None
+                and self._reattach_proc.jobname == name):
+            # (re)await the job found by prepare_from_files
+            self._proc = self._reattach_proc
+            self._reattach_proc = None
+        elif (run_name is None and self._presubmitted_proc is not None
+                and self._presubmitted_proc.jobname == name):
+            proc = self._presubmitted_proc
+            # NOTE: the presubmitted part runs the mdrun command of the
+            #       previous part, i.e. it could use a larger nsteps than
+            #       requested, which can only happen for the last part and
+            #       we cut the trajectory anyway if we do more steps
+            if (walltime == self._presubmitted_walltime
+                    and (self._strip_nsteps(cmd_str)
+                         == self._strip_nsteps(self._presubmitted_cmd))
+                    ) or proc.slurm_job_state not in [None, "PENDING"]:
+                # Note: we also use it if it already started (we can not
+                #       cancel it without risking a half-written part)
+                self._proc = proc
+                self._presubmitted_proc = None
+                self._presubmitted_cmd = None
+                self._presubmitted_walltime = None
+            else:
+                logger.info("Canceling presubmitted part %s because the "
+                            "requested walltime or mdrun command differs.",
+                            proc.slurm_jobid)
+                await self.cancel_presubmitted_part()
+                self._proc = await self._submit_part(name=name,
+                                                     cmd_str=cmd_str,
+                                                     workdir=workdir,
+                                                     walltime=walltime,
+                                                     )
+        else:
+            await self.cancel_presubmitted_part()
+            self._proc = await self._submit_part(name=name, cmd_str=cmd_str,
+                                                 workdir=workdir,
+                                                 walltime=walltime,
+                                                 )
+        if (run_name is None and self._proc.returncode is None
+                and self._nsteps_total is not None
+                and self._next_part_needed(
+                            remaining_steps=(self._nsteps_total
+                                             - self._steps_done),
+                            walltime=walltime)):
+            await self._presubmit_next_part(cmd_str=cmd_str, workdir=workdir,
+                                            walltime=walltime)
+
+    def _next_part_needed(self, remaining_steps, walltime):
+        # whether a part starting with remaining_steps to go can not do them
+        # all in walltime, i.e. if we will surely need the next part, we only
+        # presubmit in that case (a presubmitted part that we do not need has
+        # usually already started when we notice and cancel it)
+        if (not self.presubmit_next_part or self.pilot_executor is not None
+                or walltime is None or self.steps_per_hour is None):
+            return False
+        max_steps = (self.steps_per_hour * walltime
+                     * self._mdrun_time_conversion_factor)
+        return remaining_steps > self.presubmit_steps_margin * max_steps
+
+    async def _presubmit_next_part(self, cmd_str, workdir, walltime):
+        sem = _SEMAPHORES["SLURM_MAX_JOB"]
+        if sem is not None:
+            if sem.locked(self.slurm_job_class):
+                logger.debug("Not presubmitting the next part, no free "
+                             "SLURM_MAX_JOB slot.")
+                return
+            await sem.acquire(self.slurm_job_class)
+        name = self._deffnm + self._num_suffix(
+                                        sim_part=self._simulation_part + 1)
+        try:
+            proc = await self._submit_part(
+                                name=name, cmd_str=cmd_str, workdir=workdir,
+                                walltime=walltime,
+                                dependency=f"afterok:{self._proc.slurm_jobid}",
+                                           )
+        except slurm.SlurmSubmissionError as e:
+            # not fatal, we will just submit the next part when it is due
+            logger.warning("Presubmitting the next part (%s) failed (%s).",
+                           name, e)
+            if sem is not None:
+                sem.release(self.slurm_job_class)
+            return
+        self._presubmitted_proc = proc
+        self._presubmitted_cmd = cmd_str
+        self._presubmitted_walltime = walltime
+        self._presubmitted_sem = sem
+
+    async def _wait_gmx_mdrun(self, cmd_str, workdir, walltime=None,
+                              nsteps=None, **kwargs):
+        n_resubmits = 0
+        while True:
+            stdout, stderr = await self._proc.communicate()
+            # we have the output now, no need to keep it (spooled) around
+            self._proc.discard_stdfile_data()
+            state = self._proc.slurm_job_state
+            if (self._proc.returncode == 0 or state is None
+                    or not any(s in state.upper()
+                               for s in self.resubmit_slurm_states)):
+                return stdout, stderr
+            if n_resubmits >= self.max_resubmits_per_part:
+                logger.error("SLURM job %s for part %s ended in state %s, not"
+                             " resubmitting because we already resubmitted "
+                             "%d times.", self._proc.slurm_jobid,
+                             self._simulation_part, state, n_resubmits)
+                return stdout, stderr
+            n_resubmits += 1
+            logger.warning("SLURM job %s for part %s ended in state %s, "
+                           "resubmitting from checkpoint (%d of %d).",
+                           self._proc.slurm_jobid, self._simulation_part,
+                           state, n_resubmits, self.max_resubmits_per_part)
+            await self._resubmit_from_checkpoint(cmd_str=cmd_str,
+                                                 workdir=workdir,
+                                                 walltime=walltime,
+                                                 nsteps=nsteps)
+
+    async def _resubmit_from_checkpoint(self, cmd_str, workdir, walltime,
+                                        nsteps=None):
+        # the dependency of the presubmitted part can never be satisfied
+        await self.cancel_presubmitted_part()
+        old_name = self._name_from_name_or_none(run_name=None)
+        cpt_step = await last_checkpoint_step_from_log(
+                                    os.path.join(workdir, old_name + ".log"))
+        # the command for the resubmitted part, the presubmitted next part
+        # still gets cmd_str (it runs the full nsteps of a part)
+        resubmit_cmd_str = cmd_str
+        if cpt_step is None:
+            # no checkpoint written (by this part), mdrun will redo the whole
+            # part, so we remove the partial output (gromacs would back it up)
+            for ending in ["trr", "xtc", "edr", "log"]:
+                try:
+                    await aiofiles.os.remove(os.path.join(
+                                                workdir,
+                                                f"{old_name}.{ending}"))
+                except FileNotFoundError:
+                    pass
+        else:
+            # mdrun continues in a new gromacs part from the checkpoint,
+            # the frames after the checkpoint (in the current part) will
+            # be produced again
+            traj_file = os.path.join(workdir,
+                                     f"{old_name}.{self.output_traj_type}")
+            if await self._trim_trajectory_to_step(traj_file=traj_file,
+                                                   step=cpt_step):
+                self._part_segments.append(traj_file)
+            self._simulation_part += 1
+            if nsteps is not None:
+                # mdrun counts -nsteps from the checkpoint, so we only ask for
+                # the steps still missing in this (logical) part, which
+                # started at self._steps_done
+                resubmit_cmd_str = self._mdrun_cmd(
+                                tpr=self._tpr, workdir=workdir,
+                                deffnm=self._deffnm, maxh=walltime,
+                                nsteps=max(0, nsteps - (cpt_step
+                                                        - self._steps_done)),
+                                                   )
+        try:
+            await aiofiles.os.remove(os.path.join(workdir, old_name + ".slurm"))
+        except FileNotFoundError:
+            pass
+        self._proc = await self._submit_part(
+                            name=self._name_from_name_or_none(run_name=None),
+                            cmd_str=resubmit_cmd_str,
+                            workdir=workdir,
+                            walltime=walltime,
+                                             )
+        if (self._nsteps_total is not None and cpt_step is not None
+                and self._next_part_needed(
+                            remaining_steps=(self._nsteps_total
+                                             - cpt_step),
+                            walltime=walltime)):
+            await self._presubmit_next_part(cmd_str=cmd_str, workdir=workdir,
+                                            walltime=walltime)
+
+    async def _trim_trajectory_to_step(self, traj_file, step) -> bool:
+        # remove all frames after step from traj_file,
+        # returns False if no frame is left (then the file is removed)
+        if not await aiofiles.ospath.exists(traj_file):
+            return False
+        traj = Trajectory(trajectory_files=traj_file,
+                          structure_file=self._tpr,
+                          nstout=self.nstout,
+                          )
+        n_frames = (step - traj.first_step) // self.nstout + 1
+        if n_frames >= len(traj):
+            return True
+        if n_frames <= 0:
+            await aiofiles.os.remove(traj_file)
+            return False
+        head, tail = os.path.split(traj_file)
+        tmp_file = os.path.join(head, "trimmed_" + tail)
+        await TrajectoryConcatenator().concatenate_async(
+                                                trajs=[traj],
+                                                slices=[(0, n_frames, 1)],
+                                                tra_out=tmp_file,
+                                                struct_out=None,
+                                                overwrite=True,
+                                                         )
+        await aiofiles.os.rename(tmp_file, traj_file)
+        return True
 
     async def _acquire_resources_gmx_mdrun(self, **kwargs):
-        if _SEMAPHORES["SLURM_MAX_JOB"] is not None:
+        if (self._presubmitted_sem is not None
+                and self._presubmitted_proc is not None
+                and self._presubmitted_proc.jobname
+                    == self._deffnm + self._num_suffix(
+                                            sim_part=self._simulation_part)):
+            # take over the slot we hold for the presubmitted part, it is the
+            # part we are about to run (and if it is not used, because it is
+            # canceled in _start_gmx_mdrun, the slot is ours anyway)
+            self._presubmitted_sem = None
+            return
+        # NOTE: pilot tasks do not count as SLURM jobs (the workers are)
+        if (_SEMAPHORES["SLURM_MAX_JOB"] is not None
+                and self.pilot_executor is None):
             logger.debug("SLURM_MAX_JOB semaphore is %s before acquiring.",
                          _SEMAPHORES['SLURM_MAX_JOB'])
-            await _SEMAPHORES["SLURM_MAX_JOB"].acquire()
+            await _SEMAPHORES["SLURM_MAX_JOB"].acquire(self.slurm_job_class)
         else:
             logger.debug("SLURM_MAX_JOB semaphore is None")
 
     async def _cleanup_gmx_mdrun(self, workdir, run_name=None, **kwargs):
-        if _SEMAPHORES["SLURM_MAX_JOB"] is not None:
-            _SEMAPHORES["SLURM_MAX_JOB"].release()
+        if (run_name is None
+                and (self._proc is None or self._proc.returncode != 0)):
+            # the current part failed (or got canceled), so the next part will
+            # never start
+            await self.cancel_presubmitted_part()
+        if (_SEMAPHORES["SLURM_MAX_JOB"] is not None
+                and self.pilot_executor is None):
+            _SEMAPHORES["SLURM_MAX_JOB"].release(self.slurm_job_class)
         # remove the sbatch script
         name = self._name_from_name_or_none(run_name=run_name)
         fname = os.path.join(workdir, name + ".slurm")
@@ -1055,6 +1698,18 @@ class SlurmGmxEngine(GmxEngine):
         except FileNotFoundError:
             pass
 
+    async def _kill_gmx_mdrun(self, **kwargs):
+        # SlurmProcess.kill() blocks the event loop until scancel returns and
+        # PilotProcess.kill() only schedules the cancelation in the background
+        # (which never runs if the event loop shuts down), so we wait here
+        if self._proc is None or self._proc.returncode is not None:
+            return
+        try:
+            await self._proc.terminate_async()
+        except slurm.SlurmError as e:
+            logger.error("Could not cancel SLURM job %s (%s).",
+                         self._proc.slurm_jobid, e)
+
     # TODO: do we even need/want that?
     @property
     def slurm_job_state(self):
@@ -13,7 +13,10 @@
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
 import os
+import re
+import typing
 import logging
+import aiofiles
 import aiofiles.os
 
 from ..trajectory.trajectory import Trajectory
@@ -147,6 +150,113 @@ async def get_all_file_parts(folder: str, deffnm: str, file_ending: str) -> "lis
     return parts
 
 
+async def mdrun_performance_from_log(log_file: str,
+                                    dt: typing.Optional[float] = None,
+                                    tail_bytes: int = 2**14,
+                                    ) -> typing.Union[dict, None]:
+    """
+    Get the performance reported by mdrun at the end of the given log file.
+
+    Only the last `tail_bytes` of the file are read, i.e. this is cheap also
+    for long logs.
+
+    Parameters
+    ----------
+    log_file : str
+        Path to the gromacs log file.
+    dt : float or None, optional
+        The integration timestep in ps, if given we also calculate the number
+        of integration steps per hour, by default None.
+    tail_bytes : int, optional
+        Number of bytes to read from the end of the file, by default 2**14.
+
+    Returns
+    -------
+    dict or None
+        Dictionary with keys "ns_per_day", "hours_per_ns" and (if dt is given)
+        "steps_per_hour". None if the file does not exist or does not contain
+        the performance (e.g. because mdrun crashed).
+    """
+    try:
+        async with aiofiles.open(log_file, "rb") as f:
+            await f.seek(0, os.SEEK_END)
+            size = await f.tell()
+            await f.seek(max(size - tail_bytes, 0))
+            tail = (await f.read()).decode(errors="replace")
+    except FileNotFoundError:
+        logger.warning("Log file %s not found.", log_file)
+        return None
+    # the last lines of a gromacs log look like
+    #                  (ns/day)    (hour/ns)
+    # Performance:       56.789        0.423
+    matches = re.findall(r"^Performance:\s+(\S+)\s+(\S+)", tail,
+                         flags=re.MULTILINE)
+    if len(matches) == 0:
+        return None
+    try:
+        ns_per_day, hours_per_ns = (float(v) for v in matches[-1])
+    except ValueError:
+        return None
+    performance = {"ns_per_day": ns_per_day, "hours_per_ns": hours_per_ns}
+    if dt is not None:
+        # 1 ns = 1000 ps
+        performance["steps_per_hour"] = ns_per_day * 1000 / dt / 24
+    return performance
+
+
+async def checkpoint_steps_from_log(log_file: str) -> "list[int]":
+    """
+    Get the integration steps of all checkpoints written by mdrun.
+
+    Parameters
+    ----------
+    log_file : str
+        Path to the gromacs log file.
+
+    Returns
+    -------
+    list[int]
+        The steps of the checkpoints mdrun noted in the log file (in the order
+        they were written). Empty if the file does not exist or mdrun did not
+        write a checkpoint (yet).
+    """
+    # mdrun notes every checkpoint it writes in the log as
+    # Writing checkpoint, step 51000 at Mon Jun  3 12:04:05 2024
+    regexp = re.compile(r"^Writing checkpoint, step (\d+)")
+    steps = []
+    try:
+        async with aiofiles.open(log_file, "r") as f:
+            while (line := await f.readline()):
+                match = regexp.match(line)
+                if match is not None:
+                    steps.append(int(match.group(1)))
+    except FileNotFoundError:
+        return []
+    return steps
+
+
+async def last_checkpoint_step_from_log(log_file: str,
+                                        ) -> typing.Union[int, None]:
+    """
+    Get the integration step of the last checkpoint written by mdrun.
+
+    Parameters
+    ----------
+    log_file : str
+        Path to the gromacs log file.
+
+    Returns
+    -------
+    int or None
+        The step of the last checkpoint mdrun noted in the log file. None if
+        the file does not exist or mdrun did not write a checkpoint (yet).
+    """
+    steps = await checkpoint_steps_from_log(log_file=log_file)
+    if len(steps) == 0:
+        return None
+    return steps[-1]
+
+
 def ensure_mdp_options(mdp: MDP, genvel: str = "no", continuation: str = "yes") -> MDP:
     """
     Ensure that some commonly used mdp options have the given values.
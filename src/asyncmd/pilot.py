@@ -0,0 +1,965 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+Pilot jobs: run many short tasks inside few long-lived (SLURM) allocations.
+
+The :class:`PilotJobExecutor` starts a number of workers (either as SLURM jobs
+or as local processes) which claim tasks from a file-based queue in a shared
+directory, see :mod:`asyncmd._pilot_worker` for the details of the queue.
+The :class:`PilotProcess` emulates the API of :class:`asyncmd.slurm.SlurmProcess`
+(and therefore also of `asyncio.subprocess.Process`) for tasks run by the
+pilot workers, i.e. it can be used as a drop-in replacement. This way we pay
+the queue waiting time only once per pilot allocation instead of once per task.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shlex
+import sys
+import time
+import typing
+import aiofiles
+import aiofiles.os
+
+from . import _pilot_worker
+from . import slurm
+from .tools import (remove_file_if_exist, remove_file_if_exist_async,
+                    run_in_background,
+                    )
+from ._config import _SEMAPHORES
+
+
+logger = logging.getLogger(__name__)
+
+
+# path to the worker script, we execute it directly (by path) to not import
+# asyncmd (and all its dependencies) in the workers
+_WORKER_SCRIPT = os.path.abspath(_pilot_worker.__file__)
+
+
+class PilotJobExecutor:
+    """
+    Dispatch SlurmProcess-compatible tasks to long-lived pilot workers.
+
+    Attributes
+    ----------
+    poll_interval : float
+        Time (in seconds) between subsequent checks of the queue directory for
+        finished tasks (on the client side) and for new tasks (on the worker
+        side), by default 1.
+    heartbeat_interval : float
+        Time (in seconds) between heartbeats of the workers, by default 10.
+        We consider a worker lost (and its running task failed due to node
+        failure, i.e. returncode 2) if we do not see a heartbeat for three
+        times this interval.
+    worker_idle_timeout : float
+        Time (in seconds) after which idle workers exit, by default 600.
+        Note that tasks still in the queue when none of the started workers
+        is alive anymore (exited or no heartbeat) fail (with returncode 1 and
+        state "FAILED"), i.e. (re)start workers before submitting tasks after
+        a long break.
+    max_failed_polls : int
+        Number of consecutive failed checks of the queue directory after
+        which we give up and make all waiting tasks raise a
+        :class:`asyncmd.slurm.SlurmError`, by default 10.
+    python_executable : str
+        Name or path of the python executable used to run the workers, by
+        default the executable running this python interpreter.
+    """
+
+    poll_interval = 1.
+    heartbeat_interval = 10.
+    worker_idle_timeout = 600.
+    max_failed_polls = 10
+    python_executable = sys.executable
+    # stop claiming tasks a bit before the allocation time-limit, such that
+    # the workers can finish up gracefully (cf. SlurmGmxEngine)
+    _walltime_conversion_factor = 0.99
+
+    def __init__(self, queue_dir: str, **kwargs) -> None:
+        """
+        Initialize a :class:`PilotJobExecutor`.
+
+        Note that you can set all attributes by passing matching init kwargs
+        with the wanted values.
+
+        Parameters
+        ----------
+        queue_dir : str
+            Absolute or relative path to the directory used as task queue.
+            Must be accessible from all pilot workers, i.e. it must be on a
+            shared filesystem if the workers run on the compute nodes.
+
+        Raises
+        ------
+        TypeError
+            If the value set via init kwarg for a attribute does not match the
+            default/original type for that attribute.
+        """
+        # make it possible to set any attribute via kwargs
+        # check the type for attributes with default values
+        dval = object()
+        for kwarg, value in kwargs.items():
+            cval = getattr(self, kwarg, dval)
+            if cval is not dval:
+                if isinstance(value, type(cval)):
+                    # value is of same type as default so set it
+                    setattr(self, kwarg, value)
+                else:
+                    raise TypeError(f"Setting attribute {kwarg} with "
+                                    + f"mismatching type ({type(value)}). "
+                                    + f" Default type is {type(cval)}."
+                                    )
+        self.queue_dir = os.path.abspath(queue_dir)
+        for subdir in ["tasks", "running", "done", "cancel", "workers",
+                       "logs"]:
+            os.makedirs(os.path.join(self.queue_dir, subdir), exist_ok=True)
+        # remove a shutdown marker from a previous executor
+        remove_file_if_exist(os.path.join(self.queue_dir, "shutdown"))
+        # the task ids sort in submission order (the workers take the oldest)
+        self._id_prefix = f"{int(time.time())}_{os.getpid()}"
+        self._task_counter = itertools.count()
+        self._worker_counter = itertools.count()
+        # worker ids -> asyncio.subprocess.Process or slurm.SlurmProcess
+        self._workers = {}
+        # worker ids -> tasks waiting for the workers to exit
+        self._worker_exits = {}
+        # ids of the workers we have seen a heartbeat from
+        self._seen_workers = set()
+        # task ids -> futures for the result dicts of the tasks
+        # (we remove them in forget_task)
+        self._task_futures = {}
+        # task ids of all tasks that did not finish yet
+        self._unfinished = set()
+        # task ids -> last known state ("PENDING", "RUNNING" or final)
+        self._task_states = {}
+        # the polling task, created on first use (we need a running loop)
+        self._poll_task = None
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.queue_dir, *parts)
+
+    def _worker_cmd(self, worker_id: str,
+                    walltime: typing.Optional[float] = None) -> str:
+        cmd = f"{self.python_executable} {_WORKER_SCRIPT}"
+        cmd += f" {shlex.quote(self.queue_dir)} {worker_id}"
+        cmd += f" --idle-timeout {self.worker_idle_timeout}"
+        cmd += f" --poll-interval {self.poll_interval}"
+        cmd += f" --heartbeat-interval {self.heartbeat_interval}"
+        if walltime is not None:
+            cmd += f" --walltime {walltime}"
+        return cmd
+
+    @property
+    def workers(self) -> "list[str]":
+        """Ids of all workers started by this executor."""
+        return list(self._workers)
+
+    @property
+    def n_alive_workers(self) -> int:
+        """Number of workers started by this executor that did not exit."""
+        return sum(not task.done() for task in self._worker_exits.values())
+
+    def _add_worker(self, worker_id: str,
+                    proc: typing.Union[asyncio.subprocess.Process,
+                                       slurm.SlurmProcess],
+                    ) -> None:
+        self._workers[worker_id] = proc
+        self._worker_exits[worker_id] = asyncio.create_task(
+                                self._wait_for_worker_exit(worker_id=worker_id)
+                                                            )
+
+    async def _wait_for_worker_exit(self, worker_id: str) -> None:
+        try:
+            returncode = await self._workers[worker_id].wait()
+        except (slurm.SlurmError, OSError) as e:
+            # we can not tell if it still runs, but we can not use it either
+            logger.error("Could not wait for pilot worker %s: %s",
+                         worker_id, e)
+        else:
+            logger.info("Pilot worker %s exited with returncode %s.",
+                        worker_id, returncode)
+
+    async def start_local_workers(self, n_workers: int) -> "list[str]":
+        """
+        Start pilot workers as local processes.
+
+        Useful for testing and for running on a single (large) node.
+
+        Parameters
+        ----------
+        n_workers : int
+            Number of workers to start.
+
+        Returns
+        -------
+        list[str]
+            The ids of the started workers.
+        """
+        worker_ids = []
+        for _ in range(n_workers):
+            worker_id = f"local_{self._id_prefix}_{next(self._worker_counter)}"
+            log_fname = self._path("logs", f"{worker_id}.log")
+            with open(log_fname, "wb") as log_file:
+                proc = await asyncio.create_subprocess_exec(
+                                *shlex.split(self._worker_cmd(worker_id)),
+                                stdin=asyncio.subprocess.DEVNULL,
+                                stdout=log_file,
+                                stderr=log_file,
+                                close_fds=True,
+                                                            )
+            self._add_worker(worker_id=worker_id, proc=proc)
+            worker_ids.append(worker_id)
+        logger.info("Started %d local pilot workers.", n_workers)
+        return worker_ids
+
+    async def start_slurm_workers(self, n_workers: int, sbatch_script: str,
+                                  time: typing.Optional[float] = None,
+                                  jobname: str = "asyncmd_pilot",
+                                  ) -> "list[str]":
+        """
+        Start pilot workers as SLURM jobs (one worker per job).
+
+        Parameters
+        ----------
+        n_workers : int
+            Number of workers (SLURM jobs) to start.
+        sbatch_script : str
+            Path to a sbatch submission script file or string with the content
+            of a submission script. Note that the submission script must
+            contain the following placeholders:
+
+             - {worker_cmd} : Replaced by the command to run the worker.
+
+        time : float or None
+            Timelimit for the pilot jobs in hours. None will result in using
+            the default as either specified in the sbatch script or the
+            partition. Note that workers only claim tasks (with a timelimit)
+            if they can finish them within their allocation.
+        jobname : str, optional
+            SLURM jobname of the pilot jobs, by default "asyncmd_pilot".
+
+        Returns
+        -------
+        list[str]
+            The ids of the started workers.
+        """
+        # we expect sbatch_script to be a str,
+        # but it could be either the path to a submit script or the content of
+        # the submission script directly
+        # we decide what it is by checking for the shebang
+        if not sbatch_script.startswith("#!"):
+            # probably path to a file, lets try to read it
+            with open(sbatch_script, 'r') as f:
+                sbatch_script = f.read()
+        walltime = (None if time is None
+                    else time * 3600 * self._walltime_conversion_factor)
+        worker_ids = [f"slurm_{self._id_prefix}_{next(self._worker_counter)}"
+                      for _ in range(n_workers)]
+
+        async def submit_worker(worker_id):
+            fname = self._path("logs", f"{worker_id}.slurm")
+            script = sbatch_script.format(
+                            worker_cmd=self._worker_cmd(worker_id=worker_id,
+                                                        walltime=walltime)
+                                          )
+            async with _SEMAPHORES["MAX_FILES_OPEN"]:
+                async with aiofiles.open(fname, "w") as f:
+                    await f.write(script)
+            proc = await slurm.create_slurmprocess_submit(
+                                                jobname=jobname,
+                                                sbatch_script=fname,
+                                                workdir=self._path("logs"),
+                                                time=time,
+                                                stdfiles_removal="success",
+                                                          )
+            self._add_worker(worker_id=worker_id, proc=proc)
+
+        await asyncio.gather(*(submit_worker(worker_id)
+                               for worker_id in worker_ids))
+        logger.info("Submitted %d SLURM pilot jobs.", n_workers)
+        return worker_ids
+
+    def new_task_id(self) -> str:
+        """Return a new (unique) task id."""
+        return f"{self._id_prefix}_{next(self._task_counter):09d}"
+
+    async def submit_task(self, script: str, workdir: str, stdout: str,
+                          stderr: str, stdin: typing.Optional[str] = None,
+                          time: typing.Optional[float] = None,
+                          task_id: typing.Optional[str] = None,
+                          ) -> str:
+        """
+        Put a task into the queue.
+
+        Parameters
+        ----------
+        script : str
+            Absolute path to the (bash) script to run.
+        workdir : str
+            Absolute path to the working directory for the task.
+        stdout : str
+            Absolute path to the file stdout is written to.
+        stderr : str
+            Absolute path to the file stderr is written to.
+        stdin : str or None, optional
+            File (relative to workdir) to connect to the scripts stdin.
+        time : float or None, optional
+            Timelimit for the task in hours, by default None (no limit).
+        task_id : str or None, optional
+            The id for the task as returned by :meth:`new_task_id`, by default
+            None, which results in using a new id.
+
+        Returns
+        -------
+        str
+            The id of the task.
+        """
+        if task_id is None:
+            task_id = self.new_task_id()
+        task = {"script": script, "workdir": workdir, "stdout": stdout,
+                "stderr": stderr, "stdin": stdin, "time": time,
+                }
+        fname = self._path("tasks", f"{task_id}.json")
+        # write to tmp file and rename, the workers must not see partial data
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            async with aiofiles.open(fname + ".tmp", "w") as f:
+                await f.write(json.dumps(task))
+        self._task_futures[task_id] = asyncio.get_running_loop().create_future()
+        self._task_states[task_id] = "PENDING"
+        self._unfinished.add(task_id)
+        await aiofiles.os.rename(fname + ".tmp", fname)
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll_loop())
+        return task_id
+
+    def task_state(self, task_id: str) -> typing.Union[str, None]:
+        """Return the last known state of the task with given id."""
+        return self._task_states.get(task_id, None)
+
+    async def wait_for_task(self, task_id: str) -> dict:
+        """
+        Wait for the task with given id to finish.
+
+        Parameters
+        ----------
+        task_id : str
+            The id of the task.
+
+        Can be called any number of times (also concurrently) until the task
+        is forgotten, see :meth:`forget_task`.
+
+        Returns
+        -------
+        dict
+            Result of the task, contains at least "returncode" and "state".
+
+        Raises
+        ------
+        ValueError
+            If the task is unknown (or already forgotten).
+        """
+        try:
+            fut = self._task_futures[task_id]
+        except KeyError:
+            raise ValueError(f"Unknown task id {task_id}, not submitted via "
+                             + "this executor or already forgotten."
+                             ) from None
+        # shield, such that the (shared) future survives if we get canceled
+        return await asyncio.shield(fut)
+
+    def forget_task(self, task_id: str) -> None:
+        """
+        Forget the (finished) task with given id and its result.
+
+        Call this when the result is not needed anymore to free the memory,
+        :class:`PilotProcess` does it after retrieving the result.
+
+        Parameters
+        ----------
+        task_id : str
+            The id of the task.
+
+        Raises
+        ------
+        RuntimeError
+            If the task did not finish yet.
+        """
+        if task_id in self._unfinished:
+            raise RuntimeError(f"Can not forget unfinished task {task_id}.")
+        self._task_futures.pop(task_id, None)
+        self._task_states.pop(task_id, None)
+
+    async def cancel_task(self, task_id: str) -> None:
+        """
+        Cancel the task with given id (and wait until it is canceled).
+
+        Parameters
+        ----------
+        task_id : str
+            The id of the task.
+        """
+        fut = self._task_futures.get(task_id, None)
+        if fut is None or fut.done():
+            return
+        try:
+            # if we can remove it from the pending tasks no worker has it
+            await aiofiles.os.remove(self._path("tasks", f"{task_id}.json"))
+        except FileNotFoundError:
+            # already claimed by a worker, tell the worker to stop it
+            async with _SEMAPHORES["MAX_FILES_OPEN"]:
+                async with aiofiles.open(self._path("cancel", task_id), "w"):
+                    pass
+            await asyncio.shield(fut)
+            await remove_file_if_exist_async(self._path("cancel", task_id))
+        else:
+            self._set_task_result(task_id=task_id,
+                                  result={"returncode": 1,
+                                          "state": "CANCELLED",
+                                          "worker": None,
+                                          })
+
+    def _set_task_result(self, task_id: str, result: dict) -> None:
+        self._task_states[task_id] = result["state"]
+        self._unfinished.discard(task_id)
+        fut = self._task_futures.get(task_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
+
+    async def _poll_loop(self) -> None:
+        # the one and only polling loop, runs as long as we have tasks
+        n_failed_polls = 0
+        while len(self._unfinished) > 0:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except Exception as e:
+                # the waiting tasks depend on us, so we try again
+                n_failed_polls += 1
+                if n_failed_polls >= self.max_failed_polls:
+                    logger.error("Polling the pilot queue failed %d times in "
+                                 "a row, giving up. The last error was: %s",
+                                 n_failed_polls, e)
+                    self._fail_unfinished_tasks(err=e)
+                    break
+                logger.warning("Polling the pilot queue failed (%s), trying "
+                               "again (%d of %d).", e, n_failed_polls,
+                               self.max_failed_polls)
+                continue
+            n_failed_polls = 0
+
+    async def _poll(self) -> None:
+        # check the queue directory once and set the results of finished tasks
+        loop = asyncio.get_running_loop()
+        # do the (blocking) filesystem scan in a thread
+        done, running, heartbeats = await loop.run_in_executor(
+                                                    None, self._scan_queue,
+                                                               )
+        for task_id, result in done.items():
+            self._set_task_result(task_id=task_id, result=result)
+        now = time.time()
+        for task_id, worker_id in running.items():
+            if task_id not in self._unfinished:
+                continue
+            self._task_states[task_id] = "RUNNING"
+            last_beat = heartbeats.get(worker_id, None)
+            if (last_beat is None
+                    or now - last_beat > 3 * self.heartbeat_interval):
+                # lost the worker while running the task, make sure no one
+                # else picks it up (its worker can not write it to done)
+                logger.error("Lost pilot worker %s while running task %s.",
+                             worker_id, task_id)
+                await remove_file_if_exist_async(
+                        self._path("running", f"{task_id}@{worker_id}.json")
+                                                 )
+                # report it as node failure, such that the callers retry
+                self._set_task_result(task_id=task_id,
+                                      result={"returncode": 2,
+                                              "state": "NODE_FAIL",
+                                              "worker": worker_id,
+                                              })
+        self._seen_workers.update(w for w in heartbeats if w in self._workers)
+        if (len(self._workers) > 0
+                and not any(self._worker_alive(worker_id=w, now=now,
+                                               heartbeats=heartbeats)
+                            for w in self._workers)):
+            await self._fail_pending_tasks()
+
+    def _worker_alive(self, worker_id: str, now: float,
+                      heartbeats: "dict[str, float]") -> bool:
+        # whether the worker (still) runs or could still start running
+        if self._worker_exits[worker_id].done():
+            return False
+        last_beat = heartbeats.get(worker_id, None)
+        if last_beat is None:
+            # not yet started (e.g. a pending SLURM job) or already exited
+            return worker_id not in self._seen_workers
+        return now - last_beat <= 3 * self.heartbeat_interval
+
+    def _fail_unfinished_tasks(self, err: Exception) -> None:
+        # make all waiters raise instead of waiting for a poll that never comes
+        for task_id in self._unfinished:
+            fut = self._task_futures.get(task_id, None)
+            if fut is not None and not fut.done():
+                exc = slurm.SlurmError("Could not poll the state of pilot task"
+                                       f" {task_id} ({type(err).__name__}: "
+                                       f"{err}).")
+                exc.__cause__ = err
+                fut.set_exception(exc)
+
+    async def _fail_pending_tasks(self) -> None:
+        # no worker left which could claim the tasks still in the queue, so
+        # we take them out (as in cancel_task) and fail them
+        n_failed = 0
+        for task_id in list(self._unfinished):
+            if self._task_states[task_id] != "PENDING":
+                continue
+            try:
+                await aiofiles.os.remove(self._path("tasks",
+                                                    f"{task_id}.json"))
+            except FileNotFoundError:
+                # claimed by a worker (just before it exited), we see the
+                # result or lose the worker in the next scan
+                continue
+            self._set_task_result(task_id=task_id,
+                                  result={"returncode": 1,
+                                          "state": "FAILED",
+                                          "worker": None,
+                                          })
+            n_failed += 1
+        if n_failed > 0:
+            logger.error("No pilot worker alive, failed %d pending tasks.",
+                         n_failed)
+
+    def _cancel_task_nowait(self, task_id: str) -> None:
+        # blocking version of cancel_task which does not wait for the worker
+        fut = self._task_futures.get(task_id, None)
+        if fut is None or fut.done():
+            return
+        try:
+            os.remove(self._path("tasks", f"{task_id}.json"))
+        except FileNotFoundError:
+            # already claimed by a worker, the next poll sees the result
+            with open(self._path("cancel", task_id), "w"):
+                pass
+        else:
+            self._set_task_result(task_id=task_id,
+                                  result={"returncode": 1,
+                                          "state": "CANCELLED",
+                                          "worker": None,
+                                          })
+
+    def _scan_queue(self) -> tuple[dict, dict, dict]:
+        # blocking scan of the queue directory, returns:
+        # - the results of all finished tasks (and removes their files)
+        # - the worker ids for all running tasks
+        # - the time of the last heartbeat for every worker
+        done = {}
+        with os.scandir(self._path("done")) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                task_id = entry.name[:-len(".json")]
+                if task_id not in self._unfinished:
+                    continue  # not ours (or already canceled)
+                with open(entry.path, "r") as f:
+                    done[task_id] = json.load(f)
+                remove_file_if_exist(entry.path)
+        running = {}
+        with os.scandir(self._path("running")) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                task_id, worker_id = entry.name[:-len(".json")].split("@")
+                running[task_id] = worker_id
+        # the task could have finished between reading done and running
+        for task_id in done:
+            running.pop(task_id, None)
+        heartbeats = {}
+        with os.scandir(self._path("workers")) as entries:
+            for entry in entries:
+                try:
+                    heartbeats[entry.name] = entry.stat().st_mtime
+                except FileNotFoundError:
+                    pass  # the worker just exited
+        return done, running, heartbeats
+
+    async def shutdown(self, wait: bool = True) -> None:
+        """
+        Tell all workers to exit as soon as they are idle.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Whether to wait for all workers to exit, by default True.
+            If False, SLURM pilot jobs are canceled directly instead (note that
+            this also kills all tasks running in them).
+        """
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            async with aiofiles.open(self._path("shutdown"), "w"):
+                pass
+        if wait:
+            await asyncio.gather(*self._worker_exits.values())
+        else:
+            await asyncio.gather(*(proc.terminate_async()
+                                   for proc in self._workers.values()
+                                   if isinstance(proc, slurm.SlurmProcess)
+                                   and proc.returncode is None))
+
+
+class PilotProcess:
+    """
+    Task run by the workers of a :class:`PilotJobExecutor`.
+
+    Emulates the API of :class:`asyncmd.slurm.SlurmProcess` (and therefore also
+    of `asyncio.subprocess.Process`), the script is run with bash by one of
+    the pilot workers (``#SBATCH`` lines are just comments in this case).
+    """
+
+    def __init__(self, jobname: str, sbatch_script: str,
+                 executor: PilotJobExecutor,
+                 workdir: typing.Optional[str] = None,
+                 time: typing.Optional[float] = None,
+                 stdfiles_removal: str = "success",
+                 ) -> None:
+        """
+        Initialize a `PilotProcess`.
+
+        Parameters
+        ----------
+        jobname : str
+            Name of the task, used for the stdfile names.
+        sbatch_script : str
+            Absolute or relative path to a (bash) script.
+        executor : PilotJobExecutor
+            The executor whose workers run the task.
+        workdir : str or None
+            Absolute or relative path to use as working directory. None will
+            result in using the current directory as workdir.
+        time : float or None
+            Timelimit for the task in hours. None means no time limit (apart
+            from the time-limit of the pilot allocation).
+        stdfiles_removal : str
+            Whether to remove the stdout, stderr (and possibly stdin) files.
+            Possible values are:
+
+             - "success": remove on sucessful completion, i.e. zero returncode)
+             - "no": never remove
+             - "yes"/"always": remove on job completion independent of
+               returncode and also when using :meth:`terminate`
+        """
+        self.jobname = jobname
+        self.sbatch_script = os.path.abspath(sbatch_script)
+        self.executor = executor
+        if workdir is None:
+            workdir = os.getcwd()
+        self.workdir = os.path.abspath(workdir)
+        self.time = time
+        self.stdfiles_removal = stdfiles_removal
+        self._jobid = None
+        self._result = None
+        self._stdout_data = None
+        self._stderr_data = None
+        self._stdin = None
+
+    @property
+    def stdfiles_removal(self) -> str:
+        """
+        Whether/when we remove stdfiles created by the task.
+
+        Can be one of "success", "no", "yes", "always", where "yes" and
+        "always" are synomyms for always remove. "success" means remove
+        stdfiles if the task was successful and "no" means never remove.
+        """
+        return self._stdfiles_removal
+
+    @stdfiles_removal.setter
+    def stdfiles_removal(self, val: str) -> None:
+        allowed_vals = ["success", "no", "yes", "always"]
+        if val.lower() not in allowed_vals:
+            raise ValueError(f"remove_stdfiles must be one of {allowed_vals}, "
+                             + f"but was {val.lower()}.")
+        self._stdfiles_removal = val.lower()
+
+    async def submit(self, stdin: typing.Optional[str] = None) -> None:
+        """
+        Put the task into the executors queue.
+
+        Parameters
+        ----------
+        stdin : str or None
+            If given it is interpreted as a file (relative to workdir) which
+            we connect to the scripts stdin.
+
+        Raises
+        ------
+        RuntimeError
+            If the task has already been submitted.
+        """
+        if self._jobid is not None:
+            raise RuntimeError(f"Already monitoring task with id {self._jobid}.")
+        self._stdin = stdin
+        # we need the task id for the stdfile names, so we get one first and
+        # only then put the task into the queue
+        self._jobid = self.executor.new_task_id()
+        stdin_fname, stdout_fname, stderr_fname = self._stdfile_names()
+        await self.executor.submit_task(script=self.sbatch_script,
+                                        workdir=self.workdir,
+                                        stdout=stdout_fname,
+                                        stderr=stderr_fname,
+                                        stdin=stdin,
+                                        time=self.time,
+                                        task_id=self._jobid,
+                                        )
+        logger.debug("Submitted pilot task with id %s.", self._jobid)
+
+    @property
+    def slurm_jobid(self) -> typing.Union[str, None]:
+        """The id of the task (named as for `SlurmProcess`)."""
+        return self._jobid
+
+    @property
+    def nodes(self) -> typing.Union["list[str]", None]:
+        """The worker (id) which ran the task (None if unknown)."""
+        if self._result is None or self._result.get("worker") is None:
+            return None
+        return [self._result["worker"]]
+
+    @property
+    def slurm_job_state(self) -> typing.Union[str, None]:
+        """The state of the task ("PENDING", "RUNNING" or a final state)."""
+        if self._jobid is None:
+            return None
+        if self._result is not None:
+            return self._result["state"]
+        return self.executor.task_state(self._jobid)
+
+    @property
+    def returncode(self) -> typing.Union[int, None]:
+        """The returncode of the task (None if not finished)."""
+        if self._result is None:
+            return None
+        return self._result["returncode"]
+
+    def _stdfile_names(self) -> tuple[typing.Optional[str], str, str]:
+        # stdin, stdout, stderr, named as for SlurmProcess
+        return ((os.path.join(self.workdir, self._stdin)
+                 if self._stdin is not None else None),
+                os.path.join(self.workdir, f"{self.jobname}.out.{self._jobid}"),
+                os.path.join(self.workdir, f"{self.jobname}.err.{self._jobid}"),
+                )
+
+    async def _remove_stdfiles_async(self) -> None:
+        await asyncio.gather(*(remove_file_if_exist_async(f)
+                               for f in self._stdfile_names()
+                               if f is not None))
+
+    async def _read_stdfiles(self) -> tuple[bytes, bytes]:
+        if self._stdout_data is not None and self._stderr_data is not None:
+            # return cached values if we already read the files previously
+            return self._stdout_data, self._stderr_data
+        data = []
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            for fname in self._stdfile_names()[1:]:
+                try:
+                    async with aiofiles.open(fname, "rb") as f:
+                        data.append(await f.read())
+                except FileNotFoundError:
+                    logger.warning("stdfile %s not found.", fname)
+                    data.append(bytes())
+        self._stdout_data, self._stderr_data = data
+        return self._stdout_data, self._stderr_data
+
+    def discard_stdfile_data(self) -> None:
+        """
+        Discard the stdout and stderr data we kept when removing the stdfiles.
+
+        Afterwards :meth:`communicate` only returns what is (still) in the
+        stdfiles, i.e. nothing if they were removed.
+        """
+        self._stdout_data = None
+        self._stderr_data = None
+
+    async def wait(self) -> int:
+        """
+        Wait for the task to finish. Set and return the returncode.
+
+        Returns
+        -------
+        int
+            returncode of the task
+
+        Raises
+        ------
+        RuntimeError
+            If the task has never been submitted.
+        """
+        if self._jobid is None:
+            raise RuntimeError("Can only wait for submitted tasks with "
+                               + "known id. Did you ever submit the task?")
+        if self._result is None:
+            self._result = await self.executor.wait_for_task(self._jobid)
+            self.executor.forget_task(self._jobid)
+        if (((self.returncode == 0) and (self._stdfiles_removal == "success"))
+                or self._stdfiles_removal == "yes"
+                or self._stdfiles_removal == "always"):
+            # read them in and cache them so we can still call communicate()
+            # to get the data later
+            await self._read_stdfiles()
+            await self._remove_stdfiles_async()
+        return self.returncode
+
+    async def communicate(self, input: typing.Optional[bytes] = None
+                          ) -> tuple[bytes, bytes]:
+        """
+        Interact with process. Optionally send data to the process.
+        Wait for the process to finish, then read from stdout and stderr (files)
+        and return the data.
+
+        Parameters
+        ----------
+        input : bytes or None, optional
+            The input data to send to the process, by default None.
+            Note that you an only send data to processes created/submited with
+            stdin set.
+
+        Returns
+        -------
+        tuple[bytes, bytes]
+            (stdout, stderr)
+
+        Raises
+        ------
+        RuntimeError
+            If the task has never been submitted.
+        ValueError
+            If stdin is not None but the process was created without stdin set.
+        """
+        if self._jobid is None:
+            raise RuntimeError("Can only wait for submitted tasks with "
+                               + "known id. Did you ever submit the task?")
+        if input is not None:
+            if self._stdin is None:
+                raise ValueError("Can only send input to a PilotProcess "
+                                 + "created/submited with stdin (file) given.")
+            async with _SEMAPHORES["MAX_FILES_OPEN"]:
+                async with aiofiles.open(os.path.join(self.workdir,
+                                                      f"{self._stdin}"),
+                                         "wb",
+                                         ) as f:
+                    await f.write(input)
+        await self.wait()
+        return await self._read_stdfiles()
+
+    def terminate(self) -> None:
+        """
+        Terminate (cancel) the task.
+
+        This does not block, when called from within a running event loop the
+        task is canceled in a background task (errors are logged), see
+        :meth:`terminate_async` to wait for the cancelation. Without running
+        event loop we only remove the task from the queue or tell its worker
+        to stop it.
+
+        Raises
+        ------
+        RuntimeError
+            If no task id is known, e.g. because it was never submitted.
+        """
+        if self._jobid is None:
+            raise RuntimeError("Can not cancel a task with unknown id. "
+                               + "Did you ever submit it?")
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # no running loop (e.g. at interpreter shutdown), so we can not
+            # wait for the worker
+            self.executor._cancel_task_nowait(task_id=self._jobid)
+        else:
+            run_in_background(self.terminate_async())
+
+    async def terminate_async(self) -> None:
+        """
+        Terminate (cancel) the task and wait until it is canceled.
+
+        Raises
+        ------
+        RuntimeError
+            If no task id is known, e.g. because it was never submitted.
+        """
+        if self._jobid is None:
+            raise RuntimeError("Can not cancel a task with unknown id. "
+                               + "Did you ever submit it?")
+        await self.executor.cancel_task(task_id=self._jobid)
+        if self._result is None:
+            self._result = await self.executor.wait_for_task(self._jobid)
+            self.executor.forget_task(self._jobid)
+        if (self._stdfiles_removal == "yes"
+                or self._stdfiles_removal == "always"):
+            # read them in and cache them (as in wait)
+            await self._read_stdfiles()
+            await self._remove_stdfiles_async()
+
+    def kill(self) -> None:
+        """Alias for :meth:`terminate`."""
+        self.terminate()
+
+
+async def create_pilotprocess_submit(executor: PilotJobExecutor,
+                                     jobname: str,
+                                     sbatch_script: str,
+                                     workdir: str,
+                                     time: typing.Optional[float] = None,
+                                     stdfiles_removal: str = "success",
+                                     stdin: typing.Optional[str] = None,
+                                     ) -> PilotProcess:
+    """
+    Create and submit a PilotProcess.
+
+    All arguments are directly passed trough to :meth:`PilotProcess.__init__`
+    and :meth:`PilotProcess.submit`.
+
+    Parameters
+    ----------
+    executor : PilotJobExecutor
+        The executor whose workers run the task.
+    jobname : str
+        Name of the task, used for the stdfile names.
+    sbatch_script : str
+        Absolute or relative path to a (bash) script.
+    workdir : str
+        Absolute or relative path to use as working directory.
+    time : float or None
+        Timelimit for the task in hours.
+    stdfiles_removal : str
+        Whether to remove the stdout, stderr (and possibly stdin) files, see
+        :class:`PilotProcess`.
+    stdin : str or None
+        If given it is interpreted as a file to which we connect the scripts
+        stdin.
+
+    Returns
+    -------
+    PilotProcess
+        The submitted pilot process instance.
+    """
+    proc = PilotProcess(jobname=jobname, sbatch_script=sbatch_script,
+                        executor=executor, workdir=workdir, time=time,
+                        stdfiles_removal=stdfiles_removal,
+                        )
+    await proc.submit(stdin=stdin)
+    return proc
@@ -14,12 +14,17 @@
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import collections
+import datetime
+import json
 import logging
+import random
 import re
 import shlex
 import subprocess
+import tempfile
 import time
 import typing
+import warnings
 import os
 import aiofiles
 import aiofiles.os
@@ -27,8 +32,10 @@ import aiofiles.os
 from .tools import (ensure_executable_available,
                     remove_file_if_exist_async,
                     remove_file_if_exist,
+                    run_in_background,
                     )
 from ._config import _SEMAPHORES
+from . import _fswatch
 
 
 logger = logging.getLogger(__name__)
@@ -71,9 +78,12 @@ _SLURM_STATE_TO_EXITCODE = {
     "NODE_FAIL": 2,
     "OUT_OF_MEMORY": 1,  # Job experienced out of memory error.
     "PENDING": None,  # Job is awaiting resource allocation.
-    # NOTE: preemption means interupting a process to later restart it,
-    #       i.e. None is probably the right thing to return
-    "PREEMPTED": None,  # Job terminated due to preemption.
+    # NOTE: PREEMPTED is a final state, a job that is preempted and requeued
+    #       by SLURM (same jobid) shows up as REQUEUED/PENDING again, i.e.
+    #       if we would return None we could wait forever for a preempted job
+    #       Note that 'PREEMPTED' does not contain 'fail', i.e. it is not
+    #       counted as a node failure by the node fail heuristic
+    "PREEMPTED": 1,  # Job terminated due to preemption.
     "RUNNING": None,  # Job currently has an allocation.
     "REQUEUED": None,  # Job was requeued.
     # Job is about to change size.
@@ -88,6 +98,106 @@ _SLURM_STATE_TO_EXITCODE = {
     "TIMEOUT": 1,  # TODO: can this happen for jobs that finish properly?
 }
 
+# node states (as reported by sinfo --format='%T') in which SLURM does not
+# start new jobs on the node, cf. https://slurm.schedmd.com/sinfo.html#SECTION_NODE-STATE-CODES
+_SINFO_UNAVAILABLE_STATES = {"down", "drained", "draining", "fail", "failing",
+                             "maint", "future", "inval", "unknown",
+                             "reboot_issued", "reboot_requested",
+                             }
+
+
+# sbatch errors (on stderr) after which we retry the submission, i.e. errors
+# that hint at a busy/unreachable slurmctld and not at a problem with the job
+_SBATCH_TRANSIENT_ERRORS_REGEX = re.compile(
+        r"socket timed out|timed out|unable to contact slurm controller"
+        + r"|temporarily unable to accept job|resource temporarily unavailable"
+        + r"|connection refused|zero bytes were transmitted or received"
+        + r"|slurmctld.*(?:busy|not responding)",
+        flags=re.IGNORECASE,
+                                            )
+# transient errors after which the job might have been submitted anyway
+_SBATCH_AMBIGUOUS_ERRORS_REGEX = re.compile(
+        r"timed out|zero bytes were transmitted or received",
+        flags=re.IGNORECASE,
+                                            )
+
+
+# the fields we query from sacct (in this order)
+_SACCT_FIELDS = ["jobid", "state", "exitcode", "nodelist",
+                 # accounting fields
+                 "submit", "eligible", "start", "end", "elapsedraw",
+                 "alloccpus", "totalcpu", "maxrss", "partition", "qos",
+                 ]
+# jobinfo keys for the accounting values, see SlurmProcess.accounting
+_ACCOUNTING_KEYS = ["submit", "eligible", "start", "end", "elapsed",
+                    "alloc_cpus", "total_cpu", "max_rss", "partition", "qos"]
+
+
+def _queue_wait(info: dict) -> typing.Union[float, None]:
+    # time (in seconds) a job waited in the queue, counted from when it became
+    # eligible (i.e. not including the time it waited for dependencies)
+    submit = info["eligible"] if info["eligible"] is not None else info["submit"]
+    if submit is None or info["start"] is None:
+        return None
+    return max(info["start"] - submit, 0.)
+
+
+def _parse_slurm_timestamp(val: str) -> typing.Union[float, None]:
+    # e.g. '2023-03-17T12:01:02', but also 'Unknown' or 'None'
+    try:
+        return datetime.datetime.fromisoformat(val.strip()).timestamp()
+    except ValueError:
+        return None
+
+
+def _parse_slurm_duration(val: str) -> typing.Union[float, None]:
+    # [DD-[HH:]]MM:SS[.mmm], returns seconds
+    val = val.strip()
+    if not val:
+        return None
+    days = 0
+    if "-" in val:
+        days, val = val.split("-")
+    try:
+        parts = [float(p) for p in val.split(":")]
+        days = int(days)
+    except ValueError:
+        return None
+    seconds = 0.
+    for p in parts:
+        seconds = seconds * 60 + p
+    return days * 86400 + seconds
+
+
+def _parse_slurm_memory(val: str) -> typing.Union[int, None]:
+    # e.g. '1234K', '12.5M' or '0', returns bytes
+    val = val.strip()
+    if not val:
+        return None
+    factor = 1
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    if val[-1].upper() in units:
+        factor = units[val[-1].upper()]
+        val = val[:-1]
+    try:
+        return int(float(val) * factor)
+    except ValueError:
+        return None
+
+
+def _parse_slurm_int(val: str) -> typing.Union[int, None]:
+    try:
+        return int(val.strip())
+    except ValueError:
+        return None
+
+
+def _mean(values: list) -> typing.Union[float, None]:
+    values = [v for v in values if v is not None]
+    if len(values) == 0:
+        return None
+    return sum(values) / len(values)
+
 
 # TODO: better classname?!
 class SlurmClusterMediator:
@@ -100,23 +210,116 @@ class SlurmClusterMediator:
         Name or path to the sinfo executable, by default "sinfo".
     sacct_executable : str
         Name or path to the sacct executable, by default "sacct".
+    squeue_executable : str
+        Name or path to the squeue executable, by default "squeue".
+    scancel_executable : str
+        Name or path to the scancel executable, by default "scancel".
+    use_squeue : bool
+        Whether to use squeue to monitor the state of pending and running
+        jobs, by default True. If True, sacct is only called for jobs that
+        left the queue to get their final state, exitcode and nodelist.
+        If False, sacct is used for all jobs.
+    max_jobids_per_call : int
+        Maximum number of jobids we pass to a single sacct/squeue call, if we
+        monitor more jobs we split them into chunks and query them
+        concurrently.
     min_time_between_sacct_calls : int
-        Minimum time (in seconds) between subsequent sacct calls.
+        Minimum time (in seconds) between subsequent sacct calls. This is also
+        the polling interval used for freshly submitted jobs and for jobs
+        that are about to reach their time limit.
+    max_time_between_sacct_calls : int
+        Maximum time (in seconds) between subsequent sacct calls, i.e. the
+        longest polling interval used for long pending/running jobs.
+    sacct_backoff_factor : float
+        Factor by which the polling interval for a job is increased after
+        every sacct call that did not show a change in its state.
+    max_failed_polls : int
+        Number of consecutive failed polls (e.g. because squeue/sacct can not
+        be executed or exits with an error) after which we give up, i.e. all
+        waiting :meth:`wait_for_state_change` calls raise a `SlurmError`.
+        Between failed polls we back off (starting at one second, multiplied
+        by `sacct_backoff_factor` up to `max_time_between_sacct_calls`).
     num_fails_for_broken_node : int
         Number of failed jobs we need to observe per node before declaring it
         to be broken (and not submitting any more jobs to it).
     success_to_fail_ratio : int
         Number of successful jobs we need to observe per node to decrease the
         failed job counter by one.
+    straggler_fail_weight : float
+        Fraction of a failed job added to the failed job counter of every node
+        a straggling job ran on (i.e. a job that took much longer than usual),
+        see :meth:`note_straggler_on_nodes`. Zero disables it.
+    node_fail_half_life : float
+        Half life (in hours) of the failed job counter of every node, i.e.
+        failures are forgotten over time. Zero or negative values disable the
+        decay.
+    node_probation_interval : float
+        Time (in hours) for which a node declared broken is excluded, after
+        that it is used again on probation, i.e. the next failure on the node
+        excludes it again and the first success releases it (if its decayed
+        failed job counter is below `num_fails_for_broken_node`).
+    max_exclude_nodes : int
+        Maximum number of broken nodes passed to sbatch ``--exclude``, if more
+        nodes are broken we exclude the ones with the highest (decayed) failed
+        job counters. Nodes in `exclude_nodes` set by the user do not count.
+    min_time_between_sinfo_calls : int
+        Minimum time (in seconds) between two sinfo calls to update the node
+        states. Nodes which are down or drained are not passed to
+        ``--exclude`` (SLURM does not use them anyway) and do not count for
+        the broken cluster failsaves.
     exclude_nodes : list[str]
-        List of nodes to exclude in job submissions.
-
+        List of nodes to exclude in job submissions, set by the user. The
+        nodes declared broken by the node fail heuristic are added to it, see
+        :meth:`broken_nodes`.
+    journal_file : str or None
+        Path to the (append-only) journal file, in which we record all
+        submitted jobs, their state changes and the node fail/success counts.
+        If set to an existing journal, the state is restored from it and all
+        jobs which have not been removed from monitoring are monitored again,
+        see also :func:`reattach_slurmprocess`. None means no journal.
+    journal_compaction_interval : int
+        Number of records we append to the journal before we rewrite it with
+        only the current state (i.e. without the finished and removed jobs),
+        the journal is also compacted whenever it is loaded. If the current
+        state has more records we wait for as many appended records.
+    accounting_history_size : int
+        Number of finished jobs for which we keep the accounting records
+        (timestamps, runtime, CPU time and memory usage) to calculate
+        statistics, see :meth:`job_statistics`.
+    max_submissions_per_second : float
+        Maximum (sustained) rate of sbatch calls, submissions exceeding it
+        wait in a (FIFO) queue, see :attr:`submission_backlog`. Zero or
+        negative values mean no limit.
+    submission_burst : int
+        Number of sbatch calls we can make at once (without waiting) before
+        the rate limit applies.
+    max_sbatch_retries : int
+        Number of times we retry a submission that failed with a transient
+        error (e.g. a timeout or slurmctld being busy).
+    sbatch_retry_backoff : float
+        Base time (in seconds) for the exponential backoff between retries,
+        the n-th retry waits a random time between zero and
+        ``sbatch_retry_backoff * 2**n`` seconds.
     """
 
     sinfo_executable = "sinfo"
     sacct_executable = "sacct"
+    squeue_executable = "squeue"
+    scancel_executable = "scancel"
+    # NOTE: squeue asks slurmctld directly, which is usually much cheaper than
+    #       asking the slurm database (sacct), especially on large clusters
+    use_squeue = True
+    max_jobids_per_call = 500
     # wait for at least 5 s between two sacct calls
     min_time_between_sacct_calls = 5
+    # NOTE: the polling interval for each job starts at min_time_between_..
+    #       and is increased by sacct_backoff_factor after every poll without
+    #       state change (up to max_time_between_sacct_calls), it is reset to
+    #       the minimum when the state changes or the job is about to reach
+    #       its time limit
+    max_time_between_sacct_calls = 120
+    sacct_backoff_factor = 1.5
+    max_failed_polls = 10
     # NOTE: We track the number of failed/successfull jobs associated with each
     #       node and use this information to decide if a node is broken
     # number of 'suspected fail' counts that a node needs to accumulate for us
@@ -125,12 +328,50 @@ class SlurmClusterMediator:
     # minimum number of successfuly completed jobs we need to see on a node to
     # decrease the 'suspected fail' counter by one
     success_to_fail_ratio = 50
-    # TODO/FIXME: currently we have some tolerance until a node is declared
-    #             broken but as soon as it is broken it will stay that forever?!
-    #             (here forever means until we reinitialize SlurmClusterMediator)
-
-    def __init__(self, **kwargs) -> None:
+    # jobs that straggle (e.g. the CV jobs we speculatively re-execute) count
+    # as this fraction of a failure for the nodes they ran on
+    straggler_fail_weight = 0.5
+    # NOTE: the fail counts decay exponentially with this half life (in
+    #       hours), such that occasional failures are forgotten during long
+    #       campaigns instead of adding up until the node is declared broken
+    node_fail_half_life = 24.
+    # nodes we declared broken are excluded for this time (in hours), then
+    # they are on probation, i.e. one more failure excludes them again
+    node_probation_interval = 12.
+    # the --exclude list only contains the worst offenders, a very long list
+    # slows down scheduling and blocks more capacity than necessary
+    max_exclude_nodes = 50
+    # update the node states via sinfo at most every 5 min (at submission)
+    min_time_between_sinfo_calls = 300
+    journal_compaction_interval = 10000
+    # NOTE: we keep the accounting records of the last N finished jobs (and
+    #       the durations of the last N calls of every SLURM command), such
+    #       that the memory needed for the statistics is bounded
+    accounting_history_size = 10000
+    # NOTE: all sbatch calls go through a token bucket, such that hundreds of
+    #       simultaneous submissions do not overwhelm slurmctld, and we retry
+    #       (with jittered exponential backoff) if sbatch fails transiently
+    max_submissions_per_second = 10.
+    submission_burst = 20
+    max_sbatch_retries = 5
+    sbatch_retry_backoff = 2.
+
+    def __init__(self, journal_file: typing.Optional[str] = None,
+                 **kwargs) -> None:
         self._exclude_nodes = []
+        self._journal_file = None
+        self._journal_fh = None
+        # number of records in the journal file and how many of them describe
+        # the current state (as of the last compaction)
+        self._journal_n_records = 0
+        self._journal_n_state_records = 0
+        # submission info for all journaled jobs, keys are jobids
+        self._journaled_jobs = {}
+        # jobs restored from the journal that nobody reattached (yet), we
+        # stop monitoring them as soon as they reach a final state and keep
+        # their last known jobinfo (in case they are reattached later)
+        self._unclaimed_jobids = set()
+        self._released_jobinfo = {}
         # make it possible to set any attribute via kwargs
         # check the type for attributes with default values
         dval = object()
@@ -148,22 +389,76 @@ class SlurmClusterMediator:
         # this either checks for our defaults or whatever we just set via kwargs
         self.sacct_executable = ensure_executable_available(self.sacct_executable)
         self.sinfo_executable = ensure_executable_available(self.sinfo_executable)
-        self._node_job_fails = collections.Counter()
+        self.scancel_executable = ensure_executable_available(
+                                                    self.scancel_executable
+                                                              )
+        if self.use_squeue:
+            self.squeue_executable = ensure_executable_available(
+                                                        self.squeue_executable
+                                                                 )
+        # (decayed) fail counts of the nodes and the time of their last update
+        self._node_job_fails = {}
+        self._node_fail_times = {}
         self._node_job_successes = collections.Counter()
+        # time at which we declared the (still not released) nodes broken
+        self._node_broken_since = {}
         self._all_nodes = self.list_all_nodes()
-        self._jobids = []  # list of jobids of jobs we know about
-        self._jobids_sacct = []  # list of jobids we monitor actively via sacct
+        # nodes which sinfo reports as down/drained, updated at submission
+        self._unavailable_nodes = set()
+        self._last_sinfo_call = 0
+        # NOTE: we use the keys of self._jobinfo as registry of all jobs we
+        #       know about, additionally we keep a set of the jobids we monitor
+        #       actively, i.e. of all jobs that did not reach a final state
+        #       (both make adding/removing jobs O(1), which matters when we
+        #        monitor tens of thousands of jobs)
+        self._jobids_sacct = set()  # jobids we monitor actively via sacct
         # we will store the info about jobs in a dict keys are jobids
         # values are dicts with key queried option and value the (parsed)
         # return value
         # currently queried options are: state, exitcode and nodelist
         self._jobinfo = {}
         self._last_sacct_call = 0  # make sure we dont call sacct too often
+        # polling schedule for every job, keys are jobids, values are dicts
+        # with the current polling interval, the time of the next poll and
+        # the time limit and start time (if known)
+        self._poll_schedule = {}
+        # futures of waiters for state changes, keys are jobids, values are
+        # lists of tuples (state when waiting started, future)
+        self._state_waiters = collections.defaultdict(list)
+        # the polling task, created on first use (we need a running loop)
+        self._poll_task = None
+        # set to wake up the polling task before the next scheduled poll,
+        # see request_poll (created with the polling task)
+        self._poll_wakeup = None
         # make sure we can only call sacct once at a time
         # (since there is only one ClusterMediator at a time we can create
         #  the semaphore here in __init__)
         self._sacct_semaphore = asyncio.BoundedSemaphore(1)
+        # jobs to cancel in the next scancel call, keys are jobids,
+        # values the futures the cancelers wait for
+        self._scancel_pending = {}
+        self._scancel_scheduled = False
+        # the time from which the next sbatch call may happen (the token
+        # bucket) and the number of submissions waiting for it
+        self._next_submission_time = 0.
+        self._submission_backlog = 0
+        # start time estimates (sbatch --test-only) used to choose partitions,
+        # keys are (sbatch options, time, partition, qos), values are tuples
+        # (time of the estimate, task returning the estimated start)
+        self._start_estimates = {}
+        # accounting records of finished jobs (and the jobnames to tag them)
+        self._jobnames = {}
+        self._finished_jobs = collections.deque(
+                                        maxlen=self.accounting_history_size
+                                                )
+        # durations of the calls to SLURM commands, keys are the command names
+        self._slurm_command_durations = collections.defaultdict(
+                lambda: collections.deque(maxlen=self.accounting_history_size)
+                                                                )
         self._build_regexps()
+        if journal_file is not None:
+            # after everything else is set up, such that we can restore state
+            self.journal_file = journal_file
 
     def _build_regexps(self):
         # first build the regexps used to match slurmstates to assign exitcodes
@@ -187,32 +482,443 @@ class SlurmClusterMediator:
                                                )
                             for e_code, regexp_str in regexp_strings.items()
                                                }
-        # build the regexp used to match and get the main-step lines from sacct
-        # output
-        self._match_mainstep_line_regexp = re.compile(
+        # the regexp used to split the jobids from sacct output into the jobid
+        # of the job (or array task) and the step (e.g. 'batch', if any)
+        self._match_jobid_regexp = re.compile(
             r"""
-            ^\d+  # the jobid at start of the line (but only the non-substeps)
-            \|\|\|\|  # the (first) separator (we set 4 "|" as separator)
-            .*?  # everything until the next separator (non-greedy), i.e. state
-            \|\|\|\|  # the second separator
-            .*?  # exitcode
-            \|\|\|\|  # third separator
-            .*?  # nodes
-            \|\|\|\|  # final (fourth) separator
+            ^(\d+(?:_\d+)?)  # the jobid (with optional array task id)
+            (?:\.(.+))?$  # the (optional) step after a '.'
             """,
-            flags=re.VERBOSE | re.MULTILINE | re.DOTALL,
-                                                      )
+            flags=re.VERBOSE,
+                                              )
 
     @property
     def exclude_nodes(self) -> "list[str]":
-        """Return a list with all nodes excluded from job submissions."""
-        return self._exclude_nodes.copy()
+        """
+        Return a list with all nodes excluded from job submissions.
+
+        These are the nodes set by the user and (at most `max_exclude_nodes`
+        of) the currently broken nodes which are not down or drained anyway,
+        the worst offenders first. Setting it only sets the user nodes.
+        """
+        exclude_nodes = self._exclude_nodes.copy()
+        broken = [node for node in self.broken_nodes()
+                  if (node not in self._unavailable_nodes
+                      and node not in exclude_nodes)
+                  ]
+        return exclude_nodes + broken[:self.max_exclude_nodes]
 
     @exclude_nodes.setter
     def exclude_nodes(self, val : typing.Union[list[str], None]):
         if val is None:
             val = []
         self._exclude_nodes = val
+        self._journal(event="exclude_nodes", nodes=val)
+
+    def broken_nodes(self) -> "list[str]":
+        """
+        List all nodes currently excluded by the node fail heuristic.
+
+        Nodes which are on probation (i.e. for which the probation interval
+        has passed since they have been declared broken) are not included.
+
+        Returns
+        -------
+        list[str]
+            The broken nodes, sorted by their (decayed) failed job counter
+            with the highest counter first.
+        """
+        now = time.time()
+        probation = self.node_probation_interval * 3600
+        broken = [node for node, since in self._node_broken_since.items()
+                  if now - since < probation]
+        return sorted(broken, key=lambda node: self._node_fail_score(node,
+                                                                     now),
+                      reverse=True)
+
+    def node_health(self) -> "dict[str, dict]":
+        """
+        Return the node health as tracked by the node fail heuristic.
+
+        Returns
+        -------
+        dict[str, dict]
+            Keys are the nodes on which we have seen failed jobs, values are
+            dicts with the (decayed) failed job counter ("fail_score"), the
+            number of successes since the last decrease of the counter
+            ("successes"), the time the node has been declared broken (or
+            None, "broken_since") and whether it is currently excluded.
+        """
+        exclude_nodes = set(self.exclude_nodes)
+        now = time.time()
+        return {node: {"fail_score": self._node_fail_score(node, now),
+                       "successes": self._node_job_successes[node],
+                       "broken_since": self._node_broken_since.get(node, None),
+                       "excluded": node in exclude_nodes,
+                       }
+                for node in self._node_job_fails
+                }
+
+    @property
+    def journal_file(self) -> typing.Union[str, None]:
+        """
+        Path to the journal file (None if we do not keep a journal).
+
+        Setting it to an existing journal restores the state from it, i.e. all
+        jobs (and their last known state) that have not been removed from
+        monitoring, the node fail/success counters and the excluded nodes.
+        Restored jobs that are not reattached (see
+        :func:`reattach_slurmprocess`) are only monitored until they reach a
+        final state. They can still be reattached until the journal is loaded
+        again, but they are not restored from it anymore.
+        """
+        return self._journal_file
+
+    @journal_file.setter
+    def journal_file(self, val: typing.Union[str, None]) -> None:
+        if self._journal_fh is not None:
+            self._journal_fh.close()
+            self._journal_fh = None
+        self._journal_file = None
+        if val is None:
+            return
+        val = os.path.abspath(val)
+        if os.path.isfile(val):
+            self._replay_journal(fname=val)
+        self._journal_file = val
+        self._compact_journal()
+
+    def _compact_journal(self) -> None:
+        # write out a compacted journal (only the current state), such that
+        # the journal does not grow indefinitely (neither during long runs nor
+        # over many restarts)
+        if self._journal_fh is not None:
+            self._journal_fh.close()
+            self._journal_fh = None
+        lines = self._journal_state_lines()
+        tmp_fname = self._journal_file + ".tmp"
+        with open(tmp_fname, "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+        os.replace(tmp_fname, self._journal_file)
+        # line buffered, such that every record is written out directly
+        self._journal_fh = open(self._journal_file, "a", buffering=1)
+        self._journal_n_records = self._journal_n_state_records = len(lines)
+
+    def _journal(self, event: str, **data) -> None:
+        # append a record to the journal (if we keep one)
+        if self._journal_fh is None:
+            return
+        data["event"] = event
+        self._journal_fh.write(json.dumps(data) + "\n")
+        self._journal_n_records += 1
+        if (self._journal_n_records - self._journal_n_state_records
+                >= max(self.journal_compaction_interval,
+                       self._journal_n_state_records)):
+            self._compact_journal()
+
+    def _journal_state_lines(self) -> "list[str]":
+        # the current state as journal records
+        lines = []
+        for jobid, info in self._journaled_jobs.items():
+            if jobid not in self._jobinfo:
+                continue  # job no longer monitored
+            lines.append(json.dumps({"event": "submit", "jobid": jobid,
+                                     **info}))
+            jobinfo = self._jobinfo[jobid]
+            lines.append(json.dumps({"event": "state", "jobid": jobid,
+                                     "state": jobinfo["state"],
+                                     "exitcode": jobinfo["exitcode"],
+                                     "nodelist": jobinfo["nodelist"],
+                                     }))
+        for node in self._node_job_fails:
+            lines.append(json.dumps(self._node_record(node=node)))
+        lines.append(json.dumps({"event": "exclude_nodes",
+                                 "nodes": self._exclude_nodes}))
+        return lines
+
+    def _replay_journal(self, fname: str) -> None:
+        # restore the state from the journal
+        # (note that self._journal_fh is None, i.e. we do not journal here)
+        legacy_broken = set()
+        with open(fname, "r") as f:
+            for line_num, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                    event = record.pop("event")
+                except (json.JSONDecodeError, KeyError):
+                    # probably the last line of a crashed controller
+                    logger.warning("Could not parse line %d of SLURM journal "
+                                   "%s, skipping it.", line_num, fname)
+                    continue
+                if event == "submit":
+                    jobid = record.pop("jobid")
+                    self._journaled_jobs[jobid] = record
+                    self.monitor_register_job(jobid=jobid,
+                                              time_limit=record.get("time"),
+                                              jobname=record.get("jobname"),
+                                              )
+                elif event == "state":
+                    jobid = record["jobid"]
+                    if jobid not in self._jobinfo:
+                        continue
+                    state = record["state"]
+                    parsed_ec = self._parse_exitcode_from_slurm_state(
+                                                            slurm_state=state
+                                                                      )
+                    self._jobinfo[jobid].update(
+                                        state=state,
+                                        exitcode=record["exitcode"],
+                                        nodelist=record["nodelist"],
+                                        parsed_exitcode=parsed_ec,
+                                                )
+                    if parsed_ec is not None:
+                        self._jobids_sacct.discard(jobid)
+                elif event == "remove":
+                    jobid = record["jobid"]
+                    self._journaled_jobs.pop(jobid, None)
+                    self.monitor_remove_job(jobid=jobid)
+                elif event == "node":
+                    node = record["node"]
+                    self._node_job_fails[node] = record["fails"]
+                    self._node_job_successes[node] = record["successes"]
+                    if "time" in record:
+                        self._node_fail_times[node] = record["time"]
+                        if record["broken_since"] is None:
+                            self._node_broken_since.pop(node, None)
+                        else:
+                            self._node_broken_since[node] = record[
+                                                            "broken_since"]
+                    else:
+                        # journal written before the fail counts decayed,
+                        # the broken nodes were in the exclude_nodes list
+                        self._node_fail_times[node] = time.time()
+                        if record["fails"] >= self.num_fails_for_broken_node:
+                            self._node_broken_since[node] = time.time()
+                            legacy_broken.add(node)
+                elif event == "exclude_nodes":
+                    self._exclude_nodes = record["nodes"]
+        if len(legacy_broken) > 0:
+            self._exclude_nodes = [node for node in self._exclude_nodes
+                                   if node not in legacy_broken]
+        self._unclaimed_jobids = {jobid for jobid in self._journaled_jobs
+                                  if jobid in self._jobinfo}
+        for jobid in list(self._unclaimed_jobids):
+            if self._jobinfo[jobid]["parsed_exitcode"] is not None:
+                self._release_unclaimed_job(jobid=jobid)
+        logger.info("Restored %d jobs from SLURM journal %s.",
+                    len(self._journaled_jobs), fname)
+
+    def journal_submission(self, jobid: str, **info) -> None:
+        """
+        Record the submission of a job in the journal.
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the submitted job.
+        **info
+            Everything needed to reconstruct the :class:`SlurmProcess` for the
+            job, i.e. jobname, sbatch_script, workdir, time, stdfiles_removal,
+            stdin, dependency, requeue, completion_files, partition, qos and
+            exclude_nodes.
+        """
+        if self._journal_fh is None:
+            return
+        self._journaled_jobs[jobid] = info
+        self._journal(event="submit", jobid=jobid, **info)
+
+    def journaled_job_info(self, jobid: str) -> dict:
+        """
+        Return the submission info for a journaled job.
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the job.
+
+        Returns
+        -------
+        dict
+            Submission info as passed to :meth:`journal_submission`.
+
+        Raises
+        ------
+        SlurmError
+            If the job is not in the journal.
+        """
+        try:
+            return self._journaled_jobs[jobid].copy()
+        except KeyError:
+            raise SlurmError(f"Job with id {jobid} not in journal.") from None
+
+    def find_journaled_jobs(self, jobname: typing.Optional[str] = None,
+                            workdir: typing.Optional[str] = None,
+                            ) -> "list[str]":
+        """
+        Find the jobids of journaled jobs matching jobname and/or workdir.
+
+        Parameters
+        ----------
+        jobname : str or None, optional
+            The jobname to match, by default None (match all jobnames).
+        workdir : str or None, optional
+            The workdir to match, by default None (match all workdirs).
+
+        Returns
+        -------
+        list[str]
+            The jobids of all matching jobs in order of submission.
+        """
+        if workdir is not None:
+            workdir = os.path.abspath(workdir)
+        return [jobid for jobid, info in self._journaled_jobs.items()
+                if (jobname is None or info["jobname"] == jobname)
+                and (workdir is None or info["workdir"] == workdir)
+                ]
+
+    def _release_unclaimed_job(self, jobid: str) -> None:
+        # stop monitoring a job restored from the journal which nobody
+        # reattached and which reached a final state, it stays in
+        # self._journaled_jobs (such that it can still be reattached), but it
+        # will not be restored from the journal anymore
+        self._unclaimed_jobids.discard(jobid)
+        self._released_jobinfo[jobid] = self._jobinfo[jobid].copy()
+        self._stop_monitoring(jobid=jobid)
+        self._journal(event="remove", jobid=jobid)
+        logger.debug("Stopped monitoring job with id %s restored from the "
+                     "journal, it reached a final state without being "
+                     "reattached.", jobid)
+
+    def _claim_journaled_job(self, jobid: str) -> dict:
+        # make sure we monitor a journaled job (again) because somebody
+        # reattached it, returns the submission info
+        info = self.journaled_job_info(jobid=jobid)
+        self._unclaimed_jobids.discard(jobid)
+        # this is a no-op for jobs we still monitor (but it makes sure we
+        # monitor the job in any case)
+        self.monitor_register_job(jobid=jobid, time_limit=info["time"],
+                                  jobname=info["jobname"])
+        jobinfo = self._released_jobinfo.pop(jobid, None)
+        if jobinfo is None:
+            return info
+        self._jobinfo[jobid].update(jobinfo)
+        # the job is done, no need to ask sacct about it
+        self._jobids_sacct.discard(jobid)
+        self._journal(event="submit", jobid=jobid, **info)
+        self._journal(event="state", jobid=jobid, state=jobinfo["state"],
+                      exitcode=jobinfo["exitcode"],
+                      nodelist=jobinfo["nodelist"])
+        return info
+
+    @property
+    def submission_backlog(self) -> int:
+        """
+        Number of submissions currently waiting for the submission rate limit.
+
+        Submissions waiting to retry after a transient sbatch error are
+        included. Use this (or :meth:`submission_delay`) to notice
+        back-pressure, i.e. that we submit faster than we are allowed to.
+        """
+        return self._submission_backlog
+
+    def submission_delay(self) -> float:
+        """
+        Time (in seconds) a submission made now would wait for its turn.
+
+        Returns
+        -------
+        float
+            The expected wait due to the submission rate limit (not including
+            retries), zero if we can submit right away.
+        """
+        if self.max_submissions_per_second <= 0:
+            return 0.
+        now = time.time()
+        interval = 1 / self.max_submissions_per_second
+        slot = max(self._next_submission_time,
+                   now - (self.submission_burst - 1) * interval)
+        return max(slot - now, 0.)
+
+    async def wait_for_submission_slot(self) -> None:
+        """
+        Wait until we may call sbatch (the next time).
+
+        Implements a token bucket with rate ``max_submissions_per_second`` and
+        size ``submission_burst``, the slots are handed out in the order of
+        the calls to this method.
+        """
+        if self.max_submissions_per_second <= 0:
+            return
+        now = time.time()
+        interval = 1 / self.max_submissions_per_second
+        # reserve our slot (directly, i.e. first come first served)
+        slot = max(self._next_submission_time,
+                   now - (self.submission_burst - 1) * interval)
+        self._next_submission_time = slot + interval
+        if slot <= now:
+            return
+        logger.debug("Waiting %.2f s for the submission rate limit (%d "
+                     "submissions waiting).", slot - now,
+                     self._submission_backlog)
+        self._submission_backlog += 1
+        try:
+            await asyncio.sleep(slot - now)
+        finally:
+            self._submission_backlog -= 1
+
+    async def find_unknown_jobs(self, jobname: str, workdir: str,
+                                submitted_after: float) -> "list[str]":
+        """
+        Find jobs with given name and workdir we do not know about (yet).
+
+        Used after an sbatch call that failed in an ambiguous way (e.g. timed
+        out), to find out if the job has been submitted anyway.
+
+        Parameters
+        ----------
+        jobname : str
+            The SLURM jobname.
+        workdir : str
+            The working directory of the job.
+        submitted_after : float
+            Only consider jobs submitted after this time (in seconds since the
+            epoch).
+
+        Returns
+        -------
+        list[str]
+            The jobids (of the allocations, i.e. without steps and array task
+            ids) of all matching jobs not registered for monitoring.
+        """
+        starttime = datetime.datetime.fromtimestamp(
+                                            submitted_after
+                                            ).isoformat(timespec="seconds")
+        sacct_cmd = (f"{self.sacct_executable} --noheader --parsable"
+                     + f" --name={jobname} --starttime={starttime}"
+                     + " --format=jobid,workdir,submit")
+        returncode, stdout, stderr = await self._run_slurm_command(sacct_cmd)
+        if returncode != 0:
+            logger.warning("sacct returned non-zero exit code %s while "
+                           "looking for job %s (stderr: %s).",
+                           returncode, jobname, stderr)
+            return []
+        jobids = []
+        for line in stdout.split("\n"):
+            splits = line.split("|")
+            if len(splits) < 3 or "." in splits[0]:
+                continue  # empty line or a step
+            jobid = splits[0].split("_")[0]
+            submit = _parse_slurm_timestamp(splits[2])
+            # NOTE: sacct --starttime only has second resolution
+            if (os.path.abspath(splits[1]) != os.path.abspath(workdir)
+                    or (submit is not None and submit < submitted_after - 1)
+                    or jobid in self._jobinfo
+                    or f"{jobid}_0" in self._jobinfo
+                    or jobid in jobids):
+                continue
+            jobids.append(jobid)
+        return jobids
 
     def list_all_nodes(self) -> "list[str]":
         """
@@ -231,8 +937,60 @@ class SlurmClusterMediator:
         node_list = node_list[:-1]
         return node_list
 
+    async def update_node_states(self, force: bool = False) -> None:
+        """
+        Update the node states via sinfo (if the last call is not too recent).
+
+        Nodes that are down, drained, draining, failing or in maintenance are
+        not passed to ``--exclude`` (SLURM does not schedule jobs on them
+        anyway) and are ignored in the failsaves for broken nodes.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Call sinfo independent of the time since the last call,
+            by default False.
+        """
+        now = time.time()
+        if (not force and (now - self._last_sinfo_call
+                           < self.min_time_between_sinfo_calls)):
+            return
+        # set it first, such that concurrent submissions do not call sinfo too
+        self._last_sinfo_call = now
+        # one line per node (and partition) with hostname and (long) state
+        sinfo_cmd = (f"{self.sinfo_executable} --noheader --Node"
+                     + " --format='%n %T'")
+        returncode, stdout, stderr = await self._run_slurm_command(sinfo_cmd)
+        if returncode != 0:
+            logger.warning("sinfo returned non-zero exit code %s (stderr: %s)."
+                           " Keeping the previous node states.",
+                           returncode, stderr)
+            return
+        all_nodes = set()
+        unavailable = set()
+        for line in stdout.split("\n"):
+            splits = line.split()
+            if len(splits) < 2:
+                continue
+            node, state = splits[0], splits[1].lower()
+            all_nodes.add(node)
+            # the state can have a suffix, e.g. 'down*' (not responding) or
+            # 'idle~' (powered off), see `man sinfo`
+            if (state.endswith("*")
+                    or state.rstrip("*~#!%$@^-+") in _SINFO_UNAVAILABLE_STATES):
+                unavailable.add(node)
+        if len(all_nodes) > 0:
+            self._all_nodes = sorted(all_nodes)
+        if unavailable != self._unavailable_nodes:
+            logger.info("Nodes %s are down or drained according to sinfo.",
+                        sorted(unavailable))
+        self._unavailable_nodes = unavailable
+
     # TODO: better func names?
-    def monitor_register_job(self, jobid: str) -> None:
+    def monitor_register_job(self, jobid: str,
+                             time_limit: typing.Optional[float] = None,
+                             jobname: typing.Optional[str] = None,
+                             ) -> None:
         """
         Add job with given jobid to sacct monitoring calls.
 
@@ -240,8 +998,13 @@ class SlurmClusterMediator:
         ----------
         jobid : str
             The SLURM jobid of the job to monitor.
+        time_limit : float or None
+            The time limit of the job in hours (if known), used to poll more
+            frequently when the job is about to reach its time limit.
+        jobname : str or None
+            The jobname (if known), used to group the accounting statistics.
         """
-        if jobid not in self._jobids:
+        if jobid not in self._jobinfo:
             # we use a dict with defaults to make sure that we get a 'PENDING'
             # for new jobs because this will make us check again in a bit
             # (sometimes there is a lag between submission and the appearance
@@ -250,10 +1013,22 @@ class SlurmClusterMediator:
                                     "exitcode": None,
                                     "parsed_exitcode": None,
                                     "nodelist": [],
+                                    # accounting info, the timestamps are
+                                    # our observations until sacct tells us
+                                    **{key: None for key in _ACCOUNTING_KEYS},
+                                    "submit": time.time(),
                                     }
+            if jobname is not None:
+                self._jobnames[jobid] = jobname
+            self._poll_schedule[jobid] = {
+                    "interval": self.min_time_between_sacct_calls,
+                    "next": time.time() + self.min_time_between_sacct_calls,
+                    "time_limit": (None if time_limit is None
+                                   else time_limit * 3600),
+                    "start": None,
+                                          }
             # add the jobid to the sacct calls only **after** we set the defaults
-            self._jobids.append(jobid)
-            self._jobids_sacct.append(jobid)
+            self._jobids_sacct.add(jobid)
             logger.debug("Registered job with id %s for sacct monitoring.",
                          jobid,
                          )
@@ -272,20 +1047,38 @@ class SlurmClusterMediator:
         jobid : str
             The SLURM jobid of the job to remove.
         """
-        if jobid in self._jobids:
-            self._jobids.remove(jobid)
-            del self._jobinfo[jobid]
-            try:
-                self._jobids_sacct.remove(jobid)
-            except ValueError:
-                pass  # already not actively monitored anymore
+        if jobid in self._jobinfo:
+            self._stop_monitoring(jobid=jobid)
+            self._unclaimed_jobids.discard(jobid)
+            if self._journaled_jobs.pop(jobid, None) is not None:
+                self._journal(event="remove", jobid=jobid)
             logger.debug("Removed job with id %s from sacct monitoring.",
                          jobid,
                          )
         else:
-            logger.info("Not monitoring job with id %s, not removing.",
-                        jobid,
-                        )
+            self._released_jobinfo.pop(jobid, None)
+            if self._journaled_jobs.pop(jobid, None) is not None:
+                # (released) job restored from the journal, the journal
+                # already knows it is removed
+                logger.debug("Removed job with id %s from the journaled jobs.",
+                             jobid,
+                             )
+            else:
+                logger.info("Not monitoring job with id %s, not removing.",
+                            jobid,
+                            )
+
+    def _stop_monitoring(self, jobid: str) -> None:
+        jobinfo = self._jobinfo.pop(jobid)
+        self._jobnames.pop(jobid, None)
+        del self._poll_schedule[jobid]
+        # wake up everyone still waiting for this job, they will get the
+        # last known jobinfo
+        for _, fut in self._state_waiters.pop(jobid, []):
+            if not fut.done():
+                fut.set_result(jobinfo.copy())
+        # (might be already not actively monitored anymore)
+        self._jobids_sacct.discard(jobid)
 
     async def get_info_for_job(self, jobid: str) -> dict:
         """
@@ -303,6 +1096,281 @@ class SlurmClusterMediator:
              the keys (str) are sacct format fields,
              the values are the (parsed) corresponding values.
         """
+        await self._update_cached_jobinfo_ratelimited()
+        return self._jobinfo[jobid].copy()
+
+    async def wait_for_state_change(self, jobid: str,
+                                    last_state: typing.Optional[str] = None,
+                                    ) -> dict:
+        """
+        Wait until the state of the job with given jobid changes.
+
+        The waiting is done via a future which is resolved by the (single)
+        polling loop of the mediator. The polling loop adapts its interval to
+        the jobs it is waiting for, see ``min_time_between_sacct_calls``,
+        ``max_time_between_sacct_calls`` and ``sacct_backoff_factor``.
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the job.
+        last_state : str or None
+            The last state of the job known to the caller, we return as soon
+            as the state differs from it. If None, the currently cached state
+            is used.
+
+        Returns
+        -------
+        dict
+            Dictionary with information about the job, as returned by
+            :meth:`get_info_for_job`.
+
+        Raises
+        ------
+        SlurmError
+            If the job is not monitored (anymore).
+        """
+        try:
+            jobinfo = self._jobinfo[jobid]
+        except KeyError:
+            raise SlurmError(f"Job with id {jobid} is not monitored. Can not "
+                             "wait for it to change state.") from None
+        if last_state is None:
+            last_state = jobinfo["state"]
+        elif last_state != jobinfo["state"]:
+            # already changed
+            return jobinfo.copy()
+        fut = asyncio.get_running_loop().create_future()
+        self._state_waiters[jobid].append((last_state, fut))
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_wakeup = asyncio.Event()
+            self._poll_task = asyncio.create_task(self._poll_loop())
+        try:
+            return await fut
+        finally:
+            try:
+                self._state_waiters[jobid].remove((last_state, fut))
+            except ValueError:
+                pass  # already removed (when the state changed)
+            if len(self._state_waiters.get(jobid, [])) == 0:
+                self._state_waiters.pop(jobid, None)
+
+    def request_poll(self, jobid: str) -> None:
+        """
+        Poll the state of the job with given jobid as soon as possible.
+
+        Used when we have a hint that the job changed its state, e.g. because
+        its output files appeared. Note that we still do not call sacct more
+        often than ``min_time_between_sacct_calls`` allows.
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the job.
+        """
+        sched = self._poll_schedule.get(jobid, None)
+        if sched is None:
+            return
+        sched["interval"] = self.min_time_between_sacct_calls
+        sched["next"] = time.time()
+        if self._poll_wakeup is not None:
+            self._poll_wakeup.set()
+
+    async def cancel_job(self, jobid: str) -> None:
+        """
+        Cancel the SLURM job with given jobid and remove it from monitoring.
+
+        All jobs that are canceled in the same iteration of the event loop
+        (e.g. when canceling an `asyncio.gather` of many jobs) are collected
+        and canceled together with one (or a few, see `max_jobids_per_call`)
+        scancel call(s).
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the job to cancel.
+
+        Raises
+        ------
+        SlurmCancelationError
+            If scancel has non-zero returncode.
+        """
+        loop = asyncio.get_running_loop()
+        fut = self._scancel_pending.get(jobid, None)
+        if fut is None:
+            fut = loop.create_future()
+            self._scancel_pending[jobid] = fut
+            if not self._scancel_scheduled:
+                # run after everything that is ready in this loop iteration,
+                # i.e. after all other jobs canceled at the same time
+                self._scancel_scheduled = True
+                loop.call_soon(self._start_scancel_task)
+        # shield, such that the (shared) future survives if we get canceled
+        await asyncio.shield(fut)
+
+    def _start_scancel_task(self) -> None:
+        pending = self._scancel_pending
+        self._scancel_pending = {}
+        self._scancel_scheduled = False
+        self.run_in_background(self._run_scancel(pending=pending))
+
+    def run_in_background(self, coro: typing.Coroutine) -> asyncio.Task:
+        """
+        Run the given coroutine as task without anyone awaiting it.
+
+        See :func:`asyncmd.tools.run_in_background`.
+
+        Parameters
+        ----------
+        coro : typing.Coroutine
+            The coroutine to run.
+
+        Returns
+        -------
+        asyncio.Task
+            The task wrapping the coroutine.
+        """
+        return run_in_background(coro)
+
+    async def _run_scancel(self, pending: "dict[str, asyncio.Future]") -> None:
+        # cancel all jobs in pending and set the results of their futures
+        chunks = self._chunk_jobids(jobids=list(pending))
+        results = await asyncio.gather(
+                    *(self._run_slurm_command(f"{self.scancel_executable} "
+                                              + " ".join(chunk))
+                      for chunk in chunks),
+                    return_exceptions=True,
+                                       )
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                err = result
+            elif result[0] != 0:
+                err = SlurmCancelationError(
+                        "Something went wrong canceling the slurm jobs "
+                        + f"{chunk}. scancel had exitcode {result[0]}"
+                        + f" and output {result[1]} {result[2]}."
+                                            )
+            else:
+                err = None
+                logger.debug("Canceled SLURM jobs with jobids %s. scancel "
+                             "returned %s.", chunk, result[1])
+            if err is not None:
+                logger.error("Could not cancel SLURM jobs %s: %s", chunk, err)
+            for jobid in chunk:
+                fut = pending[jobid]
+                if fut.done():
+                    continue
+                if err is None:
+                    # remove the job from the monitoring
+                    self.monitor_remove_job(jobid=jobid)
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(err)
+                    # the futures are shielded, i.e. the awaiting cancel_job
+                    # calls might be gone (canceled) already, mark the
+                    # exception as retrieved such that asyncio does not
+                    # complain (we logged it above)
+                    fut.exception()
+
+    async def _poll_loop(self) -> None:
+        # the one and only polling loop, runs as long as we have waiters
+        n_failed_polls = 0
+        retry_at = 0
+        while len(self._state_waiters) > 0:
+            now = time.time()
+            next_poll = min((self._poll_schedule[jobid]["next"]
+                             for jobid in self._state_waiters
+                             if jobid in self._poll_schedule),
+                            default=now)
+            # but never call sacct more often than the minimum time allows
+            # (and back off after failed polls)
+            next_poll = max(next_poll, retry_at,
+                            (self._last_sacct_call
+                             + self.min_time_between_sacct_calls))
+            self._poll_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._poll_wakeup.wait(),
+                                       timeout=max(0, next_poll - now))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                # someone requested a poll, recalculate when to poll
+                continue
+            if len(self._state_waiters) == 0:
+                break
+            try:
+                await self._update_cached_jobinfo_ratelimited()
+            except Exception as e:
+                # the waiters depend on us, so we try again (after a while)
+                n_failed_polls += 1
+                if n_failed_polls >= self.max_failed_polls:
+                    logger.error("Polling the job states failed %d times in "
+                                 "a row, giving up. The last error was: %s",
+                                 n_failed_polls, e)
+                    self._fail_state_waiters(err=e)
+                    break
+                delay = min(self.sacct_backoff_factor ** (n_failed_polls - 1),
+                            self.max_time_between_sacct_calls)
+                logger.warning("Polling the job states failed (%s), trying "
+                               "again in %.1f s (%d of %d).", e, delay,
+                               n_failed_polls, self.max_failed_polls)
+                retry_at = time.time() + delay
+                continue
+            n_failed_polls = 0
+            retry_at = 0
+            self._update_poll_schedule()
+
+    def _fail_state_waiters(self, err: Exception) -> None:
+        # make all waiters raise instead of waiting for a poll that never comes
+        for jobid, waiters in self._state_waiters.items():
+            for _, fut in waiters:
+                if not fut.done():
+                    exc = SlurmError(f"Could not poll the state of job {jobid}"
+                                     f" ({type(err).__name__}: {err}).")
+                    exc.__cause__ = err
+                    fut.set_exception(exc)
+
+    def _update_poll_schedule(self) -> None:
+        # called after every sacct call, backoff the polling interval for all
+        # jobs that did not change their state and adapt the interval for jobs
+        # that are close to their time limit
+        now = time.time()
+        for jobid, sched in self._poll_schedule.items():
+            if sched["next"] > now:
+                # not yet due (but polled anyway together with other jobs)
+                continue
+            interval = min(sched["interval"] * self.sacct_backoff_factor,
+                           self.max_time_between_sacct_calls)
+            if sched["start"] is not None and sched["time_limit"] is not None:
+                remaining = sched["start"] + sched["time_limit"] - now
+                if remaining < interval:
+                    # poll around the expected end (but not faster than min)
+                    interval = max(remaining,
+                                   self.min_time_between_sacct_calls)
+            sched["interval"] = interval
+            sched["next"] = now + interval
+
+    def _note_state_change(self, jobid: str, state: str) -> None:
+        # called when we detect a state change of a job in the sacct output
+        # reset the polling interval and resolve the waiters futures
+        now = time.time()
+        jobinfo = self._jobinfo[jobid]
+        if "RUNNING" in state and jobinfo["start"] is None:
+            jobinfo["start"] = now
+        elif jobinfo["parsed_exitcode"] is not None and jobinfo["end"] is None:
+            jobinfo["end"] = now
+        sched = self._poll_schedule.get(jobid, None)
+        if sched is not None:
+            if "RUNNING" in state and sched["start"] is None:
+                sched["start"] = now
+            sched["interval"] = self.min_time_between_sacct_calls
+            sched["next"] = now + sched["interval"]
+        for last_state, fut in self._state_waiters.get(jobid, []):
+            if last_state != state and not fut.done():
+                fut.set_result(self._jobinfo[jobid].copy())
+
+    async def _update_cached_jobinfo_ratelimited(self) -> None:
+        """Call sacct if the last call was not too recent."""
         async with self._sacct_semaphore:
             if (time.time() - self._last_sacct_call
                     > self.min_time_between_sacct_calls):
@@ -314,90 +1382,467 @@ class SlurmClusterMediator:
                 # parse the sacct output into the time-delay
                 self._last_sacct_call = time.time()
 
-        return self._jobinfo[jobid].copy()
-
     async def _update_cached_jobinfo(self) -> None:
-        """Call sacct and update cached info for all jobids we know about."""
-        sacct_cmd = f"{self.sacct_executable} --noheader"
-        # query only for the specific job we are running
-        sacct_cmd += f" -j {','.join(self._jobids_sacct)}"
-        sacct_cmd += " -o jobid,state,exitcode,nodelist"
-        # parsable does print the separator at the end of each line
-        sacct_cmd += " --parsable"
-        sacct_cmd += " --delimiter='||||'"  # use 4 "|" as separator char(s)
+        """Update cached info for all jobids we know about."""
+        if len(self._jobids_sacct) == 0:
+            # nothing to query (and sacct would list all jobs without -j)
+            return
+        chunks = self._chunk_jobids(jobids=list(self._jobids_sacct))
+        if self.use_squeue:
+            # get the state for all active jobs from squeue (cheap, as it asks
+            # slurmctld directly) and call sacct only for the jobs that left
+            # the queue (to get their final state, exitcode and nodelist)
+            not_in_queue = await asyncio.gather(
+                    *(self._update_cached_jobinfo_squeue(jobids=chunk)
+                      for chunk in chunks)
+                                                )
+            chunks = self._chunk_jobids(jobids=[jobid
+                                                for chunk in not_in_queue
+                                                for jobid in chunk]
+                                        )
+        await asyncio.gather(*(self._update_cached_jobinfo_sacct(jobids=chunk)
+                               for chunk in chunks)
+                             )
+
+    def _chunk_jobids(self, jobids: "list[str]") -> "list[list[str]]":
+        # split jobids into chunks of at most max_jobids_per_call jobids
+        # this keeps the command lines for sacct/squeue bounded and lets us
+        # query the chunks concurrently
+        return [jobids[i:i + self.max_jobids_per_call]
+                for i in range(0, len(jobids), self.max_jobids_per_call)]
+
+    async def _run_slurm_command(self, cmd: str) -> tuple[int, str, str]:
+        # run the given command (sacct or squeue) and return
+        # returncode, stdout and stderr
         # 3 file descriptors: stdin,stdout,stderr
         # (note that one semaphore counts for 3 files!)
         await _SEMAPHORES["MAX_FILES_OPEN"].acquire()
+        proc = None
+        cmd = shlex.split(cmd)
+        start = time.time()
         try:
-            sacct_proc = await asyncio.subprocess.create_subprocess_exec(
-                                                *shlex.split(sacct_cmd),
+            proc = await asyncio.subprocess.create_subprocess_exec(
+                                                *cmd,
                                                 stdout=asyncio.subprocess.PIPE,
                                                 stderr=asyncio.subprocess.PIPE,
                                                 close_fds=True,
-                                                                          )
-            stdout, stderr = await sacct_proc.communicate()
-            sacct_return = stdout.decode()
+                                                                   )
+            stdout, stderr = await proc.communicate()
         except asyncio.CancelledError as e:
-            sacct_proc.kill()
+            if proc is not None:
+                proc.kill()
             raise e from None
         finally:
             # and put the three back into the semaphore
             _SEMAPHORES["MAX_FILES_OPEN"].release()
+        self._slurm_command_durations[os.path.basename(cmd[0])].append(
+                                                        time.time() - start
+                                                                       )
+        return proc.returncode, stdout.decode(), stderr.decode()
+
+    async def _update_cached_jobinfo_squeue(self, jobids: "list[str]",
+                                            ) -> "list[str]":
+        """
+        Call squeue and update cached info for all given jobs still in queue.
+
+        Parameters
+        ----------
+        jobids : list[str]
+            The jobids to query.
+
+        Returns
+        -------
+        list[str]
+            The jobids of all jobs that are not (active) in the queue anymore,
+            i.e. for which we need to get the (final) state from sacct.
+        """
+        squeue_cmd = f"{self.squeue_executable} --noheader"
+        # query only for the specific jobs we are monitoring,
+        # '--array' gives one line per array task (also for pending ones)
+        squeue_cmd += f" --array --jobs={','.join(jobids)}"
+        squeue_cmd += " --format='%i||||%T||||%N||||'"
+        returncode, squeue_return, stderr = await self._run_slurm_command(
+                                                                squeue_cmd
+                                                                          )
+        logger.debug("squeue returned %s.", squeue_return)
+        if returncode != 0:
+            # squeue errs e.g. if none of the given jobids is known (anymore)
+            # so we just ask sacct for all jobs
+            logger.debug("squeue had non-zero returncode (%s), stderr was %s."
+                         " Using sacct for all jobs.", returncode, stderr)
+            return jobids
+        return self._parse_squeue_output(squeue_return=squeue_return,
+                                         jobids=jobids)
+
+    def _parse_squeue_output(self, squeue_return: str,
+                             jobids: "list[str]") -> "list[str]":
+        # parse squeue output, update the jobinfo for all jobs in the queue
+        # and return all jobids (from jobids) which are not in the queue
+        jobids_in_queue = set()
+        for line in squeue_return.split("\n"):
+            splits = line.split("||||")
+            if len(splits) != 4:
+                # empty line at the end or something we can not parse
+                continue
+            jobid, state, nodelist, _ = (val.strip() for val in splits)
+            if _SLURM_STATE_TO_EXITCODE.get(state, -1) is not None:
+                # the job is in the queue but in a state we do not know or
+                # which is a final state (e.g. 'COMPLETING'), so we let
+                # sacct figure out the final state
+                continue
+            jobids_in_queue.add(jobid)
+            self._process_job_state(jobid=jobid, state=state, exitcode=None,
+                                    nodelist=nodelist,
+                                    )
+        return [jobid for jobid in jobids if jobid not in jobids_in_queue]
+
+    async def _update_cached_jobinfo_sacct(self, jobids: "list[str]") -> None:
+        """Call sacct and update cached info for given jobids."""
+        sacct_cmd = f"{self.sacct_executable} --noheader"
+        # query only for the specific job we are running
+        sacct_cmd += f" -j {','.join(jobids)}"
+        sacct_cmd += f" -o {','.join(_SACCT_FIELDS)}"
+        # parsable does print the separator at the end of each line
+        sacct_cmd += " --parsable"
+        sacct_cmd += " --delimiter='||||'"  # use 4 "|" as separator char(s)
+        returncode, sacct_return, stderr = await self._run_slurm_command(
+                                                                sacct_cmd
+                                                                         )
+        if returncode != 0:
+            raise SlurmError(f"sacct had non-zero returncode ({returncode}),"
+                             f" stderr was: {stderr}")
         # only jobid (and possibly clustername) returned, semikolon to separate
         logger.debug("sacct returned %s.", sacct_return)
-        # sacct returns one line per substep, we only care for the whole job
-        # so our regexp checks explictly for jobid only
-        # (the substeps have .$NUM suffixes)
-        for match in self._match_mainstep_line_regexp.finditer(sacct_return):
-            splits = match.group().split("||||")
-            if len(splits) != 5:
+        self._parse_sacct_output(sacct_return=sacct_return)
+
+    def _parse_sacct_output(self, sacct_return: str) -> None:
+        # sacct returns one line per substep, we take state, exitcode and
+        # nodelist from the line for the whole job (the substeps have
+        # .$STEP suffixes), but the MaxRSS is only reported for the steps
+        jobs = {}
+        for line in sacct_return.split("\n"):
+            if not line.strip():
+                continue
+            splits = line.split("||||")
+            if len(splits) != len(_SACCT_FIELDS) + 1:
                 # basic sanity check that everything went alright parsing,
                 # i.e. that we got the number of fields we expect
+                # (+1 for the empty string after the final separator)
                 logger.error("Could not parse sacct output line due to "
                              "unexpected number of fields. The line was: %s",
-                             match.group())
+                             line)
+                continue
+            fields = dict(zip(_SACCT_FIELDS, splits))
+            match = self._match_jobid_regexp.match(fields["jobid"].strip())
+            if match is None:
+                continue
+            jobid, step = match.groups()
+            max_rss = _parse_slurm_memory(fields["maxrss"])
+            if step is not None:
+                if jobid in jobs and max_rss is not None:
+                    jobs[jobid][1]["max_rss"] = max(
+                                        jobs[jobid][1]["max_rss"] or 0, max_rss
+                                                    )
+                continue
+            accounting = {
+                "submit": _parse_slurm_timestamp(fields["submit"]),
+                "eligible": _parse_slurm_timestamp(fields["eligible"]),
+                "start": _parse_slurm_timestamp(fields["start"]),
+                "end": _parse_slurm_timestamp(fields["end"]),
+                "elapsed": _parse_slurm_int(fields["elapsedraw"]),
+                "alloc_cpus": _parse_slurm_int(fields["alloccpus"]),
+                "total_cpu": _parse_slurm_duration(fields["totalcpu"]),
+                "max_rss": max_rss,
+                "partition": fields["partition"].strip() or None,
+                "qos": fields["qos"].strip() or None,
+                          }
+            jobs[jobid] = (fields, accounting)
+        for jobid, (fields, accounting) in jobs.items():
+            # parse returns (remove spaces, etc.) and put them in cache
+            self._process_job_state(jobid=jobid, state=fields["state"],
+                                    exitcode=fields["exitcode"],
+                                    nodelist=fields["nodelist"],
+                                    accounting=accounting,
+                                    )
+
+    def _process_job_state(self, jobid: str, state: str,
+                           exitcode: typing.Optional[str],
+                           nodelist: str,
+                           accounting: typing.Optional[dict] = None,
+                           ) -> None:
+        """
+        Update the cached jobinfo for a job with the state reported by SLURM.
+
+        Parameters
+        ----------
+        jobid : str
+            The SLURM jobid of the job.
+        state : str
+            The SLURM state (as reported by sacct or squeue).
+        exitcode : str or None
+            The exitcode as reported by sacct, None if it is not known (as for
+            jobs reported by squeue), then we keep the cached value.
+        nodelist : str
+            The nodelist (in SLURM shorthand notation).
+        accounting : dict or None
+            The accounting values as reported by sacct, None if they are not
+            known (as for jobs reported by squeue).
+        """
+        try:
+            last_seen_state = self._jobinfo[jobid]["state"]
+        except KeyError:
+            # this can happen if we remove the job from monitoring
+            # after the sacct call but before parsing of sacct_return
+            # (then the _jobinfo dict will not contain the job anymore
+            #  and we get the KeyError from the jobid)
+            # we go to the next jobid as we are not monitoring this one
+            # TODO: do we want/need to log this?!
+            return
+        else:
+            if accounting is not None:
+                # (only overwrite our observations with known values)
+                self._jobinfo[jobid].update({key: val
+                                             for key, val in accounting.items()
+                                             if val is not None})
+            if last_seen_state == state:
+                # we only process nodelist and update jobinfo when
+                # necessary, i.e. if the slurm_state changed
+                return
+        nodelist = self._process_nodelist(nodelist=nodelist)
+        self._jobinfo[jobid]["nodelist"] = nodelist
+        if exitcode is not None:
+            self._jobinfo[jobid]["exitcode"] = exitcode
+        self._jobinfo[jobid]["state"] = state
+        logger.debug(f"Extracted from SLURM output: jobid {jobid},"
+                     + f" state {state}, exitcode {exitcode} and "
+                     + f"nodelist {nodelist}.")
+        parsed_ec = self._parse_exitcode_from_slurm_state(slurm_state=state)
+        self._jobinfo[jobid]["parsed_exitcode"] = parsed_ec
+        if jobid in self._journaled_jobs:
+            self._journal(event="state", jobid=jobid, state=state,
+                          exitcode=self._jobinfo[jobid]["exitcode"],
+                          nodelist=nodelist)
+        self._note_state_change(jobid=jobid, state=state)
+        if parsed_ec is not None:
+            logger.debug("Parsed slurm state %s for job %s"
+                         " as returncode %s. Removing job"
+                         "from sacct calls because its state will"
+                         " not change anymore.",
+                         state, jobid, parsed_ec,
+                         )
+            self._jobids_sacct.discard(jobid)
+            self._record_finished_job(jobid=jobid)
+            self._node_fail_heuristic(jobid=jobid,
+                                      parsed_exitcode=parsed_ec,
+                                      slurm_state=state,
+                                      nodelist=nodelist,
+                                      )
+            if jobid in self._unclaimed_jobids:
+                self._release_unclaimed_job(jobid=jobid)
+
+    def _record_finished_job(self, jobid: str) -> None:
+        # keep the accounting record of a job that reached a final state
+        jobinfo = self._jobinfo[jobid]
+        if jobinfo["end"] is None:
+            jobinfo["end"] = time.time()
+        record = {key: jobinfo[key] for key in _ACCOUNTING_KEYS}
+        record.update(jobid=jobid,
+                      jobname=self._jobnames.get(jobid, None),
+                      state=jobinfo["state"],
+                      parsed_exitcode=jobinfo["parsed_exitcode"],
+                      nodelist=jobinfo["nodelist"],
+                      )
+        self._finished_jobs.append(record)
+
+    @property
+    def finished_jobs_accounting(self) -> "list[dict]":
+        """
+        The accounting records of the last finished jobs.
+
+        Each record is a dict with the keys jobid, jobname, state,
+        parsed_exitcode, nodelist and the accounting keys as in
+        :attr:`SlurmProcess.accounting`. At most ``accounting_history_size``
+        records are kept.
+        """
+        return [record.copy() for record in self._finished_jobs]
+
+    def job_statistics(self, group_by: typing.Optional[str] = "jobname",
+                       ) -> dict:
+        """
+        Aggregate statistics over the last finished jobs.
+
+        Parameters
+        ----------
+        group_by : str or None, optional
+            Group the jobs by "jobname", "node", "state", "partition" or
+            "qos", by default "jobname". None results in one group (with key
+            None) for all jobs.
+            Note that jobs running on multiple nodes are counted for every
+            node when grouping by node.
+
+        Returns
+        -------
+        dict
+            Keys are the groups, values are dicts with the number of jobs
+            ("n_jobs"), the number of unsuccessful jobs ("n_failed"), the mean
+            queue wait ("mean_queue_wait"), the mean and total runtime
+            ("mean_run_time", "total_run_time", all in seconds), the mean CPU
+            efficiency ("mean_cpu_efficiency", between 0 and 1), the largest
+            MaxRSS ("max_rss", in bytes) and the throughput ("throughput",
+            finished jobs per hour between the first start and last end).
+
+        Raises
+        ------
+        ValueError
+            If group_by is not one of the allowed values.
+        """
+        allowed_group_by = ["jobname", "node", "state", "partition", "qos",
+                            None]
+        if group_by not in allowed_group_by:
+            raise ValueError(f"group_by must be one of {allowed_group_by}, "
+                             + f"but was {group_by}.")
+        groups = collections.defaultdict(list)
+        for record in self._finished_jobs:
+            if group_by == "node":
+                for node in record["nodelist"]:
+                    groups[node].append(record)
             else:
-                # the last is the empty string after the final/fourth separator
-                jobid, state, exitcode, nodelist, _ = splits
-                # parse returns (remove spaces, etc.) and put them in cache
-                jobid = jobid.strip()
-                try:
-                    last_seen_state = self._jobinfo[jobid]["state"]
-                except KeyError:
-                    # this can happen if we remove the job from monitoring
-                    # after the sacct call but before parsing of sacct_return
-                    # (then the _jobinfo dict will not contain the job anymore
-                    #  and we get the KeyError from the jobid)
-                    # we go to the next jobid as we are not monitoring this one
-                    # TODO: do we want/need to log this?!
-                    continue
-                else:
-                    if last_seen_state == state:
-                        # we only process nodelist and update jobinfo when
-                        # necessary, i.e. if the slurm_state changed
-                        continue
-                nodelist = self._process_nodelist(nodelist=nodelist)
-                self._jobinfo[jobid]["nodelist"] = nodelist
-                self._jobinfo[jobid]["exitcode"] = exitcode
-                self._jobinfo[jobid]["state"] = state
-                logger.debug(f"Extracted from sacct output: jobid {jobid},"
-                             + f" state {state}, exitcode {exitcode} and "
-                             + f"nodelist {nodelist}.")
-                parsed_ec = self._parse_exitcode_from_slurm_state(slurm_state=state)
-                self._jobinfo[jobid]["parsed_exitcode"] = parsed_ec
-                if parsed_ec is not None:
-                    logger.debug("Parsed slurm state %s for job %s"
-                                 " as returncode %s. Removing job"
-                                 "from sacct calls because its state will"
-                                 " not change anymore.",
-                                 state, jobid, parsed_ec,
-                                 )
-                    self._jobids_sacct.remove(jobid)
-                    self._node_fail_heuristic(jobid=jobid,
-                                              parsed_exitcode=parsed_ec,
-                                              slurm_state=state,
-                                              nodelist=nodelist,
-                                              )
+                groups[record[group_by] if group_by is not None
+                       else None].append(record)
+        return {key: self._aggregate_job_records(records)
+                for key, records in groups.items()}
+
+    def _aggregate_job_records(self, records: "list[dict]") -> dict:
+        queue_waits = []
+        run_times = []
+        cpu_effs = []
+        for r in records:
+            queue_wait = _queue_wait(r)
+            if queue_wait is not None:
+                queue_waits.append(queue_wait)
+            run_time = r["elapsed"]
+            if run_time is None and r["start"] is not None:
+                run_time = max(r["end"] - r["start"], 0.)
+            run_times.append(run_time)
+            if (run_time and r["alloc_cpus"] and r["total_cpu"] is not None):
+                cpu_effs.append(r["total_cpu"] / (run_time * r["alloc_cpus"]))
+        starts = [r["start"] for r in records if r["start"] is not None]
+        ends = [r["end"] for r in records if r["end"] is not None]
+        throughput = None
+        if starts and ends and max(ends) > min(starts):
+            throughput = len(records) / (max(ends) - min(starts)) * 3600
+        max_rss = [r["max_rss"] for r in records if r["max_rss"] is not None]
+        return {"n_jobs": len(records),
+                "n_failed": sum(r["parsed_exitcode"] != 0 for r in records),
+                "mean_queue_wait": _mean(queue_waits),
+                "mean_run_time": _mean(run_times),
+                "total_run_time": sum(t for t in run_times if t is not None),
+                "mean_cpu_efficiency": _mean(cpu_effs),
+                "max_rss": max(max_rss, default=None),
+                "throughput": throughput,
+                }
+
+    def node_statistics(self) -> dict:
+        """
+        Aggregate statistics per node over the last finished jobs.
+
+        Shorthand for ``job_statistics(group_by="node")``, see
+        :meth:`job_statistics`.
+
+        Returns
+        -------
+        dict
+            Keys are the node names, values the statistics.
+        """
+        return self.job_statistics(group_by="node")
+
+    def observed_queue_wait(self, partition: typing.Optional[str] = None,
+                            qos: typing.Optional[str] = None,
+                            n_jobs: int = 20,
+                            ) -> typing.Union[float, None]:
+        """
+        Mean queue wait of the last finished jobs in partition with qos.
+
+        Parameters
+        ----------
+        partition : str or None, optional
+            The partition, None matches all partitions, by default None.
+        qos : str or None, optional
+            The QOS, None matches all QOS, by default None.
+        n_jobs : int, optional
+            Use (at most) the last n_jobs matching jobs, by default 20.
+
+        Returns
+        -------
+        float or None
+            The mean queue wait (in seconds, since the jobs became eligible)
+            or None if we have not seen any matching jobs yet.
+        """
+        queue_waits = []
+        for record in reversed(self._finished_jobs):
+            if ((partition is not None and record["partition"] != partition)
+                    or (qos is not None and record["qos"] != qos)):
+                continue
+            queue_wait = _queue_wait(record)
+            if queue_wait is None:
+                continue
+            queue_waits.append(queue_wait)
+            if len(queue_waits) >= n_jobs:
+                break
+        return _mean(queue_waits)
+
+    def observed_run_times(self, jobname: str,
+                           n_jobs: int = 50) -> "list[float]":
+        """
+        Run times of the last successfully finished jobs with jobname.
+
+        Parameters
+        ----------
+        jobname : str
+            The SLURM jobname.
+        n_jobs : int, optional
+            Return (at most) the run times of the last n_jobs matching jobs,
+            by default 50.
+
+        Returns
+        -------
+        list[float]
+            The run times (in seconds), most recent job first.
+        """
+        run_times = []
+        for record in reversed(self._finished_jobs):
+            if (record["jobname"] != jobname
+                    or record["parsed_exitcode"] != 0):
+                continue
+            run_time = record["elapsed"]
+            if run_time is None and record["start"] is not None:
+                run_time = max(record["end"] - record["start"], 0.)
+            if run_time is None:
+                continue
+            run_times.append(run_time)
+            if len(run_times) >= n_jobs:
+                break
+        return run_times
+
+    def slurm_command_statistics(self) -> dict:
+        """
+        Statistics about the calls to SLURM commands (sacct, squeue, scancel).
+
+        Returns
+        -------
+        dict
+            Keys are the command names, values are dicts with the number of
+            (recorded) calls ("n_calls"), the mean and maximum call duration
+            ("mean_duration", "max_duration") and the duration of the last
+            call ("last_duration"), all durations are in seconds.
+        """
+        return {cmd: {"n_calls": len(durations),
+                      "mean_duration": _mean(list(durations)),
+                      "max_duration": max(durations),
+                      "last_duration": durations[-1],
+                      }
+                for cmd, durations in self._slurm_command_durations.items()
+                if len(durations) > 0}
 
     def _process_nodelist(self, nodelist: str) -> "list[str]":
         """
@@ -504,20 +1949,67 @@ class SlurmClusterMediator:
 
     # Bookkeeping functions for node fail heuristic, one for success updates
     # one for failure updates
-    def _note_job_fail_on_nodes(self, nodelist: list[str]) -> None:
+    def _node_fail_score(self, node: str,
+                         now: typing.Optional[float] = None) -> float:
+        # the decayed fail count of node
+        score = self._node_job_fails.get(node, 0)
+        if score == 0 or self.node_fail_half_life <= 0:
+            return score
+        if now is None:
+            now = time.time()
+        elapsed = (now - self._node_fail_times[node]) / 3600
+        return score * 0.5 ** (elapsed / self.node_fail_half_life)
+
+    def _decay_node_fail_score(self, node: str, now: float) -> float:
+        # store the decayed fail count, such that we can add/subtract from it
+        score = self._node_fail_score(node=node, now=now)
+        self._node_job_fails[node] = score
+        self._node_fail_times[node] = now
+        return score
+
+    def note_straggler_on_nodes(self, nodelist: "list[str]") -> None:
+        """
+        Note that a job ran much longer than usual on the given nodes.
+
+        Adds ``straggler_fail_weight`` to the failed job counter of every node,
+        i.e. nodes on which jobs straggle repeatedly are eventually declared
+        broken (and on probation one straggler excludes the node again).
+
+        Parameters
+        ----------
+        nodelist : list[str]
+            The nodes the straggling job ran on.
+        """
+        if self.straggler_fail_weight <= 0 or len(nodelist) == 0:
+            return
+        logger.info("Noting straggling job on nodes %s.", nodelist)
+        self._note_job_fail_on_nodes(nodelist=nodelist,
+                                     weight=self.straggler_fail_weight)
+
+    def _note_job_fail_on_nodes(self, nodelist: list[str],
+                                weight: float = 1.) -> None:
         logger.debug("Adding nodes %s to node fail counter.", nodelist)
+        now = time.time()
         for node in nodelist:
-            self._node_job_fails[node] += 1
-            if self._node_job_fails[node] >= self.num_fails_for_broken_node:
+            score = self._decay_node_fail_score(node=node, now=now) + weight
+            self._node_job_fails[node] = score
+            if node in self._node_broken_since:
+                # on probation (or a job that started before we excluded it)
+                logger.info("Job failed on broken node %s (on probation), "
+                            "excluding it (again).", node)
+                self._node_broken_since[node] = now
+            elif score >= self.num_fails_for_broken_node:
                 # declare it broken
                 logger.info("Adding node %s to list of excluded nodes.", node)
-                if node not in self._exclude_nodes:
-                    self._exclude_nodes.append(node)
-                else:
-                    logger.error("Node %s already in exclude node list.", node)
+                self._node_broken_since[node] = now
+            self._journal_node(node=node)
         # failsaves
-        all_nodes = len(self._all_nodes)
-        exclude_nodes = len(self._exclude_nodes)
+        # (only consider nodes SLURM could schedule our jobs on at all)
+        all_nodes = len([node for node in self._all_nodes
+                         if node not in self._unavailable_nodes])
+        exclude_nodes = len([node for node in (set(self._exclude_nodes)
+                                               | set(self.broken_nodes()))
+                             if node not in self._unavailable_nodes])
         if exclude_nodes >= all_nodes / 4:
             logger.error("We already declared 1/4 of the cluster as broken."
                          + "Houston, we might have a problem?")
@@ -529,6 +2021,8 @@ class SlurmClusterMediator:
 
     def _note_job_success_on_nodes(self, nodelist: list[str]) -> None:
         logger.debug("Adding nodes %s to node success counter.", nodelist)
+        now = time.time()
+        probation = self.node_probation_interval * 3600
         for node in nodelist:
             if node not in self._node_job_fails:
                 # only count successes for nodes on which we have seen failures
@@ -538,20 +2032,44 @@ class SlurmClusterMediator:
                 # we seen enough success to decrease the fail count by one
                 # zero the success counter and see if we decrease fail count
                 # Note that the fail count must not become negative!
-                self._node_job_successes[node] = 0
                 logger.debug("Seen %s successful jobs on node %s. "
                              "Zeroing success counter.",
                              self._node_job_successes[node], node,
                              )
-                if self._node_job_fails[node] > 0:
+                self._node_job_successes[node] = 0
+                score = self._decay_node_fail_score(node=node, now=now)
+                if score > 0:
                     # we have seen failures previously, so decrease counter
                     # but do not go below 0 and also do not delete it, i.e.
                     # keep counting successes
-                    self._node_job_fails[node] -= 1
+                    self._node_job_fails[node] = max(score - 1, 0)
                     logger.info("Decreased node fail count by one for node %s,"
                                 "node now has %s recorded failures.",
                                 node, self._node_job_fails[node],
                                 )
+            since = self._node_broken_since.get(node, None)
+            if (since is not None and now - since >= probation
+                    and (self._node_fail_score(node=node, now=now)
+                         < self.num_fails_for_broken_node)):
+                # passed the probation
+                logger.info("Node %s passed its probation, it is no longer "
+                            "considered broken.", node)
+                del self._node_broken_since[node]
+            self._journal_node(node=node)
+
+    def _node_record(self, node: str) -> dict:
+        # the journal record with the current fail/success counts of node
+        return {"event": "node", "node": node,
+                "fails": self._node_job_fails[node],
+                "time": self._node_fail_times[node],
+                "successes": self._node_job_successes[node],
+                "broken_since": self._node_broken_since.get(node, None),
+                }
+
+    def _journal_node(self, node: str) -> None:
+        # record the current fail/success counts of node in the journal
+        record = self._node_record(node=node)
+        self._journal(**record)
 
 
 class SlurmProcess:
@@ -564,26 +2082,19 @@ class SlurmProcess:
     ----------
     sbatch_executable : str
         Name or path to the sbatch executable, by default "sbatch".
-    scancel_executable: str
-        Name or path to the scancel executable, by default "scancel".
-    sleep_time : int
-        Time (in seconds) between checks if the underlying job has finished
-        when using `self.wait`.
+    stdfiles_spool_max_size : int
+        Maximum number of bytes of stdout/stderr data (each) we keep in memory
+        when the stdfiles are removed, larger outputs are spilled to a
+        temporary file on disk, by default 1 MiB.
     """
 
     # use same instance of class for all SlurmProcess instances
-    try:
-        _slurm_cluster_mediator = SlurmClusterMediator()
-    except ValueError:
-        _slurm_cluster_mediator = None
-        # we raise a ValueError if sacct/sinfo are not available
-        logger.warning("Could not initialize SLURM cluster handling. "
-                       "If you are sure SLURM (sinfo/sacct/etc) is available"
-                       " try calling `asyncmd.config.set_slurm_settings()`"
-                       " with the appropriate arguments.")
-    # we can not simply wait for the subprocess, since slurm exits directly
-    # so we will sleep for this long between checks if slurm-job completed
-    sleep_time = 15  # TODO: heuristic? dynamically adapt?
+    # NOTE: it is created on first use (and not at import, because it calls
+    #       sinfo), see `_get_slurm_cluster_mediator`
+    _slurm_cluster_mediator = None
+    # NOTE: we can not simply wait for the subprocess, since sbatch exits
+    #       directly, instead we wait for the SlurmClusterMediator to tell us
+    #       when the state of our job changes (it polls sacct for all jobs)
     # NOTE: no options to set/pass extra_args for sbatch:
     #       the only command line options for sbatch we allow will be contolled
     #       by us since cmd line options for sbatch take precendece over every-
@@ -591,12 +2102,34 @@ class SlurmProcess:
     #       files and therefore enable to implement communicate(), i.e. parse
     #       stderr and stdout
     sbatch_executable = "sbatch"
-    scancel_executable = "scancel"
+    # NOTE: when we remove the stdfiles we keep their content (for
+    #       communicate and the streams) in SpooledTemporaryFiles, i.e. only
+    #       small outputs stay in memory
+    stdfiles_spool_max_size = 2**20
+    # chunk size used when copying/reading the stdfiles
+    _stdfile_chunk_size = 2**16
+    # how to watch for the completion_files (and the stdfiles) while waiting,
+    # "auto", "inotify", "poll" or "off", see :mod:`asyncmd._fswatch`
+    completion_watch = "auto"
+    completion_poll_interval = 1.  # seconds between checks when polling
+    # NOTE: with more than one candidate partition/QOS we submit to the one
+    #       with the shortest expected queue wait, which is the weighted mean
+    #       of SLURMs estimate (sbatch --test-only, reused for jobs with the
+    #       same options for start_estimate_max_age seconds) and the mean
+    #       queue wait we observed for our last jobs there
+    start_estimate_max_age = 60.
+    observed_queue_wait_weight = 0.5
 
     def __init__(self, jobname: str, sbatch_script: str,
                  workdir: typing.Optional[str] = None,
                  time: typing.Optional[float] = None,
                  stdfiles_removal: str = "success",
+                 dependency: typing.Optional[str] = None,
+                 requeue: typing.Optional[bool] = None,
+                 completion_files: typing.Optional["list[str]"] = None,
+                 partition: typing.Union[str, "list[str]", None] = None,
+                 qos: typing.Union[str, "list[str]", None] = None,
+                 exclude_nodes: typing.Optional["list[str]"] = None,
                  **kwargs) -> None:
         """
         Initialize a `SlurmProcess`.
@@ -625,12 +2158,44 @@ class SlurmProcess:
              - "yes"/"always": remove on job completion independent of
                returncode and also when using :meth:`terminate`
 
+        dependency : str or None
+            SLURM dependency specification (``--dependency``) for the job,
+            e.g. "afterok:1234" to start the job only after the job with
+            jobid 1234 completed successfully. None means no dependency.
+        requeue : bool or None
+            Whether SLURM may requeue the job (e.g. after preemption or a node
+            failure), i.e. ``--requeue`` or ``--no-requeue``. None means the
+            cluster default is used.
+        completion_files : list[str] or None
+            Files (absolute or relative to workdir) the job writes when it is
+            done, e.g. its results. While waiting for the job we watch for
+            them (and for SLURM closing the stdfiles) and ask for the job
+            state directly when they appear instead of waiting for the next
+            scheduled sacct call, see ``completion_watch``. The job state is
+            still taken from sacct only.
+        partition : str, list[str] or None
+            SLURM partition (``--partition``) for the job or a list of
+            candidate partitions. None means the partition from the sbatch
+            script (or the cluster default) is used.
+        qos : str, list[str] or None
+            SLURM QOS (``--qos``) for the job or a list of candidate QOS.
+            None means the QOS from the sbatch script (or the default) is used.
+            If we got more than one candidate partition and/or QOS, we choose
+            the combination with the shortest expected queue wait at
+            submission, see :meth:`choose_partition_qos`.
+        exclude_nodes : list[str] or None
+            Nodes to exclude (``--exclude``) for this job only, in addition to
+            the nodes excluded by the :class:`SlurmClusterMediator`. None means
+            no additional nodes.
+
         Raises
         ------
         TypeError
             If the value set via init kwarg for a attribute does not match the
-            default/original type for that attribute.
+            default/original type for that attribute or if there is no
+            attribute with the name of the kwarg.
         """
+        self._apply_deprecated_settings(kwargs=kwargs)
         # we expect sbatch_script to be a path to a file
         # make it possible to set any attribute via kwargs
         # check the type for attributes with default values
@@ -646,9 +2211,11 @@ class SlurmProcess:
                                     + f"mismatching type ({type(value)}). "
                                     + f" Default type is {type(cval)}."
                                     )
+            else:
+                raise TypeError(f"{type(self).__name__} has no attribute "
+                                + f"{kwarg} to set via init kwargs.")
         # this either checks for our defaults or whatever we just set via kwargs
         ensure_executable_available(self.sbatch_executable)
-        ensure_executable_available(self.scancel_executable)
         self.jobname = jobname
         # TODO/FIXME: do we want sbatch_script to be relative to wdir?
         #             (currently it is relative to current dir when creating
@@ -660,12 +2227,81 @@ class SlurmProcess:
         self.workdir = os.path.abspath(workdir)
         self.time = time
         self.stdfiles_removal = stdfiles_removal
+        self.dependency = dependency
+        self.requeue = requeue
+        self.completion_files = completion_files
+        self.partition_candidates = ([partition] if isinstance(partition, str)
+                                     else list(partition or []))
+        self.qos_candidates = ([qos] if isinstance(qos, str)
+                               else list(qos or []))
+        # the partition and QOS we submit with, chosen at submission if we
+        # got more than one candidate
+        self.partition = (self.partition_candidates[0]
+                          if len(self.partition_candidates) == 1 else None)
+        self.qos = (self.qos_candidates[0]
+                    if len(self.qos_candidates) == 1 else None)
+        self.exclude_nodes = list(exclude_nodes or [])
         self._jobid = None
         self._jobinfo = {}  # dict with jobinfo cached from slurm cluster mediator
+        # spooled content of the stdfiles (set when we remove the files)
         self._stdout_data = None
         self._stderr_data = None
         self._stdin = None
 
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # the spools can not be pickled (if they rolled over to disk), so we
+        # pickle their content instead
+        for which in ["stdout", "stderr"]:
+            spool = state[f"_{which}_data"]
+            if spool is not None:
+                if spool.closed:
+                    state[f"_{which}_data"] = None
+                else:
+                    spool.seek(0)
+                    state[f"_{which}_data"] = spool.read()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        for which in ["stdout", "stderr"]:
+            data = state[f"_{which}_data"]
+            if data is not None:
+                spool = tempfile.SpooledTemporaryFile(
+                                    max_size=self.stdfiles_spool_max_size,
+                                                      )
+                spool.write(data)
+                setattr(self, f"_{which}_data", spool)
+
+    def _apply_deprecated_settings(self, kwargs: dict) -> None:
+        # map settings which moved to the SlurmClusterMediator onto it (and
+        # warn), they can be passed as init kwargs or set on the class
+        sleep_time = kwargs.pop("sleep_time",
+                                getattr(type(self), "sleep_time", None))
+        if sleep_time is not None:
+            warnings.warn("SlurmProcess.sleep_time is deprecated, the job "
+                          "states are polled by the SlurmClusterMediator. "
+                          "Use `asyncmd.config.set_slurm_settings("
+                          "max_time_between_sacct_calls=...)` instead, "
+                          "setting it to sleep_time for now.",
+                          DeprecationWarning, stacklevel=3)
+            self.slurm_cluster_mediator.max_time_between_sacct_calls = (
+                                                                sleep_time)
+        scancel_executable = kwargs.pop(
+                                "scancel_executable",
+                                getattr(type(self), "scancel_executable", None)
+                                        )
+        if scancel_executable is not None:
+            warnings.warn("SlurmProcess.scancel_executable is deprecated, "
+                          "jobs are canceled by the SlurmClusterMediator. "
+                          "Use `asyncmd.config.set_slurm_settings("
+                          "scancel_executable=...)` instead, setting it to "
+                          "the given value for now.",
+                          DeprecationWarning, stacklevel=3)
+            self.slurm_cluster_mediator.scancel_executable = (
+                        ensure_executable_available(scancel_executable)
+                                                              )
+
     @property
     def stdfiles_removal(self) -> str:
         """
@@ -685,17 +2321,33 @@ class SlurmProcess:
                              + f"but was {val.lower()}.")
         self._stdfiles_removal = val.lower()
 
+    @staticmethod
+    def _get_slurm_cluster_mediator() -> SlurmClusterMediator:
+        # return the (singleton) mediator, create it (with the default
+        # settings) if nobody did so far
+        if SlurmProcess._slurm_cluster_mediator is None:
+            try:
+                SlurmProcess._slurm_cluster_mediator = SlurmClusterMediator()
+            except ValueError as e:
+                # we raise a ValueError if sacct/sinfo are not available
+                raise RuntimeError("Could not initialize SLURM cluster "
+                                   + "handling. If you are sure SLURM "
+                                   + "(sinfo/sacct/etc) is available try "
+                                   + "calling "
+                                   + "`asyncmd.config.set_slurm_settings()`"
+                                   + " with the appropriate arguments."
+                                   ) from e
+        return SlurmProcess._slurm_cluster_mediator
+
     @property
     def slurm_cluster_mediator(self) -> SlurmClusterMediator:
         """
         The (singleton) `SlurmClusterMediator` instance of this `SlurmProcess`.
-        """
-        if self._slurm_cluster_mediator is None:
-            raise RuntimeError("SLURM monitoring not initialized. Please call"
-                               + "`asyncmd.config.set_slurm_settings()`"
-                               + " with appropriate arguments.")
 
-        return self._slurm_cluster_mediator
+        It is created (with the default settings) on first use if it has not
+        been set up via :func:`asyncmd.config.set_slurm_settings` before.
+        """
+        return self._get_slurm_cluster_mediator()
 
     async def submit(self, stdin: typing.Optional[str] = None) -> None:
         """
@@ -719,35 +2371,169 @@ class SlurmProcess:
         """
         if self._jobid is not None:
             raise RuntimeError(f"Already monitoring job with id {self._jobid}.")
+        # keep a ref to the stdin value, we need it in communicate
+        self._stdin = stdin
+        # make sure we do not exclude nodes that are down/drained anyway
+        await self.slurm_cluster_mediator.update_node_states()
+        self.partition, self.qos = await self.choose_partition_qos()
+        sbatch_cmd = self._sbatch_cmd(stdin=stdin)
+        jobid = await self._run_sbatch(sbatch_cmd=sbatch_cmd)
+        logger.info("Submited SLURM job with jobid %s.", jobid)
+        self._jobid = jobid
+        self.slurm_cluster_mediator.monitor_register_job(jobid=jobid,
+                                                         time_limit=self.time,
+                                                         jobname=self.jobname,
+                                                         )
+        self._journal_submission()
+        # get jobinfo (these will probably just be the defaults but at
+        #  least this is a dict with the rigth keys...)
+        await self._update_sacct_jobinfo()
+
+    def _journal_submission(self) -> None:
+        # record everything we need to reconstruct us in the mediators journal
+        self.slurm_cluster_mediator.journal_submission(
+                                        jobid=self._jobid,
+                                        jobname=self.jobname,
+                                        sbatch_script=self.sbatch_script,
+                                        workdir=self.workdir,
+                                        time=self.time,
+                                        stdfiles_removal=self.stdfiles_removal,
+                                        stdin=self._stdin,
+                                        dependency=self.dependency,
+                                        requeue=self.requeue,
+                                        completion_files=self.completion_files,
+                                        partition=self.partition,
+                                        qos=self.qos,
+                                        exclude_nodes=self.exclude_nodes,
+                                                       )
+
+    def _sbatch_cmd(self, stdin: typing.Optional[str] = None,
+                    array_size: typing.Optional[int] = None,
+                    test_only: bool = False) -> str:
+        # construct the sbatch command line for submission of this job
+        # if array_size is given we construct the command for a job array
+        # with array_size tasks (with task ids 0 to array_size - 1)
+        # if test_only is True, sbatch only estimates when the job would start
         sbatch_cmd = f"{self.sbatch_executable}"
         sbatch_cmd += f" --job-name={self.jobname}"
         # set working directory for batch script to workdir
         sbatch_cmd += f" --chdir={self.workdir}"
-        # FIXME/TODO: does this work for job-arrays?
-        #             (probably not, but do we care?)
-        sbatch_cmd += f" --output=./{self._stdout_name(use_slurm_symbols=True)}"
-        sbatch_cmd += f" --error=./{self._stderr_name(use_slurm_symbols=True)}"
+        use_array = array_size is not None
+        if use_array:
+            sbatch_cmd += f" --array=0-{array_size - 1}"
+        sbatch_cmd += (" --output=./"
+                       + self._stdout_name(use_slurm_symbols=True,
+                                           array=use_array)
+                       )
+        sbatch_cmd += (" --error=./"
+                       + self._stderr_name(use_slurm_symbols=True,
+                                           array=use_array)
+                       )
         if self.time is not None:
             timelimit = self.time * 60
             timelimit_min = int(timelimit)  # take only the full minutes
             timelimit_sec = round(60 * (timelimit - timelimit_min))
             timelimit_str = f"{timelimit_min}:{timelimit_sec}"
             sbatch_cmd += f" --time={timelimit_str}"
-        # keep a ref to the stdin value, we need it in communicate
-        self._stdin = stdin
+        if self.dependency is not None:
+            sbatch_cmd += f" --dependency={self.dependency}"
+        if self.requeue is not None:
+            sbatch_cmd += " --requeue" if self.requeue else " --no-requeue"
+        if self.partition is not None:
+            sbatch_cmd += f" --partition={self.partition}"
+        if self.qos is not None:
+            sbatch_cmd += f" --qos={self.qos}"
         if stdin is not None:
             # TODO: do we need to check if the file exists or that the location
             #       is writeable?
             sbatch_cmd += f" --input=./{stdin}"
         # get the list of nodes we dont want to run on
         exclude_nodes = self.slurm_cluster_mediator.exclude_nodes
+        exclude_nodes += [node for node in self.exclude_nodes
+                          if node not in exclude_nodes]
         if len(exclude_nodes) > 0:
             sbatch_cmd += f" --exclude={','.join(exclude_nodes)}"
-        sbatch_cmd += f" --parsable {self.sbatch_script}"
+        if test_only:
+            sbatch_cmd += " --test-only"
+        else:
+            sbatch_cmd += " --parsable"
+        sbatch_cmd += f" {self.sbatch_script}"
+        return sbatch_cmd
+
+    async def _run_sbatch(self, sbatch_cmd: str) -> str:
+        # run the given sbatch command and return the jobid
+        # we go through the mediators submission rate limit and retry (with
+        # jittered exponential backoff) if sbatch fails with a transient error
+        mediator = self.slurm_cluster_mediator
+        first_attempt = time.time()
+        attempt = 0
+        while True:
+            await mediator.wait_for_submission_slot()
+            stdout, stderr = await self._call_sbatch(sbatch_cmd=sbatch_cmd)
+            # only jobid (and possibly clustername) returned, semikolon to
+            # separate
+            logger.debug("sbatch returned stdout: %s, stderr: %s.",
+                         stdout, stderr)
+            jobid = stdout.split(";")[0].strip()
+            # make sure jobid is an int/ can be cast as one
+            err = False
+            try:
+                jobid_int = int(jobid)
+            except ValueError:
+                # can not cast to int, so probably something went wrong
+                err = True
+            else:
+                if str(jobid_int) != jobid:
+                    err = True
+            if not err:
+                return jobid
+            transient = _SBATCH_TRANSIENT_ERRORS_REGEX.search(stderr)
+            if transient is None or attempt >= mediator.max_sbatch_retries:
+                raise SlurmSubmissionError("Could not submit SLURM job."
+                                           + f" Exit code was: {stdout} \n"
+                                           + f"sbatch stdout: {stdout} \n"
+                                           + f"sbatch stderr: {stderr} \n"
+                                           )
+            if _SBATCH_AMBIGUOUS_ERRORS_REGEX.search(stderr) is not None:
+                # sbatch timed out, but slurmctld might have gotten (and
+                # accepted) the submission anyway, make sure we do not submit
+                # the same job twice
+                found = await mediator.find_unknown_jobs(
+                                                jobname=self.jobname,
+                                                workdir=self.workdir,
+                                                submitted_after=first_attempt,
+                                                         )
+                if len(found) == 1:
+                    logger.warning("sbatch failed (%s) but the job has been "
+                                   "submitted with jobid %s anyway.",
+                                   transient.group(0), found[0])
+                    return found[0]
+                elif len(found) > 1:
+                    raise SlurmSubmissionError(
+                            "sbatch failed transiently and we found multiple "
+                            + f"matching jobs ({found}), not retrying. "
+                            + f"sbatch stderr: {stderr}"
+                                               )
+            delay = random.uniform(0, (mediator.sbatch_retry_backoff
+                                       * 2**attempt))
+            attempt += 1
+            logger.warning("sbatch failed with a transient error (%s), "
+                           "retrying (%d/%d) in %.1f s.",
+                           transient.group(0), attempt,
+                           mediator.max_sbatch_retries, delay)
+            mediator._submission_backlog += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                mediator._submission_backlog -= 1
+
+    async def _call_sbatch(self, sbatch_cmd: str) -> tuple[str, str]:
+        # call sbatch once, return stdout and stderr
         logger.debug("About to execute sbatch_cmd %s.", sbatch_cmd)
         # 3 file descriptors: stdin,stdout,stderr
         # Note: one semaphore counts for 3 open files!
         await _SEMAPHORES["MAX_FILES_OPEN"].acquire()
+        sbatch_proc = None
         try:
             sbatch_proc = await asyncio.subprocess.create_subprocess_exec(
                                                 *shlex.split(sbatch_cmd),
@@ -757,38 +2543,149 @@ class SlurmProcess:
                                                 close_fds=True,
                                                                           )
             stdout, stderr = await sbatch_proc.communicate()
-            sbatch_return = stdout.decode()
         except asyncio.CancelledError as e:
-            sbatch_proc.kill()
+            if sbatch_proc is not None:
+                sbatch_proc.kill()
             raise e from None
         finally:
             _SEMAPHORES["MAX_FILES_OPEN"].release()
-        # only jobid (and possibly clustername) returned, semikolon to separate
-        logger.debug("sbatch returned stdout: %s, stderr: %s.",
-                     sbatch_return, stderr.decode())
-        jobid = sbatch_return.split(";")[0].strip()
-        # make sure jobid is an int/ can be cast as one
-        err = False
-        try:
-            jobid_int = int(jobid)
-        except ValueError:
-            # can not cast to int, so probably something went wrong submitting
-            err = True
-        else:
-            if str(jobid_int) != jobid:
-                err = True
-        if err:
-            raise SlurmSubmissionError("Could not submit SLURM job."
-                                       + f" Exit code was: {sbatch_return} \n"
-                                       + f"sbatch stdout: {stdout.decode()} \n"
-                                       + f"sbatch stderr: {stderr.decode()} \n"
-                                       )
-        logger.info("Submited SLURM job with jobid %s.", jobid)
-        self._jobid = jobid
-        self.slurm_cluster_mediator.monitor_register_job(jobid=jobid)
-        # get jobinfo (these will probably just be the defaults but at
-        #  least this is a dict with the rigth keys...)
-        await self._update_sacct_jobinfo()
+        return stdout.decode(), stderr.decode()
+
+    async def estimate_start_time(self) -> typing.Union[float, None]:
+        """
+        Estimate when this job would start if we submitted it now.
+
+        Uses ``sbatch --test-only``, i.e. SLURM's scheduler (including its
+        backfill plan) decides, but nothing is submitted.
+
+        Returns
+        -------
+        float or None
+            The expected start time (seconds since the epoch) or None if it
+            could not be determined.
+        """
+        sbatch_cmd = self._sbatch_cmd(stdin=None, test_only=True)
+        # sbatch --test-only loads slurmctld like a submission, so it counts
+        # against the same submission rate limit
+        await self.slurm_cluster_mediator.wait_for_submission_slot()
+        stdout, stderr = await self._call_sbatch(sbatch_cmd=sbatch_cmd)
+        # sbatch reports e.g. 'sbatch: Job 1234 to start at
+        # 2023-03-17T12:01:02 using 8 processors on nodes n01 in partition p'
+        # (on stderr, but we look at both to be save)
+        match = re.search(r"to start at (\S+)", stderr + stdout)
+        if match is None:
+            logger.warning("Could not estimate start time for job %s. sbatch "
+                           "returned stdout: %s, stderr: %s.", self.jobname,
+                           stdout, stderr)
+            return None
+        return _parse_slurm_timestamp(match.group(1))
+
+    async def choose_partition_qos(self) -> tuple[typing.Union[str, None],
+                                                  typing.Union[str, None]]:
+        """
+        Choose the candidate partition and QOS with the shortest queue wait.
+
+        The expected queue wait for every combination of candidate partition
+        and QOS is the weighted mean (see ``observed_queue_wait_weight``) of
+        the estimate of SLURMs scheduler (``sbatch --test-only``) and the
+        mean queue wait of our last jobs with that partition and QOS, see
+        :meth:`SlurmClusterMediator.observed_queue_wait`.
+        Nothing is submitted.
+
+        Returns
+        -------
+        tuple[str or None, str or None]
+            The chosen partition and QOS. The first candidates if we can not
+            estimate the queue wait for any combination.
+        """
+        candidates = [(partition, qos)
+                      for partition in self.partition_candidates or [None]
+                      for qos in self.qos_candidates or [None]]
+        if len(candidates) == 1:
+            return candidates[0]
+        queue_waits = await asyncio.gather(
+                            *(self._expected_queue_wait(partition=partition,
+                                                        qos=qos)
+                              for partition, qos in candidates)
+                                           )
+        known = [(queue_wait, i) for i, queue_wait in enumerate(queue_waits)
+                 if queue_wait is not None]
+        if len(known) == 0:
+            logger.warning("Could not estimate the queue wait for any of the "
+                           "partitions/QOS %s, using the first.", candidates)
+            return candidates[0]
+        # min over (queue_wait, index), i.e. the first candidate for ties
+        _, best = min(known)
+        logger.debug("Expected queue waits for partitions/QOS %s are %s s, "
+                     "choosing %s.", candidates, queue_waits,
+                     candidates[best])
+        return candidates[best]
+
+    async def _expected_queue_wait(self, partition: typing.Union[str, None],
+                                   qos: typing.Union[str, None],
+                                   ) -> typing.Union[float, None]:
+        estimated = await self._estimated_queue_wait(partition=partition,
+                                                     qos=qos)
+        observed = self.slurm_cluster_mediator.observed_queue_wait(
+                                                        partition=partition,
+                                                        qos=qos,
+                                                                   )
+        if estimated is None:
+            return observed
+        if observed is None:
+            return estimated
+        weight = self.observed_queue_wait_weight
+        return (1 - weight) * estimated + weight * observed
+
+    async def _estimated_queue_wait(self, partition: typing.Union[str, None],
+                                    qos: typing.Union[str, None],
+                                    ) -> typing.Union[float, None]:
+        # SLURMs estimate (sbatch --test-only) for the queue wait of a job
+        # like us in partition with qos
+        estimate_time, start = await self._cached_start_estimate(
+                                                        partition=partition,
+                                                        qos=qos,
+                                                                 )
+        if start is None:
+            return None
+        return max(start - estimate_time, 0.)
+
+    async def _cached_start_estimate(self, partition: typing.Union[str, None],
+                                     qos: typing.Union[str, None],
+                                     ) -> tuple[float, typing.Union[float,
+                                                                    None]]:
+        # returns the time of the estimate and the estimated start (as from
+        # estimate_start_time) for a job like us in partition with qos, we
+        # reuse recent estimates for jobs with the same sbatch options (from
+        # the script) and time limit, such that we need only a few sbatch
+        # calls for many similar jobs
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            async with aiofiles.open(self.sbatch_script, "r") as f:
+                script = await f.read()
+        options = tuple(line.strip() for line in script.split("\n")
+                        if line.startswith("#SBATCH"))
+        key = (options, self.time, partition, qos)
+        estimates = self.slurm_cluster_mediator._start_estimates
+        now = time.time()
+        estimate_time, task = estimates.get(key, (None, None))
+        if (estimate_time is None
+                or now - estimate_time > self.start_estimate_max_age):
+            # remove the outdated estimates (such that we do not grow forever)
+            for k in [k for k, (t, tsk) in estimates.items()
+                      if now - t > self.start_estimate_max_age and tsk.done()]:
+                del estimates[k]
+            probe = SlurmProcess(jobname=self.jobname,
+                                 sbatch_script=self.sbatch_script,
+                                 workdir=self.workdir, time=self.time,
+                                 partition=partition, qos=qos,
+                                 )
+            estimate_time = now
+            task = asyncio.ensure_future(probe.estimate_start_time())
+            estimates[key] = (estimate_time, task)
+        # shield, such that a canceled submission does not cancel the
+        # estimate other submissions wait for
+        start = await asyncio.shield(task)
+        return estimate_time, start
 
     @property
     def slurm_jobid(self) -> typing.Union[str, None]:
@@ -812,20 +2709,46 @@ class SlurmProcess:
             return None
         return self._jobinfo.get("parsed_exitcode", None)
 
-    def _stdout_name(self, use_slurm_symbols: bool = False) -> str:
+    @property
+    def accounting(self) -> dict:
+        """
+        Accounting info for this job (as far as known).
+
+        Keys are "submit", "eligible", "start" and "end" (timestamps in
+        seconds since the epoch), "queue_wait" (since the job became eligible,
+        i.e. without waiting for dependencies) and "elapsed" (in seconds),
+        "alloc_cpus", "total_cpu" (CPU time in seconds), "cpu_efficiency"
+        (between 0 and 1), "max_rss" (in bytes), "partition" and "qos".
+        Unknown values are None. The timestamps are our own observations until
+        sacct reports the values from SLURM.
+        """
+        info = {key: self._jobinfo.get(key, None) for key in _ACCOUNTING_KEYS}
+        info["queue_wait"] = _queue_wait(info)
+        info["cpu_efficiency"] = None
+        if (info["elapsed"] and info["alloc_cpus"]
+                and info["total_cpu"] is not None):
+            info["cpu_efficiency"] = (info["total_cpu"]
+                                      / (info["elapsed"] * info["alloc_cpus"]))
+        return info
+
+    def _stdout_name(self, use_slurm_symbols: bool = False,
+                     array: bool = False) -> str:
+        # NOTE: for job arrays '%A_%a' expands to '$ARRAYJOBID_$TASKID', which
+        #       is exactly the jobid we use for the single array tasks
         name = f"{self.jobname}.out."
         if use_slurm_symbols:
-            name += "%j"
+            name += "%A_%a" if array else "%j"
         elif self.slurm_jobid is not None:
             name += f"{self.slurm_jobid}"
         else:
             raise RuntimeError("Can not construct stdout filename without jobid.")
         return name
 
-    def _stderr_name(self, use_slurm_symbols: bool = False) -> str:
+    def _stderr_name(self, use_slurm_symbols: bool = False,
+                     array: bool = False) -> str:
         name = f"{self.jobname}.err."
         if use_slurm_symbols:
-            name += "%j"
+            name += "%A_%a" if array else "%j"
         elif self.slurm_jobid is not None:
             name += f"{self.slurm_jobid}"
         else:
@@ -850,37 +2773,234 @@ class SlurmProcess:
                   for f in fnames)
                              )
 
-    async def _read_stdfiles(self) -> tuple[bytes, bytes]:
+    async def _spool_stdfile(self, fname: str) -> tempfile.SpooledTemporaryFile:
+        # copy the file chunkwise to a spool, i.e. only small files end up
+        # completely in memory
+        spool = tempfile.SpooledTemporaryFile(
+                                    max_size=self.stdfiles_spool_max_size,
+                                              )
+        try:
+            async with aiofiles.open(fname, "rb") as f:
+                while True:
+                    chunk = await f.read(self._stdfile_chunk_size)
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+        except FileNotFoundError:
+            logger.warning("File %s not found.", fname)
+        return spool
+
+    async def _spool_stdfiles(self) -> None:
+        # keep the content of the stdfiles (e.g. before we remove them)
         if self._stdout_data is not None and self._stderr_data is not None:
-            # return cached values if we already read the files previously
-            return self._stdout_data, self._stderr_data
-        # we read them in binary mode to get bytes objects back, this way they
-        # behave like the bytes objects returned by asyncio.subprocess
+            return
         async with _SEMAPHORES["MAX_FILES_OPEN"]:
-            stdout_fname = os.path.join(
-                                    self.workdir,
-                                    self._stdout_name(use_slurm_symbols=False),
-                                        )
-            try:
-                async with aiofiles.open(stdout_fname,"rb") as f:
-                    stdout = await f.read()
-            except FileNotFoundError:
-                logger.warning("stdout file %s not found.", stdout_fname)
-                stdout = bytes()
-            stderr_fname = os.path.join(
-                                    self.workdir,
-                                    self._stderr_name(use_slurm_symbols=False),
-                                        )
-            try:
-                async with aiofiles.open(stderr_fname, "rb") as f:
-                    stderr = await f.read()
-            except FileNotFoundError:
-                logger.warning("stderr file %s not found.", stderr_fname)
-                stderr = bytes()
-        # cache the content
+            stdout = await self._spool_stdfile(
+                        os.path.join(self.workdir,
+                                     self._stdout_name(use_slurm_symbols=False)
+                                     )
+                                               )
+            stderr = await self._spool_stdfile(
+                        os.path.join(self.workdir,
+                                     self._stderr_name(use_slurm_symbols=False)
+                                     )
+                                               )
         self._stdout_data = stdout
         self._stderr_data = stderr
-        return stdout, stderr
+
+    def discard_stdfile_data(self) -> None:
+        """
+        Discard the stdout and stderr data we kept when removing the stdfiles.
+
+        Closes the spools (removing their temporary files if they rolled over
+        to disk). Afterwards :meth:`communicate` and the streams only return
+        what is (still) in the stdfiles, i.e. nothing if they were removed.
+        """
+        for which in ["stdout", "stderr"]:
+            spool = getattr(self, f"_{which}_data")
+            if spool is not None:
+                spool.close()
+                setattr(self, f"_{which}_data", None)
+
+    async def _read_stdfile_chunk(self, which: str, pos: int,
+                                  chunk_size: int) -> bytes:
+        # read (at most) chunk_size bytes starting at pos from stdout/stderr,
+        # either from the file or from the spool if the file is removed
+        if which == "stdout":
+            fname = self._stdout_name(use_slurm_symbols=False)
+        else:
+            fname = self._stderr_name(use_slurm_symbols=False)
+        spool = getattr(self, f"_{which}_data")
+        if spool is None:
+            try:
+                async with _SEMAPHORES["MAX_FILES_OPEN"]:
+                    async with aiofiles.open(os.path.join(self.workdir, fname),
+                                             "rb") as f:
+                        await f.seek(pos)
+                        return await f.read(chunk_size)
+            except FileNotFoundError:
+                # not yet created or removed in the meantime
+                spool = getattr(self, f"_{which}_data")
+                if spool is None:
+                    return bytes()
+        spool.seek(pos)
+        return spool.read(chunk_size)
+
+    async def _read_stdfiles(self) -> tuple[bytes, bytes]:
+        # we read them in binary mode to get bytes objects back, this way they
+        # behave like the bytes objects returned by asyncio.subprocess
+        # Note: we read chunkwise from the file or the spool (whatever is
+        #       there), but in the end both are completely in memory
+        stdout, stderr = bytearray(), bytearray()
+        for which, data, fname in [
+                ("stdout", stdout, self._stdout_name(use_slurm_symbols=False)),
+                ("stderr", stderr, self._stderr_name(use_slurm_symbols=False)),
+                                   ]:
+            while True:
+                chunk = await self._read_stdfile_chunk(
+                                        which=which, pos=len(data),
+                                        chunk_size=self._stdfile_chunk_size,
+                                                       )
+                if not chunk:
+                    break
+                data += chunk
+            if (len(data) == 0 and getattr(self, f"_{which}_data") is None
+                    and not os.path.isfile(os.path.join(self.workdir, fname))):
+                logger.warning("%s file %s not found.", which,
+                               os.path.join(self.workdir, fname))
+        return bytes(stdout), bytes(stderr)
+
+    async def _stream_stdfile(self, which: str, chunk_size: int,
+                              poll_interval: float, lines: bool,
+                              ) -> typing.AsyncIterator[bytes]:
+        if self._jobid is None:
+            raise RuntimeError("Can only stream the output of submitted SLURM "
+                               + "jobs with known jobid. Did you ever submit "
+                               + "the job?")
+        pos = 0
+        buffer = bytes()
+        job_done = False
+        state_task = None
+        try:
+            while True:
+                # check before reading, such that the last read gets
+                # everything written until the job ended
+                job_done = job_done or self.returncode is not None
+                while True:
+                    chunk = await self._read_stdfile_chunk(
+                                                which=which, pos=pos,
+                                                chunk_size=chunk_size,
+                                                           )
+                    if not chunk:
+                        break
+                    pos += len(chunk)
+                    if not lines:
+                        yield chunk
+                        continue
+                    *complete, buffer = (buffer + chunk).split(b"\n")
+                    for line in complete:
+                        yield line + b"\n"
+                    if len(buffer) >= chunk_size:
+                        # very long line, yield partially to bound memory
+                        yield buffer
+                        buffer = bytes()
+                if job_done:
+                    if buffer:
+                        yield buffer
+                    return
+                if state_task is None:
+                    state_task = asyncio.ensure_future(
+                        self.slurm_cluster_mediator.wait_for_state_change(
+                                            jobid=self.slurm_jobid,
+                                            last_state=self.slurm_job_state,
+                                                                          )
+                                                       )
+                done, _ = await asyncio.wait({state_task},
+                                             timeout=poll_interval)
+                if done:
+                    try:
+                        self._jobinfo = state_task.result()
+                    except SlurmError:
+                        # not monitored anymore, i.e. the job is finished
+                        # (and waited for) or canceled
+                        job_done = True
+                    state_task = None
+        finally:
+            if state_task is not None:
+                state_task.cancel()
+
+    async def stream_stdout(self, chunk_size: int = 2**16,
+                            poll_interval: float = 1.,
+                            lines: bool = False,
+                            ) -> typing.AsyncIterator[bytes]:
+        """
+        Iterate over the stdout of the job while it runs (like ``tail -f``).
+
+        The stdout file is read incrementally, i.e. we never keep more than
+        `chunk_size` bytes in memory. The iteration ends when the job is
+        finished (or canceled) and all its output has been read.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Maximum number of bytes per yielded chunk, by default 2**16.
+        poll_interval : float, optional
+            Time (in seconds) between checks for new output, by default 1.
+        lines : bool, optional
+            Whether to yield complete lines (including the trailing newline)
+            instead of chunks, by default False. Lines longer than
+            `chunk_size` are yielded in parts.
+
+        Yields
+        ------
+        bytes
+            The next chunk (or line) of stdout.
+
+        Raises
+        ------
+        RuntimeError
+            If the job has never been submitted.
+        """
+        async for chunk in self._stream_stdfile(which="stdout",
+                                                chunk_size=chunk_size,
+                                                poll_interval=poll_interval,
+                                                lines=lines):
+            yield chunk
+
+    async def stream_stderr(self, chunk_size: int = 2**16,
+                            poll_interval: float = 1.,
+                            lines: bool = False,
+                            ) -> typing.AsyncIterator[bytes]:
+        """
+        Iterate over the stderr of the job while it runs (like ``tail -f``).
+
+        See :meth:`stream_stdout` for details.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Maximum number of bytes per yielded chunk, by default 2**16.
+        poll_interval : float, optional
+            Time (in seconds) between checks for new output, by default 1.
+        lines : bool, optional
+            Whether to yield complete lines (including the trailing newline)
+            instead of chunks, by default False.
+
+        Yields
+        ------
+        bytes
+            The next chunk (or line) of stderr.
+
+        Raises
+        ------
+        RuntimeError
+            If the job has never been submitted.
+        """
+        async for chunk in self._stream_stdfile(which="stderr",
+                                                chunk_size=chunk_size,
+                                                poll_interval=poll_interval,
+                                                lines=lines):
+            yield chunk
 
     async def _update_sacct_jobinfo(self) -> None:
         # Note that the cluster mediator limits the call frequency for sacct
@@ -907,19 +3027,71 @@ class SlurmProcess:
             # wait indefinitively if we call wait() before submit()
             raise RuntimeError("Can only wait for submitted SLURM jobs with "
                                + "known jobid. Did you ever submit the job?")
-        while self.returncode is None:
-            await asyncio.sleep(self.sleep_time)
-            await self._update_sacct_jobinfo()  # update local cached jobinfo
+        watch_task = None
+        if self.returncode is None and self.completion_watch != "off":
+            watch_task = asyncio.create_task(self._watch_for_completion())
+        try:
+            while self.returncode is None:
+                # update local cached jobinfo as soon as the job state changes
+                self._jobinfo = await self.slurm_cluster_mediator.wait_for_state_change(
+                                            jobid=self.slurm_jobid,
+                                            last_state=self.slurm_job_state,
+                                                                                    )
+        finally:
+            if watch_task is not None:
+                watch_task.cancel()
         self.slurm_cluster_mediator.monitor_remove_job(jobid=self.slurm_jobid)
         if (((self.returncode == 0) and (self._stdfiles_removal == "success"))
                 or self._stdfiles_removal == "yes"
                 or self._stdfiles_removal == "always"):
-            # read them in and cache them so we can still call communicate()
-            # to get the data later
-            stdout, stderr = await self._read_stdfiles()
+            # spool them so we can still call communicate() (and stream) to
+            # get the data later
+            await self._spool_stdfiles()
             await self._remove_stdfiles_async()
         return self.returncode
 
+    async def _watch_for_completion(self) -> None:
+        # wait for the completion files to appear (or SLURM to close the
+        # stdfiles) and request a sacct call for our job every time it
+        # happens, runs until canceled (by wait)
+        names = collections.defaultdict(set)
+        for fname in (self.completion_files or []):
+            directory, name = os.path.split(os.path.join(self.workdir, fname))
+            names[directory].add(name)
+        # SLURM closes the stdfiles when the job ends (but note that they are
+        #  also closed when a job step started with srun ends)
+        close_names = {self._stdout_name(), self._stderr_name()}
+        names.setdefault(self.workdir, set())
+        watcher = _fswatch.get_file_watcher()
+        while True:
+            tasks = [asyncio.create_task(watcher.wait(
+                                directory=directory,
+                                names=list(dir_names),
+                                close_names=(list(close_names)
+                                             if directory == self.workdir
+                                             else []),
+                                method=self.completion_watch,
+                                poll_interval=self.completion_poll_interval,
+                                                      ))
+                     for directory, dir_names in names.items()]
+            try:
+                done, _ = await asyncio.wait(
+                                        tasks,
+                                        return_when=asyncio.FIRST_COMPLETED,
+                                             )
+            finally:
+                for task in tasks:
+                    task.cancel()
+            for task in done:
+                name = task.result()
+                logger.debug("File %s of job %s changed, requesting a poll.",
+                             name, self.slurm_jobid)
+                # do not trigger again for the same file
+                for dir_names in names.values():
+                    dir_names.discard(name)
+                close_names.discard(name)
+            self.slurm_cluster_mediator.request_poll(jobid=self.slurm_jobid)
+
     async def communicate(self, input: typing.Optional[bytes] = None) -> tuple[bytes, bytes]:
         """
         Interact with process. Optionally send data to the process.
@@ -944,6 +3116,13 @@ class SlurmProcess:
             If the job has never been submitted.
         ValueError
             If stdin is not None but the process was created without stdin set.
+
+        Notes
+        -----
+        As with `asyncio.subprocess.Process.communicate`, the complete stdout
+        and stderr are returned as bytes, i.e. they must fit into memory
+        (twice, while we join the chunks). Use :meth:`stream_stdout` and
+        :meth:`stream_stderr` to process large outputs chunkwise instead.
         """
         # order as in asyncio.subprocess, there it is:
         #   1.) write to stdin (optional)
@@ -986,6 +3165,10 @@ class SlurmProcess:
         """
         Terminate (cancel) the underlying SLURM job.
 
+        Note that this blocks until scancel returns, use
+        :meth:`terminate_async` to cancel from within a running event loop
+        without blocking it.
+
         Raises
         ------
         SlurmCancelationError
@@ -993,31 +3176,55 @@ class SlurmProcess:
         RuntimeError
             If no jobid is known, e.g. because the job was never submitted.
         """
-        if self._jobid is not None:
-            scancel_cmd = f"{self.scancel_executable} {self._jobid}"
-            # TODO: parse/check output to make sure scancel went as expected?!
-            try:
-                scancel_out = subprocess.check_output(shlex.split(scancel_cmd),
-                                                      text=True)
-            except subprocess.CalledProcessError as e:
-                raise SlurmCancelationError(
-                        "Something went wrong canceling the slurm job "
-                        + f"{self._jobid}. scancel had exitcode {e.returncode}"
-                        + f" and output {e.output}."
-                        ) from e
-            # if we got until here the job is successfuly canceled....
-            logger.debug(f"Canceled SLURM job with jobid {self.slurm_jobid}."
-                         + f"scancel returned {scancel_out}.")
-            # remove the job from the monitoring
-            self.slurm_cluster_mediator.monitor_remove_job(jobid=self._jobid)
-            if (self._stdfiles_removal == "yes"
-                    or self._stdfiles_removal == "always"):
-                # and remove stdfiles as/if requested
-                self._remove_stdfiles_sync()
-        else:
+        if self._jobid is None:
+            # we probably never submitted the job?
+            raise RuntimeError("self.jobid is not set, can not cancel a job "
+                               + "with unknown jobid. Did you ever submit it?")
+        scancel_cmd = (f"{self.slurm_cluster_mediator.scancel_executable} "
+                       + f"{self._jobid}")
+        try:
+            scancel_out = subprocess.check_output(shlex.split(scancel_cmd),
+                                                  text=True)
+        except subprocess.CalledProcessError as e:
+            raise SlurmCancelationError(
+                    "Something went wrong canceling the slurm job "
+                    + f"{self._jobid}. scancel had exitcode {e.returncode}"
+                    + f" and output {e.output}."
+                    ) from e
+        # if we got until here the job is successfuly canceled....
+        logger.debug(f"Canceled SLURM job with jobid {self.slurm_jobid}."
+                     + f"scancel returned {scancel_out}.")
+        # remove the job from the monitoring
+        self.slurm_cluster_mediator.monitor_remove_job(jobid=self._jobid)
+        if (self._stdfiles_removal == "yes"
+                or self._stdfiles_removal == "always"):
+            # and remove stdfiles as/if requested
+            self._remove_stdfiles_sync()
+
+    async def terminate_async(self) -> None:
+        """
+        Terminate (cancel) the underlying SLURM job without blocking.
+
+        Jobs canceled at the same time are canceled together using one
+        scancel call, see :meth:`SlurmClusterMediator.cancel_job`.
+
+        Raises
+        ------
+        SlurmCancelationError
+            If scancel has non-zero returncode.
+        RuntimeError
+            If no jobid is known, e.g. because the job was never submitted.
+        """
+        if self._jobid is None:
             # we probably never submitted the job?
             raise RuntimeError("self.jobid is not set, can not cancel a job "
                                + "with unknown jobid. Did you ever submit it?")
+        # this also removes the job from the monitoring
+        await self.slurm_cluster_mediator.cancel_job(jobid=self._jobid)
+        if (self._stdfiles_removal == "yes"
+                or self._stdfiles_removal == "always"):
+            # and remove stdfiles as/if requested
+            await self._remove_stdfiles_async()
 
     def kill(self) -> None:
         """Alias for :meth:`terminate`."""
@@ -1078,14 +3285,190 @@ async def create_slurmprocess_submit(jobname: str,
     return proc
 
 
+async def create_slurmprocess_array_submit(jobname: str,
+                                           sbatch_script: str,
+                                           workdir: str,
+                                           n_tasks: int,
+                                           time: typing.Optional[float] = None,
+                                           stdfiles_removal: str = "success",
+                                           **kwargs,
+                                           ) -> "list[SlurmProcess]":
+    """
+    Submit a SLURM job array and create one SlurmProcess per array task.
+
+    The job array is submitted with one call to sbatch (``--array``), the
+    array tasks have the task ids ``0`` to ``n_tasks - 1``. The sbatch script
+    can use the environment variable ``SLURM_ARRAY_TASK_ID`` to decide what to
+    do in each task. Every returned :class:`SlurmProcess` represents exactly
+    one array task (with jobid ``$ARRAYJOBID_$TASKID``), i.e. each of them can
+    be waited for (and canceled) independently.
+
+    Parameters
+    ----------
+    jobname : str
+        SLURM jobname (``--job-name``).
+    sbatch_script : str
+        Absolute or relative path to a SLURM submission script.
+    workdir : str
+        Absolute or relative path to use as working directory.
+    n_tasks : int
+        Number of array tasks.
+    time : float or None
+        Timelimit for each array task in hours. None will result in using the
+        default as either specified in the sbatch script or the partition.
+    stdfiles_removal : str
+        Whether to remove the stdout, stderr files, see
+        :func:`create_slurmprocess_submit`.
+
+    Returns
+    -------
+    list[SlurmProcess]
+        The submitted slurm processes, ordered by array task id.
+
+    Raises
+    ------
+    ValueError
+        If ``n_tasks`` is smaller than one.
+    SlurmSubmissionError
+        If something goes wrong during the submission with sbatch.
+    """
+    if n_tasks < 1:
+        raise ValueError(f"n_tasks must be >= 1, but was {n_tasks}.")
+    procs = [SlurmProcess(jobname=jobname, sbatch_script=sbatch_script,
+                          workdir=workdir, time=time,
+                          stdfiles_removal=stdfiles_removal,
+                          **kwargs)
+             for _ in range(n_tasks)]
+    # use the first proc to construct the sbatch cmd and submit the array,
+    # they all have the same settings anyway
+    await procs[0].slurm_cluster_mediator.update_node_states()
+    partition, qos = await procs[0].choose_partition_qos()
+    for proc in procs:
+        proc.partition, proc.qos = partition, qos
+    sbatch_cmd = procs[0]._sbatch_cmd(stdin=None, array_size=n_tasks)
+    array_jobid = await procs[0]._run_sbatch(sbatch_cmd=sbatch_cmd)
+    logger.info("Submited SLURM job array with jobid %s and %d tasks.",
+                array_jobid, n_tasks)
+    for task_id, proc in enumerate(procs):
+        proc._jobid = f"{array_jobid}_{task_id}"
+        proc.slurm_cluster_mediator.monitor_register_job(jobid=proc._jobid,
+                                                         time_limit=time,
+                                                         jobname=jobname,
+                                                         )
+        proc._journal_submission()
+    await asyncio.gather(*(proc._update_sacct_jobinfo() for proc in procs))
+    return procs
+
+
+async def find_backfill_walltime(sbatch_script: str, workdir: str,
+                                 walltimes: "list[float]",
+                                 jobname: str = "asyncmd_backfill_probe",
+                                 max_start_delay: float = 60.,
+                                 ) -> typing.Union[float, None]:
+    """
+    Find the longest of the given walltimes that SLURM would start right away.
+
+    Asks SLURM (via ``sbatch --test-only``) for the expected start time of the
+    given sbatch script, starting with the longest walltime until one fits,
+    i.e. we probe the current backfill window. Nothing is submitted.
+    As for the partition choice (see :meth:`SlurmProcess.choose_partition_qos`)
+    we reuse recent estimates for scripts with the same sbatch options and
+    walltime, see ``SlurmProcess.start_estimate_max_age``.
+
+    Parameters
+    ----------
+    sbatch_script : str
+        Absolute or relative path to a SLURM submission script.
+    workdir : str
+        Absolute or relative path to use as working directory.
+    walltimes : list[float]
+        The candidate walltimes in hours.
+    jobname : str, optional
+        The SLURM jobname to use for the probes, by default
+        "asyncmd_backfill_probe".
+    max_start_delay : float, optional
+        Maximum delay (in seconds) between now and the expected start for a
+        job to count as starting right away, by default 60.
+
+    Returns
+    -------
+    float or None
+        The longest walltime (in hours) which would start within
+        `max_start_delay` seconds, None if none of them would.
+    """
+    for walltime in sorted(walltimes, reverse=True):
+        proc = SlurmProcess(jobname=jobname, sbatch_script=sbatch_script,
+                            workdir=workdir, time=walltime)
+        estimate_time, start = await proc._cached_start_estimate(
+                                                    partition=proc.partition,
+                                                    qos=proc.qos,
+                                                                 )
+        logger.debug("Backfill probe for walltime %f h returned start time "
+                     "%s.", walltime, start)
+        if start is not None and start - estimate_time <= max_start_delay:
+            return walltime
+    return None
+
+
+async def reattach_slurmprocess(jobid: str) -> SlurmProcess:
+    """
+    Reconstruct the SlurmProcess for a job submitted by a previous controller.
+
+    The job must be in the journal of the SlurmClusterMediator, i.e. the
+    previous controller must have used the same journal file (see
+    :func:`set_slurm_settings`). This enables us to (re)await jobs which are
+    still running (or finished) after e.g. the python process died.
+
+    Parameters
+    ----------
+    jobid : str
+        The SLURM jobid of the job.
+
+    Returns
+    -------
+    SlurmProcess
+        The slurm process instance for the job.
+
+    Raises
+    ------
+    SlurmError
+        If the job is not in the journal.
+    """
+    mediator = SlurmProcess._get_slurm_cluster_mediator()
+    info = mediator._claim_journaled_job(jobid=jobid)
+    stdin = info.pop("stdin")
+    proc = SlurmProcess(**info)
+    proc._jobid = jobid
+    proc._stdin = stdin
+    await proc._update_sacct_jobinfo()
+    logger.info("Reattached to SLURM job with jobid %s (state %s).",
+                jobid, proc.slurm_job_state)
+    return proc
+
+
 def set_all_slurm_settings(sinfo_executable: str = "sinfo",
                            sacct_executable: str = "sacct",
+                           squeue_executable: str = "squeue",
+                           use_squeue: bool = True,
+                           max_jobids_per_call: int = 500,
                            sbatch_executable: str = "sbatch",
                            scancel_executable: str = "scancel",
                            min_time_between_sacct_calls: int = 10,
+                           max_time_between_sacct_calls: int = 120,
+                           sacct_backoff_factor: float = 1.5,
                            num_fails_for_broken_node: int = 3,
                            success_to_fail_ratio: int = 50,
+                           straggler_fail_weight: float = 0.5,
+                           node_fail_half_life: float = 24.,
+                           node_probation_interval: float = 12.,
+                           max_exclude_nodes: int = 50,
+                           min_time_between_sinfo_calls: int = 300,
+                           max_submissions_per_second: float = 10.,
+                           submission_burst: int = 20,
+                           max_sbatch_retries: int = 5,
+                           sbatch_retry_backoff: float = 2.,
                            exclude_nodes: typing.Optional[list[str]] = None,
+                           journal_file: typing.Optional[str] = None,
                            ) -> None:
     """
     (Re) initialize all settings relevant for SLURM job control.
@@ -1104,6 +3487,14 @@ def set_all_slurm_settings(sinfo_executable: str = "sinfo",
         Name of path to the sinfo executable, by default "sinfo".
     sacct_executable : str, optional
         Name or path to the sacct executable, by default "sacct".
+    squeue_executable : str, optional
+        Name or path to the squeue executable, by default "squeue".
+    use_squeue : bool, optional
+        Whether to use squeue to monitor pending and running jobs (and sacct
+        only for jobs that left the queue), by default True.
+    max_jobids_per_call : int, optional
+        Maximum number of jobids passed to a single sacct/squeue call,
+        by default 500.
     sbatch_executable : str, optional
         Name or path to the sbatch executable, by default "sbatch".
     scancel_executable : str, optional
@@ -1111,37 +3502,110 @@ def set_all_slurm_settings(sinfo_executable: str = "sinfo",
     min_time_between_sacct_calls : int, optional
         Minimum time (in seconds) between subsequent sacct calls,
         by default 10.
+    max_time_between_sacct_calls : int, optional
+        Maximum time (in seconds) between subsequent sacct calls for long
+        pending/running jobs, by default 120.
+    sacct_backoff_factor : float, optional
+        Factor by which the polling interval for a job is increased after
+        every sacct call without state change, by default 1.5.
     num_fails_for_broken_node : int, optional
         Number of failed jobs we need to observe per node before declaring it
         to be broken (and not submitting any more jobs to it), by default 3.
     success_to_fail_ratio : int, optional
         Number of successful jobs we need to observe per node to decrease the
         failed job counter by one, by default 50.
+    straggler_fail_weight : float, optional
+        Fraction of a failed job added to the failed job counter of the nodes
+        a straggling job ran on, by default 0.5.
+    node_fail_half_life : float, optional
+        Half life (in hours) of the failed job counter of every node,
+        by default 24.
+    node_probation_interval : float, optional
+        Time (in hours) for which a broken node is excluded before we use it
+        again on probation, by default 12.
+    max_exclude_nodes : int, optional
+        Maximum number of broken nodes we exclude (the worst offenders),
+        by default 50.
+    min_time_between_sinfo_calls : int, optional
+        Minimum time (in seconds) between subsequent sinfo calls to update
+        the node states, by default 300.
+    max_submissions_per_second : float, optional
+        Maximum (sustained) rate of sbatch calls, zero or negative values mean
+        no limit, by default 10.
+    submission_burst : int, optional
+        Number of sbatch calls we can make at once before the rate limit
+        applies, by default 20.
+    max_sbatch_retries : int, optional
+        Number of retries for submissions failing with a transient sbatch
+        error, by default 5.
+    sbatch_retry_backoff : float, optional
+        Base time (in seconds) for the jittered exponential backoff between
+        retries, by default 2.
     exclude_nodes : list[str], optional
         List of nodes to exclude in job submissions, by default None, which
         results in no excluded nodes.
+    journal_file : str, optional
+        Path to the journal file in which we record all submitted jobs (and
+        from which we restore the state if it exists), by default None, which
+        results in no journal.
     """
     global SlurmProcess
+    if SlurmProcess._slurm_cluster_mediator is not None:
+        # close the journal of the mediator we replace (before the new one
+        # possibly restores the state from the same journal file)
+        SlurmProcess._slurm_cluster_mediator.journal_file = None
     SlurmProcess._slurm_cluster_mediator = SlurmClusterMediator(
                     sinfo_executable=sinfo_executable,
                     sacct_executable=sacct_executable,
+                    squeue_executable=squeue_executable,
+                    scancel_executable=scancel_executable,
+                    use_squeue=use_squeue,
+                    max_jobids_per_call=max_jobids_per_call,
                     min_time_between_sacct_calls=min_time_between_sacct_calls,
+                    max_time_between_sacct_calls=max_time_between_sacct_calls,
+                    sacct_backoff_factor=sacct_backoff_factor,
                     num_fails_for_broken_node=num_fails_for_broken_node,
                     success_to_fail_ratio=success_to_fail_ratio,
-                    exclude_nodes=exclude_nodes,
+                    straggler_fail_weight=straggler_fail_weight,
+                    node_fail_half_life=node_fail_half_life,
+                    node_probation_interval=node_probation_interval,
+                    max_exclude_nodes=max_exclude_nodes,
+                    min_time_between_sinfo_calls=min_time_between_sinfo_calls,
+                    max_submissions_per_second=max_submissions_per_second,
+                    submission_burst=submission_burst,
+                    max_sbatch_retries=max_sbatch_retries,
+                    sbatch_retry_backoff=sbatch_retry_backoff,
+                    # None is not a list, i.e. would fail the type check
+                    exclude_nodes=([] if exclude_nodes is None
+                                   else exclude_nodes),
+                    journal_file=journal_file,
                                                                 )
     SlurmProcess.sbatch_executable = sbatch_executable
-    SlurmProcess.scancel_executable = scancel_executable
 
 
 def set_slurm_settings(sinfo_executable: typing.Optional[str] = None,
                        sacct_executable: typing.Optional[str] = None,
+                       squeue_executable: typing.Optional[str] = None,
+                       use_squeue: typing.Optional[bool] = None,
+                       max_jobids_per_call: typing.Optional[int] = None,
                        sbatch_executable: typing.Optional[str] = None,
                        scancel_executable: typing.Optional[str] = None,
                        min_time_between_sacct_calls: typing.Optional[int] = None,
+                       max_time_between_sacct_calls: typing.Optional[int] = None,
+                       sacct_backoff_factor: typing.Optional[float] = None,
                        num_fails_for_broken_node: typing.Optional[int] = None,
                        success_to_fail_ratio: typing.Optional[int] = None,
+                       straggler_fail_weight: typing.Optional[float] = None,
+                       node_fail_half_life: typing.Optional[float] = None,
+                       node_probation_interval: typing.Optional[float] = None,
+                       max_exclude_nodes: typing.Optional[int] = None,
+                       min_time_between_sinfo_calls: typing.Optional[int] = None,
+                       max_submissions_per_second: typing.Optional[float] = None,
+                       submission_burst: typing.Optional[int] = None,
+                       max_sbatch_retries: typing.Optional[int] = None,
+                       sbatch_retry_backoff: typing.Optional[float] = None,
                        exclude_nodes: typing.Optional[list[str]] = None,
+                       journal_file: typing.Optional[str] = None,
                        ) -> None:
     """
     Set single or multiple settings relevant for SLURM job control.
@@ -1150,6 +3614,8 @@ def set_slurm_settings(sinfo_executable: typing.Optional[str] = None,
     executables. This function only modifies thoose settings for which a value
     other than None is passed. See `set_all_slurm_settings` if you want to set/
     modify all slurm settings and/or reset them to their defaults.
+    Note that the SLURM cluster handling is initialized on first use, if this
+    function is called before, it is initialized with the given executables.
 
     Parameters
     ----------
@@ -1157,6 +3623,14 @@ def set_slurm_settings(sinfo_executable: typing.Optional[str] = None,
         Name of path to the sinfo executable, by default None.
     sacct_executable : str, optional
         Name or path to the sacct executable, by default None.
+    squeue_executable : str, optional
+        Name or path to the squeue executable, by default None.
+    use_squeue : bool, optional
+        Whether to use squeue to monitor pending and running jobs (and sacct
+        only for jobs that left the queue), by default None.
+    max_jobids_per_call : int, optional
+        Maximum number of jobids passed to a single sacct/squeue call,
+        by default None.
     sbatch_executable : str, optional
         Name or path to the sbatch executable, by default None.
     scancel_executable : str, optional
@@ -1164,30 +3638,108 @@ def set_slurm_settings(sinfo_executable: typing.Optional[str] = None,
     min_time_between_sacct_calls : int, optional
         Minimum time (in seconds) between subsequent sacct calls,
         by default None.
+    max_time_between_sacct_calls : int, optional
+        Maximum time (in seconds) between subsequent sacct calls for long
+        pending/running jobs, by default None.
+    sacct_backoff_factor : float, optional
+        Factor by which the polling interval for a job is increased after
+        every sacct call without state change, by default None.
     num_fails_for_broken_node : int, optional
         Number of failed jobs we need to observe per node before declaring it
         to be broken (and not submitting any more jobs to it), by default None.
     success_to_fail_ratio : int, optional
         Number of successful jobs we need to observe per node to decrease the
         failed job counter by one, by default None.
+    straggler_fail_weight : float, optional
+        Fraction of a failed job added to the failed job counter of the nodes
+        a straggling job ran on, by default None.
+    node_fail_half_life : float, optional
+        Half life (in hours) of the failed job counter of every node,
+        by default None.
+    node_probation_interval : float, optional
+        Time (in hours) for which a broken node is excluded before we use it
+        again on probation, by default None.
+    max_exclude_nodes : int, optional
+        Maximum number of broken nodes we exclude (the worst offenders),
+        by default None.
+    min_time_between_sinfo_calls : int, optional
+        Minimum time (in seconds) between subsequent sinfo calls to update
+        the node states, by default None.
+    max_submissions_per_second : float, optional
+        Maximum (sustained) rate of sbatch calls, zero or negative values mean
+        no limit, by default None.
+    submission_burst : int, optional
+        Number of sbatch calls we can make at once before the rate limit
+        applies, by default None.
+    max_sbatch_retries : int, optional
+        Number of retries for submissions failing with a transient sbatch
+        error, by default None.
+    sbatch_retry_backoff : float, optional
+        Base time (in seconds) for the jittered exponential backoff between
+        retries, by default None.
     exclude_nodes : list[str], optional
         List of nodes to exclude in job submissions, by default None, which
         results in no excluded nodes.
+    journal_file : str, optional
+        Path to the journal file in which we record all submitted jobs (and
+        from which we restore the state if it exists), by default None.
     """
     global SlurmProcess
+    if SlurmProcess._slurm_cluster_mediator is None:
+        # nobody used SLURM so far, create the mediator directly with the
+        # given executables (the default ones might not exist)
+        executables = {"sinfo_executable": sinfo_executable,
+                       "sacct_executable": sacct_executable,
+                       "squeue_executable": squeue_executable,
+                       "scancel_executable": scancel_executable,
+                       }
+        SlurmProcess._slurm_cluster_mediator = SlurmClusterMediator(
+                                **{key: val for key, val in executables.items()
+                                   if val is not None}
+                                                                    )
     if sinfo_executable is not None:
         SlurmProcess._slurm_cluster_mediator.sinfo_executable = sinfo_executable
     if sacct_executable is not None:
         SlurmProcess._slurm_cluster_mediator.sacct_executable = sacct_executable
+    if squeue_executable is not None:
+        SlurmProcess._slurm_cluster_mediator.squeue_executable = squeue_executable
+    if use_squeue is not None:
+        SlurmProcess._slurm_cluster_mediator.use_squeue = use_squeue
+    if max_jobids_per_call is not None:
+        SlurmProcess._slurm_cluster_mediator.max_jobids_per_call = max_jobids_per_call
     if sbatch_executable is not None:
         SlurmProcess.sbatch_executable = sbatch_executable
     if scancel_executable is not None:
-        SlurmProcess.scancel_executable = scancel_executable
+        SlurmProcess._slurm_cluster_mediator.scancel_executable = scancel_executable
     if min_time_between_sacct_calls is not None:
         SlurmProcess._slurm_cluster_mediator.min_time_between_sacct_calls = min_time_between_sacct_calls
+    if max_time_between_sacct_calls is not None:
+        SlurmProcess._slurm_cluster_mediator.max_time_between_sacct_calls = max_time_between_sacct_calls
+    if sacct_backoff_factor is not None:
+        SlurmProcess._slurm_cluster_mediator.sacct_backoff_factor = sacct_backoff_factor
     if num_fails_for_broken_node is not None:
         SlurmProcess._slurm_cluster_mediator.num_fails_for_broken_node = num_fails_for_broken_node
     if success_to_fail_ratio is not None:
         SlurmProcess._slurm_cluster_mediator.success_to_fail_ratio = success_to_fail_ratio
+    if straggler_fail_weight is not None:
+        SlurmProcess._slurm_cluster_mediator.straggler_fail_weight = straggler_fail_weight
+    if node_fail_half_life is not None:
+        SlurmProcess._slurm_cluster_mediator.node_fail_half_life = node_fail_half_life
+    if node_probation_interval is not None:
+        SlurmProcess._slurm_cluster_mediator.node_probation_interval = node_probation_interval
+    if max_exclude_nodes is not None:
+        SlurmProcess._slurm_cluster_mediator.max_exclude_nodes = max_exclude_nodes
+    if min_time_between_sinfo_calls is not None:
+        SlurmProcess._slurm_cluster_mediator.min_time_between_sinfo_calls = min_time_between_sinfo_calls
+    if max_submissions_per_second is not None:
+        SlurmProcess._slurm_cluster_mediator.max_submissions_per_second = max_submissions_per_second
+    if submission_burst is not None:
+        SlurmProcess._slurm_cluster_mediator.submission_burst = submission_burst
+    if max_sbatch_retries is not None:
+        SlurmProcess._slurm_cluster_mediator.max_sbatch_retries = max_sbatch_retries
+    if sbatch_retry_backoff is not None:
+        SlurmProcess._slurm_cluster_mediator.sbatch_retry_backoff = sbatch_retry_backoff
     if exclude_nodes is not None:
         SlurmProcess._slurm_cluster_mediator.exclude_nodes = exclude_nodes
+    if journal_file is not None:
+        SlurmProcess._slurm_cluster_mediator.journal_file = journal_file
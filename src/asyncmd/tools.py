@@ -12,11 +12,21 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import asyncio
+import logging
 import os
 import shutil
+import typing
 import aiofiles
 
 
+logger = logging.getLogger(__name__)
+
+
+# references to the tasks created by run_in_background (until they are done)
+_BACKGROUND_TASKS = set()
+
+
 def ensure_executable_available(executable: str) -> str:
     """
     Ensure the given executable is available and executable.
@@ -84,3 +94,38 @@ async def remove_file_if_exist_async(f: str):
     except FileNotFoundError:
         # TODO: should we info/warn if the file is not there?
         pass
+
+
+def run_in_background(coro: typing.Coroutine) -> asyncio.Task:
+    """
+    Run the given coroutine as task without anyone awaiting it.
+
+    We keep a reference to the task until it is done (such that it is not
+    garbage collected) and log exceptions it might raise.
+
+    Parameters
+    ----------
+    coro : typing.Coroutine
+        The coroutine to run.
+
+    Returns
+    -------
+    asyncio.Task
+        The task wrapping the coroutine.
+
+    Raises
+    ------
+    RuntimeError
+        If there is no running event loop.
+    """
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+
+def _background_task_done(task: asyncio.Task) -> None:
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed with %s.",
+                     task, repr(task.exception()))
@@ -12,14 +12,32 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
-from .functionwrapper import (PyTrajectoryFunctionWrapper,
-                              SlurmTrajectoryFunctionWrapper,
-                              )
-from .propagate import (ConditionalTrajectoryPropagator,
-                        TrajectoryPropagatorUntilAnyState,
-                        InPartsTrajectoryPropagator,
-                        construct_TP_from_plus_and_minus_traj_segments,
-                        )
-from .trajectory import (_forget_trajectory,
-                         _forget_all_trajectories,
-                         )
+import importlib as _importlib
+
+
+# NOTE: imported on first access, such that e.g. `asyncmd.trajectory.trajectory`
+#       can be used without importing the propagators (and the gromacs engines)
+_LAZY_ATTRIBUTES = {
+    "PyTrajectoryFunctionWrapper": ".functionwrapper",
+    "SlurmTrajectoryFunctionWrapper": ".functionwrapper",
+    "ConditionalTrajectoryPropagator": ".propagate",
+    "TrajectoryPropagatorUntilAnyState": ".propagate",
+    "InPartsTrajectoryPropagator": ".propagate",
+    "construct_TP_from_plus_and_minus_traj_segments": ".propagate",
+    "TrajectoryFunctionValueColumnStore": ".column_store",
+    "_forget_trajectory": ".trajectory",
+    "_forget_all_trajectories": ".trajectory",
+}
+# __all__ is needed for `import *` to also find the not yet imported names
+__all__ = [name for name in _LAZY_ATTRIBUTES if not name.startswith("_")]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = _importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
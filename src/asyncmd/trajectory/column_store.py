@@ -0,0 +1,475 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+"""
+Columnar (cross-trajectory) storage of trajectory function values in h5py.
+
+The caches in :mod:`asyncmd.trajectory.trajectory` store the values per
+trajectory, i.e. loading the values of one function for many trajectories
+(e.g. for analysis or reweighting) means one group traversal and read per
+trajectory. The :class:`TrajectoryFunctionValueColumnStore` stores all values
+of one function in one (chunked, append-only) dataset instead, such that they
+can be loaded with one contiguous read.
+"""
+import logging
+import typing
+import collections
+import numpy as np
+
+from .trajectory import TrajectoryFunctionValueCacheH5PY
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrajectoryFunctionValueColumnStore:
+    """
+    Store the values of every function for all trajectories in one dataset.
+
+    For every func_id the group
+    ``asyncmd/TrajectoryFunctionValueColumns/{func_id}`` (with the func_id
+    escaped as in :class:`asyncmd.trajectory.trajectory.TrajectoryFunctionValueCacheH5PY`)
+    contains the datasets
+
+    - ``values``: the values of all trajectories concatenated along the first
+      (frame) axis,
+    - ``hash_traj``: the hash of every trajectory (as uint64, i.e. modulo
+      2**64), in the order in which they were added,
+    - ``offsets``: the start of every trajectory in ``values`` (plus the total
+      number of frames as last entry), i.e. the values of the i-th trajectory
+      are ``values[offsets[i]:offsets[i+1]]``.
+
+    All datasets are chunked and only ever appended to. The values for single
+    trajectories are available through the per-trajectory mapping returned
+    by :meth:`trajectory`. Use :meth:`export_h5py_cache` to (incrementally)
+    fill the store from a h5py trajectory function value cache.
+
+    Note that the store assumes a single writer, i.e. only one process should
+    append to it at any time.
+
+    Examples
+    --------
+    >>> store = TrajectoryFunctionValueColumnStore(h5file)
+    >>> store.export_h5py_cache(h5file)
+    >>> values, hash_trajs, offsets = store.load(wrapped_func.id)
+    """
+
+    _h5py_root_path = "asyncmd/TrajectoryFunctionValueColumns"
+    _h5py_paths = {"values": "values",
+                   "hash_traj": "hash_traj",
+                   "offsets": "offsets",
+                   }
+    # target size of the chunks of the values datasets (in bytes)
+    chunk_bytes = 1024**2
+    # export_h5py_cache appends (at least) this many bytes at once
+    export_batch_bytes = 64 * 1024**2
+
+    def __init__(self, h5py_group) -> None:
+        """
+        Initialize a `TrajectoryFunctionValueColumnStore`.
+
+        Parameters
+        ----------
+        h5py_group : h5py.Group or h5py.File
+            The file or group to use as root for the store, can be the same
+            as the one used for the h5py cache.
+        """
+        self.h5py_group = h5py_group
+        if h5py_group.file.mode == "r":
+            self._root_grp = h5py_group.get(self._h5py_root_path, None)
+        else:
+            self._root_grp = h5py_group.require_group(self._h5py_root_path)
+        # func_id -> {hash_traj: row}, built when first needed
+        self._row_index = {}
+
+    @staticmethod
+    def _hash_key(hash_traj: int) -> int:
+        # trajectory hashes are unsigned 64 bit ints, but make sure that e.g.
+        # negative values (two's complement) end up the same
+        return int(hash_traj) % 2**64
+
+    def __len__(self) -> int:
+        return 0 if self._root_grp is None else len(self._root_grp)
+
+    def __iter__(self):
+        if self._root_grp is None:
+            return
+        for name in self._root_grp.keys():
+            yield TrajectoryFunctionValueCacheH5PY._func_id(name)
+
+    def __contains__(self, func_id) -> bool:
+        if not isinstance(func_id, str) or self._root_grp is None:
+            return False
+        return (TrajectoryFunctionValueCacheH5PY._dataset_name(func_id)
+                in self._root_grp)
+
+    def _column_grp(self, func_id: str):
+        if func_id not in self:
+            raise KeyError(f"No values for {func_id} stored (yet).")
+        return self._root_grp[
+                    TrajectoryFunctionValueCacheH5PY._dataset_name(func_id)
+                              ]
+
+    def _rows(self, func_id: str) -> "dict[int, int]":
+        try:
+            return self._row_index[func_id]
+        except KeyError:
+            pass
+        if func_id in self:
+            hash_trajs = self._column_grp(func_id)[self._h5py_paths["hash_traj"]][:]
+            rows = {int(h): row for row, h in enumerate(hash_trajs)}
+        else:
+            rows = {}
+        self._row_index[func_id] = rows
+        return rows
+
+    def hash_trajs(self, func_id: str) -> np.ndarray:
+        """
+        Return the hashes of all trajectories with values for func_id.
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+
+        Returns
+        -------
+        np.ndarray
+            The trajectory hashes (as uint64) in the order they were added.
+
+        Raises
+        ------
+        KeyError
+            If there are no values for func_id.
+        """
+        return self._column_grp(func_id)[self._h5py_paths["hash_traj"]][:]
+
+    def load(self, func_id: str) -> "tuple[np.ndarray, np.ndarray, np.ndarray]":
+        """
+        Load the values of func_id for all trajectories (with one read).
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            ``(values, hash_trajs, offsets)``, the values of the i-th
+            trajectory (with hash ``hash_trajs[i]``) are
+            ``values[offsets[i]:offsets[i+1]]``.
+
+        Raises
+        ------
+        KeyError
+            If there are no values for func_id.
+        """
+        grp = self._column_grp(func_id)
+        hash_trajs = grp[self._h5py_paths["hash_traj"]][:]
+        # ignore what an interrupted append might have left behind
+        offsets = grp[self._h5py_paths["offsets"]][:len(hash_trajs) + 1]
+        return (grp[self._h5py_paths["values"]][:offsets[-1]],
+                hash_trajs,
+                offsets,
+                )
+
+    def get(self, func_id: str, hash_traj: int,
+            default=None) -> typing.Optional[np.ndarray]:
+        """
+        Return the values of func_id for the trajectory with hash_traj.
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+        hash_traj : int
+            Hash of the trajectory.
+        default : optional
+            Returned if there are no values, by default None.
+
+        Returns
+        -------
+        np.ndarray or default
+            The (read-only) values.
+        """
+        row = self._rows(func_id).get(self._hash_key(hash_traj), None)
+        if row is None:
+            return default
+        grp = self._column_grp(func_id)
+        start, stop = grp[self._h5py_paths["offsets"]][row:row + 2]
+        vals = grp[self._h5py_paths["values"]][start:stop]
+        vals.flags.writeable = False
+        return vals
+
+    def append(self, func_id: str, hash_traj: int, vals: np.ndarray) -> None:
+        """
+        Append the values of func_id for the trajectory with hash_traj.
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+        hash_traj : int
+            Hash of the trajectory.
+        vals : np.ndarray
+            The values, the first axis must be the frames.
+
+        Raises
+        ------
+        TypeError
+            If ``func_id`` is not a string.
+        ValueError
+            If there are already values stored for func_id and hash_traj or
+            if the shape (except for the number of frames) of vals does not
+            match the already stored values for func_id.
+        """
+        self.append_many(func_id=func_id, hash_trajs=[hash_traj],
+                         vals_list=[vals])
+
+    def append_many(self, func_id: str, hash_trajs: list[int],
+                    vals_list: list[np.ndarray]) -> None:
+        """
+        Append the values of func_id for multiple trajectories at once.
+
+        Much faster than calling :meth:`append` for every trajectory, since
+        every dataset is resized (and written to) only once.
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+        hash_trajs : list[int]
+            Hashes of the trajectories.
+        vals_list : list[np.ndarray]
+            The values for every trajectory, the first axis must be the frames.
+
+        Raises
+        ------
+        TypeError
+            If ``func_id`` is not a string.
+        ValueError
+            If there are already values stored for func_id and any of the
+            hash_trajs (or a hash is given twice) or if the shape (except for
+            the number of frames) of any vals does not match the already
+            stored values for func_id.
+        """
+        if not isinstance(func_id, str):
+            raise TypeError("func_id must be of type str.")
+        if len(hash_trajs) != len(vals_list):
+            raise ValueError("hash_trajs and vals_list must have the same "
+                             + "length.")
+        if len(hash_trajs) == 0:
+            return
+        rows = self._rows(func_id)
+        hash_keys = [self._hash_key(h) for h in hash_trajs]
+        for hash_traj, hash_key in zip(hash_trajs, hash_keys):
+            if hash_key in rows:
+                raise ValueError("There are already values stored for func_id "
+                                 + f"{func_id} and trajectory hash "
+                                 + f"{hash_traj}. Changing the stored values "
+                                 + "is not supported.")
+        if len(set(hash_keys)) != len(hash_keys):
+            raise ValueError("Got the same trajectory hash more than once.")
+        vals_list = [np.asarray(vals) for vals in vals_list]
+        if any(vals.ndim == 0 for vals in vals_list):
+            raise ValueError("vals must have at least one (the frame) axis.")
+        if func_id not in self:
+            self._create_column(func_id=func_id, vals=vals_list[0])
+        grp = self._column_grp(func_id)
+        values = grp[self._h5py_paths["values"]]
+        hash_traj_dset = grp[self._h5py_paths["hash_traj"]]
+        offsets = grp[self._h5py_paths["offsets"]]
+        for vals in vals_list:
+            if values.shape[1:] != vals.shape[1:]:
+                raise ValueError(f"Values for func_id {func_id} have shape "
+                                 + f"(n_frames, *{values.shape[1:]}), but "
+                                 + f"got values with shape {vals.shape}.")
+        # the index (hash_traj) is the source of truth: an interrupted append
+        # can leave values (and offsets) behind that are not referenced by
+        # it, we start after the last referenced frame and overwrite those
+        n_rows = len(hash_traj_dset)
+        start = int(offsets[n_rows])
+        lens = [vals.shape[0] for vals in vals_list]
+        new_offsets = start + np.cumsum(lens)
+        # write the values first and the index last, such that an
+        # interrupted append leaves (only) unreferenced values behind
+        values.resize(new_offsets[-1], axis=0)
+        values[start:] = np.concatenate(vals_list, axis=0)
+        offsets.resize(n_rows + 1 + len(lens), axis=0)
+        offsets[n_rows + 1:] = new_offsets
+        hash_traj_dset.resize(n_rows + len(hash_keys), axis=0)
+        hash_traj_dset[n_rows:] = np.array(hash_keys, dtype=np.uint64)
+        for row, hash_key in enumerate(hash_keys, start=n_rows):
+            rows[hash_key] = row
+
+    def _create_column(self, func_id: str, vals: np.ndarray) -> None:
+        grp = self._root_grp.require_group(
+                    TrajectoryFunctionValueCacheH5PY._dataset_name(func_id)
+                                           )
+        row_bytes = max(vals[:1].nbytes, 1)
+        chunk_rows = max(self.chunk_bytes // row_bytes, 1)
+        grp.create_dataset(self._h5py_paths["values"],
+                           shape=(0,) + vals.shape[1:],
+                           maxshape=(None,) + vals.shape[1:],
+                           chunks=(chunk_rows,) + vals.shape[1:],
+                           dtype=vals.dtype,
+                           )
+        grp.create_dataset(self._h5py_paths["hash_traj"], shape=(0,),
+                           maxshape=(None,), chunks=(8192,), dtype=np.uint64,
+                           )
+        grp.create_dataset(self._h5py_paths["offsets"], data=np.zeros(1),
+                           maxshape=(None,), chunks=(8192,), dtype=np.int64,
+                           )
+
+    def extend_from_cache(self, hash_traj: int,
+                          cache: collections.abc.Mapping,
+                          func_ids: typing.Optional[list[str]] = None,
+                          ) -> int:
+        """
+        Append all values of one trajectory cache that are not stored yet.
+
+        Parameters
+        ----------
+        hash_traj : int
+            Hash of the trajectory.
+        cache : collections.abc.Mapping
+            Any of the trajectory function value caches (or a dict) mapping
+            func_id to values.
+        func_ids : list[str], optional
+            Only append values for these func_ids, by default None (all).
+
+        Returns
+        -------
+        int
+            The number of appended values.
+        """
+        hash_key = self._hash_key(hash_traj)
+        n_appended = 0
+        for func_id in (cache if func_ids is None else func_ids):
+            if hash_key in self._rows(func_id) or func_id not in cache:
+                continue
+            self.append(func_id=func_id, hash_traj=hash_traj,
+                        vals=cache[func_id])
+            n_appended += 1
+        return n_appended
+
+    def export_h5py_cache(self, h5py_cache,
+                          func_ids: typing.Optional[list[str]] = None) -> int:
+        """
+        Append all values from a h5py cache that are not in the store yet.
+
+        Can be called repeatedly (e.g. after every simulation round) to add
+        the values of new trajectories (and functions).
+
+        Parameters
+        ----------
+        h5py_cache : h5py.Group or h5py.File
+            The file or group registered as cache, see
+            :func:`asyncmd.config.register_h5py_cache`.
+        func_ids : list[str], optional
+            Only export values for these func_ids, by default None (all).
+
+        Returns
+        -------
+        int
+            The number of appended values.
+        """
+        root = h5py_cache.get(TrajectoryFunctionValueCacheH5PY._h5py_root_path,
+                              None)
+        if root is None:
+            return 0
+        # collect the values and append them in batches (per func_id)
+        pending = collections.defaultdict(lambda: ([], []))
+        pending_bytes = 0
+        n_appended = 0
+
+        def flush():
+            nonlocal pending_bytes, n_appended
+            for func_id, (hash_trajs, vals_list) in pending.items():
+                self.append_many(func_id=func_id, hash_trajs=hash_trajs,
+                                 vals_list=vals_list)
+                n_appended += len(hash_trajs)
+            pending.clear()
+            pending_bytes = 0
+
+        for hash_traj in list(root.keys()):
+            hash_traj = int(hash_traj)
+            hash_key = self._hash_key(hash_traj)
+            cache = TrajectoryFunctionValueCacheH5PY(h5py_cache,
+                                                     hash_traj=hash_traj)
+            for func_id in (cache if func_ids is None else func_ids):
+                if hash_key in self._rows(func_id) or func_id not in cache:
+                    continue
+                vals = cache[func_id]
+                pending[func_id][0].append(hash_traj)
+                pending[func_id][1].append(vals)
+                pending_bytes += vals.nbytes
+            if pending_bytes >= self.export_batch_bytes:
+                flush()
+        flush()
+        logger.debug("Exported %d trajectory function values to the column "
+                     "store.", n_appended)
+        return n_appended
+
+    def trajectory(self, hash_traj: int) -> "TrajectoryColumnStoreView":
+        """
+        Return a (read-only) mapping from func_id to values for one trajectory.
+
+        Parameters
+        ----------
+        hash_traj : int
+            Hash of the trajectory.
+
+        Returns
+        -------
+        TrajectoryColumnStoreView
+        """
+        return TrajectoryColumnStoreView(store=self, hash_traj=hash_traj)
+
+
+class TrajectoryColumnStoreView(collections.abc.Mapping):
+    """
+    Mapping from func_id to values for one trajectory in a column store.
+
+    Same (read) interface as the per-trajectory caches, see
+    :meth:`TrajectoryFunctionValueColumnStore.trajectory`.
+    """
+
+    def __init__(self, store: TrajectoryFunctionValueColumnStore,
+                 hash_traj: int) -> None:
+        self._store = store
+        self._hash_traj = hash_traj
+        self._hash_key = store._hash_key(hash_traj)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        for func_id in self._store:
+            if self._hash_key in self._store._rows(func_id):
+                yield func_id
+
+    def __contains__(self, key) -> bool:
+        if not isinstance(key, str):
+            return False
+        return self._hash_key in self._store._rows(key)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if not isinstance(key, str):
+            raise TypeError("Keys must be of type str.")
+        vals = self._store.get(key, self._hash_traj)
+        if vals is None:
+            raise KeyError(f"No values for {key} stored (yet).")
+        return vals
@@ -20,19 +20,16 @@ import logging
 import functools
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import MDAnalysis as mda
-try:
-    # mda v>=2.3 has moved the timestep class
-    from MDAnalysis.coordinates.timestep import Timestep as mda_Timestep
-except ImportError:
-    # this is where it lives for mda v<=2.2
-    from MDAnalysis.coordinates.base import Timestep as mda_Timestep
-from scipy import constants
 
 from .._config import _SEMAPHORES
+from .._lazy_import import lazy_import
 from .trajectory import Trajectory
 
 
+# MDAnalysis takes long to import, only do it when we need it
+mda = lazy_import("MDAnalysis")
+
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,10 +44,10 @@ def _is_documented_by(original):
 
 
 def _attach_mda_trafos_to_universe(
-        universe: mda.Universe,
+        universe: "mda.Universe",
         mda_transformations: typing.Optional[list[typing.Callable]] = None,
         mda_transformations_setup_func: typing.Optional[typing.Callable] = None,
-                                  ) -> mda.Universe:
+                                  ) -> "mda.Universe":
     """
     Attach MDAnalysis transformations to a given universe.
 
@@ -344,8 +341,8 @@ class FrameExtractor(abc.ABC):
 
     @abc.abstractmethod
     def apply_modification(self,
-                           universe: mda.Universe,
-                           ts: mda_Timestep,
+                           universe: "mda.Universe",
+                           ts: "mda.coordinates.timestep.Timestep",
                            ):
         """
         Apply modification to selected frame (timestep/universe).
@@ -457,8 +454,8 @@ class NoModificationFrameExtractor(FrameExtractor):
     """Extract a frame from a trajectory, write it out without modification."""
 
     def apply_modification(self,
-                           universe: mda.Universe,
-                           ts: mda_Timestep,
+                           universe: "mda.Universe",
+                           ts: "mda.coordinates.timestep.Timestep",
                            ):
         """
         Apply no modification to the extracted frame.
@@ -478,8 +475,8 @@ class InvertedVelocitiesFrameExtractor(FrameExtractor):
     """
 
     def apply_modification(self,
-                           universe: mda.Universe,
-                           ts: mda_Timestep,
+                           universe: "mda.Universe",
+                           ts: "mda.coordinates.timestep.Timestep",
                            ):
         """
         Invert all momenta of the extracted frame.
@@ -547,8 +544,8 @@ class RandomVelocitiesFrameExtractor(FrameExtractor):
         self._rng = np.random.default_rng()
 
     def apply_modification(self,
-                           universe: mda.Universe,
-                           ts: mda_Timestep,
+                           universe: "mda.Universe",
+                           ts: "mda.coordinates.timestep.Timestep",
                            ):
         """
         Draw random Maxwell-Boltzmann velocities for extracted frame.
@@ -567,6 +564,8 @@ class RandomVelocitiesFrameExtractor(FrameExtractor):
         # so we use R = N_A * k_B [J / (mol * K) = kg m**2 / (s**2 * mol * K)]
         # and add in a factor 10 to get 1/σ**2 = m / (k_B * T)
         # in the correct units
+        # NOTE: scipy is only imported here, it takes long to import
+        from scipy import constants
         scale = np.empty((ts.n_atoms, 3), dtype=np.float64)
         s1d = np.sqrt((self.T * constants.R * 0.1)
                       / universe.atoms.masses
@@ -14,12 +14,14 @@
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
 import os
 import abc
+import time
 import shlex
 import asyncio
 import inspect
 import logging
 import hashlib
 import functools
+import statistics
 import typing
 import aiofiles
 import aiofiles.os
@@ -29,6 +31,7 @@ from concurrent.futures import ThreadPoolExecutor
 
 from .._config import _SEMAPHORES
 from .. import slurm
+from .. import pilot
 from ..tools import ensure_executable_available, remove_file_if_exist_async
 from .trajectory import Trajectory
 
@@ -304,11 +307,63 @@ class SlurmTrajectoryFunctionWrapper(TrajectoryFunctionWrapper):
         Name of or path to the wrapped executable.
     call_kwargs : dict
         Keyword arguments for wrapped function.
+    batch_size : int
+        Maximum number of trajectories for which the function values are
+        calculated together in one SLURM job array (with one array task per
+        trajectory). By default 1, which means no batching, i.e. one SLURM job
+        is submitted for every trajectory.
+    batch_collect_time : float
+        Time (in seconds) we collect requests for function values before
+        submitting them together as one job array (if ``batch_size > 1``).
+        Note that we submit the array directly (without waiting) as soon as
+        ``batch_size`` requests are collected.
+    slurm_job_class : str
+        The job class of our SLURM jobs for the SLURM_MAX_JOB budget, by
+        default "trajectory_function", see
+        :func:`asyncmd.config.set_slurm_max_jobs`.
+    speculative_execution : bool
+        Whether to submit a duplicate of jobs which run much longer than usual
+        (stragglers), by default False. The duplicate excludes the nodes of
+        the straggler, the first successful job wins and the other one is
+        canceled. The nodes of a straggler beaten by its duplicate are noted
+        in the node health statistics, see
+        :meth:`asyncmd.slurm.SlurmClusterMediator.note_straggler_on_nodes`.
+        Only used for single jobs, i.e. not for batches (``batch_size > 1``)
+        or with a pilot executor.
+    speculative_runtime_factor : float
+        A job is a straggler if it runs longer than this factor times the
+        median run time of our last successful jobs (with the same jobname,
+        i.e. by default the same function id), by default 3.
+    speculative_min_runtime : float
+        Minimum run time (in seconds) before a job can be a straggler, by
+        default 60.
+    speculative_min_jobs : int
+        Number of successful jobs we need to have observed before we consider
+        any job a straggler, by default 10.
+    speculative_check_interval : float
+        Maximum time (in seconds) between two checks if a running job is a
+        straggler, by default 30.
     """
 
+    # NOTE: batching uses one SLURM job array per batch, each caller still
+    #       gets its own SlurmProcess (one per array task), i.e. node failures
+    #       and other errors are handled per trajectory
+    batch_size = 1
+    batch_collect_time = 5.
+    slurm_job_class = "trajectory_function"
+    # NOTE: speculative execution is off by default, the duplicates cost
+    #       (a little) compute time and count towards SLURM_MAX_JOB
+    speculative_execution = False
+    speculative_runtime_factor = 3.
+    speculative_min_runtime = 60.
+    speculative_min_jobs = 10
+    speculative_check_interval = 30.
+
     def __init__(self, executable, sbatch_script,
                  call_kwargs: typing.Optional[dict] = None,
-                 load_results_func=None, **kwargs):
+                 load_results_func=None,
+                 pilot_executor: typing.Optional[pilot.PilotJobExecutor] = None,
+                 **kwargs):
         """
         Initialize :class:`SlurmTrajectoryFunctionWrapper`.
 
@@ -339,10 +394,24 @@ class SlurmTrajectoryFunctionWrapper(TrajectoryFunctionWrapper):
             If a function is supplied, it will be called with the full path to
             the results file (as in the call to the executable) and should
             return a numpy array containing the loaded values.
+        pilot_executor : asyncmd.pilot.PilotJobExecutor or None
+            If given, the function values are calculated by the workers of the
+            pilot executor (inside their allocations) instead of in separate
+            SLURM jobs (``batch_size`` is ignored in this case). Note that the
+            script is then run with bash, i.e. all ``#SBATCH`` options are
+            ignored.
         """
         # property defaults before superclass init to be resettable via kwargs
         self._slurm_jobname = None
+        self.pilot_executor = pilot_executor
         super().__init__(**kwargs)
+        # pending requests (for batching), list of tuples:
+        # (cmd_str, result_file, slurm_workdir, future for the SlurmProcess)
+        self._batch_pending = []
+        self._batch_collector = None
+        # keep references to running submission tasks (asyncio only keeps
+        # weak references to tasks)
+        self._batch_submissions = set()
         self._executable = None
         # we expect sbatch_script to be a str,
         # but it could be either the path to a submit script or the content of
@@ -373,6 +442,16 @@ class SlurmTrajectoryFunctionWrapper(TrajectoryFunctionWrapper):
     def slurm_jobname(self, val):
         self._slurm_jobname = val
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # cant pickle futures and tasks (+ they are useless when unpickling)
+        state["_batch_pending"] = []
+        state["_batch_collector"] = None
+        state["_batch_submissions"] = set()
+        # the executor (with its futures and tasks) is tied to this session
+        state["pilot_executor"] = None
+        return state
+
     def __repr__(self) -> str:
         return (f"SlurmTrajectoryFunctionWrapper(executable={self._executable}, "
                 + f"call_kwargs={self.call_kwargs})"
@@ -436,44 +515,32 @@ class SlurmTrajectoryFunctionWrapper(TrajectoryFunctionWrapper):
         result_file = os.path.abspath(os.path.join(
                         tra_dir, f"{tra_name}_{hash_part}_CVfunc_id_{self.id}"
                                                    ))
-        # we expect executable to take 3 postional args:
-        # struct traj outfile
-        cmd_str = f"{self.executable} {os.path.abspath(traj.structure_file)}"
-        cmd_str += f" {' '.join(os.path.abspath(t) for t in traj.trajectory_files)}"
-        cmd_str += f" {result_file}"
-        if len(self.call_kwargs) > 0:
-            for key, val in self.call_kwargs.items():
-                # shell escape only the values,
-                # the keys (i.e. option names/flags) should be no issue
-                if isinstance(val, list):
-                    # enable lists of arguments for the same key,
-                    # can then be used e.g. with pythons argparse `nargs="*"` or `nargs="+"`
-                    cmd_str += f" {key} {' '.join([shlex.quote(str(v)) for v in val])}"
-                else:
-                    cmd_str += f" {key} {shlex.quote(str(val))}"
-        # now prepare the sbatch script
-        script = self.sbatch_script.format(cmd_str=cmd_str)
-        # write it out
-        sbatch_fname = os.path.join(tra_dir,
-                                    tra_name + "_" + self.slurm_jobname + ".slurm")
-        if os.path.exists(sbatch_fname):
-            # TODO: should we raise an error?
-            logger.error("Overwriting existing submission file (%s).",
-                         sbatch_fname,
-                         )
-        async with _SEMAPHORES["MAX_FILES_OPEN"]:
-            async with aiofiles.open(sbatch_fname, 'w') as f:
-                await f.write(script)
+        cmd_str = self._cmd_str_for_traj(traj=traj, result_file=result_file)
+        # the (possible) duplicate of a straggler writes its own result file
+        speculative_cmd_str = self._cmd_str_for_traj(
+                            traj=traj,
+                            result_file=self._speculative_result_file(
+                                                    result_file=result_file),
+                                                     )
         # NOTE: we set returncode to 2 (what slurmprocess returns in case of
         # node failure) and rerun/retry until we either get a completed job
         # or a non-node-failure error
         returncode = 2
         while returncode == 2:
             # run slurm job
-            returncode, slurm_proc, stdout, stderr = await self._run_slurm_job(
-                                                   sbatch_fname=sbatch_fname,
+            if self.batch_size > 1 and self.pilot_executor is None:
+                returncode, slurm_proc, stdout, stderr = await self._run_slurm_job_in_batch(
+                                                   cmd_str=cmd_str,
                                                    result_file=result_file,
                                                    slurm_workdir=tra_dir,
+                                                                           )
+            else:
+                returncode, slurm_proc, stdout, stderr = await self._run_slurm_job(
+                                                   cmd_str=cmd_str,
+                                                   result_file=result_file,
+                                                   slurm_workdir=tra_dir,
+                                                   tra_name=tra_name,
+                                       speculative_cmd_str=speculative_cmd_str,
                                                                               )
             if returncode == 2:
                 logger.error("Exit code indicating node fail from CV batch job"
@@ -513,42 +580,394 @@ class SlurmTrajectoryFunctionWrapper(TrajectoryFunctionWrapper):
                                         ) as pool:
                     vals = await loop.run_in_executor(pool, load_func,
                                                       fname_results)
-        # remove the results file and sbatch script
-        await asyncio.gather(remove_file_if_exist_async(fname_results),
-                             remove_file_if_exist_async(sbatch_fname),
-                             )
+        # remove the results file
+        await remove_file_if_exist_async(fname_results)
         return vals
 
-    async def _run_slurm_job(self, sbatch_fname: str, result_file: str,
-                             slurm_workdir: str,
+    def _cmd_str_for_traj(self, traj, result_file: str) -> str:
+        # we expect executable to take 3 postional args:
+        # struct traj outfile
+        cmd_str = f"{self.executable} {os.path.abspath(traj.structure_file)}"
+        cmd_str += f" {' '.join(os.path.abspath(t) for t in traj.trajectory_files)}"
+        cmd_str += f" {result_file}"
+        if len(self.call_kwargs) > 0:
+            for key, val in self.call_kwargs.items():
+                # shell escape only the values,
+                # the keys (i.e. option names/flags) should be no issue
+                if isinstance(val, list):
+                    # enable lists of arguments for the same key,
+                    # can then be used e.g. with pythons argparse `nargs="*"` or `nargs="+"`
+                    cmd_str += f" {key} {' '.join([shlex.quote(str(v)) for v in val])}"
+                else:
+                    cmd_str += f" {key} {shlex.quote(str(val))}"
+        return cmd_str
+
+    async def _write_sbatch_script(self, sbatch_fname: str,
+                                   cmd_str: str) -> None:
+        # substitute the placeholder in the sbatch script and write it out
+        script = self.sbatch_script.format(cmd_str=cmd_str)
+        if os.path.exists(sbatch_fname):
+            # TODO: should we raise an error?
+            logger.error("Overwriting existing submission file (%s).",
+                         sbatch_fname,
+                         )
+        async with _SEMAPHORES["MAX_FILES_OPEN"]:
+            async with aiofiles.open(sbatch_fname, 'w') as f:
+                await f.write(script)
+
+    async def _run_slurm_job(self, cmd_str: str, result_file: str,
+                             slurm_workdir: str, tra_name: str,
+                             speculative_cmd_str: typing.Optional[str] = None,
                              ) -> tuple[int,slurm.SlurmProcess,bytes,bytes]:
+        # write the sbatch script
+        sbatch_fname = os.path.join(slurm_workdir,
+                                    tra_name + "_" + self.slurm_jobname + ".slurm")
+        await self._write_sbatch_script(sbatch_fname=sbatch_fname,
+                                        cmd_str=cmd_str)
         # submit and run slurm-job
-        if _SEMAPHORES["SLURM_MAX_JOB"] is not None:
-            await _SEMAPHORES["SLURM_MAX_JOB"].acquire()
+        # NOTE: pilot tasks do not count as SLURM jobs (the workers are)
+        use_semaphore = (_SEMAPHORES["SLURM_MAX_JOB"] is not None
+                         and self.pilot_executor is None)
+        if use_semaphore:
+            await _SEMAPHORES["SLURM_MAX_JOB"].acquire(self.slurm_job_class)
+        slurm_proc = None
         try:  # this try is just to make sure we always release the semaphore
-            slurm_proc = await slurm.create_slurmprocess_submit(
+            if self.pilot_executor is not None:
+                slurm_proc = await pilot.create_pilotprocess_submit(
+                                                executor=self.pilot_executor,
                                                 jobname=self.slurm_jobname,
                                                 sbatch_script=sbatch_fname,
                                                 workdir=slurm_workdir,
                                                 stdfiles_removal="success",
                                                 stdin=None,
-                                                # sleep 5 s between checking
-                                                sleep_time=5,
-                                                                )
+                                                                    )
+            else:
+                slurm_proc = await slurm.create_slurmprocess_submit(
+                                                jobname=self.slurm_jobname,
+                                                sbatch_script=sbatch_fname,
+                                                workdir=slurm_workdir,
+                                                stdfiles_removal="success",
+                                                stdin=None,
+                                                # the results appearing is
+                                                # the first sign we are done
+                                                completion_files=[
+                                                    self._results_fname(
+                                                        result_file)
+                                                                  ],
+                                                                    )
+            if (self.speculative_execution and self.pilot_executor is None
+                    and speculative_cmd_str is not None):
+                return await self._communicate_speculatively(
+                                    slurm_proc=slurm_proc,
+                                    result_file=result_file,
+                                    slurm_workdir=slurm_workdir,
+                                    tra_name=tra_name,
+                                    speculative_cmd_str=speculative_cmd_str,
+                                                             )
+            # wait for the slurm job to finish
+            # also cancel the job when this future is canceled
+            stdout, stderr = await slurm_proc.communicate()
+            returncode = slurm_proc.returncode
+            return returncode, slurm_proc, stdout, stderr
+        except asyncio.CancelledError:
+            if slurm_proc is not None:
+                await slurm_proc.terminate_async()
+            # clean up the potentialy written result file
+            await self._remove_result_file(result_file=result_file)
+            raise  # reraise CancelledError for encompassing coroutines
+        finally:
+            if use_semaphore:
+                _SEMAPHORES["SLURM_MAX_JOB"].release(self.slurm_job_class)
+            await remove_file_if_exist_async(sbatch_fname)
+
+    @staticmethod
+    def _speculative_result_file(result_file: str) -> str:
+        return result_file + "_speculative"
+
+    def _time_until_straggling(self, slurm_proc: slurm.SlurmProcess) -> float:
+        # time (in seconds) until slurm_proc becomes a straggler (negative if
+        # it already is one), but at most speculative_check_interval such that
+        # we notice changes of the run time distribution
+        start = slurm_proc.accounting["start"]
+        run_times = slurm_proc.slurm_cluster_mediator.observed_run_times(
+                                                    jobname=self.slurm_jobname,
+                                                                         )
+        if start is None or len(run_times) < self.speculative_min_jobs:
+            return self.speculative_check_interval
+        threshold = max(self.speculative_runtime_factor
+                        * statistics.median(run_times),
+                        self.speculative_min_runtime,
+                        )
+        return min(start + threshold - time.time(),
+                   self.speculative_check_interval)
+
+    async def _communicate_speculatively(self, slurm_proc: slurm.SlurmProcess,
+                                         result_file: str, slurm_workdir: str,
+                                         tra_name: str,
+                                         speculative_cmd_str: str,
+                                         ) -> tuple[int,slurm.SlurmProcess,bytes,bytes]:
+        # wait for slurm_proc to finish, but submit a duplicate (not on the
+        # same nodes) if it straggles, the first successful job wins and the
+        # other one is canceled, if both fail we return the first failure
+        spec_result_file = self._speculative_result_file(result_file)
+        running = {asyncio.create_task(slurm_proc.communicate()): slurm_proc}
+        spec_proc = None
+        use_semaphore = _SEMAPHORES["SLURM_MAX_JOB"] is not None
+        spec_acquired = False
+        first_failure = None
+        # only a normal return of the winner keeps the duplicate's results
+        winner_returned = False
+        try:
+            while True:
+                timeout = None
+                if spec_proc is None:
+                    timeout = self._time_until_straggling(slurm_proc)
+                if timeout is not None and timeout <= 0:
+                    if (use_semaphore and _SEMAPHORES["SLURM_MAX_JOB"].locked(
+                                                        self.slurm_job_class)):
+                        # no free slot for the duplicate, try again later
+                        timeout = self.speculative_check_interval
+                    else:
+                        if use_semaphore:
+                            await _SEMAPHORES["SLURM_MAX_JOB"].acquire(
+                                                        self.slurm_job_class)
+                            spec_acquired = True
+                        spec_proc = await self._submit_speculative_job(
+                                        straggler=slurm_proc,
+                                        slurm_workdir=slurm_workdir,
+                                        tra_name=tra_name,
+                                        speculative_cmd_str=speculative_cmd_str,
+                                        spec_result_file=spec_result_file,
+                                                                      )
+                        running[asyncio.create_task(
+                                            spec_proc.communicate())] = spec_proc
+                        timeout = None
+                done, _ = await asyncio.wait(
+                                        running, timeout=timeout,
+                                        return_when=asyncio.FIRST_COMPLETED,
+                                             )
+                # check the original first, it wins if both succeeded
+                for task in sorted(done,
+                                   key=lambda t: running[t] is not slurm_proc):
+                    proc = running.pop(task)
+                    stdout, stderr = task.result()
+                    result = (proc.returncode, proc, stdout, stderr)
+                    if proc.returncode != 0:
+                        if first_failure is None:
+                            first_failure = result
+                        if len(running) > 0:
+                            # wait for the other job
+                            continue
+                        return first_failure
+                    # we have a winner, cancel the other job (if running)
+                    for other_task, other_proc in running.items():
+                        other_task.cancel()
+                        try:
+                            await other_proc.terminate_async()
+                        except slurm.SlurmCancelationError as e:
+                            # do not lose the result of the winner
+                            logger.error("Could not cancel job %s: %s",
+                                         other_proc.slurm_jobid, e)
+                    running = {}
+                    if proc is slurm_proc:
+                        if spec_proc is not None:
+                            logger.info("Straggling job %s finished before "
+                                        "its duplicate (%s).",
+                                        slurm_proc.slurm_jobid,
+                                        spec_proc.slurm_jobid)
+                            await self._remove_result_file(spec_result_file)
+                        winner_returned = True
+                        return result
+                    logger.info("Duplicate job %s finished before straggling "
+                                "job %s.", spec_proc.slurm_jobid,
+                                slurm_proc.slurm_jobid)
+                    slurm_proc.slurm_cluster_mediator.note_straggler_on_nodes(
+                                            nodelist=slurm_proc.nodes or [],
+                                                                          )
+                    # move the results to where the caller expects them
+                    await aiofiles.os.rename(
+                                    self._results_fname(spec_result_file),
+                                    self._results_fname(result_file),
+                                             )
+                    winner_returned = True
+                    return result
+        finally:
+            # canceled, failed (both jobs) or an error, e.g. in submission of
+            # the duplicate: make sure the duplicate does not outlive us
+            for task in running:
+                task.cancel()
+            if not winner_returned:
+                if spec_proc is not None and spec_proc.returncode is None:
+                    try:
+                        await spec_proc.terminate_async()
+                    except slurm.SlurmCancelationError as e:
+                        logger.error("Could not cancel duplicate job %s: %s",
+                                     spec_proc.slurm_jobid, e)
+                await self._remove_result_file(spec_result_file)
+                await remove_file_if_exist_async(
+                        self._speculative_sbatch_fname(
+                                            slurm_workdir=slurm_workdir,
+                                            tra_name=tra_name,
+                                                       )
+                                                 )
+            if spec_acquired:
+                _SEMAPHORES["SLURM_MAX_JOB"].release(self.slurm_job_class)
+
+    async def _submit_speculative_job(self, straggler: slurm.SlurmProcess,
+                                      slurm_workdir: str, tra_name: str,
+                                      speculative_cmd_str: str,
+                                      spec_result_file: str,
+                                      ) -> slurm.SlurmProcess:
+        # submit the duplicate of straggler (excluding its nodes)
+        logger.info("Job %s is straggling (on nodes %s), submitting a "
+                    "duplicate.", straggler.slurm_jobid, straggler.nodes)
+        sbatch_fname = self._speculative_sbatch_fname(
+                                                slurm_workdir=slurm_workdir,
+                                                tra_name=tra_name,
+                                                      )
+        await self._write_sbatch_script(sbatch_fname=sbatch_fname,
+                                        cmd_str=speculative_cmd_str)
+        try:
+            return await slurm.create_slurmprocess_submit(
+                                jobname=self.slurm_jobname,
+                                sbatch_script=sbatch_fname,
+                                workdir=slurm_workdir,
+                                stdfiles_removal="success",
+                                stdin=None,
+                                completion_files=[
+                                    self._results_fname(spec_result_file)
+                                                  ],
+                                exclude_nodes=straggler.nodes or [],
+                                                          )
+        finally:
+            # sbatch keeps a copy of the script, so we can remove it directly
+            await remove_file_if_exist_async(sbatch_fname)
+
+    def _speculative_sbatch_fname(self, slurm_workdir: str,
+                                  tra_name: str) -> str:
+        return os.path.join(slurm_workdir,
+                            tra_name + "_" + self.slurm_jobname
+                            + "_speculative.slurm")
+
+    def _results_fname(self, result_file: str) -> str:
+        # np.save adds the '.npy' ending, a custom save/load function not
+        return (result_file + ".npy" if self.load_results_func is None
+                else result_file)
+
+    async def _remove_result_file(self, result_file: str) -> None:
+        await remove_file_if_exist_async(self._results_fname(result_file))
+
+    async def _run_slurm_job_in_batch(self, cmd_str: str, result_file: str,
+                                      slurm_workdir: str,
+                                      ) -> tuple[int,slurm.SlurmProcess,bytes,bytes]:
+        # add the request to the pending batch and wait until the collector
+        # submitted the job array, then wait for our own array task
+        # NOTE: every array task counts as one job towards SLURM_MAX_JOB, so
+        #       we acquire the semaphore *before* joining the batch
+        if _SEMAPHORES["SLURM_MAX_JOB"] is not None:
+            await _SEMAPHORES["SLURM_MAX_JOB"].acquire(self.slurm_job_class)
+        proc_fut = asyncio.get_running_loop().create_future()
+        request = (cmd_str, result_file, slurm_workdir, proc_fut)
+        slurm_proc = None
+        try:
+            self._batch_pending.append(request)
+            if len(self._batch_pending) >= self.batch_size:
+                # batch is full, submit it directly
+                batch = self._batch_pending[:self.batch_size]
+                self._batch_pending = self._batch_pending[self.batch_size:]
+                task = asyncio.create_task(self._submit_batch(batch=batch))
+                self._batch_submissions.add(task)
+                task.add_done_callback(self._batch_submissions.discard)
+            elif self._batch_collector is None:
+                self._batch_collector = asyncio.create_task(
+                                                    self._collect_batch()
+                                                            )
+            slurm_proc = await proc_fut
             # wait for the slurm job to finish
             # also cancel the job when this future is canceled
             stdout, stderr = await slurm_proc.communicate()
             returncode = slurm_proc.returncode
             return returncode, slurm_proc, stdout, stderr
         except asyncio.CancelledError:
-            slurm_proc.kill()
-            # clean up the sbatch file and potentialy written result file
-            res_fname = (result_file + ".npy" if self.load_results_func is None
-                         else result_file)
-            await asyncio.gather(remove_file_if_exist_async(sbatch_fname),
-                                 remove_file_if_exist_async(res_fname),
-                                 )
+            if slurm_proc is not None:
+                await slurm_proc.terminate_async()
+            elif proc_fut.done() and not proc_fut.cancelled():
+                # submitted but we got canceled before we got the proc back
+                if proc_fut.exception() is None:
+                    await proc_fut.result().terminate_async()
+            else:
+                # not yet submitted, just remove us from the pending requests
+                try:
+                    self._batch_pending.remove(request)
+                except ValueError:
+                    pass  # already taken by a collector
+            await self._remove_result_file(result_file=result_file)
             raise  # reraise CancelledError for encompassing coroutines
         finally:
             if _SEMAPHORES["SLURM_MAX_JOB"] is not None:
-                _SEMAPHORES["SLURM_MAX_JOB"].release()
+                _SEMAPHORES["SLURM_MAX_JOB"].release(self.slurm_job_class)
+
+    async def _collect_batch(self) -> None:
+        # wait for more requests to come in and then submit what we have
+        await asyncio.sleep(self.batch_collect_time)
+        self._batch_collector = None
+        batch = self._batch_pending[:self.batch_size]
+        self._batch_pending = self._batch_pending[self.batch_size:]
+        if len(self._batch_pending) > 0:
+            # more than one full batch is waiting, collect the rest again
+            self._batch_collector = asyncio.create_task(self._collect_batch())
+        await self._submit_batch(batch=batch)
+
+    async def _submit_batch(self, batch: list) -> None:
+        # submit one job array for all requests in batch and pass the
+        # SlurmProcess of each array task to the respective requests future
+        # remove requests that have been canceled while we were waiting
+        batch = [req for req in batch if not req[3].done()]
+        if len(batch) == 0:
+            return
+        # we use the workdir of the first request for sbatch script and
+        # stdfiles, all paths in cmd_str are absolute anyway
+        slurm_workdir = batch[0][2]
+        # every array task runs its own command, selected by its task id
+        cmd_str = 'case "$SLURM_ARRAY_TASK_ID" in\n'
+        for task_id, (req_cmd_str, _, _, _) in enumerate(batch):
+            cmd_str += f"    {task_id}) {req_cmd_str} ;;\n"
+        cmd_str += "esac"
+        # make the sbatch filename unique by using the first result file name
+        # (it is unique per trajectory and function)
+        first_result_name = os.path.split(batch[0][1])[1]
+        sbatch_fname = os.path.join(slurm_workdir,
+                                    f"{first_result_name}_batch{len(batch)}"
+                                    + ".slurm")
+        try:
+            await self._write_sbatch_script(sbatch_fname=sbatch_fname,
+                                            cmd_str=cmd_str)
+            procs = await slurm.create_slurmprocess_array_submit(
+                                                jobname=self.slurm_jobname,
+                                                sbatch_script=sbatch_fname,
+                                                workdir=slurm_workdir,
+                                                n_tasks=len(batch),
+                                                stdfiles_removal="success",
+                                                                 )
+        except BaseException as e:
+            for _, _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            for (_, result_file, _, fut), proc in zip(batch, procs):
+                proc.completion_files = [self._results_fname(result_file)]
+                if fut.done():
+                    # got canceled while we submitted, wait for the
+                    # cancelation (kill() would only schedule it)
+                    try:
+                        await proc.terminate_async()
+                    except slurm.SlurmError as e:
+                        logger.error("Could not cancel SLURM job %s (%s).",
+                                     proc.slurm_jobid, e)
+                else:
+                    fut.set_result(proc)
+        finally:
+            # sbatch keeps a copy of the script, so we can remove it directly
+            await remove_file_if_exist_async(sbatch_fname)
@@ -178,6 +178,51 @@ class _TrajectoryPropagator:
     # (private) superclass for InPartsTrajectoryPropagator and
     # ConditionalTrajectoryPropagator,
     # here we keep the common functions shared between them
+    # NOTE: the following are only used with adaptive_walltime=True, then
+    #       walltime_per_part is the maximum walltime per part and we choose
+    #       the walltime for every part from the performance of the last part
+    #       (as reported by the engine) and the current SLURM backfill window
+    #       (if the engine can probe it)
+    adaptive_walltime = False
+    # the walltime needed for the remaining steps is multiplied by this factor
+    walltime_safety_factor = 1.1
+    # minimum walltime (in hours) per part, avoids many tiny parts
+    min_walltime_per_part = 0.1
+    # candidate walltimes for the backfill probe (as fractions of the maximum)
+    backfill_walltime_fractions = [1., 0.75, 0.5, 0.25]
+
+    async def _walltime_for_next_part(self, engine,
+                                      remaining_steps: float) -> float:
+        # choose the walltime (in hours) for the next part
+        if not self.adaptive_walltime:
+            return self.walltime_per_part
+        walltime = self.walltime_per_part
+        steps_per_hour = getattr(engine, "steps_per_hour", None)
+        if steps_per_hour and np.isfinite(remaining_steps):
+            # no need to ask for more than we need for the remaining steps
+            needed = (remaining_steps / steps_per_hour
+                      * self.walltime_safety_factor)
+            walltime = min(walltime, max(needed, self.min_walltime_per_part))
+        backfill_walltime = getattr(engine, "backfill_walltime", None)
+        if backfill_walltime is not None:
+            candidates = [walltime * f for f in self.backfill_walltime_fractions
+                          if walltime * f >= self.min_walltime_per_part]
+            fitting = await backfill_walltime(walltimes=candidates)
+            if fitting is not None:
+                walltime = fitting
+        logger.debug("Using walltime %f h for the next part (%s steps "
+                     "remaining, %s steps per hour).",
+                     walltime, remaining_steps, steps_per_hour)
+        return walltime
+
+    async def _cancel_presubmitted_part(self, engine) -> None:
+        # engines that submit the next part before it is requested (e.g.
+        # SlurmGmxEngine with presubmit_next_part=True) must cancel it when we
+        # stop propagating
+        cancel = getattr(engine, "cancel_presubmitted_part", None)
+        if cancel is not None:
+            await cancel()
+
     async def remove_parts(self, workdir: str, deffnm: str,
                            file_endings_to_remove: list[str] = ["trajectories",
                                                                 "log"],
@@ -265,6 +310,7 @@ class _TrajectoryPropagator:
             if remove_asyncmd_npz_caches:
                 # NOTE: we do not try to remove the multipart traj caches since
                 #       the Propagators only return non-multipart Trajectories
+                #       (except for parts the SlurmGmxEngine had to resubmit)
                 npz_caches_to_remove = [os.path.join(
                                           f_head,
                                           "." + f_tail + "_asyncmd_cv_cache.npz",
@@ -288,6 +334,7 @@ class InPartsTrajectoryPropagator(_TrajectoryPropagator):
     """
     def __init__(self, n_steps: int, engine_cls,
                  engine_kwargs: dict, walltime_per_part: float,
+                 adaptive_walltime: bool = False,
                  ) -> None:
         """
         Initialize an `InPartTrajectoryPropagator`.
@@ -301,12 +348,19 @@ class InPartsTrajectoryPropagator(_TrajectoryPropagator):
         engine_kwargs : dict
             Dictionary of key word arguments to initialize the MD engine.
         walltime_per_part : float
-            Walltime per trajectory segment, in hours.
+            Walltime per trajectory segment, in hours. The maximum walltime
+            per segment if `adaptive_walltime` is True.
+        adaptive_walltime : bool, optional
+            Whether to choose the walltime of every segment such that it fits
+            the remaining steps (using the performance of the last segment)
+            and the current SLURM backfill window (if the engine supports
+            probing it), by default False.
         """
         self.n_steps = n_steps
         self.engine_cls = engine_cls
         self.engine_kwargs = engine_kwargs
         self.walltime_per_part = walltime_per_part
+        self.adaptive_walltime = adaptive_walltime
 
     async def propagate_and_concatenate(self,
                                         starting_configuration: Trajectory,
@@ -388,6 +442,14 @@ class InPartsTrajectoryPropagator(_TrajectoryPropagator):
             List of trajectory (segements), ordered in time.
         """
         engine = self.engine_cls(**self.engine_kwargs)
+        if self.adaptive_walltime and getattr(engine, "presubmit_next_part",
+                                              False):
+            # we choose the walltime of the next part only after the current
+            # part finished, i.e. a presubmitted part (using the walltime of
+            # the current part) would never be used
+            logger.info("Disabling presubmit_next_part of the engine because "
+                        "adaptive_walltime=True.")
+            engine.presubmit_next_part = False
         if continuation:
             # continuation: get all traj parts already done and continue from
             # there, i.e. append to the last traj part found
@@ -417,13 +479,20 @@ class InPartsTrajectoryPropagator(_TrajectoryPropagator):
             trajs = []
             step_counter = 0
 
-        while (step_counter < self.n_steps):
-            traj = await engine.run(nsteps=self.n_steps,
-                                    walltime=self.walltime_per_part,
-                                    steps_per_part=False,
-                                    )
-            step_counter = engine.steps_done
-            trajs.append(traj)
+        try:
+            while (step_counter < self.n_steps):
+                walltime = await self._walltime_for_next_part(
+                                    engine=engine,
+                                    remaining_steps=self.n_steps - step_counter,
+                                                              )
+                traj = await engine.run(nsteps=self.n_steps,
+                                        walltime=walltime,
+                                        steps_per_part=False,
+                                        )
+                step_counter = engine.steps_done
+                trajs.append(traj)
+        finally:
+            await self._cancel_presubmitted_part(engine=engine)
         return trajs
 
     async def cut_and_concatenate(self,
@@ -551,6 +620,7 @@ class ConditionalTrajectoryPropagator(_TrajectoryPropagator):
                  walltime_per_part: float,
                  max_steps: typing.Optional[int] = None,
                  max_frames: typing.Optional[int] = None,
+                 adaptive_walltime: bool = False,
                  ):
         """
         Initialize a `ConditionalTrajectoryPropagator`.
@@ -567,7 +637,8 @@ class ConditionalTrajectoryPropagator(_TrajectoryPropagator):
         engine_kwargs : dict
             Dictionary of key word arguments to initialize the MD engine.
         walltime_per_part : float
-            Walltime per trajectory segment, in hours.
+            Walltime per trajectory segment, in hours. The maximum walltime
+            per segment if `adaptive_walltime` is True.
         max_steps : int, optional
             Maximum number of integration steps to do before stopping the
             simulation because it did not commit to any condition,
@@ -575,6 +646,11 @@ class ConditionalTrajectoryPropagator(_TrajectoryPropagator):
         max_frames : int, optional
             Maximum number of frames to produce before stopping the simulation
             because it did not commit to any condition, by default None.
+        adaptive_walltime : bool, optional
+            Whether to choose the walltime of every segment such that it fits
+            the current SLURM backfill window (if the engine supports probing
+            it) and does not exceed the steps remaining until max_steps (using
+            the performance of the last segment), by default False.
 
         Notes
         -----
@@ -588,6 +664,7 @@ class ConditionalTrajectoryPropagator(_TrajectoryPropagator):
         self.engine_cls = engine_cls
         self.engine_kwargs = engine_kwargs
         self.walltime_per_part = walltime_per_part
+        self.adaptive_walltime = adaptive_walltime
         # find nstout
         try:
             traj_type = engine_kwargs["output_traj_type"]
@@ -798,13 +875,21 @@ class ConditionalTrajectoryPropagator(_TrajectoryPropagator):
             trajs = []
             step_counter = 0
 
-        while ((not any_cond_fullfilled)
-                and (step_counter <= self.max_steps)):
-            traj = await engine.run_walltime(self.walltime_per_part)
-            cond_vals = await self._condition_vals_for_traj(traj)
-            any_cond_fullfilled = np.any(cond_vals)
-            step_counter = engine.steps_done
-            trajs.append(traj)
+        try:
+            while ((not any_cond_fullfilled)
+                    and (step_counter <= self.max_steps)):
+                walltime = await self._walltime_for_next_part(
+                                    engine=engine,
+                                    remaining_steps=self.max_steps - step_counter,
+                                                              )
+                traj = await engine.run_walltime(walltime)
+                cond_vals = await self._condition_vals_for_traj(traj)
+                any_cond_fullfilled = np.any(cond_vals)
+                step_counter = engine.steps_done
+                trajs.append(traj)
+        finally:
+            # we stop on a condition, i.e. the next part is never needed
+            await self._cancel_presubmitted_part(engine=engine)
         if not any_cond_fullfilled:
             # left while loop because of max_frames reached
             raise MaxStepsReachedError(
@@ -15,17 +15,25 @@
 import io
 import os
 import copy
+import struct
 import typing
 import asyncio
+import sqlite3
 import hashlib
 import logging
 import zipfile
+import threading
+import urllib.parse
 import collections
 import numpy as np
-import MDAnalysis as mda
 
 
 from .._config import _GLOBALS
+from .._lazy_import import lazy_import
+
+
+# MDAnalysis takes long to import, only do it when we need it
+mda = lazy_import("MDAnalysis")
 
 
 logger = logging.getLogger(__name__)
@@ -79,6 +87,16 @@ def _forget_trajectory(traj_hash: int) -> None:
         pass
 
 
+def _read_only_view(vals):
+    # return a view of vals that can not be modified, such that we can hand
+    # out the (cached) values without (defensively) copying them
+    if not isinstance(vals, np.ndarray):
+        return vals
+    view = vals.view()
+    view.flags.writeable = False
+    return view
+
+
 class Trajectory:
     """
     Represent a trajectory.
@@ -123,10 +141,12 @@ class Trajectory:
             by default None
         cache_type : str or None, optional
             The cache type for the CV values cached for this trajectory,
-            must be one of 'h5py', 'npz' or 'memory'.
-            If None we will use 'h5py' if a h5py cache has been registered and
-            if not fallback to 'npz'.
-            See also the ``asyncmd.config.register_h5py_cache()`` function.
+            must be one of 'h5py', 'sqlite', 'npz' or 'memory'.
+            If None we will use the default cache type (see
+            ``asyncmd.config.set_default_trajectory_cache_type()``) and if none
+            is set fallback to 'npz'.
+            See also the ``asyncmd.config.register_h5py_cache()`` and
+            ``asyncmd.config.register_sqlite_cache()`` functions.
 
         Raises
         ------
@@ -172,6 +192,7 @@ class Trajectory:
         self._memory_cache = None
         self._npz_cache = None
         self._h5py_cache = None
+        self._sqlite_cache = None
         self._cache_type = None
         # remember if we use the global default value,
         # if yes we use the (possibly changed) global default when unpickling
@@ -353,7 +374,7 @@ class Trajectory:
         value : str or None
             Either a string indicating the type or None to choose the preferred
             cache type from the available ones.
-            If a string it must be one of 'h5py', 'npz' or 'memory'.
+            If a string it must be one of 'h5py', 'sqlite', 'npz' or 'memory'.
 
         Raises
         ------
@@ -372,7 +393,7 @@ class Trajectory:
         else:
             use_default_cache_type = False
         value = value.lower()
-        allowed_values = ["h5py", "npz", "memory"]
+        allowed_values = ["h5py", "sqlite", "npz", "memory"]
         if value not in allowed_values:
             raise ValueError("Given cache type must be `None` or one of "
                              + f"{allowed_values}. Was: {value}.")
@@ -405,6 +426,12 @@ class Trajectory:
                                         new_cache=self._memory_cache,
                                                  )
                 self._h5py_cache = None
+            if self._sqlite_cache is not None:
+                self._cache_content_to_new_cache(
+                                        old_cache=self._sqlite_cache,
+                                        new_cache=self._memory_cache,
+                                                 )
+                self._sqlite_cache = None
             self._cache_content_to_new_cache(
                                         old_cache=self._npz_cache,
                                         new_cache=self._memory_cache,
@@ -449,11 +476,53 @@ class Trajectory:
                                         new_cache=self._h5py_cache,
                                                  )
                 self._memory_cache = None
+            if self._sqlite_cache is not None:
+                self._cache_content_to_new_cache(
+                                        old_cache=self._sqlite_cache,
+                                        new_cache=self._h5py_cache,
+                                                 )
+                self._sqlite_cache = None
             self._cache_content_to_new_cache(
                                         old_cache=self._npz_cache,
                                         new_cache=self._h5py_cache,
                                              )
             self._npz_cache = None
+        elif self._cache_type == "sqlite":
+            try:
+                fname_db = _GLOBALS["SQLITE_CACHE"]
+            except KeyError as exc:
+                raise ValueError(
+                    "No sqlite cache file registered yet. Try calling "
+                    + "``asyncmd.config.register_sqlite_cache()``"
+                    + " with the appropriate arguments first") from exc
+            if (self._sqlite_cache is None
+                    or self._sqlite_cache.fname_db != fname_db):
+                # dont have one yet (or one in another database file), so
+                # setup the cache and copy the stuff from the old one (if any)
+                old_sqlite_cache = self._sqlite_cache
+                self._sqlite_cache = TrajectoryFunctionValueCacheSQLITE(
+                                                fname_db=fname_db,
+                                                hash_traj=self._traj_hash,
+                                                                        )
+                if old_sqlite_cache is not None:
+                    self._cache_content_to_new_cache(
+                                        old_cache=old_sqlite_cache,
+                                        new_cache=self._sqlite_cache,
+                                                     )
+            # transfer all values from other cache types and empty them
+            for old_cache_attr in ["_memory_cache", "_h5py_cache"]:
+                old_cache = getattr(self, old_cache_attr)
+                if old_cache is not None:
+                    self._cache_content_to_new_cache(
+                                        old_cache=old_cache,
+                                        new_cache=self._sqlite_cache,
+                                                     )
+                    setattr(self, old_cache_attr, None)
+            self._cache_content_to_new_cache(
+                                        old_cache=self._npz_cache,
+                                        new_cache=self._sqlite_cache,
+                                             )
+            self._npz_cache = None
         elif self._cache_type == "npz":
             if self._h5py_cache is not None:
                 self._cache_content_to_new_cache(
@@ -461,6 +530,12 @@ class Trajectory:
                                         new_cache=self._npz_cache,
                                                  )
                 self._h5py_cache = None
+            if self._sqlite_cache is not None:
+                self._cache_content_to_new_cache(
+                                        old_cache=self._sqlite_cache,
+                                        new_cache=self._npz_cache,
+                                                 )
+                self._sqlite_cache = None
             if self._memory_cache is not None:
                 self._cache_content_to_new_cache(
                                         old_cache=self._memory_cache,
@@ -469,7 +544,8 @@ class Trajectory:
                 self._memory_cache = None
         else:
             raise RuntimeError("This should never happen. self._cache_type "
-                               + "must be one of 'memory', 'h5py', 'npz' when "
+                               + "must be one of 'memory', 'h5py', 'sqlite', "
+                               + "'npz' when "
                                + "self._setup_cache is called. "
                                + f"Was {self._cache_type}.")
 
@@ -509,7 +585,7 @@ class Trajectory:
         u.trajectory.close()
         del u
 
-    def _fix_trr_xtc_step_wraparound(self, universe: mda.Universe) -> None:
+    def _fix_trr_xtc_step_wraparound(self, universe: "mda.Universe") -> None:
         # check/correct for wraparounds in the integration step numbers
         # NOTE: fails if the trajectory has length = 1!
         # NOTE: strictly spoken we should not assume wraparound behavior,
@@ -697,21 +773,31 @@ class Trajectory:
             #       matter here
             #       anyway I (hejung) think this order is even what we want:
             #       1.) use h5py cache if registered
-            #       2.) use npz cache (the default since h5py is not registered
+            #       2.) use sqlite cache if registered
+            #       3.) use npz cache (the default since h5py is not registered
             #                          if not set by the user)
-            #       3.) use memory/local cache (only if set on traj creation
+            #       4.) use memory/local cache (only if set on traj creation
             #                                   or if set as default cache)
             if self._h5py_cache is not None:
                 return await self._apply_wrapped_func_cached(
                                                     func_id=func_id,
                                                     wrapped_func=wrapped_func,
                                                     cache=self._h5py_cache,
+                                                    use_lru_cache=True,
+                                                             )
+            if self._sqlite_cache is not None:
+                return await self._apply_wrapped_func_cached(
+                                                    func_id=func_id,
+                                                    wrapped_func=wrapped_func,
+                                                    cache=self._sqlite_cache,
+                                                    use_lru_cache=True,
                                                              )
             if self._npz_cache is not None:
                 return await self._apply_wrapped_func_cached(
                                                     func_id=func_id,
                                                     wrapped_func=wrapped_func,
-                                                    cache=self._npz_cache
+                                                    cache=self._npz_cache,
+                                                    use_lru_cache=True,
                                                              )
             if self._memory_cache is not None:
                 return await self._apply_wrapped_func_cached(
@@ -730,17 +816,35 @@ class Trajectory:
     async def _apply_wrapped_func_cached(
                             self, func_id: str, wrapped_func,
                             cache: collections.abc.Mapping[str, np.ndarray],
+                            use_lru_cache: bool = False,
                                          ):
+        # the (process-wide) in-memory tier in front of the persistent caches,
+        # see asyncmd.config.set_trajectory_cache_lru_size
+        # NOTE: all caches return read-only arrays (the npz and h5py caches
+        #       possibly memory-mapped), so we can return them without copying
+        lru_cache = (_GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"] if use_lru_cache
+                     else None)
+        lru_key = (self._traj_hash, func_id)
+        if lru_cache is not None:
+            vals = lru_cache.get(lru_key, None)
+            if vals is not None:
+                return vals
         try:
             # see if it is in cache
-            return copy.copy(cache[func_id])
+            vals = cache[func_id]
         except KeyError:
             # if not calculate, store and return
             # send function application to seperate process and wait
             # until it finishes
             vals = await wrapped_func.get_values_for_trajectory(self)
             cache.append(func_id=func_id, vals=vals)
-            return vals
+            vals = _read_only_view(vals)
+        # memory-mapped values use no memory until they are touched (and then
+        # the OS page cache), but every map holds a file descriptor, so we do
+        # not keep them around in the LRU tier
+        if lru_cache is not None and not isinstance(vals, np.memmap):
+            lru_cache.put(lru_key, vals)
+        return vals
 
     def _cache_content_to_new_cache(
                         self,
@@ -760,7 +864,10 @@ class Trajectory:
         # NOTE: we always save to npz here and then we check for npz always
         #       when initializing a `new` trajectory and add all values to
         #       the then preferred cache
-        if self._npz_cache is None:
+        #       (except when using the sqlite cache, its whole point is to
+        #        not create one npz file per trajectory and all processes can
+        #        read the values from the same database file anyway)
+        if self._npz_cache is None and self._sqlite_cache is None:
             self._npz_cache = TrajectoryFunctionValueCacheNPZ(
                                         fname_trajs=self.trajectory_files,
                                         hash_traj=self._traj_hash,
@@ -776,6 +883,7 @@ class Trajectory:
             # and set npz cache back to None since we have not been using it
             self._npz_cache = None
         state["_h5py_cache"] = None
+        state["_sqlite_cache"] = None
         state["_npz_cache"] = None
         state["_memory_cache"] = None
         state["_semaphores_by_func_id"] = collections.defaultdict(
@@ -794,6 +902,8 @@ class Trajectory:
         except KeyError:
             # 'old' trajectory objects dont have a _workdir attribute
             pass
+        # 'old' trajectory objects also dont have a _sqlite_cache attribute
+        d.setdefault("_sqlite_cache", None)
         # now we can update without overwritting what we set in __new__
         self.__dict__.update(d)
         # sort out which cache we were using (and which we will use now)
@@ -805,10 +915,11 @@ class Trajectory:
             #  initializing a new trajectory in the same situation)
             self.cache_type = None  # this calls _setup_cache
             return  # get out of here, no need to setup the cache twice
-        if self.cache_type == "h5py":
-            # make sure h5py cache is set before trying to unpickle with it
+        if self.cache_type in ["h5py", "sqlite"]:
+            # make sure h5py/sqlite cache is set before trying to unpickle
+            # with it
             try:
-                _ = _GLOBALS["H5PY_CACHE"]
+                _ = _GLOBALS[f"{self.cache_type.upper()}_CACHE"]
             except KeyError:
                 # this will (probably) fallback to npz but I (hejung) think it
                 # is nice if we use the possibly set global default?
@@ -816,16 +927,16 @@ class Trajectory:
                 # when we change the cache but it will err when the global
                 # default cache is set to h5py (as above)
                 logger.warning("Trying to unpickle %s with cache_type "
-                               "'h5py' not possible without a registered "
+                               "'%s' not possible without a registered "
                                "cache. Falling back to global default type."
-                               "See 'asyncmd.config.register_h5py_cache' and"
+                               "See 'asyncmd.config.register_%s_cache' and"
                                " 'asyncmd.config.set_default_cache_type'.",
-                                self
+                                self, self.cache_type, self.cache_type,
                                )
                 self.cache_type = None  # this calls _setup_cache
                 return  # get out of here, no need to setup the cache twice
         # setup the cache for all cases where we are not using default cache
-        # (or had "h5py" but could not unpickle with "h5py" now [and are
+        # (or had "h5py"/"sqlite" but could not unpickle with it now [and are
         #  therefore also using the default])
         self._setup_cache()
 
@@ -859,7 +970,7 @@ class TrajectoryFunctionValueCacheMEMORY(collections.abc.Mapping):
     def __getitem__(self, key: str) -> np.ndarray:
         if not isinstance(key, str):
             raise TypeError("Keys must be of type str.")
-        return self._func_values_by_id[key]
+        return _read_only_view(self._func_values_by_id[key])
 
     def append(self, func_id: str, vals: np.ndarray) -> None:
         if not isinstance(func_id, str):
@@ -877,9 +988,16 @@ class TrajectoryFunctionValueCacheNPZ(collections.abc.Mapping):
     Interface for caching trajectory function values in a numpy npz file.
 
     Drop-in replacement for the dictionary that is used for in-memory caching.
+
+    All returned values are read-only. Values of at least ``mmap_min_bytes``
+    are memory-mapped directly from the (uncompressed) npz file, i.e. they
+    are only read from disk when (and where) they are accessed.
     """
 
     _hash_traj_npz_key = "hash_of_trajs"  # key of hash_traj in npz file
+    # smaller values are read into memory, every memory-mapped value holds a
+    # file descriptor (until it is garbage collected)
+    mmap_min_bytes = 1024**2
 
     # NOTE: this is written with the assumption that stored trajectories are
     #       immutable (except for adding additional stored function values)
@@ -986,11 +1104,50 @@ class TrajectoryFunctionValueCacheNPZ(collections.abc.Mapping):
     def __getitem__(self, key: str) -> np.ndarray:
         if not isinstance(key, str):
             raise TypeError("Keys must be of type str.")
-        if key in self._func_ids:
-            with np.load(self.fname_npz, allow_pickle=False) as npzfile:
-                return npzfile[key]
-        else:
+        if key not in self._func_ids:
             raise KeyError(f"No values for {key} cached (yet).")
+        vals = self._memmap_member(key)
+        if vals is not None:
+            return vals
+        with np.load(self.fname_npz, allow_pickle=False) as npzfile:
+            vals = npzfile[key]
+        vals.flags.writeable = False
+        return vals
+
+    def _memmap_member(self, key: str) -> typing.Optional[np.memmap]:
+        # memory-map the values of the npy member for key from the npz file,
+        # returns None if the member is too small or can not be mapped (e.g.
+        # because it is compressed or uses an unsupported npy format version)
+        # NOTE: we append to the npz (see append) without ever moving existing
+        #       members, so maps stay valid until the file is removed (and
+        #       even then, as long as they exist, they keep the data)
+        with open(self.fname_npz, "rb") as f:
+            with zipfile.ZipFile(f) as zfile:
+                info = zfile.getinfo(f"{key}.npy")
+            if (info.compress_type != zipfile.ZIP_STORED
+                    or info.file_size < self.mmap_min_bytes):
+                return None
+            # the data of the member starts after its local file header, a
+            # fixed size part (30 bytes, ending with the lengths of the name
+            # and extra field) followed by the name and the extra field
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            n_name, n_extra = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + n_name + n_extra)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            elif version == (2, 0):
+                header = np.lib.format.read_array_header_2_0(f)
+            else:
+                return None
+            shape, fortran_order, dtype = header
+            if dtype.hasobject:
+                return None
+            offset = f.tell()
+        return np.memmap(self.fname_npz, dtype=dtype, mode="r", shape=shape,
+                         order="F" if fortran_order else "C", offset=offset,
+                         )
 
     def append(self, func_id: str, vals: np.ndarray) -> None:
         """
@@ -1050,6 +1207,19 @@ class TrajectoryFunctionValueCacheH5PY(collections.abc.Mapping):
     Interface for caching trajectory function values in a given h5py group.
 
     Drop-in replacement for the dictionary that is used for in-memory caching.
+
+    The values for every trajectory are stored in the group
+    ``asyncmd/TrajectoryFunctionValueCache/{hash_traj}/FunctionValuesByID``
+    with one dataset per function, named by the (escaped) func_id, such that
+    lookups read exactly one dataset independent of the number of cached
+    functions. Trajectories cached with the previous layout (the func_ids and
+    values in two groups of datasets named by index) are migrated when their
+    cache is first opened (or all at once, see :meth:`migrate`). In files
+    opened read-only we instead build an index from func_id to dataset once.
+
+    All returned values are read-only. Values of at least ``mmap_min_bytes``
+    are memory-mapped directly from the file if their dataset is stored
+    contiguously (i.e. not chunked, compressed or external) in a file on disk.
     """
 
     # NOTE: this is written with the assumption that stored trajectories are
@@ -1057,35 +1227,175 @@ class TrajectoryFunctionValueCacheH5PY(collections.abc.Mapping):
     #       but we assume that the actual underlying trajectory stays the same,
     #       i.e. it is not extended after first storing it
 
+    _h5py_root_path = "asyncmd/TrajectoryFunctionValueCache"
+    # smaller values are read into memory, every memory-mapped value holds a
+    # file descriptor (until it is garbage collected)
+    mmap_min_bytes = 1024**2
+    _h5py_paths = {"vals_by_id": "FunctionValuesByID",
+                   # the previous layout
+                   "ids": "FunctionIDs",
+                   "vals": "FunctionValues",
+                   }
+
     def __init__(self, h5py_cache, hash_traj: int):
         self.h5py_cache = h5py_cache
         self._hash_traj = hash_traj
-        self._h5py_paths = {"ids": "FunctionIDs",
-                            "vals": "FunctionValues"
-                            }
-        self._root_grp = h5py_cache.require_group(
-                                            "asyncmd/"
-                                            + "TrajectoryFunctionValueCache/"
-                                            + f"{self._hash_traj}"
-                                                  )
-        self._ids_grp = self._root_grp.require_group(self._h5py_paths["ids"])
-        self._vals_grp = self._root_grp.require_group(self._h5py_paths["vals"])
+        grp_name = f"{self._h5py_root_path}/{self._hash_traj}"
+        # func_id -> dataset name in the legacy values group (only used if we
+        # can not migrate because the file is read-only)
+        self._legacy_index = {}
+        if self._read_only(h5py_cache):
+            self._root_grp = h5py_cache.get(grp_name, None)
+            self._vals_grp = (None if self._root_grp is None
+                              else self._root_grp.get(
+                                            self._h5py_paths["vals_by_id"],
+                                            None)
+                              )
+            self._build_legacy_index()
+        else:
+            self._root_grp = h5py_cache.require_group(grp_name)
+            self._vals_grp = self._root_grp.require_group(
+                                            self._h5py_paths["vals_by_id"]
+                                                          )
+            self._migrate_legacy_layout()
+
+    @staticmethod
+    def _read_only(h5py_cache) -> bool:
+        return h5py_cache.file.mode == "r"
+
+    @staticmethod
+    def _dataset_name(func_id: str) -> str:
+        # func_ids can be any string, but dataset names can not contain "/"
+        # (and "." is the group itself), so we escape them (reversibly)
+        return urllib.parse.quote(func_id, safe="").replace(".", "%2E")
+
+    @staticmethod
+    def _func_id(dataset_name: str) -> str:
+        return urllib.parse.unquote(dataset_name)
+
+    def _legacy_entries(self):
+        # yield (func_id, idx) for all entries in the previous layout
+        if self._root_grp is None:
+            return
+        ids_grp = self._root_grp.get(self._h5py_paths["ids"], None)
+        if ids_grp is None:
+            return
+        for idx in list(ids_grp.keys()):
+            yield ids_grp[idx].asstr()[()], idx
+
+    def _build_legacy_index(self) -> None:
+        for func_id, idx in self._legacy_entries():
+            self._legacy_index[func_id] = idx
+
+    def _migrate_legacy_layout(self) -> int:
+        # move all values stored in the previous layout to the new group
+        # NOTE: moving (renaming) a dataset does not copy its data, and we
+        #       only remove the func_id after the values have been moved,
+        #       i.e. an interrupted migration is continued next time
+        ids_path = self._h5py_paths["ids"]
+        vals_path = self._h5py_paths["vals"]
+        if ids_path not in self._root_grp:
+            return 0
+        n_migrated = 0
+        for func_id, idx in self._legacy_entries():
+            name = self._dataset_name(func_id)
+            if (f"{vals_path}/{idx}" in self._root_grp
+                    and name not in self._vals_grp):
+                self._root_grp.move(f"{vals_path}/{idx}",
+                                    f"{self._h5py_paths['vals_by_id']}/{name}")
+                n_migrated += 1
+            del self._root_grp[f"{ids_path}/{idx}"]
+        del self._root_grp[ids_path]
+        if vals_path in self._root_grp:
+            del self._root_grp[vals_path]
+        logger.debug("Migrated %d cached function values of trajectory with "
+                     "hash %s to the indexed h5py cache layout.",
+                     n_migrated, self._hash_traj)
+        return n_migrated
+
+    @classmethod
+    def migrate(cls, h5py_cache) -> int:
+        """
+        Migrate all trajectories in h5py_cache to the current layout.
+
+        This is optional, every trajectory is also migrated when its cache is
+        first opened (with a writeable file).
+
+        Parameters
+        ----------
+        h5py_cache : h5py.Group or h5py.File
+            The file or group registered as cache, see
+            :func:`asyncmd.config.register_h5py_cache`.
+
+        Returns
+        -------
+        int
+            The number of migrated trajectories.
+        """
+        root = h5py_cache.get(cls._h5py_root_path, None)
+        if root is None:
+            return 0
+        n_trajs = 0
+        for hash_traj in list(root.keys()):
+            if cls._h5py_paths["ids"] in root[hash_traj]:
+                # creating the cache migrates it
+                _ = cls(h5py_cache, hash_traj=hash_traj)
+                n_trajs += 1
+        return n_trajs
 
     def __len__(self):
-        return len(self._ids_grp.keys())
+        n_vals = 0 if self._vals_grp is None else len(self._vals_grp)
+        return n_vals + len(self._legacy_index)
 
     def __iter__(self):
-        for idx in range(len(self)):
-            yield self._ids_grp[str(idx)].asstr()[()]
+        if self._vals_grp is not None:
+            for name in self._vals_grp.keys():
+                yield self._func_id(name)
+        yield from self._legacy_index
+
+    def __contains__(self, key):
+        # (Mapping would call __getitem__, i.e. read the values)
+        if not isinstance(key, str):
+            return False
+        return ((self._vals_grp is not None
+                 and self._dataset_name(key) in self._vals_grp)
+                or key in self._legacy_index)
 
     def __getitem__(self, key):
         if not isinstance(key, str):
             raise TypeError("Keys must be of type str.")
-        for idx, k_val in enumerate(self):
-            if key == k_val:
-                return self._vals_grp[str(idx)][:]
-        # if we got until here the key is not in there
-        raise KeyError("Key not found.")
+        if self._vals_grp is not None:
+            try:
+                dset = self._vals_grp[self._dataset_name(key)]
+            except KeyError:
+                pass
+            else:
+                return self._read_dataset(dset)
+        try:
+            idx = self._legacy_index[key]
+        except KeyError:
+            # if we got until here the key is not in there
+            raise KeyError("Key not found.") from None
+        return self._read_dataset(
+                    self._root_grp[f"{self._h5py_paths['vals']}/{idx}"]
+                                  )
+
+    def _read_dataset(self, dset) -> np.ndarray:
+        if (dset.nbytes >= self.mmap_min_bytes
+                and dset.chunks is None  # contiguous (and hence unfiltered)
+                and dset.external is None
+                and not dset.is_virtual
+                and not dset.dtype.hasobject
+                and dset.file.driver == "sec2"  # i.e. a plain file on disk
+                ):
+            offset = dset.id.get_offset()
+            if offset is not None:
+                return np.memmap(dset.file.filename, dtype=dset.dtype,
+                                 mode="r", shape=dset.shape, offset=offset,
+                                 )
+        vals = dset[:]
+        vals.flags.writeable = False
+        return vals
 
     def append(self, func_id, vals):
         if not isinstance(func_id, str):
@@ -1095,6 +1405,149 @@ class TrajectoryFunctionValueCacheH5PY(collections.abc.Mapping):
                              + f"{func_id}. Changing the stored values is not "
                              + "supported.")
         # TODO: do we also want to check vals for type?
-        name = str(len(self))
-        _ = self._ids_grp.create_dataset(name, data=func_id)
-        _ = self._vals_grp.create_dataset(name, data=vals)
+        _ = self._vals_grp.create_dataset(self._dataset_name(func_id),
+                                          data=vals)
+        # make sure the values are on disk (and not only in the HDF5 buffers)
+        # such that we can memory-map them
+        self._vals_grp.file.flush()
+
+
+class TrajectoryFunctionValueCacheSQLITE(collections.abc.Mapping):
+    """
+    Interface for caching trajectory function values in a sqlite database.
+
+    Drop-in replacement for the dictionary that is used for in-memory caching.
+
+    The values for all trajectories are stored in one table of one database
+    file keyed by (hash_traj, func_id), i.e. unlike for the npz cache there is
+    only one file independent of the number of trajectories (which matters on
+    network/parallel filesystems). The database uses write-ahead logging, such
+    that multiple processes (on the same node) can read and write concurrently.
+    All returned values are read-only.
+    """
+
+    # NOTE: this is written with the assumption that stored trajectories are
+    #       immutable (except for adding additional stored function values)
+    #       but we assume that the actual underlying trajectory stays the same,
+    #       i.e. it is not extended after first storing it
+
+    _table_name = "TrajectoryFunctionValueCache"
+    # how long we wait for locks held by other processes (in s)
+    busy_timeout = 60.
+    # one connection per (process, thread, database file), sqlite connections
+    # can neither be used from other threads nor survive a fork
+    _connections = {}
+
+    def __init__(self, fname_db: str, hash_traj: int) -> None:
+        """
+        Initialize a `TrajectoryFunctionValueCacheSQLITE`.
+
+        Parameters
+        ----------
+        fname_db : str
+            Path to the sqlite database file, created if it does not exist.
+        hash_traj : int
+            Hash over the first part of the trajectory file,
+            used to make sure we cache only for the right trajectory
+            (and not any trajectories with the same filename).
+        """
+        self.fname_db = os.path.abspath(fname_db)
+        self._hash_traj = hash_traj
+        # the hashes are unsigned 64 bit ints, but sqlite INTEGER is signed
+        self._hash_key = str(hash_traj)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        key = (os.getpid(), threading.get_ident(), self.fname_db)
+        try:
+            return self._connections[key]
+        except KeyError:
+            pass
+        conn = sqlite3.connect(self.fname_db, timeout=self.busy_timeout,
+                               # autocommit, every append is its own transaction
+                               isolation_level=None,
+                               )
+        # write-ahead logging lets readers and (one) writer work concurrently
+        # NOTE: this requires shared memory, i.e. all processes using the
+        #       database must run on the same node
+        conn.execute("PRAGMA journal_mode=WAL")
+        # durable enough for a cache (and much faster) when using WAL
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table_name} ("
+                     + "hash_traj TEXT NOT NULL, "
+                     + "func_id TEXT NOT NULL, "
+                     + "vals BLOB NOT NULL, "
+                     + "PRIMARY KEY (hash_traj, func_id)"
+                     + ") WITHOUT ROWID")
+        self._connections[key] = conn
+        return conn
+
+    def __len__(self) -> int:
+        cursor = self._conn.execute(
+                    f"SELECT COUNT(*) FROM {self._table_name} WHERE hash_traj=?",
+                    (self._hash_key,))
+        return cursor.fetchone()[0]
+
+    def __iter__(self):
+        cursor = self._conn.execute(
+                    f"SELECT func_id FROM {self._table_name} WHERE hash_traj=?",
+                    (self._hash_key,))
+        # fetch all at once, such that we do not hold the read transaction
+        for (func_id,) in cursor.fetchall():
+            yield func_id
+
+    def __contains__(self, key) -> bool:
+        # (Mapping would call __getitem__, i.e. read the values)
+        if not isinstance(key, str):
+            return False
+        cursor = self._conn.execute(
+                    f"SELECT 1 FROM {self._table_name} "
+                    + "WHERE hash_traj=? AND func_id=?",
+                    (self._hash_key, key))
+        return cursor.fetchone() is not None
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if not isinstance(key, str):
+            raise TypeError("Keys must be of type str.")
+        cursor = self._conn.execute(
+                    f"SELECT vals FROM {self._table_name} "
+                    + "WHERE hash_traj=? AND func_id=?",
+                    (self._hash_key, key))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(f"No values for {key} cached (yet).")
+        vals = np.load(io.BytesIO(row[0]), allow_pickle=False)
+        vals.flags.writeable = False
+        return vals
+
+    def append(self, func_id: str, vals: np.ndarray) -> None:
+        """
+        Append values for given func_id.
+
+        Parameters
+        ----------
+        func_id : str
+            Function identifier.
+        vals : np.ndarray
+            Values of application of function with given func_id.
+
+        Raises
+        ------
+        TypeError
+            If ``func_id`` is not a string.
+        ValueError
+            If there are already values stored for ``func_id`` in self.
+        """
+        if not isinstance(func_id, str):
+            raise TypeError("func_id must be of type str.")
+        if func_id in self:
+            raise ValueError("There are already values stored for func_id "
+                             + f"{func_id}. Changing the stored values is not "
+                             + "supported.")
+        bio = io.BytesIO()
+        np.save(bio, vals, allow_pickle=False)
+        # another process could have added the (same) values since we checked
+        # above, in that case we just keep the ones already stored
+        self._conn.execute(f"INSERT OR IGNORE INTO {self._table_name} "
+                           + "(hash_traj, func_id, vals) VALUES (?, ?, ?)",
+                           (self._hash_key, func_id, bio.getvalue()))
@@ -12,8 +12,37 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import os
 import pytest
 
+from asyncmd import slurm
+
+from helpers.fakeslurm import FakeSlurm
+
+
+@pytest.fixture
+def fakeslurm(tmp_path, monkeypatch):
+    # run the local SLURM emulator and put its (fake) SLURM commands first on
+    # PATH, such that the default executable names ("sbatch", "sacct", ...)
+    # find them
+    fake = FakeSlurm(str(tmp_path / "fakeslurm"), nodes=8, queue_delay=0.,
+                     tick=0.02)
+    fake.start()
+    monkeypatch.setenv("PATH", os.path.join(fake.state_dir, "bin")
+                       + os.pathsep + os.environ["PATH"])
+    old_mediator = slurm.SlurmProcess._slurm_cluster_mediator
+    old_sbatch = slurm.SlurmProcess.sbatch_executable
+    slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                 max_time_between_sacct_calls=1,
+                                 )
+    try:
+        yield fake
+    finally:
+        fake.stop()
+        # close the journal (if the test set one)
+        slurm.SlurmProcess._slurm_cluster_mediator.journal_file = None
+        slurm.SlurmProcess._slurm_cluster_mediator = old_mediator
+        slurm.SlurmProcess.sbatch_executable = old_sbatch
 
 
 def pytest_addoption(parser):
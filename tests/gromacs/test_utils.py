@@ -0,0 +1,84 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+
+from asyncmd.gromacs.utils import (mdrun_performance_from_log,
+                                   checkpoint_steps_from_log,
+                                   last_checkpoint_step_from_log,
+                                   )
+
+
+class Test_mdrun_performance_from_log:
+    log_end = ("               Core t (s)   Wall t (s)        (%)\n"
+               "       Time:      123.456       30.864      400.0\n"
+               "                 (ns/day)    (hour/ns)\n"
+               "Performance:       48.000        0.500\n"
+               "\n"
+               "Finished mdrun on rank 0\n"
+               )
+
+    @pytest.mark.asyncio
+    async def test_performance(self, tmp_path):
+        log_file = tmp_path / "md.part0001.log"
+        # make it longer than what we read from the end
+        log_file.write_text("Step Time\n" * 10000 + self.log_end)
+        perf = await mdrun_performance_from_log(log_file=str(log_file),
+                                                dt=0.002)
+        assert perf["ns_per_day"] == 48.
+        assert perf["hours_per_ns"] == 0.5
+        # 48 ns/day = 2 ns/h = 2000 ps/h = 1e6 steps/h (for dt = 2 fs)
+        assert perf["steps_per_hour"] == pytest.approx(1e6)
+
+    @pytest.mark.asyncio
+    async def test_no_performance(self, tmp_path):
+        # crashed mdrun (no performance at the end) and missing log
+        log_file = tmp_path / "md.part0001.log"
+        log_file.write_text("Step Time\n" * 10)
+        assert await mdrun_performance_from_log(log_file=str(log_file)) is None
+        assert await mdrun_performance_from_log(
+                                    log_file=str(tmp_path / "missing.log")
+                                                ) is None
+
+
+class Test_last_checkpoint_step_from_log:
+    @pytest.mark.asyncio
+    async def test_checkpoint_step(self, tmp_path):
+        log_file = tmp_path / "md.part0001.log"
+        log_file.write_text("Step Time\n" * 10
+                            + "Writing checkpoint, step 5000 at Mon Jun  3 "
+                            + "12:04:05 2024\n\n"
+                            + "Step Time\n" * 10
+                            + "Writing checkpoint, step 10000 at Mon Jun  3 "
+                            + "12:19:05 2024\n\n"
+                            + "Step Time\n" * 10
+                            )
+        step = await last_checkpoint_step_from_log(log_file=str(log_file))
+        assert step == 10000
+        steps = await checkpoint_steps_from_log(log_file=str(log_file))
+        assert steps == [5000, 10000]
+
+    @pytest.mark.asyncio
+    async def test_no_checkpoint(self, tmp_path):
+        log_file = tmp_path / "md.part0001.log"
+        log_file.write_text("Step Time\n" * 10)
+        assert await last_checkpoint_step_from_log(
+                                            log_file=str(log_file)) is None
+        assert await last_checkpoint_step_from_log(
+                                    log_file=str(tmp_path / "missing.log")
+                                                   ) is None
+        assert await checkpoint_steps_from_log(
+                                    log_file=str(tmp_path / "missing.log")
+                                               ) == []
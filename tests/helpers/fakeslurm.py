@@ -0,0 +1,680 @@
+"""
+A tiny local SLURM emulator for testing and benchmarking asyncmd.slurm.
+
+It consists of a scheduler daemon and the (fake) SLURM commands sbatch,
+sacct, squeue, scancel and sinfo. All share a state directory:
+
+ - ``submitted.jsonl`` : jobs submitted by sbatch (appended, locked)
+ - ``cancel.jsonl`` : jobids canceled by scancel (appended, locked)
+ - ``failnodes.jsonl`` : nodes declared as failing (appended, locked)
+ - ``preempt.jsonl`` : jobids to preempt (appended, locked)
+ - ``drainnodes.jsonl`` : nodes drained by the admin (appended, locked)
+ - ``scripts/`` : copies of the submitted sbatch scripts (as sbatch keeps)
+ - ``state.json`` : the job states as written by the daemon
+ - ``config.json`` : the nodes and the queue delays (written by the daemon)
+ - ``bin/`` : wrapper scripts for the fake SLURM commands
+
+The daemon starts pending jobs after the queue delay as local processes
+(or, with ``--simulate-runtime``, only pretends to run them for the given
+time, which enables tens of thousands of concurrent jobs), kills jobs
+reaching their time limit and lets jobs on failing nodes end in NODE_FAIL.
+Drained nodes get no new jobs and sinfo reports them as 'drained' (with
+``--format='%n %T'``).
+With ``--backfill-window`` only jobs with a time limit inside the window
+start after the queue delay, longer jobs wait additionally for the
+``--long-queue-delay``. With ``--partition-delays p1=1,p2=30`` jobs in the
+given partitions use the given queue delays instead of ``--queue-delay``.
+``sbatch --test-only`` reports the resulting start.
+With ``--sbatch-error-prob`` sbatch randomly rejects submissions with a
+transient error, with ``--sbatch-timeout-prob`` it randomly accepts them
+but reports a timeout (as if the reply from slurmctld got lost).
+Jobs with ``--dependency=afterok:ID`` stay pending until job ID completed
+successfully (forever if it did not, as SLURM does by default).
+Only the sbatch options asyncmd uses are supported (``#SBATCH`` lines in the
+scripts are ignored).
+
+Usage from python (see the fakeslurm fixture in tests/conftest.py and
+benchmarks/bench_slurm_scaling.py)::
+
+    with FakeSlurm(state_dir, nodes=4, queue_delay=1.) as fake:
+        asyncmd.config.set_all_slurm_settings(**fake.executables)
+        ...
+
+Usage from the command line::
+
+    python fakeslurm.py daemon STATE_DIR [--nodes N] [--queue-delay S] ...
+    python fakeslurm.py fail-node STATE_DIR NODE
+    python fakeslurm.py preempt STATE_DIR JOBID
+    python fakeslurm.py drain STATE_DIR NODE
+"""
+import argparse
+import datetime
+import fcntl
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import time
+
+
+_FINAL_STATES = ["COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "NODE_FAIL"]
+_DEFAULT_PARTITION = "fake"
+
+
+def _append_locked(fname, records):
+    # append json lines (under a lock, such that lines do not get mixed up)
+    with open(fname, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _next_jobid(state_dir):
+    fname = os.path.join(state_dir, "next_jobid")
+    with open(fname, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read().strip()
+            jobid = int(content) if content else 1000
+            f.seek(0)
+            f.truncate()
+            f.write(str(jobid + 1))
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return jobid
+
+
+def _read_state(state_dir):
+    try:
+        with open(os.path.join(state_dir, "state.json"), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _parse_time(val):
+    # we only support what asyncmd uses (and plain minutes), returns seconds
+    parts = [int(p) for p in val.split(":")]
+    if len(parts) == 1:
+        return parts[0] * 60
+    return parts[0] * 60 + parts[1]
+
+
+def _expand_jobids(val):
+    # 'id1,id2' (also accepts whitespace separated via argv)
+    return [jid for jid in re.split(r"[,\s]+", val) if jid]
+
+
+def cmd_sbatch(state_dir, argv):
+    parser = argparse.ArgumentParser(prog="sbatch")
+    parser.add_argument("--job-name", default="fakejob")
+    parser.add_argument("--chdir", default=os.getcwd())
+    parser.add_argument("--output", default="slurm-%j.out")
+    parser.add_argument("--error", default=None)
+    parser.add_argument("--input", default=None)
+    parser.add_argument("--time", default=None)
+    parser.add_argument("--exclude", default="")
+    parser.add_argument("--array", default=None)
+    parser.add_argument("--dependency", default=None)
+    parser.add_argument("--partition", default=_DEFAULT_PARTITION)
+    parser.add_argument("--qos", default="normal")
+    # we never requeue, i.e. preempted jobs always end in PREEMPTED
+    parser.add_argument("--requeue", action="store_true")
+    parser.add_argument("--no-requeue", action="store_true")
+    parser.add_argument("--parsable", action="store_true")
+    parser.add_argument("--test-only", action="store_true")
+    parser.add_argument("script")
+    args = parser.parse_args(argv)
+    workdir = os.path.abspath(args.chdir)
+    script = os.path.join(os.getcwd(), args.script)
+    if not os.path.isfile(script):
+        print(f"sbatch: error: Unable to open file {args.script}",
+              file=sys.stderr)
+        return 1
+    config = _read_config(state_dir)
+    if not args.test_only:
+        roll = random.random()
+        if roll < config["sbatch_error_prob"]:
+            print("sbatch: error: Batch job submission failed: Resource "
+                  "temporarily unavailable", file=sys.stderr)
+            return 1
+        lost_reply = roll < (config["sbatch_error_prob"]
+                             + config["sbatch_timeout_prob"])
+    if args.test_only:
+        job_time = None if args.time is None else _parse_time(args.time)
+        start = time.time() + _queue_delay(config, job_time, args.partition)
+        start = datetime.datetime.fromtimestamp(start).isoformat(
+                                                        timespec="seconds")
+        print(f"sbatch: Job 0 to start at {start} using 1 processors on nodes"
+              f" {config['nodes'][0]} in partition {args.partition}",
+              file=sys.stderr)
+        return 0
+    afterok = []
+    if args.dependency is not None:
+        kind, _, ids = args.dependency.partition(":")
+        if kind != "afterok" or not ids:
+            print("sbatch: error: Batch job submission failed: Job dependency"
+                  " problem", file=sys.stderr)
+            return 1
+        afterok = ids.split(":")
+    jobid = _next_jobid(state_dir)
+    # like sbatch we keep a copy, i.e. the script can be removed directly
+    os.makedirs(os.path.join(state_dir, "scripts"), exist_ok=True)
+    script_copy = os.path.join(state_dir, "scripts", f"{jobid}.sh")
+    shutil.copyfile(script, script_copy)
+    base = {"name": args.job_name,
+            "script": script_copy,
+            "workdir": workdir,
+            "input": args.input,
+            "time": None if args.time is None else _parse_time(args.time),
+            "exclude": [n for n in args.exclude.split(",") if n],
+            "afterok": afterok,
+            "partition": args.partition,
+            "qos": args.qos,
+            "submit": time.time(),
+            }
+    if args.array is None:
+        tasks = [(str(jobid), None)]
+    else:
+        start, end = (int(v) for v in args.array.split("-"))
+        tasks = [(f"{jobid}_{i}", i) for i in range(start, end + 1)]
+    records = []
+    for task_jobid, task_id in tasks:
+
+        def expand(pattern):
+            out = pattern.replace("%A", str(jobid)).replace("%x", args.job_name)
+            out = out.replace("%a", str(task_id))
+            out = out.replace("%j", task_jobid)
+            return os.path.join(workdir, out)
+
+        records.append({**base,
+                        "jobid": task_jobid,
+                        "array_jobid": str(jobid),
+                        "array_task_id": task_id,
+                        "stdout": expand(args.output),
+                        "stderr": expand(args.error or args.output),
+                        })
+    _append_locked(os.path.join(state_dir, "submitted.jsonl"), records)
+    if lost_reply:
+        print("sbatch: error: Batch job submission failed: Socket timed out "
+              "on send/recv operation", file=sys.stderr)
+        return 1
+    print(str(jobid))
+    return 0
+
+
+def _sacct_field(jobid, info, field, step=None):
+    def timestamp(t):
+        if t is None:
+            return "Unknown"
+        return datetime.datetime.fromtimestamp(t).isoformat(timespec="seconds")
+
+    elapsed = 0
+    if info["start"] is not None:
+        elapsed = int((info["end"] or time.time()) - info["start"])
+    values = {"jobid": jobid if step is None else f"{jobid}.{step}",
+              "state": info["state"],
+              "exitcode": info["exitcode"],
+              "nodelist": info["node"] or "None assigned",
+              "submit": timestamp(info["submit"]),
+              "eligible": timestamp(info["eligible"]),
+              "start": timestamp(info["start"]),
+              "end": timestamp(info["end"]),
+              "elapsedraw": str(elapsed),
+              "alloccpus": "1",
+              "totalcpu": "00:00.000",
+              # MaxRSS is only reported for the steps
+              "maxrss": "" if step is None else "1024K",
+              "partition": info["partition"],
+              "jobname": info["name"],
+              "workdir": info["workdir"],
+              "qos": info["qos"],
+              }
+    return values[field.lower()]
+
+
+def cmd_sacct(state_dir, argv):
+    parser = argparse.ArgumentParser(prog="sacct")
+    parser.add_argument("--noheader", action="store_true")
+    parser.add_argument("-j", "--jobs", default="")
+    parser.add_argument("-o", "--format", default="jobid,state,exitcode")
+    parser.add_argument("--parsable", action="store_true")
+    parser.add_argument("--delimiter", default="|")
+    parser.add_argument("--name", default=None)
+    parser.add_argument("-S", "--starttime", default=None)
+    args = parser.parse_args(argv)
+    d = args.delimiter
+    fields = args.format.split(",")
+    states = _read_state(state_dir)
+    jobids = _expand_jobids(args.jobs) if args.jobs else list(states)
+    starttime = (None if args.starttime is None
+                 else datetime.datetime.fromisoformat(args.starttime
+                                                      ).timestamp())
+    lines = []
+    for jobid in jobids:
+        info = states.get(jobid)
+        if info is None:
+            continue
+        if ((args.name is not None and info["name"] != args.name)
+                or (starttime is not None and info["submit"] < starttime)):
+            continue
+        steps = [None] if info["state"] == "PENDING" else [None, "batch"]
+        for step in steps:
+            lines.append("".join(_sacct_field(jobid, info, f, step) + d
+                                 for f in fields))
+    if lines:
+        print("\n".join(lines))
+    return 0
+
+
+def cmd_squeue(state_dir, argv):
+    parser = argparse.ArgumentParser(prog="squeue")
+    parser.add_argument("--noheader", action="store_true")
+    parser.add_argument("--array", action="store_true")
+    parser.add_argument("--jobs", default="")
+    parser.add_argument("--format", default="%i %T %N")
+    args = parser.parse_args(argv)
+    states = _read_state(state_dir)
+    jobids = _expand_jobids(args.jobs) if args.jobs else list(states)
+    lines = []
+    for jobid in jobids:
+        info = states.get(jobid)
+        if info is None or info["state"] not in ["PENDING", "RUNNING"]:
+            continue
+        lines.append(args.format.replace("%i", jobid)
+                                .replace("%T", info["state"])
+                                .replace("%N", info["node"] or ""))
+    if lines:
+        print("\n".join(lines))
+    return 0
+
+
+def cmd_scancel(state_dir, argv):
+    jobids = [jid for arg in argv for jid in _expand_jobids(arg)]
+    _append_locked(os.path.join(state_dir, "cancel.jsonl"),
+                   [{"jobid": jid} for jid in jobids])
+    return 0
+
+
+def _read_config(state_dir):
+    with open(os.path.join(state_dir, "config.json"), "r") as f:
+        return json.load(f)
+
+
+def _queue_delay(config, job_time, partition=None):
+    # jobs that do not fit the backfill window wait longer
+    delay = config["partition_delays"].get(partition, config["queue_delay"])
+    window = config["backfill_window"]
+    if window is not None and (job_time is None or job_time > window):
+        delay += config["long_queue_delay"]
+    return delay
+
+
+def _read_drained(state_dir):
+    try:
+        with open(os.path.join(state_dir, "drainnodes.jsonl"), "r") as f:
+            return {json.loads(line)["node"] for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def cmd_sinfo(state_dir, argv):
+    nodes = _read_config(state_dir)["nodes"]
+    if "%T" not in " ".join(argv):
+        print("\n".join(nodes))
+        return 0
+    drained = _read_drained(state_dir)
+    print("\n".join(f"{node} {'drained' if node in drained else 'idle'}"
+                    for node in nodes))
+    return 0
+
+
+def cmd_fail_node(state_dir, argv):
+    _append_locked(os.path.join(state_dir, "failnodes.jsonl"),
+                   [{"node": node} for node in argv])
+    return 0
+
+
+def cmd_drain(state_dir, argv):
+    _append_locked(os.path.join(state_dir, "drainnodes.jsonl"),
+                   [{"node": node} for node in argv])
+    return 0
+
+
+def cmd_preempt(state_dir, argv):
+    _append_locked(os.path.join(state_dir, "preempt.jsonl"),
+                   [{"jobid": jid} for arg in argv
+                    for jid in _expand_jobids(arg)])
+    return 0
+
+
+class FakeSlurmDaemon:
+    """The scheduler, runs pending jobs as local processes."""
+
+    def __init__(self, state_dir, n_nodes=4, slots_per_node=16,
+                 queue_delay=1., node_fail_prob=0., fail_nodes=None,
+                 simulate_runtime=None, backfill_window=None,
+                 long_queue_delay=300., partition_delays=None,
+                 sbatch_error_prob=0., sbatch_timeout_prob=0., tick=0.05,
+                 seed=None):
+        self.state_dir = os.path.abspath(state_dir)
+        self.nodes = [f"node{i:03d}" for i in range(n_nodes)]
+        self.slots_per_node = slots_per_node
+        self.queue_delay = queue_delay
+        self.node_fail_prob = node_fail_prob
+        self.fail_nodes = set(fail_nodes or [])
+        self.drained_nodes = set()
+        self.simulate_runtime = simulate_runtime
+        self.tick = tick
+        self.random = random.Random(seed)
+        self.jobs = {}  # jobid -> job record (incl. state)
+        self.pending = []  # jobids in submission order
+        self.running = {}  # jobid -> Popen or None (simulated)
+        self.node_load = {node: 0 for node in self.nodes}
+        self._offsets = {}
+        self._stop = False
+        self.config = {"nodes": self.nodes,
+                       "queue_delay": queue_delay,
+                       "backfill_window": backfill_window,
+                       "long_queue_delay": long_queue_delay,
+                       "partition_delays": partition_delays or {},
+                       "sbatch_error_prob": sbatch_error_prob,
+                       "sbatch_timeout_prob": sbatch_timeout_prob,
+                       }
+        with open(os.path.join(self.state_dir, "config.json"), "w") as f:
+            json.dump(self.config, f)
+
+    def _read_new(self, name):
+        # read all new (complete) lines from the given jsonl file
+        fname = os.path.join(self.state_dir, name)
+        try:
+            with open(fname, "r") as f:
+                f.seek(self._offsets.get(name, 0))
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind("\n") + 1
+        self._offsets[name] = self._offsets.get(name, 0) + len(data[:end])
+        return [json.loads(line) for line in data[:end].splitlines() if line]
+
+    def _finish(self, jobid, state, returncode=0, signum=0):
+        job = self.jobs[jobid]
+        job["state"] = state
+        job["exitcode"] = f"{returncode}:{signum}"
+        job["end"] = time.time()
+        proc = self.running.pop(jobid, None)
+        if isinstance(proc, subprocess.Popen) and proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+        if job["node"] is not None:
+            self.node_load[job["node"]] -= 1
+
+    def _start(self, jobid, node):
+        job = self.jobs[jobid]
+        job["state"] = "RUNNING"
+        job["node"] = node
+        job["start"] = time.time()
+        self.node_load[node] += 1
+        if self.simulate_runtime is not None:
+            for fname in [job["stdout"], job["stderr"]]:
+                open(fname, "a").close()
+            self.running[jobid] = None
+            return
+        env = os.environ.copy()
+        env.update({"SLURM_JOB_ID": jobid.split("_")[0],
+                    "SLURM_JOB_NAME": job["name"],
+                    "SLURM_JOB_NODELIST": node,
+                    "SLURMD_NODENAME": node,
+                    })
+        if job["array_task_id"] is not None:
+            env["SLURM_ARRAY_JOB_ID"] = job["array_jobid"]
+            env["SLURM_ARRAY_TASK_ID"] = str(job["array_task_id"])
+        stdin = (open(os.path.join(job["workdir"], job["input"]), "rb")
+                 if job["input"] is not None else subprocess.DEVNULL)
+        with open(job["stdout"], "ab") as out:
+            err = (out if job["stderr"] == job["stdout"]
+                   else open(job["stderr"], "ab"))
+            self.running[jobid] = subprocess.Popen(
+                                    ["bash", job["script"]],
+                                    cwd=job["workdir"], stdin=stdin,
+                                    stdout=out, stderr=err, env=env,
+                                    start_new_session=True,
+                                                   )
+            if err is not out:
+                err.close()
+        if stdin is not subprocess.DEVNULL:
+            stdin.close()
+
+    def step(self):
+        now = time.time()
+        for record in self._read_new("submitted.jsonl"):
+            record.update(state="PENDING", exitcode="0:0", node=None,
+                          eligible=None, start=None, end=None)
+            self.jobs[record["jobid"]] = record
+            self.pending.append(record["jobid"])
+        for record in self._read_new("failnodes.jsonl"):
+            self.fail_nodes.add(record["node"])
+        for record in self._read_new("drainnodes.jsonl"):
+            self.drained_nodes.add(record["node"])
+        for record in self._read_new("preempt.jsonl"):
+            job = self.jobs.get(record["jobid"])
+            if job is not None and job["state"] == "RUNNING":
+                self._finish(record["jobid"], "PREEMPTED", signum=15)
+        for record in self._read_new("cancel.jsonl"):
+            # scancel with the array jobid cancels all tasks
+            jobids = [jid for jid in self.jobs
+                      if jid == record["jobid"]
+                      or self.jobs[jid]["array_jobid"] == record["jobid"]]
+            for jobid in jobids:
+                if self.jobs[jobid]["state"] in ["PENDING", "RUNNING"]:
+                    self._finish(jobid, "CANCELLED", signum=15)
+        # running jobs: finished, timed out or on a failing node?
+        for jobid in list(self.running):
+            job = self.jobs[jobid]
+            proc = self.running[jobid]
+            if job["node"] in self.fail_nodes:
+                self._finish(jobid, "NODE_FAIL", returncode=1)
+            elif job["time"] is not None and now - job["start"] > job["time"]:
+                self._finish(jobid, "TIMEOUT", returncode=0, signum=9)
+            elif proc is None:
+                if now - job["start"] >= self.simulate_runtime:
+                    self._finish(jobid, "COMPLETED")
+            elif proc.poll() is not None:
+                rc = proc.returncode
+                self._finish(jobid, "COMPLETED" if rc == 0 else "FAILED",
+                             returncode=max(rc, 0), signum=max(-rc, 0))
+        # schedule pending jobs (FIFO, after the queue delay)
+        still_pending = []
+        for jobid in self.pending:
+            job = self.jobs[jobid]
+            if job["state"] != "PENDING":
+                continue  # canceled
+            if any(self.jobs.get(dep, {}).get("state") != "COMPLETED"
+                   for dep in job.get("afterok", [])):
+                still_pending.append(jobid)
+                continue
+            if job["eligible"] is None:
+                job["eligible"] = now
+            if now - job["submit"] < _queue_delay(self.config, job["time"],
+                                                  job["partition"]):
+                still_pending.append(jobid)
+                continue
+            free = [n for n in self.nodes
+                    if n not in job["exclude"]
+                    and n not in self.drained_nodes
+                    and self.node_load[n] < self.slots_per_node]
+            if not free:
+                still_pending.append(jobid)
+                continue
+            node = min(free, key=lambda n: self.node_load[n])
+            self._start(jobid, node)
+            if (node in self.fail_nodes
+                    or self.random.random() < self.node_fail_prob):
+                self._finish(jobid, "NODE_FAIL", returncode=1)
+        self.pending = still_pending
+
+    def write_state(self):
+        state = {jobid: {"state": job["state"], "exitcode": job["exitcode"],
+                         "node": job["node"], "submit": job["submit"],
+                         "eligible": job["eligible"],
+                         "start": job["start"], "end": job["end"],
+                         "partition": job["partition"], "qos": job["qos"],
+                         "name": job["name"], "workdir": job["workdir"],
+                         }
+                 for jobid, job in self.jobs.items()}
+        tmp_fname = os.path.join(self.state_dir, "state.json.tmp")
+        with open(tmp_fname, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_fname, os.path.join(self.state_dir, "state.json"))
+
+    def run(self):
+        def stop(signum, frame):
+            self._stop = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.write_state()
+        while not self._stop:
+            self.step()
+            self.write_state()
+            time.sleep(self.tick)
+        for jobid in list(self.running):
+            self._finish(jobid, "CANCELLED", signum=15)
+        self.write_state()
+
+
+def cmd_daemon(state_dir, argv):
+    parser = argparse.ArgumentParser(prog="fakeslurm daemon")
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--slots-per-node", type=int, default=16)
+    parser.add_argument("--queue-delay", type=float, default=1.)
+    parser.add_argument("--node-fail-prob", type=float, default=0.)
+    parser.add_argument("--fail-nodes", default="")
+    parser.add_argument("--simulate-runtime", type=float, default=None)
+    parser.add_argument("--backfill-window", type=float, default=None)
+    parser.add_argument("--long-queue-delay", type=float, default=300.)
+    parser.add_argument("--partition-delays", default="")
+    parser.add_argument("--sbatch-error-prob", type=float, default=0.)
+    parser.add_argument("--sbatch-timeout-prob", type=float, default=0.)
+    parser.add_argument("--tick", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    FakeSlurmDaemon(state_dir=state_dir,
+                    n_nodes=args.nodes,
+                    slots_per_node=args.slots_per_node,
+                    queue_delay=args.queue_delay,
+                    node_fail_prob=args.node_fail_prob,
+                    fail_nodes=[n for n in args.fail_nodes.split(",") if n],
+                    simulate_runtime=args.simulate_runtime,
+                    backfill_window=args.backfill_window,
+                    long_queue_delay=args.long_queue_delay,
+                    partition_delays={
+                        p: float(d) for p, _, d in (
+                            item.partition("=")
+                            for item in args.partition_delays.split(",")
+                            if item)
+                                      },
+                    sbatch_error_prob=args.sbatch_error_prob,
+                    sbatch_timeout_prob=args.sbatch_timeout_prob,
+                    tick=args.tick,
+                    seed=args.seed,
+                    ).run()
+    return 0
+
+
+_COMMANDS = {"sbatch": cmd_sbatch, "sacct": cmd_sacct, "squeue": cmd_squeue,
+             "scancel": cmd_scancel, "sinfo": cmd_sinfo,
+             "fail-node": cmd_fail_node, "preempt": cmd_preempt,
+             "drain": cmd_drain,
+             "daemon": cmd_daemon,
+             }
+
+
+class FakeSlurm:
+    """
+    Context manager setting up the state directory and running the daemon.
+
+    All keyword arguments are passed as options to the daemon (with "_"
+    replaced by "-"), e.g. ``FakeSlurm(dir, nodes=4, queue_delay=0.5)``.
+    """
+
+    def __init__(self, state_dir, **daemon_options):
+        self.state_dir = os.path.abspath(state_dir)
+        self.daemon_options = daemon_options
+        self._daemon = None
+
+    @property
+    def executables(self):
+        """Keyword arguments for `asyncmd.config.set_all_slurm_settings`."""
+        return {f"{cmd}_executable": os.path.join(self.state_dir, "bin", cmd)
+                for cmd in ["sinfo", "sacct", "squeue", "sbatch", "scancel"]}
+
+    def fail_node(self, node):
+        cmd_fail_node(self.state_dir, [node])
+
+    def drain(self, node):
+        cmd_drain(self.state_dir, [node])
+
+    def preempt(self, jobid):
+        cmd_preempt(self.state_dir, [jobid])
+
+    def job_states(self):
+        """Return the job states (incl. submit, start and end times)."""
+        return _read_state(self.state_dir)
+
+    def start(self):
+        os.makedirs(os.path.join(self.state_dir, "bin"), exist_ok=True)
+        for cmd in ["sinfo", "sacct", "squeue", "sbatch", "scancel"]:
+            fname = os.path.join(self.state_dir, "bin", cmd)
+            with open(fname, "w") as f:
+                f.write("#!/bin/sh\n")
+                f.write(f'exec "{sys.executable}" "{os.path.abspath(__file__)}"'
+                        + f' {cmd} "{self.state_dir}" "$@"\n')
+            os.chmod(fname, os.stat(fname).st_mode | stat.S_IEXEC)
+        args = []
+        for key, val in self.daemon_options.items():
+            args += [f"--{key.replace('_', '-')}", str(val)]
+        self._daemon = subprocess.Popen([sys.executable,
+                                         os.path.abspath(__file__),
+                                         "daemon", self.state_dir, *args])
+        # wait for the daemon to write the node list and the (empty) state
+        while not os.path.isfile(os.path.join(self.state_dir, "state.json")):
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        if self._daemon is not None:
+            self._daemon.terminate()
+            self._daemon.wait()
+            self._daemon = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in _COMMANDS:
+        print(__doc__)
+        return 1
+    os.makedirs(argv[1], exist_ok=True)
+    return _COMMANDS[argv[0]](os.path.abspath(argv[1]), argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
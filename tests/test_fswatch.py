@@ -0,0 +1,104 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import asyncio
+import os
+
+from asyncmd._fswatch import FileWatcher, filesystem_type
+
+
+class TestFileWatcher:
+    async def write_later(self, fname, delay=0.2):
+        await asyncio.sleep(delay)
+        with open(fname + ".tmp", "w") as f:
+            f.write("done")
+        # the result appears atomically (like np.save + rename)
+        os.replace(fname + ".tmp", fname)
+
+    @pytest.mark.parametrize("method", ["inotify", "poll"])
+    @pytest.mark.asyncio
+    async def test_wait_for_file(self, tmp_path, method):
+        watcher = FileWatcher()
+        writer = asyncio.create_task(self.write_later(
+                                        os.path.join(tmp_path, "result.npy")
+                                                      ))
+        name = await asyncio.wait_for(watcher.wait(directory=str(tmp_path),
+                                                   names=["result.npy"],
+                                                   method=method,
+                                                   poll_interval=0.1,
+                                                   ),
+                                      timeout=5)
+        await writer
+        assert name == "result.npy"
+        # existing files are found directly
+        name = await asyncio.wait_for(watcher.wait(directory=str(tmp_path),
+                                                   names=["other", "result.npy"],
+                                                   method=method,
+                                                   poll_interval=0.1,
+                                                   ),
+                                      timeout=5)
+        assert name == "result.npy"
+
+    @pytest.mark.asyncio
+    async def test_close_names(self, tmp_path):
+        watcher = FileWatcher()
+        if watcher._libc is None:
+            pytest.skip("Inotify not available.")
+        fname = os.path.join(tmp_path, "job.out")
+        f = open(fname, "w")
+        wait_task = asyncio.create_task(watcher.wait(directory=str(tmp_path),
+                                                     names=[],
+                                                     close_names=["job.out"],
+                                                     method="inotify",
+                                                     ))
+        await asyncio.sleep(0.2)
+        assert not wait_task.done()
+        f.write("output")
+        f.close()
+        assert await asyncio.wait_for(wait_task, timeout=5) == "job.out"
+        # no watches left and the inotify fd is closed
+        assert len(watcher._wds) == 0
+        assert watcher._fd is None
+
+    @pytest.mark.asyncio
+    async def test_inotify_fd_closed(self, tmp_path):
+        watcher = FileWatcher()
+        if watcher._libc is None:
+            pytest.skip("Inotify not available.")
+        dirs = [tmp_path / "a", tmp_path / "b"]
+        for d in dirs:
+            d.mkdir()
+        tasks = [asyncio.create_task(watcher.wait(directory=str(d),
+                                                  names=["result.npy"],
+                                                  method="inotify",
+                                                  ))
+                 for d in dirs]
+        await asyncio.sleep(0.1)
+        fd = watcher._fd
+        assert fd is not None
+        # the fd stays open as long as any directory is watched
+        tasks[0].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tasks[0]
+        assert watcher._fd == fd
+        tasks[1].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tasks[1]
+        assert watcher._fd is None
+
+    def test_filesystem_type(self, tmp_path):
+        if not os.path.exists("/proc/self/mounts"):
+            pytest.skip("No /proc/self/mounts.")
+        assert filesystem_type(str(tmp_path)) is not None
@@ -0,0 +1,73 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+from asyncmd._lru_cache import ByteBoundedLRUCache
+
+
+class Sized:
+    # stand-in for a numpy array with given size
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+class TestByteBoundedLRUCache:
+    def test_get_put_and_counters(self):
+        cache = ByteBoundedLRUCache(max_bytes=100)
+        assert cache.get("a") is None
+        value = Sized(40)
+        cache.put("a", value)
+        assert cache.get("a") is value
+        assert cache.get("b", "default") == "default"
+        assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0,
+                                 "n_entries": 1, "n_bytes": 40,
+                                 "max_bytes": 100}
+        # putting the same key again replaces the value (and its size)
+        cache.put("a", Sized(10))
+        assert cache.n_bytes == 10
+        assert len(cache) == 1
+
+    def test_eviction_order(self):
+        cache = ByteBoundedLRUCache(max_bytes=100)
+        for key in ["a", "b", "c"]:
+            cache.put(key, Sized(30))
+        # use a, such that b is the least recently used
+        _ = cache.get("a")
+        cache.put("d", Sized(30))
+        assert "b" not in cache
+        assert all(key in cache for key in ["a", "c", "d"])
+        assert cache.evictions == 1
+        # values larger than the budget are not cached (and evict nothing)
+        cache.put("e", Sized(101))
+        assert "e" not in cache
+        assert len(cache) == 3
+
+    def test_resize_and_clear(self):
+        cache = ByteBoundedLRUCache(max_bytes=100)
+        for key in ["a", "b", "c"]:
+            cache.put(key, Sized(30))
+        cache.max_bytes = 60
+        assert "a" not in cache
+        assert cache.n_bytes == 60
+        cache.max_bytes = 0
+        assert len(cache) == 0
+        assert cache.n_bytes == 0
+        cache.max_bytes = 100
+        cache.put("a", Sized(30))
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.evictions == 3
+        with pytest.raises(ValueError):
+            cache.max_bytes = -1
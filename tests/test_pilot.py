@@ -0,0 +1,229 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import asyncio
+import os
+
+from asyncmd import slurm
+from asyncmd.pilot import PilotJobExecutor, create_pilotprocess_submit
+
+
+class TestPilotJobExecutor:
+    def setup_method(self):
+        self.scripts = {"ok": "#!/bin/bash\necho $ASYNCMD_PILOT_WORKER_ID\n",
+                        "fail": "#!/bin/bash\necho failing >&2\nexit 3\n",
+                        "long": "#!/bin/bash\nsleep 100\n",
+                        }
+
+    def write_scripts(self, tmp_path):
+        fnames = {}
+        for name, content in self.scripts.items():
+            fnames[name] = os.path.join(tmp_path, f"{name}.sh")
+            with open(fnames[name], "w") as f:
+                f.write(content)
+        return fnames
+
+    async def start_executor(self, tmp_path, n_workers):
+        executor = PilotJobExecutor(queue_dir=os.path.join(tmp_path, "queue"),
+                                    poll_interval=0.1,
+                                    heartbeat_interval=1.,
+                                    worker_idle_timeout=30.,
+                                    )
+        await executor.start_local_workers(n_workers=n_workers)
+        return executor
+
+    @pytest.mark.asyncio
+    async def test_run_tasks(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=2)
+        procs = await asyncio.gather(*(create_pilotprocess_submit(
+                                                executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                                  )
+                                       for _ in range(6))
+                                     )
+        results = await asyncio.gather(*(p.communicate() for p in procs))
+        assert all(p.returncode == 0 for p in procs)
+        assert all(p.slurm_job_state == "COMPLETED" for p in procs)
+        # the tasks are distributed to (and only to) our workers
+        assert {stdout.decode().strip() for stdout, _ in results} <= set(
+                                                            executor.workers
+                                                                         )
+        # stdfiles are removed on success
+        assert not any(f.startswith("ok.out") for f in os.listdir(tmp_path))
+        # failing task
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="fail",
+                                                sbatch_script=scripts["fail"],
+                                                workdir=tmp_path,
+                                                )
+        stdout, stderr = await proc.communicate()
+        assert proc.returncode == 3
+        assert proc.slurm_job_state == "FAILED"
+        assert stderr == b"failing\n"
+        await executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_cancel(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=1)
+        running = await create_pilotprocess_submit(
+                                                executor=executor,
+                                                jobname="long",
+                                                sbatch_script=scripts["long"],
+                                                workdir=tmp_path,
+                                                stdfiles_removal="yes",
+                                                   )
+        # this one stays in the queue, because our only worker is busy
+        pending = await create_pilotprocess_submit(
+                                                executor=executor,
+                                                jobname="long",
+                                                sbatch_script=scripts["long"],
+                                                workdir=tmp_path,
+                                                   )
+        while running.slurm_job_state != "RUNNING":
+            await asyncio.sleep(0.1)
+        await asyncio.gather(running.terminate_async(),
+                             pending.terminate_async())
+        assert running.slurm_job_state == "CANCELLED"
+        assert pending.slurm_job_state == "CANCELLED"
+        assert running.returncode == pending.returncode == 1
+        assert not any(f.startswith("long.out") for f in os.listdir(tmp_path))
+        await executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_wait_for_task_repeatedly(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=1)
+        task_id = await executor.submit_task(
+                                script=scripts["ok"],
+                                workdir=str(tmp_path),
+                                stdout=os.path.join(tmp_path, "ok.out"),
+                                stderr=os.path.join(tmp_path, "ok.err"),
+                                             )
+        results = await asyncio.gather(executor.wait_for_task(task_id),
+                                       executor.wait_for_task(task_id))
+        assert results[0] == results[1]
+        assert results[0]["returncode"] == 0
+        # and again (until we forget the task)
+        assert await executor.wait_for_task(task_id) == results[0]
+        executor.forget_task(task_id)
+        with pytest.raises(ValueError):
+            await executor.wait_for_task(task_id)
+        await executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_no_worker_alive(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=1)
+        # the (idle) worker exits
+        await executor.shutdown(wait=True)
+        assert executor.n_alive_workers == 0
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                )
+        # the task fails instead of waiting forever...
+        assert await asyncio.wait_for(proc.wait(), timeout=10.) == 1
+        assert proc.slurm_job_state == "FAILED"
+        # ...and is not in the queue anymore
+        assert os.listdir(os.path.join(executor.queue_dir, "tasks")) == []
+
+    @pytest.mark.asyncio
+    async def test_tasks_wait_for_first_worker(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=0)
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                )
+        # no worker started yet, so the task waits in the queue...
+        await asyncio.sleep(0.5)
+        assert proc.slurm_job_state == "PENDING"
+        # ...until the first one claims it
+        await executor.start_local_workers(n_workers=1)
+        assert await asyncio.wait_for(proc.wait(), timeout=10.) == 0
+        assert proc.slurm_job_state == "COMPLETED"
+        await executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_poll_failure(self, tmp_path, monkeypatch):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=1)
+        executor.max_failed_polls = 3
+        scan_queue = executor._scan_queue
+        n_fails = 2
+
+        def failing_scan_queue():
+            nonlocal n_fails
+            if n_fails > 0:
+                n_fails -= 1
+                raise OSError("flaky filesystem")
+            return scan_queue()
+
+        monkeypatch.setattr(executor, "_scan_queue", failing_scan_queue)
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                )
+        # we keep polling after failed polls
+        assert await asyncio.wait_for(proc.wait(), timeout=10.) == 0
+        assert n_fails == 0
+        # but give up (and tell the waiting tasks) if it keeps failing
+        n_fails = 10
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                )
+        with pytest.raises(slurm.SlurmError):
+            await asyncio.wait_for(proc.wait(), timeout=10.)
+        await executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_terminate(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = await self.start_executor(tmp_path, n_workers=1)
+        proc = await create_pilotprocess_submit(executor=executor,
+                                                jobname="long",
+                                                sbatch_script=scripts["long"],
+                                                workdir=tmp_path,
+                                                )
+        while proc.slurm_job_state != "RUNNING":
+            await asyncio.sleep(0.1)
+        # does not block, the cancelation happens in the background
+        proc.terminate()
+        assert await asyncio.wait_for(proc.wait(), timeout=10.) == 1
+        assert proc.slurm_job_state == "CANCELLED"
+        await executor.shutdown(wait=True)
+
+    def test_terminate_without_loop(self, tmp_path):
+        scripts = self.write_scripts(tmp_path)
+        executor = PilotJobExecutor(queue_dir=os.path.join(tmp_path, "queue"))
+        # no workers, i.e. the task stays in the queue
+        proc = asyncio.run(create_pilotprocess_submit(
+                                                executor=executor,
+                                                jobname="ok",
+                                                sbatch_script=scripts["ok"],
+                                                workdir=tmp_path,
+                                                      ))
+        proc.terminate()
+        assert proc.slurm_job_state == "CANCELLED"
+        assert os.listdir(os.path.join(executor.queue_dir, "tasks")) == []
@@ -0,0 +1,75 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import asyncio
+
+from asyncmd._priority_semaphore import PrioritySemaphore
+
+
+class TestPrioritySemaphore:
+    async def acquire_and_record(self, sem, job_class, order):
+        await sem.acquire(job_class)
+        order.append(job_class)
+
+    @pytest.mark.asyncio
+    async def test_priority_order(self):
+        sem = PrioritySemaphore(value=1, priorities={"cv": 1})
+        await sem.acquire("md")
+        order = []
+        # md waits first, but cv has the higher priority
+        tasks = [asyncio.create_task(self.acquire_and_record(sem, job_class,
+                                                             order))
+                 for job_class in ["md", "md", "cv"]]
+        await asyncio.sleep(0.01)
+        assert sem.waiting() == {"md": 2, "cv": 1}
+        for _ in range(3):
+            sem.release("md" if len(order) == 0 else order[-1])
+            await asyncio.sleep(0.01)
+        assert order == ["cv", "md", "md"]
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_caps_and_reservations(self):
+        sem = PrioritySemaphore(value=3, max_per_class={"md": 2},
+                                reserved_per_class={"cv": 1})
+        await sem.acquire("md")
+        await sem.acquire("md")
+        # md is capped (and the last slot is reserved for cv anyway)
+        assert sem.locked("md")
+        assert not sem.locked("cv")
+        await sem.acquire("cv")
+        assert sem.in_use == {"md": 2, "cv": 1}
+        assert sem.locked("cv")
+        sem.release("md")
+        # the free slot is not reserved for anyone (cv holds its reserved one)
+        assert not sem.locked("md")
+        with pytest.raises(ValueError):
+            sem.release("other")
+        with pytest.raises(ValueError):
+            PrioritySemaphore(value=1, reserved_per_class={"cv": 2})
+
+    @pytest.mark.asyncio
+    async def test_cancel_waiter(self):
+        sem = PrioritySemaphore(value=1)
+        await sem.acquire()
+        waiter = asyncio.create_task(sem.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        sem.release()
+        # the canceled waiter does not hold the slot
+        assert not sem.locked()
+        assert sem.waiting() == {}
@@ -0,0 +1,1298 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+
+from asyncmd import slurm
+from asyncmd._config import _SEMAPHORES
+from asyncmd.gromacs import MDP, SlurmGmxEngine
+from asyncmd.mdengine import EngineCrashedError, EngineError
+from asyncmd.trajectory.functionwrapper import SlurmTrajectoryFunctionWrapper
+
+
+def write_script(directory, name, content):
+    fname = os.path.join(directory, name)
+    with open(fname, "w") as f:
+        f.write("#!/bin/bash\n" + content + "\n")
+    return fname
+
+
+async def wait_for_fake_state(fake, jobid, states, timeout=10.):
+    # wait until the emulator reports one of states for jobid
+    start = time.time()
+    while time.time() - start < timeout:
+        state = fake.job_states().get(jobid, {}).get("state", None)
+        if state in states:
+            return state
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Job {jobid} did not reach any of {states}.")
+
+
+async def wait_until_released(mediator, jobid, timeout=10.):
+    # poll until the mediator stops monitoring jobid (nobody waits for it,
+    # i.e. the polling loop does not run)
+    start = time.time()
+    while jobid in mediator._jobinfo:
+        if time.time() - start > timeout:
+            raise TimeoutError(f"Job {jobid} is still monitored.")
+        await mediator._update_cached_jobinfo_ratelimited()
+        await asyncio.sleep(0.05)
+
+
+async def submit_jobs(tmp_path, content, n, **kwargs):
+    script = write_script(tmp_path, "job.slurm", content)
+    return await asyncio.gather(*(slurm.create_slurmprocess_submit(
+                                                    jobname=f"job{i}",
+                                                    sbatch_script=script,
+                                                    workdir=tmp_path,
+                                                    **kwargs,
+                                                                   )
+                                  for i in range(n))
+                                )
+
+
+def record_slurm_commands(mediator, monkeypatch):
+    # record all squeue/sacct/scancel commands the mediator runs
+    calls = []
+    run_slurm_command = mediator._run_slurm_command
+
+    async def record(cmd):
+        calls.append(cmd)
+        return await run_slurm_command(cmd)
+
+    monkeypatch.setattr(mediator, "_run_slurm_command", record)
+    return calls
+
+
+class TestSlurmProcess:
+    @pytest.mark.asyncio
+    async def test_submit_and_communicate(self, fakeslurm, tmp_path):
+        script = write_script(tmp_path, "job.slurm",
+                              "echo out\necho err >&2\nexit 3")
+        proc = await slurm.create_slurmprocess_submit(jobname="job",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        stdout, stderr = await proc.communicate()
+        # the returncode is parsed from the SLURM state (FAILED -> 1)
+        assert proc.returncode == 1
+        assert proc.slurm_job_state == "FAILED"
+        assert stdout == b"out\n"
+        assert stderr == b"err\n"
+
+    @pytest.mark.asyncio
+    async def test_array_submit(self, fakeslurm, tmp_path):
+        script = write_script(tmp_path, "array.slurm",
+                              "echo $SLURM_ARRAY_TASK_ID\n"
+                              + '[ "$SLURM_ARRAY_TASK_ID" != 2 ]')
+        procs = await slurm.create_slurmprocess_array_submit(
+                                                    jobname="array",
+                                                    sbatch_script=script,
+                                                    workdir=tmp_path,
+                                                    n_tasks=3,
+                                                    stdfiles_removal="yes",
+                                                             )
+        array_jobid = procs[0].slurm_jobid.split("_")[0]
+        assert [p.slurm_jobid for p in procs] == [f"{array_jobid}_{i}"
+                                                  for i in range(3)]
+        # every array task has its own state and exitcode in the mediator
+        mediator = procs[0].slurm_cluster_mediator
+        for p in procs:
+            await wait_for_fake_state(fakeslurm, p.slurm_jobid,
+                                      ["COMPLETED", "FAILED"])
+        infos = [await mediator.get_info_for_job(jobid=p.slurm_jobid)
+                 for p in procs]
+        while any(info["parsed_exitcode"] is None for info in infos):
+            await asyncio.sleep(0.05)
+            infos = [await mediator.get_info_for_job(jobid=p.slurm_jobid)
+                     for p in procs]
+        assert [info["state"] for info in infos] == ["COMPLETED", "COMPLETED",
+                                                     "FAILED"]
+        assert [info["exitcode"] for info in infos] == ["0:0", "0:0", "1:0"]
+        results = await asyncio.gather(*(p.communicate() for p in procs))
+        assert [stdout for stdout, _ in results] == [b"0\n", b"1\n", b"2\n"]
+        assert [p.returncode for p in procs] == [0, 0, 1]
+        # one sbatch call for the whole array
+        assert len(os.listdir(os.path.join(fakeslurm.state_dir,
+                                           "scripts"))) == 1
+        # stdfiles are removed (but the content is kept)
+        assert not any(f.startswith("array.") and f.endswith((".out", ".err"))
+                       for f in os.listdir(tmp_path))
+
+    @pytest.mark.asyncio
+    async def test_terminate(self, fakeslurm, tmp_path):
+        procs = await submit_jobs(tmp_path, "sleep 100", n=2,
+                                  stdfiles_removal="yes")
+        mediator = procs[0].slurm_cluster_mediator
+        # terminate blocks until scancel is done
+        procs[0].terminate()
+        await wait_for_fake_state(fakeslurm, procs[0].slurm_jobid,
+                                  ["CANCELLED"])
+        assert procs[0].slurm_jobid not in mediator._jobinfo
+        assert not os.path.exists(os.path.join(
+                        tmp_path, procs[0]._stdout_name(use_slurm_symbols=False)
+                                               ))
+        # and raises when scancel fails
+        mediator.scancel_executable = write_script(tmp_path, "scancel_fail",
+                                                   "exit 1")
+        os.chmod(mediator.scancel_executable, 0o755)
+        with pytest.raises(slurm.SlurmCancelationError):
+            procs[1].terminate()
+        with pytest.raises(slurm.SlurmCancelationError):
+            await procs[1].terminate_async()
+
+    @pytest.mark.asyncio
+    async def test_batched_scancel(self, fakeslurm, tmp_path, monkeypatch):
+        procs = await submit_jobs(tmp_path, "sleep 100", n=5)
+        mediator = procs[0].slurm_cluster_mediator
+        calls = record_slurm_commands(mediator, monkeypatch)
+        await asyncio.gather(*(p.terminate_async() for p in procs))
+        # all canceled with one scancel call
+        scancel_calls = [c for c in calls
+                         if c.startswith(mediator.scancel_executable)]
+        assert len(scancel_calls) == 1
+        for p in procs:
+            assert p.slurm_jobid in scancel_calls[0]
+            await wait_for_fake_state(fakeslurm, p.slurm_jobid,
+                                      ["CANCELLED"])
+
+    @pytest.mark.asyncio
+    async def test_scancel_failure(self, fakeslurm, tmp_path):
+        procs = await submit_jobs(tmp_path, "sleep 100", n=2)
+        mediator = procs[0].slurm_cluster_mediator
+        scancel_executable = mediator.scancel_executable
+        mediator.scancel_executable = write_script(tmp_path, "scancel_fail",
+                                                   "exit 1")
+        os.chmod(mediator.scancel_executable, 0o755)
+        # both cancelations end up in the same scancel call, the first
+        # canceler is gone (canceled) when it fails, the second gets the error
+        gone = asyncio.create_task(procs[0].terminate_async())
+        waiting = asyncio.create_task(procs[1].terminate_async())
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        with pytest.raises(slurm.SlurmCancelationError):
+            await waiting
+        # the jobs are still monitored, i.e. we can try again
+        mediator.scancel_executable = scancel_executable
+        await asyncio.gather(*(p.terminate_async() for p in procs))
+        for p in procs:
+            await wait_for_fake_state(fakeslurm, p.slurm_jobid,
+                                      ["CANCELLED"])
+
+    def test_deprecated_scancel_executable(self, fakeslurm, tmp_path,
+                                           monkeypatch):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        script = write_script(tmp_path, "job.slurm", "true")
+        scancel = write_script(tmp_path, "my_scancel", "exit 0")
+        os.chmod(scancel, 0o755)
+        with pytest.warns(DeprecationWarning):
+            slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                               scancel_executable=scancel)
+        assert mediator.scancel_executable == scancel
+        monkeypatch.setattr(slurm.SlurmProcess, "scancel_executable",
+                            fakeslurm.executables["scancel_executable"],
+                            raising=False)
+        with pytest.warns(DeprecationWarning):
+            slurm.SlurmProcess(jobname="job", sbatch_script=script)
+        assert (mediator.scancel_executable
+                == fakeslurm.executables["scancel_executable"])
+
+
+class TestSubmissionRateLimit:
+    @pytest.mark.asyncio
+    async def test_token_bucket(self, fakeslurm):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.max_submissions_per_second = 20.
+        mediator.submission_burst = 2
+        start = time.time()
+        waiters = [asyncio.create_task(mediator.wait_for_submission_slot())
+                   for _ in range(6)]
+        await asyncio.sleep(0.05)
+        # the burst went through directly, the others wait in line
+        assert mediator.submission_backlog == 4
+        assert mediator.submission_delay() > 0
+        await asyncio.gather(*waiters)
+        # 4 slots after the burst, 0.05 s apart
+        assert time.time() - start >= 0.19
+        assert mediator.submission_backlog == 0
+
+    @pytest.mark.asyncio
+    async def test_retry_transient_sbatch_error(self, fakeslurm, tmp_path):
+        # an sbatch that fails transiently twice and then submits
+        counter = os.path.join(tmp_path, "n_calls")
+        sbatch = write_script(
+                    tmp_path, "sbatch_flaky",
+                    f'n=$(cat "{counter}" 2>/dev/null || echo 0)\n'
+                    + f'echo $((n + 1)) > "{counter}"\n'
+                    + 'if [ "$n" -lt 2 ]; then\n'
+                    + '    echo "sbatch: error: Batch job submission failed: '
+                    + 'Resource temporarily unavailable" >&2\n'
+                    + '    exit 1\n'
+                    + 'fi\n'
+                    + 'exec sbatch "$@"'
+                              )
+        os.chmod(sbatch, 0o755)
+        slurm.SlurmProcess.sbatch_executable = sbatch
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.sbatch_retry_backoff = 0.01
+        script = write_script(tmp_path, "job.slurm", "true")
+        proc = await slurm.create_slurmprocess_submit(jobname="job",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        assert await proc.wait() == 0
+        with open(counter, "r") as f:
+            assert f.read().strip() == "3"
+        # without retries we get the error
+        os.remove(counter)
+        mediator.max_sbatch_retries = 0
+        with pytest.raises(slurm.SlurmSubmissionError):
+            await slurm.create_slurmprocess_submit(jobname="job",
+                                                   sbatch_script=script,
+                                                   workdir=tmp_path,
+                                                   )
+
+    @pytest.mark.asyncio
+    async def test_ambiguous_sbatch_timeout(self, fakeslurm, tmp_path):
+        # sbatch reports a timeout but slurmctld accepted the job, we must
+        # find it instead of submitting it again
+        config_fname = os.path.join(fakeslurm.state_dir, "config.json")
+        with open(config_fname, "r") as f:
+            config = json.load(f)
+        config["sbatch_timeout_prob"] = 1.
+        with open(config_fname, "w") as f:
+            json.dump(config, f)
+        script = write_script(tmp_path, "job.slurm", "true")
+        proc = await slurm.create_slurmprocess_submit(jobname="ambiguous",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        assert list(fakeslurm.job_states()) == [proc.slurm_jobid]
+        assert await proc.wait() == 0
+
+
+class TestPolling:
+    def test_poll_schedule(self, fakeslurm):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.min_time_between_sacct_calls = 1
+        mediator.max_time_between_sacct_calls = 10
+        mediator.sacct_backoff_factor = 2.
+        mediator.monitor_register_job(jobid="1", time_limit=1.)
+        sched = mediator._poll_schedule["1"]
+        assert sched["interval"] == 1
+        # backoff after every poll without state change (when due)...
+        intervals = []
+        for _ in range(5):
+            sched["next"] = 0
+            mediator._update_poll_schedule()
+            intervals.append(sched["interval"])
+        assert intervals == [2, 4, 8, 10, 10]
+        # ...but not if the job was not due
+        mediator._update_poll_schedule()
+        assert sched["interval"] == 10
+        # around the end of the time limit we poll more often
+        sched["start"] = time.time() - 3600 + 3
+        sched["next"] = 0
+        mediator._update_poll_schedule()
+        assert 1 <= sched["interval"] <= 3
+        # a state change resets the interval
+        mediator._note_state_change(jobid="1", state="RUNNING")
+        assert sched["interval"] == 1
+        # and so does request_poll (and the poll is due now)
+        sched["interval"] = 10
+        sched["next"] = time.time() + 10
+        mediator.request_poll(jobid="1")
+        assert sched["interval"] == 1
+        assert sched["next"] <= time.time()
+        mediator.monitor_remove_job(jobid="1")
+
+    @pytest.mark.asyncio
+    async def test_waiters_share_polls(self, fakeslurm, tmp_path,
+                                       monkeypatch):
+        go = os.path.join(tmp_path, "go")
+        procs = await submit_jobs(tmp_path,
+                                  f'while [ ! -e "{go}" ]; do sleep 0.05; done',
+                                  n=10)
+        mediator = procs[0].slurm_cluster_mediator
+        mediator.min_time_between_sacct_calls = 0.2
+        calls = record_slurm_commands(mediator, monkeypatch)
+        waits = asyncio.gather(*(p.wait() for p in procs))
+        await asyncio.sleep(0.5)
+        with open(go, "w"):
+            pass
+        assert await asyncio.wait_for(waits, timeout=10) == [0] * 10
+        squeue_calls = [c for c in calls
+                        if c.startswith(mediator.squeue_executable)]
+        # every poll is one squeue call for all waiting jobs
+        assert all(p.slurm_jobid in squeue_calls[0] for p in procs)
+        assert len(squeue_calls) < len(procs)
+
+    @pytest.mark.asyncio
+    async def test_squeue_sacct_fallback(self, fakeslurm, tmp_path,
+                                         monkeypatch):
+        go = os.path.join(tmp_path, "go")
+        quick, = await submit_jobs(tmp_path,
+                                   f'while [ ! -e "{go}" ]; do sleep 0.05; done',
+                                   n=1)
+        slow, = await submit_jobs(tmp_path, "sleep 100", n=1)
+        mediator = quick.slurm_cluster_mediator
+        calls = record_slurm_commands(mediator, monkeypatch)
+        wait = asyncio.create_task(quick.wait())
+        await asyncio.sleep(0.2)
+        with open(go, "w"):
+            pass
+        assert await asyncio.wait_for(wait, timeout=10) == 0
+        sacct_calls = [c for c in calls
+                       if c.startswith(mediator.sacct_executable)]
+        # sacct only for the job that left the queue
+        assert len(sacct_calls) > 0
+        assert all(quick.slurm_jobid in c and slow.slurm_jobid not in c
+                   for c in sacct_calls)
+        assert slow.slurm_jobid in [c for c in calls
+                                    if c.startswith(
+                                            mediator.squeue_executable)][-1]
+        await slow.terminate_async()
+        # without squeue, sacct is used for all jobs
+        calls.clear()
+        mediator.use_squeue = False
+        proc, = await submit_jobs(tmp_path, "true", n=1)
+        assert await proc.wait() == 0
+        assert len(calls) > 0
+        assert all(c.startswith(mediator.sacct_executable) for c in calls)
+
+    @pytest.mark.asyncio
+    async def test_request_poll(self, fakeslurm, tmp_path):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        # the first poll without state change backs off to a long interval
+        mediator.min_time_between_sacct_calls = 0.1
+        mediator.max_time_between_sacct_calls = 60
+        mediator.sacct_backoff_factor = 1000.
+        proc, = await submit_jobs(tmp_path, "sleep 0.5", n=1)
+        proc.completion_watch = "off"
+        await wait_for_fake_state(fakeslurm, proc.slurm_jobid, ["RUNNING"])
+        wait = asyncio.create_task(proc.wait())
+        await wait_for_fake_state(fakeslurm, proc.slurm_jobid, ["COMPLETED"])
+        await asyncio.sleep(0.2)
+        assert not wait.done()
+        mediator.request_poll(jobid=proc.slurm_jobid)
+        assert await asyncio.wait_for(wait, timeout=5) == 0
+
+    @pytest.mark.asyncio
+    async def test_transient_poll_failure(self, fakeslurm, tmp_path,
+                                          monkeypatch):
+        proc, = await submit_jobs(tmp_path, "sleep 0.2", n=1)
+        mediator = proc.slurm_cluster_mediator
+        n_failures = 0
+        run_slurm_command = mediator._run_slurm_command
+
+        async def fail_twice(cmd):
+            nonlocal n_failures
+            if n_failures < 2:
+                n_failures += 1
+                raise OSError("slurmctld is busy")
+            return await run_slurm_command(cmd)
+
+        monkeypatch.setattr(mediator, "_run_slurm_command", fail_twice)
+        assert await asyncio.wait_for(proc.wait(), timeout=10) == 0
+        assert n_failures == 2
+
+    @pytest.mark.asyncio
+    async def test_permanent_poll_failure(self, fakeslurm, tmp_path):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.max_failed_polls = 3
+        procs = await submit_jobs(tmp_path, "sleep 100", n=2)
+        mediator.squeue_executable = os.path.join(tmp_path, "no_squeue")
+        # all waiters fail instead of waiting forever
+        results = await asyncio.wait_for(
+                        asyncio.gather(*(p.wait() for p in procs),
+                                       return_exceptions=True),
+                        timeout=10)
+        assert all(isinstance(r, slurm.SlurmError) for r in results)
+        assert isinstance(results[0].__cause__, FileNotFoundError)
+        assert mediator._poll_task.done()
+        mediator.squeue_executable = "squeue"
+        await asyncio.gather(*(p.terminate_async() for p in procs))
+
+    def test_deprecated_sleep_time(self, fakeslurm, tmp_path, monkeypatch):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        script = write_script(tmp_path, "job.slurm", "true")
+        with pytest.warns(DeprecationWarning):
+            slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                               sleep_time=7)
+        assert mediator.max_time_between_sacct_calls == 7
+        # unknown settings are not silently ignored
+        with pytest.raises(TypeError):
+            slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                               sleep_tim=7)
+        monkeypatch.setattr(slurm.SlurmProcess, "sleep_time", 3,
+                            raising=False)
+        with pytest.warns(DeprecationWarning):
+            slurm.SlurmProcess(jobname="job", sbatch_script=script)
+        assert mediator.max_time_between_sacct_calls == 3
+
+    @pytest.mark.asyncio
+    async def test_chunked_queries(self, fakeslurm, tmp_path, monkeypatch):
+        go = os.path.join(tmp_path, "go")
+        procs = await submit_jobs(tmp_path,
+                                  f'while [ ! -e "{go}" ]; do sleep 0.05; done',
+                                  n=7)
+        jobids = {p.slurm_jobid for p in procs}
+        mediator = procs[0].slurm_cluster_mediator
+        mediator.max_jobids_per_call = 3
+        mediator.min_time_between_sacct_calls = 0.2
+        calls = record_slurm_commands(mediator, monkeypatch)
+
+        def queried_jobids(cmd):
+            if cmd.startswith(mediator.squeue_executable):
+                return cmd.split("--jobs=")[1].split()[0].split(",")
+            return cmd.split(" -j ")[1].split()[0].split(",")
+
+        waits = asyncio.gather(*(p.wait() for p in procs))
+        await asyncio.sleep(0.5)
+        # every poll queries all jobs in ceil(7 / 3) = 3 squeue calls
+        squeue_calls = [c for c in calls
+                        if c.startswith(mediator.squeue_executable)]
+        assert len(squeue_calls) >= 3
+        assert len(squeue_calls) % 3 == 0
+        assert [len(queried_jobids(c)) for c in squeue_calls[:3]] == [3, 3, 1]
+        assert set().union(*(queried_jobids(c)
+                             for c in squeue_calls[:3])) == jobids
+        with open(go, "w"):
+            pass
+        assert await asyncio.wait_for(waits, timeout=10) == [0] * 7
+        # the final states (for all jobs) come from sacct, also chunked
+        sacct_calls = [c for c in calls
+                       if c.startswith(mediator.sacct_executable)]
+        assert all(len(queried_jobids(c)) <= 3 for c in calls)
+        assert set().union(*(queried_jobids(c) for c in sacct_calls)) == jobids
+        assert all(p.slurm_job_state == "COMPLETED" for p in procs)
+
+
+class TestJournal:
+    @pytest.mark.asyncio
+    async def test_replay_and_reattach(self, fakeslurm, tmp_path):
+        journal = os.path.join(tmp_path, "journal.jsonl")
+        slurm.set_slurm_settings(journal_file=journal)
+        script = write_script(tmp_path, "job.slurm",
+                              f'while [ ! -e "{tmp_path}/go" ]; do '
+                              + 'sleep 0.05; done\necho done')
+        proc = await slurm.create_slurmprocess_submit(jobname="journaled",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      time=0.5,
+                                                      )
+        done_proc = await slurm.create_slurmprocess_submit(
+                                                    jobname="finished",
+                                                    sbatch_script=script,
+                                                    workdir=tmp_path,
+                                                           )
+        await wait_for_fake_state(fakeslurm, proc.slurm_jobid, ["RUNNING"])
+        old_mediator = proc.slurm_cluster_mediator
+        # a new controller (e.g. after the python process died)
+        slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                     max_time_between_sacct_calls=1,
+                                     journal_file=journal,
+                                     )
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        assert mediator is not old_mediator
+        assert mediator.find_journaled_jobs(jobname="journaled",
+                                            workdir=tmp_path,
+                                            ) == [proc.slurm_jobid]
+        with open(os.path.join(tmp_path, "go"), "w"):
+            pass
+        reattached = await slurm.reattach_slurmprocess(jobid=proc.slurm_jobid)
+        assert reattached.jobname == "journaled"
+        assert reattached.time == 0.5
+        stdout, _ = await reattached.communicate()
+        assert reattached.returncode == 0
+        assert stdout == b"done\n"
+        # waited for, i.e. removed from the journal
+        assert mediator.find_journaled_jobs(jobname="journaled") == []
+        with pytest.raises(slurm.SlurmError):
+            await slurm.reattach_slurmprocess(jobid=proc.slurm_jobid)
+        # the other job was not reattached, we stopped monitoring it when it
+        # finished but we can still reattach it (until the next restart)
+        await wait_for_fake_state(fakeslurm, done_proc.slurm_jobid,
+                                  ["COMPLETED"])
+        await wait_until_released(mediator, done_proc.slurm_jobid)
+        assert mediator.find_journaled_jobs() == [done_proc.slurm_jobid]
+        reattached = await slurm.reattach_slurmprocess(
+                                                jobid=done_proc.slurm_jobid)
+        assert reattached.returncode == 0
+        # and (since we did not wait for it) the reattached job is in the
+        # journal for the next controller
+        slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                     max_time_between_sacct_calls=1,
+                                     journal_file=journal,
+                                     )
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        assert mediator.find_journaled_jobs() == [done_proc.slurm_jobid]
+        reattached = await slurm.reattach_slurmprocess(
+                                                jobid=done_proc.slurm_jobid)
+        assert await reattached.wait() == 0
+
+    @pytest.mark.asyncio
+    async def test_unclaimed_jobs_released(self, fakeslurm, tmp_path):
+        journal = os.path.join(tmp_path, "journal.jsonl")
+        slurm.set_slurm_settings(journal_file=journal)
+        script = write_script(tmp_path, "job.slurm",
+                              f'while [ ! -e "{tmp_path}/go" ]; do '
+                              + 'sleep 0.05; done')
+        running = await slurm.create_slurmprocess_submit(jobname="running",
+                                                         sbatch_script=script,
+                                                         workdir=tmp_path,
+                                                         )
+        finished = await slurm.create_slurmprocess_submit(
+                                                    jobname="finished",
+                                                    sbatch_script=write_script(
+                                                            tmp_path,
+                                                            "true.slurm",
+                                                            "true"),
+                                                    workdir=tmp_path,
+                                                          )
+        # known to be finished but not waited for (and removed)
+        while (await finished.slurm_cluster_mediator.get_info_for_job(
+                    jobid=finished.slurm_jobid))["parsed_exitcode"] is None:
+            await asyncio.sleep(0.05)
+        # a new controller, nobody reattaches the jobs
+        slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                     max_time_between_sacct_calls=1,
+                                     journal_file=journal,
+                                     )
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        # the finished job is not monitored anymore, the running one is
+        assert finished.slurm_jobid not in mediator._jobinfo
+        assert running.slurm_jobid in mediator._jobinfo
+        with open(os.path.join(tmp_path, "go"), "w"):
+            pass
+        await wait_for_fake_state(fakeslurm, running.slurm_jobid,
+                                  ["COMPLETED"])
+        # now it is not monitored anymore either...
+        await wait_until_released(mediator, running.slurm_jobid)
+        assert mediator._jobids_sacct == set()
+        # ...but both are still in the journaled jobs of this controller
+        assert mediator.find_journaled_jobs() == [running.slurm_jobid,
+                                                  finished.slurm_jobid]
+        # and they are gone for the next controller
+        slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                     max_time_between_sacct_calls=1,
+                                     journal_file=journal,
+                                     )
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        assert mediator.find_journaled_jobs() == []
+        with pytest.raises(slurm.SlurmError):
+            await slurm.reattach_slurmprocess(jobid=running.slurm_jobid)
+
+    @pytest.mark.asyncio
+    async def test_compaction(self, fakeslurm, tmp_path):
+        journal = os.path.join(tmp_path, "journal.jsonl")
+        slurm.set_slurm_settings(journal_file=journal)
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.journal_compaction_interval = 4
+        procs = await submit_jobs(tmp_path, "true", n=6)
+        await asyncio.gather(*(p.wait() for p in procs))
+        # every job has at least a submit, a state and a remove record, but
+        # the finished jobs are gone from the journal when it is compacted
+        with open(journal, "r") as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) < 3 * len(procs)
+        submitted = {r["jobid"] for r in records if r["event"] == "submit"}
+        removed = {r["jobid"] for r in records if r["event"] == "remove"}
+        assert submitted <= removed
+        # the old journal is closed when the mediator is replaced
+        slurm.set_all_slurm_settings(min_time_between_sacct_calls=0,
+                                     max_time_between_sacct_calls=1,
+                                     journal_file=journal,
+                                     )
+        assert mediator.journal_file is None
+        assert mediator._journal_fh is None
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        assert mediator.find_journaled_jobs() == []
+        # and compacted when it is loaded
+        with open(journal, "r") as f:
+            assert all(json.loads(line)["event"] in ["node", "exclude_nodes"]
+                       for line in f)
+
+
+class TestNodeHealth:
+    @pytest.mark.asyncio
+    async def test_node_fail_decay_and_probation(self, fakeslurm, tmp_path):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        mediator.num_fails_for_broken_node = 1
+        script = write_script(tmp_path, "job.slurm", "true")
+        # the emulator puts the first job on node000
+        fakeslurm.fail_node("node000")
+        proc = await slurm.create_slurmprocess_submit(jobname="job",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        await proc.wait()
+        assert proc.slurm_job_state == "NODE_FAIL"
+        assert proc.nodes == ["node000"]
+        assert mediator.broken_nodes() == ["node000"]
+        assert mediator.node_health()["node000"]["excluded"]
+        # the next job does not go there
+        proc = await slurm.create_slurmprocess_submit(jobname="job",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        assert await proc.wait() == 0
+        assert proc.nodes != ["node000"]
+        # the fail count decays with the half life
+        score = mediator.node_health()["node000"]["fail_score"]
+        mediator._node_fail_times["node000"] -= (
+                                        mediator.node_fail_half_life * 3600)
+        assert (mediator.node_health()["node000"]["fail_score"]
+                == pytest.approx(score / 2))
+        # after the probation interval the node is used again...
+        mediator._node_broken_since["node000"] -= (
+                                    mediator.node_probation_interval * 3600)
+        assert mediator.broken_nodes() == []
+        assert "node000" not in mediator.exclude_nodes
+        proc = await slurm.create_slurmprocess_submit(jobname="job",
+                                                      sbatch_script=script,
+                                                      workdir=tmp_path,
+                                                      )
+        await proc.wait()
+        # ...and the next failure excludes it again directly
+        assert proc.slurm_job_state == "NODE_FAIL"
+        assert mediator.broken_nodes() == ["node000"]
+
+
+class TestPartitionChoice:
+    def set_partition_delays(self, fakeslurm, delays):
+        config_fname = os.path.join(fakeslurm.state_dir, "config.json")
+        with open(config_fname, "r") as f:
+            config = json.load(f)
+        config["partition_delays"] = delays
+        with open(config_fname, "w") as f:
+            json.dump(config, f)
+
+    def record_estimates(self, monkeypatch):
+        probed = []
+        estimate_start_time = slurm.SlurmProcess.estimate_start_time
+
+        async def record_estimate(proc):
+            probed.append(proc.partition)
+            return await estimate_start_time(proc)
+
+        monkeypatch.setattr(slurm.SlurmProcess, "estimate_start_time",
+                            record_estimate)
+        return probed
+
+    @pytest.mark.asyncio
+    async def test_estimate_start_time(self, fakeslurm, tmp_path):
+        self.set_partition_delays(fakeslurm, {"short": 10., "long": 600.})
+        script = write_script(tmp_path, "job.slurm", "true")
+        for partition, delay in [("short", 10.), ("long", 600.)]:
+            proc = slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                      workdir=tmp_path, partition=partition)
+            now = time.time()
+            start = await proc.estimate_start_time()
+            # the estimate has a resolution of seconds
+            assert start == pytest.approx(now + delay, abs=2.)
+        # nothing is submitted
+        assert fakeslurm.job_states() == {}
+
+    @pytest.mark.asyncio
+    async def test_choose_earliest_start(self, fakeslurm, tmp_path):
+        self.set_partition_delays(fakeslurm, {"short": 10., "long": 600.,
+                                              "medium": 120.})
+        script = write_script(tmp_path, "job.slurm", "true")
+        proc = slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                  workdir=tmp_path,
+                                  partition=["long", "short", "medium"])
+        assert await proc.choose_partition_qos() == ("short", None)
+        proc = slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                  workdir=tmp_path, partition=["long", "medium"],
+                                  qos=["normal", "high"])
+        # the QOS does not change the (emulated) queue wait
+        partition, qos = await proc.choose_partition_qos()
+        assert partition == "medium"
+        assert qos in ["normal", "high"]
+        assert fakeslurm.job_states() == {}
+
+    @pytest.mark.asyncio
+    async def test_ties_choose_first(self, fakeslurm, tmp_path, monkeypatch):
+        queue_waits = {"a": 10., "b": 10., "c": 5., "d": None}
+
+        async def expected_queue_wait(proc, partition, qos):
+            return queue_waits[partition]
+
+        monkeypatch.setattr(slurm.SlurmProcess, "_expected_queue_wait",
+                            expected_queue_wait)
+        script = write_script(tmp_path, "job.slurm", "true")
+        for candidates, chosen in [(["a", "b"], "a"), (["b", "a"], "b"),
+                                   (["d", "b", "a"], "b"),
+                                   (["a", "b", "c"], "c")]:
+            proc = slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                      workdir=tmp_path, partition=candidates)
+            assert await proc.choose_partition_qos() == (chosen, None)
+
+    @pytest.mark.asyncio
+    async def test_all_estimates_fail(self, fakeslurm, tmp_path, caplog):
+        # an sbatch that rejects every (test-only) submission
+        sbatch = write_script(tmp_path, "sbatch",
+                              "echo 'sbatch: error: Invalid partition name "
+                              "specified' >&2\nexit 1")
+        os.chmod(sbatch, 0o755)
+        slurm.SlurmProcess.sbatch_executable = sbatch
+        script = write_script(tmp_path, "job.slurm", "true")
+        proc = slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                  workdir=tmp_path, partition=["a", "b"],
+                                  qos=["normal", "high"])
+        assert await proc.estimate_start_time() is None
+        with caplog.at_level(logging.WARNING, logger="asyncmd.slurm"):
+            assert await proc.choose_partition_qos() == ("a", "normal")
+        assert "Could not estimate the queue wait" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_estimate_cache(self, fakeslurm, tmp_path, monkeypatch):
+        self.set_partition_delays(fakeslurm, {"short": 10., "long": 600.})
+        probed = self.record_estimates(monkeypatch)
+        script = write_script(tmp_path, "job.slurm", "true")
+
+        def make_proc(time=None):
+            return slurm.SlurmProcess(jobname="job", sbatch_script=script,
+                                      workdir=tmp_path, time=time,
+                                      partition=["long", "short"])
+
+        assert await make_proc().choose_partition_qos() == ("short", None)
+        assert sorted(probed) == ["long", "short"]
+        # similar jobs reuse the estimates...
+        for _ in range(3):
+            assert await make_proc().choose_partition_qos() == ("short", None)
+        # ...also when asking concurrently
+        results = await asyncio.gather(*(make_proc().choose_partition_qos()
+                                         for _ in range(3)))
+        assert results == 3 * [("short", None)]
+        assert len(probed) == 2
+        # a different time limit needs new estimates
+        assert await make_proc(time=1.).choose_partition_qos() == ("short",
+                                                                   None)
+        assert len(probed) == 4
+        # and outdated estimates are renewed
+        monkeypatch.setattr(slurm.SlurmProcess, "start_estimate_max_age", 0.)
+        assert await make_proc().choose_partition_qos() == ("short", None)
+        assert len(probed) == 6
+
+
+class TestSpeculativeExecution:
+    def make_wrapper(self, tmp_path):
+        executable = write_script(tmp_path, "cv.sh", "true")
+        os.chmod(executable, 0o755)
+        return SlurmTrajectoryFunctionWrapper(
+                                executable=executable,
+                                sbatch_script="#!/bin/bash\n{cmd_str}\n",
+                                slurm_jobname="cv",
+                                speculative_execution=True,
+                                              )
+
+    async def submit_straggler(self, wrapper, tmp_path):
+        script = write_script(tmp_path, "straggler.slurm", "sleep 100")
+        return await slurm.create_slurmprocess_submit(
+                                                jobname=wrapper.slurm_jobname,
+                                                sbatch_script=script,
+                                                workdir=tmp_path,
+                                                      )
+
+    @pytest.mark.asyncio
+    async def test_duplicate_wins(self, fakeslurm, tmp_path, monkeypatch):
+        wrapper = self.make_wrapper(tmp_path)
+        # the straggler is a straggler as soon as it runs
+        monkeypatch.setattr(wrapper, "_time_until_straggling",
+                            lambda slurm_proc: 0. if slurm_proc.nodes else 0.05)
+        result_file = os.path.join(tmp_path, "result")
+        straggler = await self.submit_straggler(wrapper, tmp_path)
+        returncode, proc, _, _ = await asyncio.wait_for(
+                wrapper._communicate_speculatively(
+                        slurm_proc=straggler,
+                        result_file=result_file,
+                        slurm_workdir=str(tmp_path),
+                        tra_name="traj",
+                        speculative_cmd_str=("touch "
+                                             + result_file
+                                             + "_speculative.npy"),
+                                                   ),
+                timeout=30,
+                                                        )
+        assert returncode == 0
+        assert proc is not straggler
+        # the duplicate avoids the nodes of the straggler
+        assert not set(proc.nodes) & set(straggler.nodes)
+        await wait_for_fake_state(fakeslurm, straggler.slurm_jobid,
+                                  ["CANCELLED"])
+        # the results are where the caller expects them
+        assert os.path.isfile(result_file + ".npy")
+        assert not os.path.isfile(result_file + "_speculative.npy")
+        # and the nodes of the straggler are noted
+        mediator = straggler.slurm_cluster_mediator
+        assert mediator.node_health()[straggler.nodes[0]]["fail_score"] > 0
+
+    @pytest.mark.asyncio
+    async def test_duplicate_canceled_on_error(self, fakeslurm, tmp_path,
+                                               monkeypatch):
+        wrapper = self.make_wrapper(tmp_path)
+        monkeypatch.setattr(wrapper, "_time_until_straggling",
+                            lambda slurm_proc: 0.)
+        result_file = os.path.join(tmp_path, "result")
+        straggler = await self.submit_straggler(wrapper, tmp_path)
+
+        async def failing_communicate():
+            # fail (with an error, not a cancelation) once the duplicate runs
+            while not any(info["state"] == "RUNNING"
+                          for jobid, info in fakeslurm.job_states().items()
+                          if jobid != straggler.slurm_jobid):
+                await asyncio.sleep(0.05)
+            raise RuntimeError("Lost the straggler.")
+
+        monkeypatch.setattr(straggler, "communicate", failing_communicate)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(wrapper._communicate_speculatively(
+                                            slurm_proc=straggler,
+                                            result_file=result_file,
+                                            slurm_workdir=str(tmp_path),
+                                            tra_name="traj",
+                                            speculative_cmd_str="sleep 100",
+                                                                      ),
+                                   timeout=30)
+        spec_jobid = [jobid for jobid in fakeslurm.job_states()
+                      if jobid != straggler.slurm_jobid][0]
+        await wait_for_fake_state(fakeslurm, spec_jobid, ["CANCELLED"])
+        assert not any(f.startswith("result_speculative")
+                       or f.endswith("_speculative.slurm")
+                       for f in os.listdir(tmp_path))
+        await straggler.terminate_async()
+
+    @pytest.mark.asyncio
+    async def test_failed_cancel_keeps_winner(self, fakeslurm, tmp_path,
+                                              monkeypatch, caplog):
+        wrapper = self.make_wrapper(tmp_path)
+        monkeypatch.setattr(wrapper, "_time_until_straggling",
+                            lambda slurm_proc: 0. if slurm_proc.nodes else 0.05)
+        result_file = os.path.join(tmp_path, "result")
+        straggler = await self.submit_straggler(wrapper, tmp_path)
+        terminate_async = straggler.terminate_async
+
+        async def failing_terminate_async():
+            raise slurm.SlurmCancelationError("scancel failed.")
+
+        monkeypatch.setattr(straggler, "terminate_async",
+                            failing_terminate_async)
+        with caplog.at_level(logging.ERROR,
+                             logger="asyncmd.trajectory.functionwrapper"):
+            returncode, proc, _, _ = await asyncio.wait_for(
+                wrapper._communicate_speculatively(
+                        slurm_proc=straggler,
+                        result_file=result_file,
+                        slurm_workdir=str(tmp_path),
+                        tra_name="traj",
+                        speculative_cmd_str=("touch "
+                                             + result_file
+                                             + "_speculative.npy"),
+                                                   ),
+                timeout=30,
+                                                            )
+        # the duplicate still wins and its results are kept
+        assert returncode == 0
+        assert proc is not straggler
+        assert os.path.isfile(result_file + ".npy")
+        assert f"Could not cancel job {straggler.slurm_jobid}" in caplog.text
+        await terminate_async()
+
+
+class TestStdfiles:
+    @pytest.mark.asyncio
+    async def test_stream_stdout(self, fakeslurm, tmp_path):
+        go = os.path.join(tmp_path, "go")
+        procs = await submit_jobs(tmp_path,
+                                  f'echo first\nwhile [ ! -e "{go}" ]; do '
+                                  + 'sleep 0.05; done\necho second\n'
+                                  + 'echo -n last',
+                                  n=1)
+        proc = procs[0]
+        lines = []
+        async for line in proc.stream_stdout(poll_interval=0.05, lines=True):
+            lines.append(line)
+            if line == b"first\n":
+                # the job only goes on after we got the first line
+                with open(go, "w"):
+                    pass
+        # including the output written just before the job ended (and the
+        # incomplete last line)
+        assert lines == [b"first\n", b"second\n", b"last"]
+        # after wait the stdfiles are removed, we stream from the spool
+        assert await proc.wait() == 0
+        assert not os.path.exists(os.path.join(
+                        tmp_path, proc._stdout_name(use_slurm_symbols=False)
+                                               ))
+        chunks = [c async for c in proc.stream_stdout(chunk_size=4)]
+        assert all(len(c) <= 4 for c in chunks)
+        assert b"".join(chunks) == b"first\nsecond\nlast"
+
+    @pytest.mark.asyncio
+    async def test_spool_rollover_and_pickle(self, fakeslurm, tmp_path):
+        procs = await submit_jobs(tmp_path,
+                                  "head -c 1000 /dev/zero | tr '\\0' x\n"
+                                  + "echo err >&2",
+                                  n=1, stdfiles_spool_max_size=100)
+        proc = procs[0]
+        stdout, stderr = await proc.communicate()
+        assert stdout == b"x" * 1000
+        assert stderr == b"err\n"
+        # stdout did not fit into memory, stderr did
+        assert proc._stdout_data._rolled
+        assert not proc._stderr_data._rolled
+        # we still get the output (from the spools) after pickling
+        unpickled = pickle.loads(pickle.dumps(proc))
+        assert await unpickled.communicate() == (stdout, stderr)
+        assert await proc.communicate() == (stdout, stderr)
+        # and nothing after we discarded it
+        proc.discard_stdfile_data()
+        unpickled = pickle.loads(pickle.dumps(proc))
+        assert unpickled._stdout_data is None
+        assert await proc.communicate() == (b"", b"")
+
+
+def sacct_line(jobid, state="", exitcode="", nodelist="", submit="",
+               eligible="", start="", end="", elapsedraw="", alloccpus="",
+               totalcpu="", maxrss="", partition="", qos=""):
+    # one line of sacct output as we request it (fields as in _SACCT_FIELDS)
+    fields = [jobid, state, exitcode, nodelist, submit, eligible, start, end,
+              elapsedraw, alloccpus, totalcpu, maxrss, partition, qos]
+    return "||||".join(fields) + "||||"
+
+
+class TestAccounting:
+    def test_parse_fields(self):
+        assert slurm._parse_slurm_duration("1-02:03:04") == 93784
+        assert slurm._parse_slurm_duration("05:06.5") == 306.5
+        assert slurm._parse_slurm_duration("") is None
+        assert slurm._parse_slurm_duration("INVALID") is None
+        assert slurm._parse_slurm_memory("1234K") == 1234 * 2**10
+        assert slurm._parse_slurm_memory("12.5M") == int(12.5 * 2**20)
+        assert slurm._parse_slurm_memory("0") == 0
+        assert slurm._parse_slurm_memory("") is None
+        assert slurm._parse_slurm_timestamp("Unknown") is None
+        assert slurm._parse_slurm_timestamp("None") is None
+        assert slurm._parse_slurm_int("") is None
+        assert slurm._parse_slurm_int(" 12") == 12
+
+    def test_job_statistics(self, fakeslurm):
+        mediator = slurm.SlurmProcess._get_slurm_cluster_mediator()
+        for jobid, jobname in [("101", "md"), ("102", "md"), ("103", "cv")]:
+            mediator.monitor_register_job(jobid=jobid, jobname=jobname)
+        day = "2024-01-01T"
+        mediator._parse_sacct_output("\n".join([
+                sacct_line("101", "COMPLETED", "0:0", "node[1,2]",
+                           submit=day + "10:00:00", eligible=day + "10:00:00",
+                           start=day + "10:01:00", end=day + "10:11:00",
+                           elapsedraw="600", alloccpus="4",
+                           totalcpu="30:00", partition="p1", qos="normal"),
+                # MaxRSS is only reported for the steps
+                sacct_line("101.batch", "COMPLETED", "0:0", "node1",
+                           maxrss="1024K"),
+                sacct_line("101.0", "COMPLETED", "0:0", "node[1,2]",
+                           maxrss="2M"),
+                sacct_line("102", "FAILED", "1:0", "node3",
+                           submit=day + "10:00:00", eligible=day + "10:05:00",
+                           start=day + "10:06:00", end=day + "10:07:00",
+                           elapsedraw="60", alloccpus="2", totalcpu="01:00",
+                           partition="p2"),
+                # no accounting info at all
+                sacct_line("103", "COMPLETED", "0:0", "node1",
+                           submit="Unknown", eligible="Unknown",
+                           start="None", end="Unknown"),
+                                                   ]))
+        stats = mediator.job_statistics()
+        assert stats["md"] == {"n_jobs": 2,
+                               "n_failed": 1,
+                               # counted from eligible, not from submit
+                               "mean_queue_wait": 60.,
+                               "mean_run_time": 330.,
+                               "total_run_time": 660.,
+                               "mean_cpu_efficiency": (0.75 + 0.5) / 2,
+                               "max_rss": 2 * 2**20,
+                               # 2 jobs in the 10 min from first start to
+                               # last end
+                               "throughput": 12.,
+                               }
+        assert stats["cv"] == {"n_jobs": 1,
+                               "n_failed": 0,
+                               "mean_queue_wait": None,
+                               "mean_run_time": None,
+                               "total_run_time": 0,
+                               "mean_cpu_efficiency": None,
+                               "max_rss": None,
+                               "throughput": None,
+                               }
+        # for unknown values we keep our own observations
+        record, = [r for r in mediator.finished_jobs_accounting
+                   if r["jobid"] == "103"]
+        assert record["submit"] is not None and record["end"] is not None
+        assert record["partition"] is None
+        assert set(mediator.job_statistics(group_by="partition")) == {
+                                                            "p1", "p2", None}
+        nodes = mediator.node_statistics()
+        assert nodes["node1"]["n_jobs"] == 2
+        assert nodes["node3"]["n_failed"] == 1
+        assert mediator.job_statistics(group_by=None)[None]["n_jobs"] == 3
+        with pytest.raises(ValueError):
+            mediator.job_statistics(group_by="jobid")
+
+
+FAKE_MDRUN = """#!{python}
+import json, os, sys, time
+import MDAnalysis as mda
+
+argv = [arg for arg in sys.argv[1:] if arg != "-noappend"]
+args = dict(zip(argv[::2], argv[1::2]))
+with open("mdrun_calls.jsonl", "a") as f:
+    f.write(json.dumps(args) + "\\n")
+start, part = 0, 1
+if os.path.isfile(args["-cpi"]):
+    with open(args["-cpi"]) as f:
+        start, part = json.load(f)
+    part += 1
+nsteps = int(args["-nsteps"])
+suffix = f".part{{part:04d}}"
+u = mda.Universe("{gro}")
+stop = start + nsteps
+preempt_at = {preempt_at}
+if part == 1 and preempt_at is not None:
+    # write some frames after the checkpoint, they are produced again
+    stop = preempt_at + 20
+first = start if part == 1 else start + 10
+
+
+def write_checkpoint(step):
+    # like mdrun, keep the previous checkpoint as _prev.cpt
+    if os.path.isfile(args["-cpo"]):
+        os.replace(args["-cpo"], args["-cpo"][:-4] + "_prev.cpt")
+    with open(args["-cpo"], "w") as cpt:
+        json.dump([step, part], cpt)
+
+
+with mda.Writer(args["-o"][:-4] + suffix + ".trr", n_atoms=len(u.atoms)) as w:
+    for step in range(first, stop + 1, 10):
+        u.trajectory.ts.data["step"] = step
+        u.trajectory.ts.time = step * 0.002
+        w.write(u)
+with open(args["-g"][:-4] + suffix + ".log", "w") as f:
+    if part == 1 and preempt_at is not None:
+        f.write(f"Writing checkpoint, step {{preempt_at}} at today\\n")
+        f.flush()
+        write_checkpoint(preempt_at)
+        open("waiting_for_preemption", "w").close()
+        time.sleep(100)
+    f.write(f"Writing checkpoint, step {{stop}} at today\\n")
+write_checkpoint(stop)
+open(args["-c"][:-4] + suffix + ".gro", "w").close()
+"""
+
+
+class TestSlurmGmxEngineResubmit:
+    gro_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "test_data", "trajectory", "ala.gro")
+
+    def make_engine(self, tmp_path, monkeypatch, preempt_at):
+        # trimming the trajectory needs a MAX_PROCESS slot (and the default
+        # is zero on machines with less than 4 cores)
+        monkeypatch.setitem(_SEMAPHORES, "MAX_PROCESS",
+                            asyncio.BoundedSemaphore(1))
+        mdrun = os.path.join(tmp_path, "fake_mdrun")
+        with open(mdrun, "w") as f:
+            f.write(FAKE_MDRUN.format(python=sys.executable, gro=self.gro_file,
+                                      preempt_at=preempt_at))
+        os.chmod(mdrun, 0o755)
+        mdp = MDP(original_file=os.path.join(os.path.dirname(self.gro_file),
+                                             "..", "gromacs", "empty.mdp"))
+        mdp["nsteps"] = -1
+        mdp["dt"] = 0.002
+        mdp["nstxout"] = 10
+        engine = SlurmGmxEngine(mdconfig=mdp, gro_file=self.gro_file,
+                                top_file=self.gro_file,
+                                sbatch_script="#!/bin/bash\n{mdrun_cmd}\n",
+                                mdrun_executable=mdrun,
+                                grompp_executable="true",
+                                )
+        # we can not run grompp here, so we set up what prepare would do
+        # (the fake mdrun does not read the tpr, the gro is our structure)
+        engine.workdir = str(tmp_path)
+        engine._deffnm = "md"
+        engine._tpr = self.gro_file
+        engine._simulation_part = 0
+        engine._prepared = True
+        return engine
+
+    def mdrun_calls(self, tmp_path):
+        with open(os.path.join(tmp_path, "mdrun_calls.jsonl"), "r") as f:
+            return [json.loads(line) for line in f]
+
+    @pytest.mark.asyncio
+    async def test_resubmit_preempted(self, fakeslurm, tmp_path,
+                                      monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=40)
+        run = asyncio.create_task(engine.run(nsteps=100))
+        marker = os.path.join(tmp_path, "waiting_for_preemption")
+        while not os.path.isfile(marker):
+            assert not run.done()
+            await asyncio.sleep(0.05)
+        first_jobid = engine._proc.slurm_jobid
+        fakeslurm.preempt(first_jobid)
+        traj = await asyncio.wait_for(run, timeout=30)
+        assert fakeslurm.job_states()[first_jobid]["state"] == "PREEMPTED"
+        # resubmitted once, continuing from the checkpoint with the steps
+        # still missing in the part
+        calls = self.mdrun_calls(tmp_path)
+        assert [call["-nsteps"] for call in calls] == ["100", "60"]
+        assert len(fakeslurm.job_states()) == 2
+        # the frames after the checkpoint are removed from the first segment
+        assert [os.path.basename(f) for f in traj.trajectory_files] == [
+                                            "md.part0001.trr",
+                                            "md.part0002.trr"]
+        assert traj.first_step == 0
+        assert traj.last_step == 100
+        assert len(traj) == 11
+        assert engine.steps_done == 100
+        assert engine.frames_done == 11
+
+    @pytest.mark.asyncio
+    async def test_no_resubmit_without_budget(self, fakeslurm, tmp_path,
+                                              monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=40)
+        engine.max_resubmits_per_part = 0
+        run = asyncio.create_task(engine.run(nsteps=100))
+        marker = os.path.join(tmp_path, "waiting_for_preemption")
+        while not os.path.isfile(marker):
+            assert not run.done()
+            await asyncio.sleep(0.05)
+        fakeslurm.preempt(engine._proc.slurm_jobid)
+        # PREEMPTED is a failed job for us
+        with pytest.raises(EngineCrashedError):
+            await asyncio.wait_for(run, timeout=30)
+        assert engine._proc.slurm_job_state == "PREEMPTED"
+        assert engine._proc.returncode != 0
+        assert len(self.mdrun_calls(tmp_path)) == 1
+
+    @pytest.mark.asyncio
+    async def test_resubmit_node_fail(self, fakeslurm, tmp_path,
+                                      monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=40)
+        run = asyncio.create_task(engine.run(nsteps=100))
+        marker = os.path.join(tmp_path, "waiting_for_preemption")
+        while not os.path.isfile(marker):
+            assert not run.done()
+            await asyncio.sleep(0.05)
+        first_jobid = engine._proc.slurm_jobid
+        node = fakeslurm.job_states()[first_jobid]["node"]
+        # no new jobs on the node, such that the resubmitted part runs
+        fakeslurm.drain(node)
+        fakeslurm.fail_node(node)
+        traj = await asyncio.wait_for(run, timeout=30)
+        assert fakeslurm.job_states()[first_jobid]["state"] == "NODE_FAIL"
+        calls = self.mdrun_calls(tmp_path)
+        assert [call["-nsteps"] for call in calls] == ["100", "60"]
+        assert traj.last_step == 100
+        assert engine.steps_done == 100
+
+    @pytest.mark.asyncio
+    async def test_no_presubmit_if_next_part_uncertain(self, fakeslurm,
+                                                       tmp_path, monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=None)
+        engine.presubmit_next_part = True
+        # performance not known (yet)
+        await engine.run(nsteps=100, walltime=0.1)
+        assert len(fakeslurm.job_states()) == 1
+        # performance known, but we do not know how many steps will follow
+        engine._performance = {"ns_per_day": 1., "hours_per_ns": 1.,
+                               "steps_per_hour": 100.}
+        await engine.run(nsteps=100, walltime=0.1, steps_per_part=True)
+        assert len(fakeslurm.job_states()) == 2
+        assert engine._presubmitted_proc is None
+
+    def cancel_presubmitted_when_done(self, engine, fakeslurm, monkeypatch,
+                                      n_extra_cpts=0):
+        cancel = engine.cancel_presubmitted_part
+
+        async def cancel_when_done():
+            # make sure the presubmitted part ran before we cancel it
+            proc = engine._presubmitted_proc
+            if proc is not None:
+                await wait_for_fake_state(fakeslurm, proc.slurm_jobid,
+                                          ["COMPLETED"])
+                log_file = os.path.join(proc.workdir, proc.jobname + ".log")
+                with open(log_file, "a") as f:
+                    for _ in range(n_extra_cpts):
+                        f.write("Writing checkpoint, step 0 at today\n")
+            await cancel()
+
+        monkeypatch.setattr(engine, "cancel_presubmitted_part",
+                            cancel_when_done)
+
+    @pytest.mark.asyncio
+    async def test_clean_up_started_presubmitted_part(self, fakeslurm,
+                                                      tmp_path, monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=None)
+        engine.presubmit_next_part = True
+        # the part can do at most 10 steps in its walltime, i.e. we need more
+        engine._performance = {"ns_per_day": 1., "hours_per_ns": 1.,
+                               "steps_per_hour": 100.}
+        self.cancel_presubmitted_when_done(engine, fakeslurm, monkeypatch)
+        # but the fake mdrun ignores maxh and does all steps in one part
+        traj = await asyncio.wait_for(engine.run(nsteps=100, walltime=0.1),
+                                      timeout=30)
+        assert len(fakeslurm.job_states()) == 2
+        assert len(self.mdrun_calls(tmp_path)) == 2
+        assert engine._presubmitted_proc is None
+        assert traj.last_step == 100
+        # the outputs of the canceled part are gone (except for the SLURM
+        # stdout and stderr) and the checkpoint is the one of the last part
+        for fname in ["md.part0002.trr", "md.part0002.log",
+                      "md.part0002.slurm", "md.confout.part0002.gro",
+                      "md_prev.cpt"]:
+            assert not os.path.isfile(os.path.join(tmp_path, fname))
+        with open(os.path.join(tmp_path, "md.cpt"), "r") as f:
+            assert json.load(f) == [100, 1]
+
+    @pytest.mark.asyncio
+    async def test_presubmitted_part_with_several_checkpoints(
+                                        self, fakeslurm, tmp_path, monkeypatch):
+        engine = self.make_engine(tmp_path, monkeypatch, preempt_at=None)
+        engine.presubmit_next_part = True
+        engine._performance = {"ns_per_day": 1., "hours_per_ns": 1.,
+                               "steps_per_hour": 100.}
+        # the checkpoint of the first part can not be restored
+        self.cancel_presubmitted_when_done(engine, fakeslurm, monkeypatch,
+                                           n_extra_cpts=1)
+        with pytest.raises(EngineError):
+            await asyncio.wait_for(engine.run(nsteps=100, walltime=0.1),
+                                   timeout=30)
+        assert engine._presubmitted_proc is None
+        # the outputs of the canceled part are kept, they match the checkpoint
+        for fname in ["md.part0002.trr", "md.part0002.log",
+                      "md.confout.part0002.gro"]:
+            assert os.path.isfile(os.path.join(tmp_path, fname))
+        assert not os.path.isfile(os.path.join(tmp_path, "md.part0002.slurm"))
+        with open(os.path.join(tmp_path, "md.cpt"), "r") as f:
+            assert json.load(f)[1] == 2
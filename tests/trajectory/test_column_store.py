@@ -0,0 +1,122 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import numpy as np
+
+from asyncmd.trajectory.trajectory import TrajectoryFunctionValueCacheH5PY
+from asyncmd.trajectory.column_store import TrajectoryFunctionValueColumnStore
+
+
+h5py = pytest.importorskip("h5py", minversion=None,
+                           reason="Requires 'h5py' to run.",
+                           )
+
+
+class Test_TrajectoryFunctionValueColumnStore:
+    def setup_method(self):
+        self.ran_gen = np.random.default_rng()
+
+    def test_append_load_get(self, tmp_path):
+        h5file = h5py.File(tmp_path / "store.h5", mode="w")
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        func_id = "some/func.id"
+        # include a negative hash (as used in the tests) and a large one
+        hash_trajs = [-5, 2**64 - 1, 12345]
+        traj_lens = [10, 1, 23]
+        values = [self.ran_gen.random((n, 3)) for n in traj_lens]
+        for hash_traj, vals in zip(hash_trajs, values):
+            store.append(func_id=func_id, hash_traj=hash_traj, vals=vals)
+        assert list(store) == [func_id]
+        all_vals, stored_hashes, offsets = store.load(func_id)
+        assert all_vals.shape == (sum(traj_lens), 3)
+        assert list(offsets) == [0, 10, 11, 34]
+        assert list(stored_hashes) == [h % 2**64 for h in hash_trajs]
+        for i, (hash_traj, vals) in enumerate(zip(hash_trajs, values)):
+            assert np.array_equal(all_vals[offsets[i]:offsets[i + 1]], vals)
+            assert np.array_equal(store.get(func_id, hash_traj), vals)
+        assert store.get(func_id, 1) is None
+        # errors
+        with pytest.raises(ValueError):
+            store.append(func_id=func_id, hash_traj=-5, vals=values[0])
+        with pytest.raises(ValueError):
+            store.append(func_id=func_id, hash_traj=1,
+                         vals=np.zeros((10, 2)))
+        with pytest.raises(ValueError):
+            store.append_many(func_id=func_id, hash_trajs=[1, 1],
+                              vals_list=[values[0], values[0]])
+        with pytest.raises(KeyError):
+            store.load("not there")
+        h5file.close()
+        # and read it again (read-only)
+        h5file = h5py.File(tmp_path / "store.h5", mode="r")
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        view = store.trajectory(hash_trajs[1])
+        assert len(view) == 1
+        assert func_id in view
+        assert np.array_equal(view[func_id], values[1])
+        with pytest.raises(KeyError):
+            _ = store.trajectory(1)[func_id]
+
+    def test_interrupted_append(self, tmp_path):
+        # values (and offsets) written by an interrupted append are not
+        # referenced by the index and must be overwritten by the next append
+        h5file = h5py.File(tmp_path / "store.h5", mode="w")
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        store.append(func_id="a", hash_traj=1, vals=np.zeros((5, 2)))
+        grp = h5file[store._h5py_root_path]["a"]
+        # simulate an append interrupted after writing values and offsets
+        grp["values"].resize(8, axis=0)
+        grp["values"][5:] = -1.
+        grp["offsets"].resize(3, axis=0)
+        grp["offsets"][2] = 8
+        vals = np.ones((4, 2))
+        store.append(func_id="a", hash_traj=2, vals=vals)
+        assert np.array_equal(store.get("a", 2), vals)
+        all_vals, hash_trajs, offsets = store.load("a")
+        assert list(offsets) == [0, 5, 9]
+        assert all_vals.shape == (9, 2)
+        assert not np.any(all_vals == -1.)
+        # and the same for a fresh store (i.e. a rebuilt row index)
+        grp["values"].resize(12, axis=0)
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        all_vals, hash_trajs, offsets = store.load("a")
+        assert all_vals.shape == (9, 2)
+        assert list(hash_trajs) == [1, 2]
+
+    def test_export_h5py_cache(self, tmp_path):
+        h5file = h5py.File(tmp_path / "cache.h5", mode="w")
+        func_ids = ["func_a", "func_b"]
+        values = {}
+        for hash_traj in range(5):
+            cache = TrajectoryFunctionValueCacheH5PY(h5file,
+                                                     hash_traj=hash_traj)
+            for func_id in func_ids:
+                vals = self.ran_gen.random(self.ran_gen.integers(1, 20))
+                cache.append(func_id=func_id, vals=vals)
+                values[(func_id, hash_traj)] = vals
+        store = TrajectoryFunctionValueColumnStore(h5file)
+        assert store.export_h5py_cache(h5file, func_ids=["func_a"]) == 5
+        assert list(store) == ["func_a"]
+        # exporting again only adds what is missing
+        assert store.export_h5py_cache(h5file) == 5
+        assert store.export_h5py_cache(h5file) == 0
+        for func_id in func_ids:
+            all_vals, hash_trajs, offsets = store.load(func_id)
+            for i, hash_traj in enumerate(hash_trajs):
+                assert np.array_equal(all_vals[offsets[i]:offsets[i + 1]],
+                                      values[(func_id, int(hash_traj))])
+        view = store.trajectory(3)
+        assert sorted(view) == func_ids
+        assert np.array_equal(view["func_b"], values[("func_b", 3)])
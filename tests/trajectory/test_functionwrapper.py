@@ -0,0 +1,104 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import asyncio
+import os
+import sys
+import MDAnalysis as mda
+
+from asyncmd import slurm, Trajectory
+from asyncmd._config import _SEMAPHORES
+from asyncmd.trajectory.functionwrapper import SlurmTrajectoryFunctionWrapper
+
+
+# a CV "function" returning the number in the trajectory name (traj_N.trr)
+CV_EXECUTABLE = """#!{python}
+import os, sys
+import numpy as np
+
+idx = int(os.path.basename(sys.argv[2]).split(".")[0].split("_")[1])
+np.save(sys.argv[3], np.array([[idx]]))
+"""
+
+
+class TestSlurmTrajectoryFunctionWrapper:
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "test_data", "trajectory")
+
+    def make_wrapper(self, tmp_path, monkeypatch, **kwargs):
+        # loading the results needs a MAX_PROCESS slot (and the default is
+        # zero on machines with less than 4 cores)
+        monkeypatch.setitem(_SEMAPHORES, "MAX_PROCESS",
+                            asyncio.BoundedSemaphore(1))
+        executable = os.path.join(tmp_path, "cv.py")
+        with open(executable, "w") as f:
+            f.write(CV_EXECUTABLE.format(python=sys.executable))
+        os.chmod(executable, 0o755)
+        return SlurmTrajectoryFunctionWrapper(
+                                executable=executable,
+                                sbatch_script="#!/bin/bash\n{cmd_str}\n",
+                                slurm_jobname="cv",
+                                **kwargs,
+                                              )
+
+    def make_trajectories(self, tmp_path, n):
+        # trajectories with different content (i.e. different hashes), such
+        # that they are different Trajectory objects
+        struct = os.path.join(self.data_dir, "ala.gro")
+        u = mda.Universe(struct)
+        trajs = []
+        for i in range(n):
+            fname = os.path.join(tmp_path, f"traj_{i}.trr")
+            with mda.Writer(fname, n_atoms=len(u.atoms)) as w:
+                for step in range(i + 1):
+                    u.trajectory.ts.data["step"] = step
+                    u.trajectory.ts.time = step * 0.002
+                    w.write(u)
+            trajs.append(Trajectory(trajectory_files=fname,
+                                    structure_file=struct))
+        return trajs
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(["n_trajs", "batch_size"],
+                             [(5, 2), (4, 4), (3, 5)])
+    async def test_batch_size(self, fakeslurm, tmp_path, monkeypatch,
+                              n_trajs, batch_size):
+        wrapper = self.make_wrapper(tmp_path, monkeypatch,
+                                    batch_size=batch_size,
+                                    batch_collect_time=0.2)
+        array_submits = []
+        array_submit = slurm.create_slurmprocess_array_submit
+
+        async def count_array_submit(**kwargs):
+            array_submits.append(kwargs["n_tasks"])
+            return await array_submit(**kwargs)
+
+        monkeypatch.setattr(slurm, "create_slurmprocess_array_submit",
+                            count_array_submit)
+        trajs = self.make_trajectories(tmp_path, n=n_trajs)
+        results = await asyncio.wait_for(
+                    asyncio.gather(*(wrapper.get_values_for_trajectory(t)
+                                     for t in trajs)),
+                    timeout=30)
+        # ceil(n_trajs / batch_size) job arrays, all but the last one full
+        n_batches = -(-n_trajs // batch_size)
+        assert len(array_submits) == n_batches
+        assert sum(array_submits) == n_trajs
+        assert all(n == batch_size for n in array_submits[:-1])
+        assert len(fakeslurm.job_states()) == n_trajs
+        # every trajectory gets its own values
+        assert [r.tolist() for r in results] == [[[i]] for i in range(n_trajs)]
+        assert not any(f.endswith((".npy", ".slurm"))
+                       for f in os.listdir(tmp_path))
@@ -0,0 +1,98 @@
+# This file is part of asyncmd.
+#
+# asyncmd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# asyncmd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with asyncmd. If not, see <https://www.gnu.org/licenses/>.
+import pytest
+import json
+import os
+import numpy as np
+
+from asyncmd import slurm
+from asyncmd.gromacs import MDP, SlurmGmxEngine
+from asyncmd.trajectory.propagate import InPartsTrajectoryPropagator
+
+
+class TestAdaptiveWalltime:
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "test_data")
+
+    def make_engine(self, tmp_path):
+        gro_file = os.path.join(self.data_dir, "trajectory", "ala.gro")
+        mdp = MDP(original_file=os.path.join(self.data_dir, "gromacs",
+                                             "empty.mdp"))
+        mdp["nsteps"] = -1
+        engine = SlurmGmxEngine(mdconfig=mdp, gro_file=gro_file,
+                                top_file=gro_file,
+                                sbatch_script="#!/bin/bash\n{mdrun_cmd}\n",
+                                mdrun_executable="true",
+                                grompp_executable="true",
+                                )
+        # we only probe, i.e. we only need what prepare sets for the names
+        engine.workdir = str(tmp_path)
+        engine._deffnm = "md"
+        return engine
+
+    def set_backfill_window(self, fakeslurm, window):
+        # only jobs with a time limit of at most window seconds start directly
+        config_fname = os.path.join(fakeslurm.state_dir, "config.json")
+        with open(config_fname, "r") as f:
+            config = json.load(f)
+        config["backfill_window"] = window
+        with open(config_fname, "w") as f:
+            json.dump(config, f)
+
+    @pytest.mark.asyncio
+    async def test_backfill_probe(self, fakeslurm, tmp_path, monkeypatch):
+        self.set_backfill_window(fakeslurm, window=1800)
+        probed = []
+        estimate_start_time = slurm.SlurmProcess.estimate_start_time
+
+        async def record_estimate(proc):
+            probed.append(proc.time)
+            return await estimate_start_time(proc)
+
+        monkeypatch.setattr(slurm.SlurmProcess, "estimate_start_time",
+                            record_estimate)
+        engine = self.make_engine(tmp_path)
+        propagator = InPartsTrajectoryPropagator(n_steps=1000,
+                                                 engine_cls=SlurmGmxEngine,
+                                                 engine_kwargs={},
+                                                 walltime_per_part=2.,
+                                                 adaptive_walltime=True,
+                                                 )
+        # the longest candidate (fractions of 2 h) inside the window, we
+        # probe from the longest and stop at the first fitting one
+        walltime = await propagator._walltime_for_next_part(
+                                            engine=engine,
+                                            remaining_steps=np.inf,
+                                                            )
+        assert walltime == 0.5
+        assert probed == [2., 1.5, 1., 0.5]
+        # the next part reuses the (recent) estimates
+        walltime = await propagator._walltime_for_next_part(
+                                            engine=engine,
+                                            remaining_steps=np.inf,
+                                                            )
+        assert walltime == 0.5
+        assert len(probed) == 4
+        # the probe script is removed again
+        assert not any(f.endswith(".slurm") for f in os.listdir(tmp_path))
+        # nothing fits
+        self.set_backfill_window(fakeslurm, window=60)
+        monkeypatch.setattr(slurm.SlurmProcess, "start_estimate_max_age", 0.)
+        walltime = await propagator._walltime_for_next_part(
+                                            engine=engine,
+                                            remaining_steps=np.inf,
+                                                            )
+        assert walltime == 2.
+        assert len(probed) == 8
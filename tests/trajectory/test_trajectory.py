@@ -15,6 +15,7 @@
 import pytest
 import os
 import pickle
+import concurrent.futures
 import numpy as np
 
 from unittest.mock import AsyncMock
@@ -25,10 +26,19 @@ from asyncmd.config import _GLOBALS  # noqa: F401
 from asyncmd.trajectory.trajectory import (TrajectoryFunctionValueCacheMEMORY,
                                            TrajectoryFunctionValueCacheNPZ,
                                            TrajectoryFunctionValueCacheH5PY,
+                                           TrajectoryFunctionValueCacheSQLITE,
                                            )
 from asyncmd.trajectory.functionwrapper import TrajectoryFunctionWrapper
 
 
+def _append_to_sqlite_cache(fname_db, hash_traj, func_ids):
+    # used in the sqlite cache test (in other processes)
+    cache = TrajectoryFunctionValueCacheSQLITE(fname_db, hash_traj=hash_traj)
+    for func_id in func_ids:
+        cache.append(func_id=func_id, vals=np.full((50, 2), int(func_id)))
+    return len(cache)
+
+
 class TBase:
     # base class all trajectory.py tests
     # contains general purpose data generation/setup functions
@@ -314,11 +324,11 @@ class Test_Trajectory(TBase):
         assert_neq(traj1, object())
 
     @pytest.mark.parametrize("default_cache_type",
-                             [None, "npz", "h5py", "memory"])
+                             [None, "npz", "h5py", "sqlite", "memory"])
     @pytest.mark.parametrize("cache_type",
-                             [None, "npz", "h5py", "memory"])
+                             [None, "npz", "h5py", "sqlite", "memory"])
     @pytest.mark.parametrize("initial_cache_type",
-                             [None, "npz", "h5py", "memory"])
+                             [None, "npz", "h5py", "sqlite", "memory"])
     @pytest.mark.asyncio
     async def test__setup_cache(self, tmp_path, default_cache_type, cache_type,
                                 initial_cache_type):
@@ -341,6 +351,14 @@ class Test_Trajectory(TBase):
                 del _GLOBALS["H5PY_CACHE"]
             except KeyError:
                 pass
+        if "sqlite" in [default_cache_type, cache_type, initial_cache_type]:
+            asyncmd.config.register_sqlite_cache(fname=tmp_path / "cache.db")
+        else:
+            # ensure it is not set
+            try:
+                del _GLOBALS["SQLITE_CACHE"]
+            except KeyError:
+                pass
         # Note that we need this bit below after calling register_h5py_file
         # because that calls set_default_trajectory_cache_type("h5py")
         if default_cache_type is not None:
@@ -410,9 +428,9 @@ class Test_Trajectory(TBase):
             assert not os.path.isfile(fname_npz_cache)
 
     @pytest.mark.parametrize("default_cache_type",
-                             [None, "npz", "h5py", "memory"])
+                             [None, "npz", "h5py", "sqlite", "memory"])
     @pytest.mark.parametrize("cache_type",
-                             [None, "npz", "h5py", "memory"])
+                             [None, "npz", "h5py", "sqlite", "memory"])
     @pytest.mark.parametrize("change_wdir_between_pickle_unpickle",
                              [True, False])
     @pytest.mark.asyncio
@@ -436,6 +454,14 @@ class Test_Trajectory(TBase):
                 del _GLOBALS["H5PY_CACHE"]
             except KeyError:
                 pass
+        if default_cache_type == "sqlite" or cache_type == "sqlite":
+            asyncmd.config.register_sqlite_cache(fname=tmp_path / "cache.db")
+        else:
+            # ensure it is not set
+            try:
+                del _GLOBALS["SQLITE_CACHE"]
+            except KeyError:
+                pass
         # Note that we need this bit below after calling register_h5py_file
         # because that calls set_default_trajectory_cache_type("h5py")
         if default_cache_type is not None:
@@ -511,7 +537,60 @@ class Test_Trajectory(TBase):
                                         fname_trajs=traj.trajectory_files,
                                         trajectory_hash=traj.trajectory_hash,
                                                                               )
-        os.unlink(fname_npz_cache)
+        if (cache_type or default_cache_type) == "sqlite":
+            # the values are not written to npz when pickling with sqlite
+            assert not os.path.isfile(fname_npz_cache)
+        else:
+            os.unlink(fname_npz_cache)
+
+    @pytest.mark.asyncio
+    async def test_lru_cache_tier(self):
+        # values cached in npz are also kept in the in-memory LRU tier
+        global _GLOBALS
+        try:
+            del _GLOBALS["TRAJECTORY_FUNCTION_CACHE_TYPE"]
+        except KeyError:
+            pass
+        lru_cache = _GLOBALS["TRAJECTORY_FUNCTION_LRU_CACHE"]
+        traj = Trajectory(
+                    trajectory_files="tests/test_data/trajectory/ala_traj.trr",
+                    structure_file="tests/test_data/trajectory/ala.tpr",
+                    cache_type="npz",
+                          )
+        func_id = self.make_func_id()
+        func_values = self.make_func_values(traj_len=200, cv_dim=3)
+        wrapped_func = AsyncMock(TrajectoryFunctionWrapper)
+        wrapped_func.get_values_for_trajectory.side_effect = [func_values]
+        await traj._apply_wrapped_func(func_id=func_id,
+                                       wrapped_func=wrapped_func,
+                                       )
+        assert (traj.trajectory_hash, func_id) in lru_cache
+        hits = lru_cache.stats()["hits"]
+        for _ in range(3):
+            vals = await traj._apply_wrapped_func(func_id=func_id,
+                                                  wrapped_func=None,
+                                                  )
+            assert np.all(np.equal(vals, func_values))
+            # the returned values are read-only (and not copied)
+            with pytest.raises(ValueError):
+                vals[:] = 0.
+        assert lru_cache.stats()["hits"] == hits + 3
+        # and with a budget of zero we read from the npz again
+        max_bytes = lru_cache.max_bytes
+        try:
+            asyncmd.config.set_trajectory_cache_lru_size(max_bytes=0)
+            assert len(lru_cache) == 0
+            vals = await traj._apply_wrapped_func(func_id=func_id,
+                                                  wrapped_func=None,
+                                                  )
+            assert np.all(np.equal(vals, func_values))
+            assert len(lru_cache) == 0
+        finally:
+            asyncmd.config.set_trajectory_cache_lru_size(max_bytes=max_bytes)
+            os.unlink(TrajectoryFunctionValueCacheNPZ._get_cache_filename(
+                                        fname_trajs=traj.trajectory_files,
+                                        trajectory_hash=traj.trajectory_hash,
+                                                                          ))
 
 
 class Test_TrajectoryFunctionValueCache(TBase):
@@ -521,6 +600,7 @@ class Test_TrajectoryFunctionValueCache(TBase):
     @pytest.mark.parametrize("cache_class",
                              [TrajectoryFunctionValueCacheNPZ,
                               TrajectoryFunctionValueCacheH5PY,
+                              TrajectoryFunctionValueCacheSQLITE,
                               TrajectoryFunctionValueCacheMEMORY,
                               ]
                              )
@@ -528,6 +608,8 @@ class Test_TrajectoryFunctionValueCache(TBase):
         first_arg = None
         if cache_class is TrajectoryFunctionValueCacheNPZ:
             first_arg = [tmp_path / "traj_name.traj"]
+        elif cache_class is TrajectoryFunctionValueCacheSQLITE:
+            first_arg = tmp_path / "traj_cache.db"
         elif cache_class is TrajectoryFunctionValueCacheH5PY:
             h5py = pytest.importorskip("h5py", minversion=None,
                                        reason="Requires 'h5py' to run.",
@@ -583,16 +665,69 @@ class Test_TrajectoryFunctionValueCache(TBase):
                                )
                       )
 
+    @pytest.mark.parametrize("cache_class",
+                             [TrajectoryFunctionValueCacheNPZ,
+                              TrajectoryFunctionValueCacheH5PY,
+                              TrajectoryFunctionValueCacheSQLITE,
+                              TrajectoryFunctionValueCacheMEMORY,
+                              ]
+                             )
+    @pytest.mark.parametrize("fortran_order", [True, False])
+    def test_read_only_and_memmap(self, tmp_path, cache_class, fortran_order):
+        first_arg = None
+        if cache_class is TrajectoryFunctionValueCacheNPZ:
+            first_arg = [tmp_path / "traj_name.traj"]
+        elif cache_class is TrajectoryFunctionValueCacheSQLITE:
+            first_arg = tmp_path / "traj_cache.db"
+        elif cache_class is TrajectoryFunctionValueCacheH5PY:
+            h5py = pytest.importorskip("h5py", minversion=None,
+                                       reason="Requires 'h5py' to run.",
+                                       )
+            first_arg = h5py.File(tmp_path / "traj_cache.h5", mode="w")
+        cache = cache_class(first_arg, hash_traj=self.make_trajectory_hash())
+        small_id, large_id = self.make_func_id(), self.make_func_id()
+        small_vals = self.make_func_values(traj_len=10, cv_dim=3)
+        large_vals = self.make_func_values(traj_len=500, cv_dim=40)
+        if fortran_order:
+            large_vals = np.asfortranarray(large_vals)
+        cache.append(func_id=small_id, vals=small_vals)
+        cache.append(func_id=large_id, vals=large_vals)
+        if cache_class in [TrajectoryFunctionValueCacheNPZ,
+                           TrajectoryFunctionValueCacheH5PY]:
+            # map everything at least 1 kB
+            cache.mmap_min_bytes = 1000
+        for func_id, vals, mapped in [(small_id, small_vals, False),
+                                      (large_id, large_vals, True)]:
+            cached_vals = cache[func_id]
+            assert np.array_equal(cached_vals, vals)
+            assert not cached_vals.flags.writeable
+            with pytest.raises(ValueError):
+                cached_vals[0] = 0.
+            if cache_class is TrajectoryFunctionValueCacheMEMORY:
+                # a view, i.e. not copied
+                assert np.shares_memory(cached_vals, vals)
+            elif cache_class is TrajectoryFunctionValueCacheSQLITE:
+                assert not isinstance(cached_vals, np.memmap)
+            else:
+                assert isinstance(cached_vals, np.memmap) == mapped
+        # appending to the npz does not invalidate existing maps
+        mapped_vals = cache[large_id]
+        cache.append(func_id=self.make_func_id(), vals=large_vals)
+        assert np.array_equal(mapped_vals, large_vals)
+
     # Note these test dont work for the memory cache as it is not stateful,
     # i.e. recreating it will empty it (as there is no file to back it)
     @pytest.mark.parametrize("cache_class",
                              [TrajectoryFunctionValueCacheNPZ,
                               TrajectoryFunctionValueCacheH5PY,
+                              TrajectoryFunctionValueCacheSQLITE,
                               ]
                              )
     def test_stateful_append_iter_len(self, tmp_path, cache_class):
         if cache_class is TrajectoryFunctionValueCacheNPZ:
             first_arg = [tmp_path / "traj_name.traj"]
+        elif cache_class is TrajectoryFunctionValueCacheSQLITE:
+            first_arg = tmp_path / "traj_cache.db"
         elif cache_class is TrajectoryFunctionValueCacheH5PY:
             h5py = pytest.importorskip("h5py", minversion=None,
                                        reason="Requires 'h5py' to run.",
@@ -694,3 +829,74 @@ class Test_TrajectoryFunctionValueCache(TBase):
                                             hash_traj=hash_traj_mm,
                                             )
         assert not os.path.exists(cache_file_name)
+
+    def test_sqlite_concurrent_processes(self, tmp_path):
+        # several processes append to the same database at the same time
+        fname_db = tmp_path / "traj_cache.db"
+        hash_traj = self.make_trajectory_hash()
+        n_procs, n_per_proc = 4, 25
+        func_ids = [[str(i * n_per_proc + j) for j in range(n_per_proc)]
+                    for i in range(n_procs)]
+        with concurrent.futures.ProcessPoolExecutor(n_procs) as executor:
+            futures = [executor.submit(_append_to_sqlite_cache, fname_db,
+                                       hash_traj, ids)
+                       for ids in func_ids]
+            for fut in futures:
+                assert fut.result() >= n_per_proc
+        cache = TrajectoryFunctionValueCacheSQLITE(fname_db,
+                                                   hash_traj=hash_traj)
+        assert len(cache) == n_procs * n_per_proc
+        for func_id in cache:
+            assert np.all(cache[func_id] == int(func_id))
+        # other trajectories in the same database are independent
+        other = TrajectoryFunctionValueCacheSQLITE(fname_db,
+                                                   hash_traj=hash_traj + 1)
+        assert len(other) == 0
+        assert "0" not in other
+
+    @pytest.mark.parametrize("read_only", [True, False])
+    def test_h5py_legacy_layout(self, tmp_path, read_only):
+        h5py = pytest.importorskip("h5py", minversion=None,
+                                   reason="Requires 'h5py' to run.",
+                                   )
+        fname_traj_cache = tmp_path / "traj_cache.h5"
+        hash_traj = self.make_trajectory_hash()
+        n_cached_cvs = 4
+        traj_len = 23
+        test_data_func_ids = [self.make_func_id() for _ in range(n_cached_cvs)]
+        # func_ids are arbitrary strings (not valid dataset names)
+        test_data_func_ids[-1] = "some/func.id"
+        test_data_func_values = [self.make_func_values(traj_len, 2)
+                                 for _ in range(n_cached_cvs)]
+        # write the values in the previous layout (datasets named by index)
+        with h5py.File(fname_traj_cache, mode="w") as h5file:
+            root_grp = h5file.require_group("asyncmd/"
+                                            + "TrajectoryFunctionValueCache/"
+                                            + f"{hash_traj}")
+            ids_grp = root_grp.require_group("FunctionIDs")
+            vals_grp = root_grp.require_group("FunctionValues")
+            for idx, (func_id, func_values) in enumerate(
+                                        zip(test_data_func_ids,
+                                            test_data_func_values)):
+                ids_grp.create_dataset(str(idx), data=func_id)
+                vals_grp.create_dataset(str(idx), data=func_values)
+        with h5py.File(fname_traj_cache,
+                       mode="r" if read_only else "r+") as h5file:
+            cache = TrajectoryFunctionValueCacheH5PY(h5file,
+                                                     hash_traj=hash_traj)
+            assert len(cache) == n_cached_cvs
+            assert sorted(cache) == sorted(test_data_func_ids)
+            for func_id, func_values in zip(test_data_func_ids,
+                                            test_data_func_values):
+                assert func_id in cache
+                assert np.all(np.equal(cache[func_id], func_values))
+            assert self.make_func_id() not in cache
+            root_grp = h5file["asyncmd/TrajectoryFunctionValueCache/"
+                              + f"{hash_traj}"]
+            if read_only:
+                assert "FunctionIDs" in root_grp
+            else:
+                # migrated to the new layout
+                assert list(root_grp.keys()) == ["FunctionValuesByID"]
+                assert (TrajectoryFunctionValueCacheH5PY.migrate(h5file)
+                        == 0)